@@ -1,6 +1,6 @@
 const mongoose = require("mongoose");
 const Auth = require("../models/auth.model");
-const axios = require("axios"); // For Flask API (dummy for now)
+const { flaskApi, relayBusy } = require("../utils/flaskApi");
 
 const createBloodRequest = async (req, res) => {
   try {
@@ -63,8 +63,8 @@ const createBloodRequest = async (req, res) => {
       //   { name: "Donor4", phone: "9999990004", location: { latitude: 28.64, longitude: 77.24 } },
       //   { name: "Donor5", phone: "9999990005", location: { latitude: 28.65, longitude: 77.25 } }
       // ];
-      const flaskRes = await axios.get(
-        "http://127.0.0.1:5000/api/blood/find-donors",
+      const flaskRes = await flaskApi.get(
+        "/api/blood/find-donors",
         {
           params: {
             blood_group: bloodGroup,
@@ -81,6 +81,7 @@ const createBloodRequest = async (req, res) => {
       });
     }
   } catch (error) {
+    if (relayBusy(error, res)) return;
     console.error("Error processing blood request:", error);
     res.status(500).json({ message: "Error processing blood request" });
   }
@@ -152,8 +153,8 @@ const createOrganRequest = async (req, res) => {
     await hospital.save();
 
     // Call Flask API for organ matching
-    const flaskRes = await axios.get(
-      "http://127.0.0.1:5000/api/organ/find-matches",
+    const flaskRes = await flaskApi.get(
+      "/api/organ/find-matches",
       {
         params: {
           organ: organType,
@@ -168,6 +169,7 @@ const createOrganRequest = async (req, res) => {
       donors: Array.isArray(donors) ? donors : [],
     });
   } catch (error) {
+    if (relayBusy(error, res)) return;
     console.error(
       "Error processing organ request:",
       error?.response?.data || error.message
@@ -0,0 +1,42 @@
+const axios = require("axios");
+require("dotenv").config();
+
+// The Flask service rate-limits per caller. It only trusts this backend's name
+// with the matching secret (ADMISSION_CALLER_TOKENS on the Flask side);
+// without it we share the loopback address's bucket.
+const CLIENT_ID = process.env.FLASK_CLIENT_ID || "node-backend";
+const CLIENT_TOKEN = process.env.FLASK_CLIENT_TOKEN || "";
+const MAX_RETRY_AFTER_SECONDS = 5;
+
+const flaskApi = axios.create({
+  baseURL: process.env.FLASK_API_URL || "http://127.0.0.1:5000",
+  headers: CLIENT_TOKEN
+    ? { "X-Client-ID": CLIENT_ID, "X-Client-Token": CLIENT_TOKEN }
+    : {},
+});
+
+// Retry once when the Flask admission controller sheds the request (429),
+// waiting for its Retry-After hint if it is short enough.
+flaskApi.interceptors.response.use(undefined, async (error) => {
+  const { config, response } = error;
+  if (!config || config.__retried || response?.status !== 429) {
+    throw error;
+  }
+  const retryAfter = Number(response.headers["retry-after"]) || 1;
+  if (retryAfter > MAX_RETRY_AFTER_SECONDS) {
+    throw error;
+  }
+  config.__retried = true;
+  await new Promise((resolve) => setTimeout(resolve, retryAfter * 1000));
+  return flaskApi.request(config);
+});
+
+// Relays a 429 from Flask to our own caller; returns true if it did.
+const relayBusy = (error, res) => {
+  if (error?.response?.status !== 429) return false;
+  res.set("Retry-After", error.response.headers["retry-after"] || "1");
+  res.status(503).json({ message: "Matching service busy, retry shortly" });
+  return true;
+};
+
+module.exports = { flaskApi, relayBusy };
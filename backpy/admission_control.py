@@ -0,0 +1,244 @@
+import os
+import hmac
+import math
+import time
+import threading
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Optional
+from flask import g, jsonify, request
+from instrumentation import REGISTRY
+from structured_logging import get_sampled_logger
+
+# Under overload every shed request would log; SHED_TOTAL counts them all
+SHED_LOG_EVERY = 50
+shed_logger = get_sampled_logger(__name__, SHED_LOG_EVERY)
+
+# --- Admission Control Configuration ---
+# Requests allowed to run at once across all route classes
+ADMISSION_SLOTS = int(os.environ.get('ADMISSION_SLOTS', 8))
+# Slots only the top-priority class may use, so SOS never waits behind a full pool
+RESERVED_SLOTS = 2
+# Callers are rate-limited by remote address. A service may name itself with
+# CALLER_HEADER, but the name is only trusted alongside its shared secret in
+# CALLER_TOKEN_HEADER (ADMISSION_CALLER_TOKENS="node-backend=<secret>,..."),
+# so clients cannot rotate names to get fresh buckets.
+CALLER_HEADER = 'X-Client-ID'
+CALLER_TOKEN_HEADER = 'X-Client-Token'
+CALLER_TOKENS = dict(pair.split('=', 1) for pair in os.environ.get('ADMISSION_CALLER_TOKENS', '').split(',')
+                     if '=' in pair)
+MAX_TRACKED_CALLERS = 10_000
+
+CRITICAL, WEBHOOK, STANDARD, BULK = 'critical', 'webhook', 'standard', 'bulk'
+
+
+@dataclass
+class RouteClass:
+    """Limits for one class of routes; lower priority numbers are served first."""
+    name: str
+    priority: int
+    max_concurrent: int
+    max_queued: int
+    max_wait_seconds: float
+    # Per-caller token bucket (requests per second, burst); None disables it
+    rate: Optional[float] = None
+    burst: int = 0
+    active: int = 0
+    queue: Deque = field(default_factory=deque)
+
+
+ROUTE_CLASSES = {
+    CRITICAL: dict(priority=0, max_concurrent=ADMISSION_SLOTS, max_queued=256, max_wait_seconds=10.0),
+    # Public provider callbacks: ahead of ordinary traffic but rate-limited, so a
+    # flood of them cannot take the slots reserved for SOS
+    WEBHOOK: dict(priority=1, max_concurrent=max(1, ADMISSION_SLOTS // 4), max_queued=64,
+                  max_wait_seconds=5.0, rate=10.0, burst=50),
+    STANDARD: dict(priority=2, max_concurrent=max(1, ADMISSION_SLOTS * 3 // 4), max_queued=64,
+                   max_wait_seconds=5.0, rate=5.0, burst=20),
+    BULK: dict(priority=3, max_concurrent=max(1, ADMISSION_SLOTS // 2), max_queued=16,
+               max_wait_seconds=1.0, rate=2.0, burst=10),
+}
+
+# Flask endpoint -> route class; anything unlisted is STANDARD
+ENDPOINT_CLASSES = {
+    'sos.trigger_emergency_sos': CRITICAL,
+    'sos.get_sos_status': CRITICAL,
+    'replies.sms_inbound': WEBHOOK,
+    # Authenticated operators only; the sending itself runs off-request
+    'broadcast.start_broadcast': CRITICAL,
+    'broadcast.cancel_broadcast': CRITICAL,
+    'blood_donor_endpoint': BULK,
+    'eligible_soon_endpoint': BULK,
+    'organ_match_endpoint': BULK,
+    'inventory.get_inventory_forecast': BULK,
+    'bulk_import.import_endpoint': BULK,
+}
+# Long-lived streams and scrapes never take a slot
+EXEMPT_ENDPOINTS = {'sos.stream_sos_events', 'metrics.metrics_endpoint', 'static'}
+
+QUEUE_DEPTH = REGISTRY.gauge(
+    'admission_queue_depth', 'Requests waiting for an admission slot.', ('route_class',))
+IN_FLIGHT = REGISTRY.gauge(
+    'admission_in_flight', 'Admitted requests currently running.', ('route_class',))
+SHED_TOTAL = REGISTRY.counter(
+    'admission_shed_total', 'Requests rejected with 429 by admission control.', ('route_class', 'reason'))
+WAIT_SECONDS = REGISTRY.histogram(
+    'admission_wait_seconds', 'Time admitted requests spent queued.', ('route_class',))
+
+
+class Rejected(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBuckets:
+    """Per-caller token buckets, oldest callers evicted past MAX_TRACKED_CALLERS."""
+
+    def __init__(self, rate: float, burst: int, max_callers: int = MAX_TRACKED_CALLERS):
+        self.rate = rate
+        self.burst = burst
+        self.max_callers = max_callers
+        self._buckets: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, caller: str, now: Optional[float] = None) -> float:
+        """0 if a token was taken, else seconds until one is available."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, last = self._buckets.pop(caller, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+            self._buckets[caller] = (tokens - 1 if wait == 0 else tokens, now)
+            while len(self._buckets) > self.max_callers:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class AdmissionController:
+    """Priority admission over a fixed number of request slots.
+
+    Each route class has its own wait queue, concurrency cap and optional
+    per-caller token bucket. A freed slot goes to the highest-priority class
+    with a waiter that is under its cap, so bulk callers can fill at most
+    their share of the slots and queued SOS requests always go first; the
+    last `reserved` slots are kept for the top class alone.
+    Lower classes are shed early (short queues, short waits) with a
+    Retry-After hint instead of piling up behind critical work.
+    """
+
+    def __init__(self, slots: int = ADMISSION_SLOTS, classes: Optional[Dict[str, Dict]] = None,
+                 reserved: int = RESERVED_SLOTS):
+        self.slots = slots
+        self.reserved = min(reserved, slots - 1)
+        self.classes = {name: RouteClass(name, **config) for name, config in (classes or ROUTE_CLASSES).items()}
+        self._by_priority = sorted(self.classes.values(), key=lambda c: c.priority)
+        self._buckets = {c.name: TokenBuckets(c.rate, c.burst) for c in self._by_priority if c.rate}
+        self._active = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, class_name: str, caller: str) -> float:
+        """Blocks until admitted; returns seconds queued or raises Rejected."""
+        route_class = self.classes[class_name]
+        bucket = self._buckets.get(class_name)
+        if bucket is not None:
+            wait = bucket.take(caller)
+            if wait:
+                raise self._shed(route_class, 'rate_limited', wait)
+
+        ticket = {'event': threading.Event(), 'granted': False}
+        with self._lock:
+            if len(route_class.queue) >= route_class.max_queued:
+                raise self._shed(route_class, 'queue_full', route_class.max_wait_seconds)
+            route_class.queue.append(ticket)
+            self._dispatch()
+            self._export(route_class)
+        start = time.perf_counter()
+        if not ticket['event'].wait(route_class.max_wait_seconds):
+            with self._lock:
+                if not ticket['granted']:
+                    route_class.queue.remove(ticket)
+                    self._export(route_class)
+                    raise self._shed(route_class, 'queue_timeout', route_class.max_wait_seconds)
+        waited = time.perf_counter() - start
+        WAIT_SECONDS.observe(waited, class_name)
+        return waited
+
+    def release(self, class_name: str) -> None:
+        with self._lock:
+            self.classes[class_name].active -= 1
+            self._active -= 1
+            self._dispatch()
+            for route_class in self._by_priority:
+                self._export(route_class)
+
+    def _dispatch(self) -> None:
+        # Caller holds the lock
+        top = self._by_priority[0].priority
+        for route_class in self._by_priority:
+            limit = self.slots if route_class.priority == top else self.slots - self.reserved
+            while (self._active < limit and route_class.queue
+                   and route_class.active < route_class.max_concurrent):
+                ticket = route_class.queue.popleft()
+                ticket['granted'] = True
+                route_class.active += 1
+                self._active += 1
+                ticket['event'].set()
+            if self._active >= self.slots:
+                return
+
+    def _shed(self, route_class: RouteClass, reason: str, retry_after: float) -> Rejected:
+        SHED_TOTAL.inc(route_class.name, reason)
+        return Rejected(reason, retry_after)
+
+    @staticmethod
+    def _export(route_class: RouteClass) -> None:
+        QUEUE_DEPTH.set(len(route_class.queue), route_class.name)
+        IN_FLIGHT.set(route_class.active, route_class.name)
+
+
+def route_class_for(endpoint: Optional[str]) -> Optional[str]:
+    if endpoint is None or endpoint in EXEMPT_ENDPOINTS:
+        return None
+    return ENDPOINT_CLASSES.get(endpoint, STANDARD)
+
+
+def caller_key(headers, remote_addr: Optional[str], tokens: Optional[Dict[str, str]] = None) -> str:
+    """Bucket key: the named service if its token checks out, else the remote address."""
+    tokens = CALLER_TOKENS if tokens is None else tokens
+    name, token = headers.get(CALLER_HEADER), headers.get(CALLER_TOKEN_HEADER)
+    if name and token and name in tokens and hmac.compare_digest(tokens[name], token):
+        return f"client:{name}"
+    return remote_addr or 'unknown'
+
+
+def init_app(app, controller: Optional[AdmissionController] = None) -> AdmissionController:
+    """Installs admission control on every request; returns the controller."""
+    controller = controller or AdmissionController()
+
+    @app.before_request
+    def _admit():
+        class_name = route_class_for(request.endpoint)
+        if class_name is None:
+            return None
+        caller = caller_key(request.headers, request.remote_addr)
+        try:
+            controller.acquire(class_name, caller)
+        except Rejected as e:
+            shed_logger.warning("Request shed", extra={'route_class': class_name, 'reason': e.reason,
+                                                  'caller': caller, 'endpoint': request.endpoint})
+            response = jsonify({"error": "Server busy, retry later", "reason": e.reason})
+            response.status_code = 429
+            response.headers['Retry-After'] = str(max(1, math.ceil(e.retry_after)))
+            return response
+        g.admission_class = class_name
+        return None
+
+    @app.teardown_request
+    def _release(exc):
+        class_name = g.pop('admission_class', None)
+        if class_name is not None:
+            controller.release(class_name)
+
+    return controller
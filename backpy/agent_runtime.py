@@ -0,0 +1,123 @@
+import os
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+from flask import Blueprint, jsonify
+import matching_service
+from ai_agent_monitor import GoogleAIBloodBankAgent
+from inventory_service import InventoryService, inventory_service
+from llm_client import GeminiClient, StubLLMClient
+from structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+# --- Agent Runtime Configuration ---
+AGENT_BLUEPRINT = Blueprint('agent', __name__)
+
+
+class AgentRuntime:
+    """Runs the monitoring agent inside the Flask process as a managed service.
+
+    The agent listens on the shared inventory feed and calls the matching
+    service directly, so outreach costs no loopback HTTP request or extra
+    worker slot. start() and stop() are idempotent; stop() closes the agent,
+    so a restart never leaves its pool or HTTP session behind.
+    """
+
+    def __init__(self, inventory: InventoryService):
+        self.inventory = inventory
+        self.agent: Optional[GoogleAIBloodBankAgent] = None
+        self.started_at: Optional[datetime] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _outreach(payload: Dict) -> Dict:
+        return matching_service.initiate_outreach(**payload)
+
+    @property
+    def running(self) -> bool:
+        return self.agent is not None and self.agent.monitoring_active and self.inventory.dispatching
+
+    def start(self, api_key: Optional[str] = None) -> bool:
+        """Starts the agent; returns False if it was already running."""
+        with self._lock:
+            if self.running:
+                return False
+            if self.agent is not None:
+                # A previous agent whose dispatcher died without stop()
+                self.agent.close()
+            api_key = api_key or os.environ.get('GENAI_API_KEY', '')
+            if api_key:
+                llm = GeminiClient(api_key)
+            else:
+                # Without a key the stub echoes the rule-based analysis
+                logger.warning("GENAI_API_KEY not set, agent runs on rule-based analysis")
+                llm = StubLLMClient()
+            self.agent = GoogleAIBloodBankAgent(api_key, inventory=self.inventory, llm=llm,
+                                                outreach=self._outreach)
+            self.agent.start_event_driven()
+            self.started_at = datetime.now()
+            logger.info("Agent runtime started")
+            return True
+
+    def stop(self) -> bool:
+        """Stops the agent; returns False if it was not running."""
+        with self._lock:
+            if not self.running:
+                return False
+            self.agent.close()
+            logger.info("Agent runtime stopped")
+            return True
+
+    def health(self) -> Dict:
+        agent = self.agent
+        return {
+            'status': 'running' if self.running else 'stopped',
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'dispatcher_alive': self.inventory.dispatching,
+            'pending_shortages': self.inventory.pending_count,
+            'shortages_handled': agent.shortages_handled if agent else 0,
+            'last_activity': agent.last_activity.isoformat() if agent and agent.last_activity else None,
+            'llm_client': type(agent.llm).__name__ if agent else None,
+        }
+
+
+# Global runtime bound to the shared inventory feed
+agent_runtime = AgentRuntime(inventory_service)
+
+# --- Flask API Endpoints ---
+
+@AGENT_BLUEPRINT.route('/api/ai-agent/start-monitoring', methods=['POST'])
+def start_monitoring():
+    """Starts the in-process agent (no-op if it is already running)."""
+    try:
+        started = agent_runtime.start()
+    except Exception as e:
+        return jsonify({
+            "error": f"Failed to start AI monitoring: {str(e)}",
+            "timestamp": datetime.now().isoformat()
+        }), 500
+
+    return jsonify({
+        "status": "success",
+        "message": "AI monitoring started" if started else "AI monitoring already running",
+        "health": agent_runtime.health(),
+        "timestamp": datetime.now().isoformat()
+    }), 200
+
+
+@AGENT_BLUEPRINT.route('/api/ai-agent/stop-monitoring', methods=['POST'])
+def stop_monitoring():
+    stopped = agent_runtime.stop()
+    return jsonify({
+        "status": "success",
+        "message": "AI monitoring stopped" if stopped else "AI monitoring was not running",
+        "timestamp": datetime.now().isoformat()
+    }), 200
+
+
+@AGENT_BLUEPRINT.route('/api/ai-agent/health', methods=['GET'])
+def agent_health():
+    """Runtime health; 503 while the agent is stopped so probes can alert."""
+    health = agent_runtime.health()
+    return jsonify(health), 200 if health['status'] == 'running' else 503
@@ -1,29 +1,36 @@
-import os
 import json
 import time
-import re
+import threading
+import contextvars
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta
-import google.generativeai as genai
-from typing import Dict, List
-import schedule
+from typing import Callable, Dict, List, Optional
+from llm_client import GeminiClient, extract_json
+from inventory_service import DEFAULT_HOSPITAL, HOSPITAL_LOCATIONS, InventoryService, inventory_store
+from structured_logging import configure_logging, get_logger, log_context
+
+logger = get_logger(__name__)
 
 # --- Configuration ---
 GENAI_API_KEY = ""   # Replace with your actual API key
 FLASK_API_BASE = "http://127.0.0.1:5000/api"
 
+# Blood groups are handled concurrently; locations within a group stay in
+# priority order and stop at the first success
+OUTREACH_WORKERS = 8
+OUTREACH_TIMEOUT_SECONDS = 10
+
 # Blood bank inventory thresholds (units)
 BLOOD_BANK_THRESHOLDS = {
     'O+': 20, 'O-': 15, 'A+': 25, 'A-': 12, 
     'B+': 20, 'B-': 10, 'AB+': 15, 'AB-': 8
 }
 
-# Hospital locations (example - replace with real data)
-HOSPITAL_LOCATIONS = {
-    'mumbai_central': {'lat': 19.0760, 'lon': 72.8777, 'name': 'Mumbai Central Hospital'},
-    'delhi_aiims': {'lat': 28.5672, 'lon': 77.2100, 'name': 'AIIMS Delhi'},
-    'bangalore_nimhans': {'lat': 12.9432, 'lon': 77.5969, 'name': 'NIMHANS Bangalore'}
-}
+# Analyses are cached per blood group and severity bucket (tenths of the threshold)
+SEVERITY_BUCKETS = 10
+ANALYSIS_CACHE_TTL = timedelta(minutes=30)
 
 
 class GoogleAIBloodBankAgent:
@@ -31,11 +38,28 @@ class GoogleAIBloodBankAgent:
     donor outreach using Gemini AI for decision making.
     """
 
-    def __init__(self, api_key: str):
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-2.0-flash')
+    def __init__(self, api_key: str, inventory: Optional[InventoryService] = None,
+                 hospital: str = DEFAULT_HOSPITAL, llm=None,
+                 outreach: Optional[Callable[[Dict], Dict]] = None):
+        # Any LLMClient works here; tests pass llm_client.StubLLMClient()
+        self.llm = llm or GeminiClient(api_key)
+        # In-process runtimes pass matching_service.initiate_outreach; standalone
+        # runs fall back to the Flask API over HTTP
+        self.outreach = outreach or self._http_outreach
+        self.shortages_handled = 0
+        self.last_activity: Optional[datetime] = None
+        self._analysis_cache: Dict[tuple, tuple] = {}
         self.monitoring_active = False
-        self.last_check = {}
+        # Standalone agents keep their own feed but record into the process-wide
+        # store, so there is only ever one writer per log file
+        self.inventory = inventory or InventoryService(BLOOD_BANK_THRESHOLDS, store=inventory_store)
+        self.hospital = hospital
+        self._stop_event = threading.Event()
+        self._outreach_pool = ThreadPoolExecutor(max_workers=OUTREACH_WORKERS, thread_name_prefix='outreach')
+        # One pooled keep-alive session shared by every outreach worker
+        self.http = requests.Session()
+        self.http.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=OUTREACH_WORKERS))
+        self.http.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=OUTREACH_WORKERS))
 
     def simulate_blood_inventory_check(self) -> Dict[str, Dict]:
         import random
@@ -50,61 +74,120 @@ class GoogleAIBloodBankAgent:
             }
         return inventory_data
 
-    def analyze_shortage_with_ai(self, inventory_data: Dict, blood_group: str) -> Dict:
-        shortage_info = inventory_data[blood_group]
-        prompt = f"""
-        BLOOD BANK EMERGENCY ANALYSIS:
+    def shortage_hospital(self, shortage: Dict) -> str:
+        """Hospital that reported the shortage (simulated readings are this agent's own)."""
+        return shortage.get('hospital') or self.hospital
+
+    def shortage_label(self, shortage: Dict) -> str:
+        """'hospital/blood_group', the key used for one shortage in batch prompts and results."""
+        return f"{self.shortage_hospital(shortage)}/{shortage['blood_group']}"
+
+    def rule_based_analysis(self, shortage: Dict) -> Dict:
+        """Immediate analysis used to start outreach before the LLM answers."""
+        return {
+            "urgency_level": 8 if shortage['shortage_severity'] > 0.5 else 6,
+            "donors_to_contact": 5,
+            "priority_locations": [self.shortage_hospital(shortage)],
+            "time_critical_hours": 6,
+            "communication_tone": "urgent",
+            "reasoning": "Rule-based analysis"
+        }
+
+    def _cache_key(self, shortage: Dict) -> tuple:
+        bucket = min(SEVERITY_BUCKETS - 1, int(shortage['shortage_severity'] * SEVERITY_BUCKETS))
+        return self.shortage_hospital(shortage), shortage['blood_group'], bucket
+
+    def cached_analysis(self, shortage: Dict) -> Optional[Dict]:
+        entry = self._analysis_cache.get(self._cache_key(shortage))
+        if entry and entry[1] > datetime.now():
+            return entry[0]
+        return None
+
+    def build_batch_prompt(self, shortages: List[Dict]) -> str:
+        lines = [
+            f"- {self.shortage_label(s)}: {s['current_units']}/{s['threshold']} units, "
+            f"severity {s['shortage_severity']:.2%}"
+            for s in shortages
+        ]
+        baseline = {self.shortage_label(s): self.rule_based_analysis(s) for s in shortages}
+        return f"""
+        BLOOD BANK EMERGENCY ANALYSIS (ALL CURRENT SHORTAGES):
+
+        {chr(10).join(lines)}
 
-        Blood Group: {blood_group}
-        Current Units: {shortage_info['current_units']}
-        Minimum Threshold: {shortage_info['threshold']}
-        Shortage Severity: {shortage_info['shortage_severity']:.2%}
+        Hospital location keys: {', '.join(HOSPITAL_LOCATIONS)}
 
-        TASK: Provide JSON with:
+        TASK: Return ONE JSON object keyed by hospital/blood group as listed above.
+        Each value provides:
         urgency_level (1-10),
         donors_to_contact,
         priority_locations (list of keys from HOSPITAL_LOCATIONS),
         time_critical_hours,
         communication_tone,
         reasoning
+
+        RULE_BASED_BASELINE: {json.dumps(baseline)}
         """
 
-        try:
-            response = self.model.generate_content(prompt)
-            text = response.text.strip()
-
-            # Extract JSON safely
-            match = re.search(r"\{.*\}", text, re.S)
-            if match:
-                ai_analysis = json.loads(match.group())
-                return ai_analysis
+    def request_batch_analysis(self, shortages: List[Dict]) -> Optional[Future]:
+        """Starts one LLM call covering every shortage without a cached analysis."""
+        misses = [s for s in shortages if self.cached_analysis(s) is None]
+        if not misses:
+            return None
+        return self.llm.submit(self.build_batch_prompt(misses))
+
+    def resolve_batch_analysis(self, future: Optional[Future], shortages: List[Dict]) -> Dict[str, Dict]:
+        """Waits (bounded) for a batch call; cached or rule-based analysis fills any gaps."""
+        analyses = {}
+        if future is not None:
+            try:
+                parsed = extract_json(future.result(timeout=self.llm.timeout))
+                analyses = {label: a for label, a in parsed.items() if isinstance(a, dict)}
+            except Exception as e:
+                future.cancel()
+                logger.warning("AI analysis failed, using fallback: %s", e)
+
+        results = {}
+        expires = datetime.now() + ANALYSIS_CACHE_TTL
+        for shortage in shortages:
+            label = self.shortage_label(shortage)
+            if label in analyses:
+                analysis = dict(self.rule_based_analysis(shortage), **analyses[label])
+                self._analysis_cache[self._cache_key(shortage)] = (analysis, expires)
             else:
-                raise ValueError("No JSON found in AI response")
+                analysis = self.cached_analysis(shortage) or dict(
+                    self.rule_based_analysis(shortage), reasoning="Fallback analysis due to AI error")
+            results[label] = analysis
+        return results
 
-        except Exception as e:
-            print(f"⚠️ AI Analysis failed: {e}")
-            return {
-                "urgency_level": 8 if shortage_info['shortage_severity'] > 0.5 else 6,
-                "donors_to_contact": 5,
-                "priority_locations": ["mumbai_central"],
-                "time_critical_hours": 6,
-                "communication_tone": "urgent",
-                "reasoning": "Fallback analysis due to AI error"
-            }
+    def analyze_shortages_batch(self, shortages: List[Dict]) -> Dict[str, Dict]:
+        """Analyses all shortages with at most one LLM round-trip."""
+        return self.resolve_batch_analysis(self.request_batch_analysis(shortages), shortages)
+
+    def analyze_shortage_with_ai(self, inventory_data: Dict, blood_group: str) -> Dict:
+        shortage = dict(inventory_data[blood_group], blood_group=blood_group)
+        return self.analyze_shortages_batch([shortage])[self.shortage_label(shortage)]
+
+    def _http_outreach(self, payload: Dict) -> Dict:
+        response = self.http.post(f"{FLASK_API_BASE}/blood/initiate-call-enhanced",
+                                  json=payload, timeout=OUTREACH_TIMEOUT_SECONDS)
+        response.raise_for_status()
+        return response.json()
 
     def initiate_intelligent_outreach(self, blood_group: str, ai_analysis: Dict) -> List[Dict]:
         outreach_results = []
-        locations_to_try = ai_analysis.get('priority_locations', ['mumbai_central'])
+        locations_to_try = ai_analysis.get('priority_locations', [self.hospital])
 
         for location_key in locations_to_try:
             if location_key not in HOSPITAL_LOCATIONS:
                 continue
 
             hospital = HOSPITAL_LOCATIONS[location_key]
-            print(f"🏥 Initiating outreach for {hospital['name']} - {blood_group}")
+            logger.info("Initiating outreach", extra={'hospital': hospital['name']})
 
             payload = {
                 "blood_group": blood_group,
+                "hospital": location_key,
                 "lat": hospital['lat'],
                 "lon": hospital['lon'],
                 "urgency_level": ai_analysis.get('urgency_level', 5),
@@ -112,22 +195,18 @@ class GoogleAIBloodBankAgent:
             }
 
             try:
-                response = requests.post(f"{FLASK_API_BASE}/blood/initiate-call", 
-                                         json=payload, timeout=10)
-
-                if response.status_code == 200:
-                    result = response.json()
-                    outreach_results.append({
-                        'hospital': hospital['name'],
-                        'status': result.get('status'),
-                        'donor_contacted': result.get('donor_contacted'),
-                        'timestamp': datetime.now().isoformat()
-                    })
-                    if result.get('status') == 'success':
-                        print(f"✅ Success at {hospital['name']}: {result.get('donor_contacted')}")
-                        break
-            except requests.exceptions.RequestException as e:
-                print(f"❌ API call failed for {hospital['name']}: {e}")
+                result = self.outreach(payload)
+                outreach_results.append({
+                    'hospital': hospital['name'],
+                    'status': result.get('status'),
+                    'donor_contacted': result.get('donor_contacted'),
+                    'timestamp': datetime.now().isoformat()
+                })
+                if result.get('status') == 'success':
+                    logger.info("Outreach succeeded", extra={'hospital': hospital['name']})
+                    break
+            except Exception as e:
+                logger.error("Outreach call failed: %s", e, extra={'hospital': hospital['name']})
                 outreach_results.append({
                     'hospital': hospital['name'],
                     'status': 'failed',
@@ -138,6 +217,8 @@ class GoogleAIBloodBankAgent:
         return outreach_results
 
     def generate_ai_summary_report(self, monitoring_cycle_results: List[Dict]) -> str:
+        if not monitoring_cycle_results:
+            return "All blood levels adequate; no outreach required."
         results_summary = json.dumps(monitoring_cycle_results, indent=2)
         prompt = f"""
         BLOOD BANK MONITORING CYCLE SUMMARY:
@@ -149,41 +230,85 @@ class GoogleAIBloodBankAgent:
         """
 
         try:
-            response = self.model.generate_content(prompt)
-            return response.text.strip()
+            return self.llm.generate(prompt)
         except Exception as e:
             return f"Summary generation failed: {e}. Manual review of {len(monitoring_cycle_results)} events required."
 
+    def _outreach_for_shortage(self, event: Dict, analysis: Dict) -> tuple:
+        """Worker task: the location chain for one blood group, with its duration."""
+        blood_group = event['blood_group']
+        with log_context(blood_group=blood_group):
+            logger.warning("Critical shortage", extra={
+                'current_units': event['current_units'], 'threshold': event['threshold']})
+            start = time.perf_counter()
+            results = self.initiate_intelligent_outreach(blood_group, analysis)
+            return results, time.perf_counter() - start
+
+    def process_shortages(self, events: List[Dict]) -> List[Dict]:
+        """Runs outreach for queued shortages without waiting on the LLM.
+
+        One batched LLM call is started for every uncached shortage; outreach
+        begins at once with the cached or rule-based analysis, one blood group
+        per worker, and the LLM result is attached (and cached for the next
+        cycle) when it arrives.
+        """
+        if not events:
+            return []
+        self.shortages_handled += len(events)
+        self.last_activity = datetime.now()
+        pending = self.request_batch_analysis(events)
+
+        submitted = []
+        for event in events:  # already ordered by severity
+            outreach_analysis = self.cached_analysis(event) or self.rule_based_analysis(event)
+            ctx = contextvars.copy_context()
+            future = self._outreach_pool.submit(ctx.run, self._outreach_for_shortage, event, outreach_analysis)
+            submitted.append((event, outreach_analysis, future))
+
+        shortages_detected = []
+        for event, outreach_analysis, future in submitted:
+            results, elapsed = future.result()
+            shortages_detected.append({
+                'hospital': self.shortage_hospital(event),
+                'blood_group': event['blood_group'],
+                'shortage_data': event,
+                'outreach_analysis': outreach_analysis,
+                'outreach_results': results,
+                'outreach_seconds': round(elapsed, 3)
+            })
+
+        ai_analyses = self.resolve_batch_analysis(pending, events)
+        for shortage in shortages_detected:
+            shortage['ai_analysis'] = ai_analyses[self.shortage_label(shortage['shortage_data'])]
+            logger.info("AI analysis complete", extra={
+                'hospital': shortage['hospital'],
+                'blood_group': shortage['blood_group'],
+                'urgency_level': shortage['ai_analysis']['urgency_level'],
+                'donors_to_contact': shortage['ai_analysis']['donors_to_contact']})
+        return shortages_detected
+
+    def handle_shortage(self, event: Dict) -> List[Dict]:
+        """Dispatcher entry point: handles this event plus anything queued behind it."""
+        return self.process_shortages([event] + self.inventory.drain(lambda queued: queued))
+
+    def publish_inventory(self, inventory_data: Dict[str, Dict]) -> None:
+        """Feeds a set of readings into the inventory change feed."""
+        for blood_group, data in inventory_data.items():
+            self.inventory.update(self.hospital, blood_group, data['current_units'])
+
     def run_monitoring_cycle(self) -> Dict:
         cycle_start = datetime.now()
-        print(f"\n🔍 Starting AI monitoring cycle at {cycle_start.strftime('%Y-%m-%d %H:%M:%S')}")
-
-        inventory_data = self.simulate_blood_inventory_check()
-        shortages_detected, outreach_results = [], []
-
-        for blood_group, data in inventory_data.items():
-            if data['status'] == 'critical':
-                last_check_key = f"{blood_group}_last_outreach"
-                if (self.last_check.get(last_check_key) and 
-                    datetime.now() - self.last_check[last_check_key] < timedelta(minutes=30)):
-                    print(f"⏳ Skipping {blood_group} - recent outreach within 30 minutes")
-                    continue
-
-                print(f"🚨 CRITICAL SHORTAGE: {blood_group} - {data['current_units']}/{data['threshold']} units")
-
-                ai_analysis = self.analyze_shortage_with_ai(inventory_data, blood_group)
-                print(f"🤖 AI Analysis: Urgency {ai_analysis['urgency_level']}/10, "
-                      f"Contact {ai_analysis['donors_to_contact']} donors")
-
-                results = self.initiate_intelligent_outreach(blood_group, ai_analysis)
-                shortages_detected.append({
-                    'blood_group': blood_group,
-                    'shortage_data': data,
-                    'ai_analysis': ai_analysis,
-                    'outreach_results': results
-                })
-                outreach_results.extend(results)
-                self.last_check[last_check_key] = datetime.now()
+        logger.info("Starting AI monitoring cycle")
+
+        # Groups below threshold are queued by the inventory service, which
+        # debounces repeats and orders them by severity
+        self.publish_inventory(self.simulate_blood_inventory_check())
+        wall_start = time.perf_counter()
+        shortages_detected = self.process_shortages(self.inventory.drain(lambda event: event))
+        wall_clock = time.perf_counter() - wall_start
+        # What the same work would have cost one group at a time
+        serial_time = sum(shortage['outreach_seconds'] for shortage in shortages_detected)
+        outreach_results = [r for shortage in shortages_detected for r in shortage['outreach_results']]
 
         summary_report = self.generate_ai_summary_report(shortages_detected)
 
@@ -193,58 +318,63 @@ class GoogleAIBloodBankAgent:
             'total_outreach_attempts': len(outreach_results),
             'successful_contacts': len([r for r in outreach_results if r.get('status') == 'success']),
             'ai_summary': summary_report,
+            'wall_clock_seconds': round(wall_clock, 3),
+            'serial_seconds': round(serial_time, 3),
             'detailed_results': shortages_detected
         }
 
-        print(f"📊 Cycle Complete: {cycle_results['shortages_detected']} shortages, "
-              f"{cycle_results['successful_contacts']} successful contacts")
-        print(f"🤖 AI Summary:\n{summary_report}")
+        logger.info("Monitoring cycle complete", extra={
+            'shortages_detected': cycle_results['shortages_detected'],
+            'successful_contacts': cycle_results['successful_contacts'],
+            'wall_clock_seconds': cycle_results['wall_clock_seconds'],
+            'serial_seconds': cycle_results['serial_seconds'],
+            'ai_summary': summary_report})
 
         return cycle_results
 
-    def start_continuous_monitoring(self, check_interval_minutes: int = 15):
+    def start_event_driven(self):
+        """Handles shortages on the inventory dispatcher thread and returns."""
         self.monitoring_active = True
-        print(f"🚀 Continuous AI monitoring every {check_interval_minutes} minutes")
+        self._stop_event.clear()
+        self.inventory.start_dispatcher(self.handle_shortage)
+
+    def start_continuous_monitoring(self, check_interval_minutes: int = 15):
+        """Reacts to shortages as soon as the inventory feed reports them.
+
+        Outreach is driven by the dispatcher thread, not the interval. The
+        interval only paces the simulated readings that stand in for real
+        producers posting to /api/inventory/update.
+        """
+        self.start_event_driven()
+        logger.info("Event-driven AI monitoring started", extra={
+            'simulated_feed_interval_minutes': check_interval_minutes})
         try:
             while self.monitoring_active:
-                self.run_monitoring_cycle()
-                print(f"⏰ Next check in {check_interval_minutes} minutes...")
-                time.sleep(check_interval_minutes * 60)
+                self.publish_inventory(self.simulate_blood_inventory_check())
+                self._stop_event.wait(check_interval_minutes * 60)
         except KeyboardInterrupt:
-            print("\n⛔ Monitoring stopped by user")
-            self.monitoring_active = False
+            logger.info("Monitoring stopped by user")
         except Exception as e:
-            print(f"💥 Critical error in monitoring loop: {e}")
-            self.monitoring_active = False
+            logger.exception("Critical error in monitoring loop: %s", e)
+        finally:
+            self.stop_monitoring()
 
     def stop_monitoring(self):
         self.monitoring_active = False
-        print("🛑 Monitoring stopped")
-
-def job():
-    """Defines the single task the agent needs to perform."""
-    # We create a new agent instance for each run to keep it clean.
-    agent = GoogleAIBloodBankAgent(api_key=GENAI_API_KEY)
-    print("--- Running scheduled monitoring cycle ---")
-    agent.run_monitoring_cycle()
-    print("--- Cycle complete. Waiting for next scheduled run. ---")
-
-# --- Run Once for Testing ---
+        self._stop_event.set()
+        self.inventory.stop_dispatcher()
+        logger.info("Monitoring stopped")
+
+    def close(self):
+        """Stops monitoring and releases the outreach pool and HTTP session."""
+        if self.monitoring_active:
+            self.stop_monitoring()
+        self._outreach_pool.shutdown(wait=True)
+        self.http.close()
+
+# --- Run Continuously ---
 if __name__ == "__main__":
-    print("🚀 AI Agent Scheduler Started. First run is immediate.")
-    
-    # Run the job once right away
-    job() 
-    
-    # Schedule the job to run every 15 minutes and store it in a variable
-    scheduled_job = schedule.every(4).minutes.do(job)
-
-    # CORRECTED LINE: Get the next_run time from the job variable itself
-    print(f"✅ Job scheduled successfully. Next run at: {scheduled_job.next_run.strftime('%H:%M:%S')}")
-
-    try:
-        while True:
-            schedule.run_pending()
-            time.sleep(1)
-    except KeyboardInterrupt:
-        print("\n⛔ Scheduler stopped by user.")
\ No newline at end of file
+    configure_logging()
+    logger.info("AI agent started")
+    agent = GoogleAIBloodBankAgent(api_key=GENAI_API_KEY)
+    agent.start_continuous_monitoring(check_interval_minutes=4)
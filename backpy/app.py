@@ -1,154 +1,61 @@
-import pandas as pd
-import numpy as np
-import joblib
-from datetime import datetime
-from math import radians, sin, cos, sqrt, asin
+from datetime import datetime, timedelta
 from flask import Flask, request, jsonify
-from emergency_sos_system import SOS_BLUEPRINT, sos_system
-import requests
+from emergency_sos_system import SOS_BLUEPRINT, HOSPITAL_DATA
+from sos_events import sos_stream_server
+from inventory_service import INVENTORY_BLUEPRINT
+from agent_runtime import AGENT_BLUEPRINT
+from ai_agent_monitor import HOSPITAL_LOCATIONS
+from outreach_jobs import OUTREACH_BLUEPRINT
+from donor_replies import REPLIES_BLUEPRINT
+from suppression import SUPPRESSION_BLUEPRINT
+from bulk_import import IMPORT_BLUEPRINT
+from waitlist import WAITLIST_BLUEPRINT, waitlist
+from standing_queries import STANDING_BLUEPRINT, standing_queries
+from broadcast import BROADCAST_BLUEPRINT, broadcasts
 from update_donor_status import update_donor_record # <-- You 
 from flask_cors import CORS
-
-# -- Configuration Update in app.py ---
-# CPASS_URL is now the messaging endpoint# --- Configuration Update in app.py ---
-CPASS_URL = "https://api.twilio.com/2010-04-01/Accounts/AC7f54ae9012bfa1296d94fa3b73bc4f3c/Messages.json" # Make sure YOUR_ACCOUNT_SID is correct here too!
-
-# Replace with your actual credentials from the Twilio Console
-AUTH_SID = "AC7f54ae9012bfa1296d94fa3b73bc4f3c"  # <-- Your REAL Account SID
-AUTH_TOKEN = "7ea2777041e3341ceeb9978f36fbfc7e" # <-- Your REAL Auth Token (one long string)
-
-# Define the message template for outreach
-SMS_MESSAGE_TEMPLATE = (
-    "URGENT BLOOD DONOR NEEDED. Your blood group ({blood_group}) is urgently "
-    "required at a hospital near your location. Reply YES to accept or NO to decline. "
-    "Reply STOP to opt out. [Donor ID: {donor_id}]"
+import instrumentation
+import admission_control
+from instrumentation import stage
+from structured_logging import configure_logging, get_logger
+from serialization import frame_response, parse_fields
+from eligibility import DEFAULT_DONATION_TYPE
+from distance_tables import hospital_distances
+# Matching and outreach live in the service layer; routes below are thin adapters
+from matching_service import (
+    load_resources, find_top_blood_donors, find_best_organ_match, initiate_outreach,
+    record_donation, donors_becoming_eligible, update_donor_location, valid_donation_type,
 )
 
+logger = get_logger(__name__)
 
 # --- API Setup ---
+configure_logging()
 app = Flask(__name__)
 CORS(app,resources={r"/*":{"origins":"*"}})  # Enable CORS for all routes
 # Register SOS blueprint
 app.register_blueprint(SOS_BLUEPRINT)
-
-# --- Global Variables for Loaded Resources ---
-# These will hold the dataframes and models after load_resources() runs.
-blood_df = None
-blood_model = None
-blood_features = None
-organ_df = None
-
-# --- Resource Loading Function (The Fix for before_first_request) ---
-def load_resources():
-    """Loads all necessary data and models into memory once."""
-    global blood_df, blood_model, blood_features
-    global organ_df
-
-    print("Loading resources...")
-    try:
-        # Blood Donation Resources
-        blood_df = pd.read_csv('final_indian_blood_donor_dataset.csv')
-        blood_model = joblib.load('indian_donor_likelihood_model_v3.joblib')
-        blood_features = joblib.load('indian_model_features_v3.joblib')
-        
-        # Organ Donation Resources
-        organ_df = pd.read_csv('indian_organ_donor_dataset.csv')
-        
-        # Pre-process blood donor data
-        if 'last_donation_date' not in blood_df.columns:
-            blood_df['last_donation_date'] = blood_df['created_at']
-        blood_df['last_donation_date'] = pd.to_datetime(blood_df['last_donation_date'])
-        
-        print("All resources loaded successfully.")
-    except Exception as e:
-        # Critical error if files are missing or corrupted
-        print(f"FATAL ERROR LOADING RESOURCES: {e}")
-        raise
-
-# --- Utility Functions (Haversine Distance) ---
-
-def haversine(lat1, lon1, lat2, lon2):
-    """Calculates great-circle distance in kilometers using numpy for vectorization."""
-    R = 6371  # Earth radius in kilometers
-
-    # Use np.radians and np.sin/cos/sqrt for vectorization across Pandas Series
-    lat1, lon1, lat2, lon2 = map(np.radians, [lat1, lon1, lat2, lon2])
-    
-    dlon = lon2 - lon1
-    dlat = lat2 - lat1
-    a = np.sin(dlat/2.0)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon/2.0)**2
-    c = 2 * np.arcsin(np.sqrt(a))
-    
-    return R * c
-
-# --- Blood Donor Matching Logic ---
-
-def find_top_blood_donors(blood_group, hospital_lat, hospital_long, today_date, top_n=5):
-    """Finds top blood donors based on cooldown and suitability score."""
-    
-    # Use global data loaded previously
-    df_filtered = blood_df[blood_df['blood_group'] == blood_group].copy()
-    if df_filtered.empty: return pd.DataFrame()
-
-    # Cooldown Filter (Must be > 30 days since last donation)
-    COOLDOWN_PERIOD_DAYS = 30
-    df_filtered['days_since_last_donation'] = (today_date - df_filtered['last_donation_date']).dt.days
-    
-    df_eligible = df_filtered[
-        df_filtered['days_since_last_donation'] > COOLDOWN_PERIOD_DAYS
-    ].copy()
-    
-    if df_eligible.empty: return pd.DataFrame()
-
-    # 1. Prepare Features for ML Model Prediction
-    X = pd.DataFrame(0, index=df_eligible.index, columns=blood_features)
-    for col in ['months_since_first_donation', 'number_of_donation', 'pints_donated', 'latitude', 'longitude']:
-        if col in X.columns: X[col] = df_eligible[col]
-            
-    # One-hot encoding for city
-    for index, row in df_eligible.iterrows():
-        city_col = f"city_{row['city']}"
-        if city_col in X.columns: X.loc[index, city_col] = 1
-    
-    # 2. Predict Likelihood and Calculate Score
-    df_eligible['likelihood'] = blood_model.predict_proba(X)[:, 1]
-    df_eligible['distance_km'] = haversine(df_eligible['latitude'], df_eligible['longitude'], hospital_lat, hospital_long)
-    df_eligible['suitability_score'] = df_eligible['likelihood'] / (df_eligible['distance_km'] + 1)
-    
-    df_ranked = df_eligible.sort_values(by='suitability_score', ascending=False)
-    
-    result_cols = ['donor_id', 'name', 'latitude', 'longitude', 'contact_number', 'distance_km', 'likelihood', 'suitability_score']
-    return df_ranked[result_cols].head(top_n)
-
-# --- Organ Match Ranking Logic ---
-
-def find_best_organ_match(required_organ, recipient_lat, recipient_long, current_time_utc, top_n=5):
-    """Simplified version for demo - ignores time constraints"""
-    
-    # Use global data loaded previously
-    df_eligible = organ_df[
-        (organ_df['organ_available'] == required_organ) & 
-        (organ_df['donor_type'] == 'Deceased')
-    ].copy()
-    
-    if df_eligible.empty: 
-        return pd.DataFrame()
-    
-    # Calculate Distance only (ignore time constraints for demo)
-    df_eligible['distance_km'] = df_eligible.apply(
-        lambda row: haversine(row['latitude'], row['longitude'], recipient_lat, recipient_long), axis=1
-    )
-    
-    # Score based on HLA and distance only
-    df_eligible['suitability_score'] = (
-        df_eligible['hla_match_score'] * df_eligible['tissue_size_factor']
-    ) / (df_eligible['distance_km'] + 1)
-    
-    df_ranked = df_eligible.sort_values(by='suitability_score', ascending=False)
-    
-    result_cols = ['name', 'latitude', 'longitude', 'hospital_contact_number', 'hla_match_score', 'distance_km', 'suitability_score']
-    
-    return df_ranked[result_cols].head(top_n)
+app.register_blueprint(INVENTORY_BLUEPRINT)
+app.register_blueprint(AGENT_BLUEPRINT)
+app.register_blueprint(OUTREACH_BLUEPRINT)
+app.register_blueprint(REPLIES_BLUEPRINT)
+app.register_blueprint(SUPPRESSION_BLUEPRINT)
+app.register_blueprint(IMPORT_BLUEPRINT)
+app.register_blueprint(WAITLIST_BLUEPRINT)
+app.register_blueprint(STANDING_BLUEPRINT)
+app.register_blueprint(BROADCAST_BLUEPRINT)
+# Per-stage timings, Server-Timing headers, /metrics and the X-Profile hook
+instrumentation.init_app(app)
+admission_control.init_app(app)
+
+
+def register_hospitals():
+    """Registers the known hospitals so their queries use precomputed distance tables."""
+    # monitor.py's HOSPITAL_LOCATION is Mumbai Central, already in the agent's list
+    for key, site in HOSPITAL_LOCATIONS.items():
+        hospital_distances.register(key, site['lat'], site['lon'])
+    for site in HOSPITAL_DATA:
+        hospital_distances.register(site['name'], site['latitude'], site['longitude'])
 
 # --- API Endpoints ---
 
@@ -176,7 +83,7 @@ def blood_donor_endpoint():
     if results_df.empty:
         return jsonify({"message": "No eligible blood donors found."}), 200
         
-    return jsonify(results_df.to_dict('records'))
+    return _ranking_response(results_df, 'blood_donor_endpoint')
 
 
 @app.route('/api/organ/find-matches', methods=['GET'])
@@ -189,6 +96,8 @@ def organ_match_endpoint():
         lat = float(request.args.get('lat'))
         lon = float(request.args.get('lon'))
         current_time_utc = datetime.utcnow() 
+        # Optional recipient typing, e.g. hla=A2,A24,B7,B8,DR15,DR4
+        recipient_hla = request.args.get('hla')
         
         if not organ or lat is None or lon is None:
             return jsonify({"error": "Missing required parameters: organ, lat, or lon"}), 400
@@ -197,17 +106,39 @@ def organ_match_endpoint():
         return jsonify({"error": f"Invalid parameter format. Must be string for organ, float for lat/lon: {e}"}), 400
 
     # 2. Execute Logic
-    results_df = find_best_organ_match(organ, lat, lon, current_time_utc, top_n=5)
+    results_df = find_best_organ_match(organ, lat, lon, current_time_utc, top_n=5, recipient_hla=recipient_hla)
     
     # 3. Format Response
     if results_df.empty:
         return jsonify({"message": f"No eligible organ matches found for {organ}. Check viability time."}), 200
         
-    return jsonify(results_df.to_dict('records'))
+    return _ranking_response(results_df, 'organ_match_endpoint')
+
+
+@app.route('/api/blood/eligible-soon', methods=['GET'])
+def eligible_soon_endpoint():
+    """Donors whose cooldown ends within the next `days` (default 7), soonest first."""
+    try:
+        days = int(request.args.get('days', 7))
+        blood_group = request.args.get('blood_group')
+    except ValueError as e:
+        return jsonify({"error": f"Invalid parameter format. 'days' must be an integer: {e}"}), 400
+
+    today = datetime.today().replace(hour=0, minute=0, second=0, microsecond=0)
+    results_df = donors_becoming_eligible(today, today + timedelta(days=days), blood_group)
+    return _ranking_response(results_df, 'eligible_soon_endpoint')
 
 
+def _ranking_response(results_df, endpoint_name):
+    """Serialises a ranking result honouring the optional `fields` and `format` args."""
+    try:
+        fields = parse_fields(request.args.get('fields'), list(results_df.columns))
+        response_format = request.args.get('format', 'records')
+        with stage(endpoint_name, 'serialise'):
+            return frame_response(results_df, fields, response_format)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-# ... (all previous functions and imports are assumed to be above this) ...
 
 @app.route('/api/blood/initiate-call', methods=['POST'])
 def initiate_call_outreach():
@@ -219,60 +150,30 @@ def initiate_call_outreach():
         blood_group = data['blood_group']
         lat = data['lat']
         lon = data['lon']
+        hospital = data.get('hospital')
     except:
         return jsonify({"error": "Invalid or incomplete JSON input."}), 400
 
-    # 2. Generate Ranked List
-    today = datetime.today().replace(hour=0, minute=0, second=0, microsecond=0)
-    top_donors_df = find_top_blood_donors(blood_group, lat, lon, today, top_n=5)
-    
-    if top_donors_df.empty:
-        return jsonify({"status": "failed", "reason": "No eligible donors found."}), 200
+    # 2. Rank, then message donors in order until one SMS is queued
+    return jsonify(initiate_outreach(blood_group, lat, lon, hospital=hospital)), 200
 
-    # 3. Failover Loop and CPaaS Integration
-    for index, donor in top_donors_df.iterrows():
-        
-        message_body = SMS_MESSAGE_TEMPLATE.format(
-            blood_group=blood_group,
-            donor_id=donor['donor_id'] # Use Donor ID for easy tracking in the reply
-        )
-
-        try:
-            # --- CPaaS API Call (SMS Structure) ---
-            response = requests.post(
-                CPASS_URL,
-                auth=(AUTH_SID, AUTH_TOKEN),
-                data={
-                    'From': '+18623552189',         # Your assigned CPaaS source number
-                    'To': donor['contact_number'],  # Donor's number
-                    'Body': message_body            # The text message content
-                }
-            )
-            
-            # --- Check Response and Log ---
-            if response.status_code == 201: # Success code for message queued/sent
-                print(f"SUCCESS: SMS initiated for {donor['name']} ({donor['contact_number']}).")
-                
-                # IMPORTANT: SMS confirmation is based on the donor's REPLY (a webhook),
-                # but we treat successful SENDING as step 1 completion for the API.
-                return jsonify({
-                    "status": "success", 
-                    "donor_contacted": donor['name'], 
-                    "contact_number": donor['contact_number'],
-                    "rank_used": index + 1
-                }), 200
-            
-            else:
-                print(f"FAILOVER: CPaaS error {response.status_code} for {donor['name']}. Moving to next donor.")
-
-        except Exception as e:
-            print(f"CRITICAL ERROR during CPaaS request: {e}. Moving to next donor.")
-            continue # Move to the next donor in the loop
-            
-    # 4. Final Failover (If all 5 failed)
-    return jsonify({"status": "failed", "reason": "All top 5 donors failed to queue SMS."}), 200
 
+@app.route('/api/blood/initiate-call-enhanced', methods=['POST'])
+def initiate_call_outreach_enhanced():
+    """Outreach whose message tone follows the caller's urgency level (1-10)."""
+    try:
+        data = request.json
+        blood_group = data['blood_group']
+        lat = data['lat']
+        lon = data['lon']
+        urgency_level = data.get('urgency_level', 5)
+        ai_reasoning = data.get('ai_reasoning', '')
+        hospital = data.get('hospital')
+    except Exception as e:
+        return jsonify({"error": f"Invalid or incomplete JSON input: {e}"}), 400
 
+    return jsonify(initiate_outreach(blood_group, lat, lon, urgency_level, ai_reasoning,
+                                     hospital=hospital)), 200
 
 
 @app.route('/api/blood/confirm-donation', methods=['POST'])
@@ -285,15 +186,21 @@ def confirm_donation_endpoint():
         data = request.json
         donor_id = data.get('donor_id')
         pints = data.get('pints_donated', 1) # Default to 1 pint
+        donation_type = data.get('donation_type', DEFAULT_DONATION_TYPE)
         
         if not donor_id:
             return jsonify({"error": "Missing 'donor_id'."}), 400
+        # Checked before the CSV is touched, so a bad type cannot leave a half-recorded donation
+        if not valid_donation_type(donation_type):
+            return jsonify({"error": f"Unknown donation_type: {donation_type!r}"}), 400
 
         # Replace this function call with the actual imported function once integrated.
         # For this example, we'll assume the update logic is available:
         success = update_donor_record(donor_id, pints_donated=pints)
 
         if success:
+            # Keep the loaded table's eligibility in step with the CSV
+            record_donation(donor_id, donation_type=donation_type)
             return jsonify({
                 "status": "completed", 
                 "message": f"Record updated for donor {donor_id}. Cooldown activated."
@@ -308,15 +215,39 @@ def confirm_donation_endpoint():
         return jsonify({"error": f"Internal server error during confirmation: {e}"}), 500
 
 
+@app.route('/api/donors/<donor_id>/location', methods=['POST'])
+def donor_location_endpoint(donor_id):
+    """Moves a donor in the live matching tables (JSON body: lat, lon)."""
+    try:
+        data = request.json
+        lat = float(data['lat'])
+        lon = float(data['lon'])
+    except Exception as e:
+        return jsonify({"error": f"Invalid or incomplete JSON input: {e}"}), 400
+    if abs(lat) > 90 or abs(lon) > 180:
+        return jsonify({"error": "Coordinates out of range."}), 400
+
+    if not update_donor_location(donor_id, lat, lon):
+        return jsonify({"error": "Donor not found"}), 404
+    return jsonify({"donor_id": donor_id, "latitude": lat, "longitude": lon}), 200
+
+
 # --- Running the App ---
 if __name__ == '__main__':
     # Load resources once before starting the application
     try:
+        register_hospitals()
         load_resources()
+        waitlist.load()
+        standing_queries.load()
+        standing_queries.start()
+        sos_stream_server.start()
+        broadcasts.resume()
     except Exception:
         # If resources fail to load, the app cannot start
-        print("Application failed to start due to resource loading error.")
+        logger.critical("Application failed to start due to resource loading error")
         exit(1)
         
-    # Run the application
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    # Run the application. No reloader: it would re-run this block in a child process,
+    # which would resume the same broadcasts (messaging donors twice) and fight over the stream port.
+    app.run(debug=True, use_reloader=False, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -2,110 +2,14 @@
 
 # 1. ADD THESE IMPORTS TO YOUR app.py (at the top after existing imports):
 import google.generativeai as genai
-from threading import Thread
 import concurrent.futures
 
 # 2. ADD THESE CONFIGURATION VARIABLES (after existing config):
 GENAI_API_KEY = "YOUR_GOOGLE_AI_API_KEY"  # Get this from Google AI Studio
 genai.configure(api_key=GENAI_API_KEY)
 
-# 3. ADD THIS ENHANCED ENDPOINT TO REPLACE YOUR EXISTING /api/blood/initiate-call:
-
-@app.route('/api/blood/initiate-call-enhanced', methods=['POST'])
-def initiate_call_outreach_enhanced():
-    """
-    Enhanced version that includes AI analysis for urgency and decision making.
-    """
-    try:
-        data = request.json
-        blood_group = data['blood_group']
-        lat = data['lat']
-        lon = data['lon']
-        urgency_level = data.get('urgency_level', 5)  # Scale 1-10
-        ai_reasoning = data.get('ai_reasoning', '')
-        
-    except Exception as e:
-        return jsonify({"error": f"Invalid or incomplete JSON input: {e}"}), 400
-
-    # Generate enhanced message based on urgency
-    if urgency_level >= 8:
-        message_template = (
-            "🚨 CRITICAL BLOOD EMERGENCY 🚨 Your {blood_group} blood is URGENTLY needed "
-            "at a nearby hospital. IMMEDIATE response required. Reply YES to save a life or NO to decline. "
-            "Reply STOP to opt out. [Donor ID: {donor_id}] [Emergency Level: CRITICAL]"
-        )
-    elif urgency_level >= 6:
-        message_template = (
-            "URGENT BLOOD DONOR NEEDED. Your blood group ({blood_group}) is urgently "
-            "required at a hospital near your location. Reply YES to accept or NO to decline. "
-            "Reply STOP to opt out. [Donor ID: {donor_id}] [Emergency Level: HIGH]"
-        )
-    else:
-        message_template = SMS_MESSAGE_TEMPLATE  # Use your existing template
-
-    # Use existing donor finding logic
-    today = datetime.today().replace(hour=0, minute=0, second=0, microsecond=0)
-    top_donors_df = find_top_blood_donors(blood_group, lat, lon, today, top_n=5)
-    
-    if top_donors_df.empty:
-        return jsonify({"status": "failed", "reason": "No eligible donors found."}), 200
-
-    # Enhanced failover with AI-driven prioritization
-    contacted_donors = []
-    
-    for index, donor in top_donors_df.iterrows():
-        message_body = message_template.format(
-            blood_group=blood_group,
-            donor_id=donor['donor_id']
-        )
-
-        try:
-            response = requests.post(
-                CPASS_URL,
-                auth=(AUTH_SID, AUTH_TOKEN),
-                data={
-                    'From': '+18623552189',
-                    'To': donor['contact_number'],
-                    'Body': message_body
-                }
-            )
-            
-            contacted_donors.append({
-                'donor_id': donor['donor_id'],
-                'name': donor['name'],
-                'contact_number': donor['contact_number'],
-                'status': 'success' if response.status_code == 201 else 'failed',
-                'suitability_score': float(donor['suitability_score'])
-            })
-            
-            if response.status_code == 201:
-                print(f"SUCCESS: Enhanced SMS sent to {donor['name']} (Urgency: {urgency_level}/10)")
-                return jsonify({
-                    "status": "success", 
-                    "donor_contacted": donor['name'],
-                    "contact_number": donor['contact_number'],
-                    "urgency_level": urgency_level,
-                    "ai_reasoning": ai_reasoning,
-                    "rank_used": index + 1,
-                    "all_contacted": contacted_donors
-                }), 200
-            
-        except Exception as e:
-            contacted_donors.append({
-                'donor_id': donor['donor_id'],
-                'name': donor['name'],
-                'contact_number': donor['contact_number'],
-                'status': 'error',
-                'error': str(e),
-                'suitability_score': float(donor['suitability_score'])
-            })
-            continue
-            
-    return jsonify({
-        "status": "failed", 
-        "reason": "All top 5 donors failed to receive SMS.",
-        "all_contacted": contacted_donors
-    }), 200
+# 3. /api/blood/initiate-call-enhanced NOW LIVES IN app.py as a thin adapter over
+#    matching_service.initiate_outreach(blood_group, lat, lon, urgency_level, ai_reasoning).
 
 
 # 4. ADD THESE NEW ENDPOINTS TO YOUR app.py:
@@ -270,110 +174,9 @@ def trigger_emergency_sos():
         }), 500
 
 
-@app.route('/api/ai-agent/start-monitoring', methods=['POST'])
-def start_ai_monitoring():
-    """
-    Starts the Google AI agent for continuous blood bank monitoring.
-    """
-    try:
-        config = request.json or {}
-        check_interval = config.get('check_interval_minutes', 15)
-        
-        # Start monitoring in a separate thread
-        def run_ai_monitoring():
-            model = genai.GenerativeModel('gemini-pro')
-            monitoring_active = True
-            
-            while monitoring_active:
-                try:
-                    # Simulate inventory check (replace with real API)
-                    import random
-                    
-                    inventory_data = {}
-                    thresholds = {'O+': 20, 'O-': 15, 'A+': 25, 'A-': 12, 'B+': 20, 'B-': 10, 'AB+': 15, 'AB-': 8}
-                    
-                    shortages_detected = []
-                    
-                    for blood_group, threshold in thresholds.items():
-                        current_units = random.randint(5, 35)
-                        
-                        if current_units < threshold:
-                            print(f"🚨 AI AGENT: Shortage detected for {blood_group}")
-                            
-                            # AI Analysis
-                            shortage_severity = (threshold - current_units) / threshold
-                            
-                            prompt = f"""
-                            BLOOD SHORTAGE ANALYSIS:
-                            Blood Group: {blood_group}
-                            Current: {current_units} units
-                            Threshold: {threshold} units
-                            Shortage: {shortage_severity:.1%}
-                            
-                            Determine urgency (1-10) and recommend action. Respond with JSON:
-                            {{"urgency_level": X, "recommended_donors": Y, "reasoning": "..."}}
-                            """
-                            
-                            try:
-                                ai_response = model.generate_content(prompt)
-                                import json
-                                ai_analysis = json.loads(ai_response.text)
-                            except:
-                                ai_analysis = {"urgency_level": 7, "recommended_donors": 5, "reasoning": "Fallback analysis"}
-                            
-                            # Trigger autonomous outreach
-                            payload = {
-                                "blood_group": blood_group,
-                                "lat": 19.0760,  # Mumbai example
-                                "lon": 72.8777,
-                                "urgency_level": ai_analysis['urgency_level'],
-                                "ai_reasoning": ai_analysis['reasoning']
-                            }
-                            
-                            try:
-                                response = requests.post(
-                                    "http://127.0.0.1:5000/api/blood/initiate-call-enhanced",
-                                    json=payload,
-                                    timeout=30
-                                )
-                                
-                                if response.status_code == 200:
-                                    result = response.json()
-                                    print(f"✅ AI AGENT: Successfully contacted donor for {blood_group}")
-                                    shortages_detected.append({
-                                        'blood_group': blood_group,
-                                        'ai_analysis': ai_analysis,
-                                        'outreach_result': result
-                                    })
-                            except Exception as e:
-                                print(f"❌ AI AGENT: Outreach failed for {blood_group}: {e}")
-                    
-                    if shortages_detected:
-                        print(f"📊 AI AGENT: Monitoring cycle complete. {len(shortages_detected)} shortages addressed.")
-                    else:
-                        print("💚 AI AGENT: All blood levels adequate.")
-                    
-                    time.sleep(check_interval * 60)
-                    
-                except Exception as e:
-                    print(f"💥 AI AGENT ERROR: {e}")
-                    time.sleep(60)  # Wait 1 minute before retry
-        
-        # Start monitoring thread
-        monitoring_thread = Thread(target=run_ai_monitoring, daemon=True)
-        monitoring_thread.start()
-        
-        return jsonify({
-            "status": "success",
-            "message": f"AI monitoring started with {check_interval} minute intervals",
-            "timestamp": datetime.now().isoformat()
-        }), 200
-        
-    except Exception as e:
-        return jsonify({
-            "error": f"Failed to start AI monitoring: {str(e)}",
-            "timestamp": datetime.now().isoformat()
-        }), 500
+# /api/ai-agent/start-monitoring, /stop-monitoring and /health are served by
+# agent_runtime.AGENT_BLUEPRINT: the agent runs in-process as a managed service
+# and calls matching_service directly instead of POSTing back to this server.
 
 
 @app.route('/api/emergency/test-sms', methods=['POST'])
@@ -417,11 +220,15 @@ concurrent-futures  # For Python < 3.2 (usually built-in for newer versions)
 
 # === USAGE EXAMPLES ===
 
-# 1. Start AI Monitoring:
+# 1. Start AI Monitoring, then report inventory changes:
 """
 POST /api/ai-agent/start-monitoring
+{}
+
+POST /api/inventory/update
 {
-  "check_interval_minutes": 10
+  "hospital": "mumbai_central",
+  "levels": {"O-": 9, "A+": 30}
 }
 """
 
@@ -0,0 +1,393 @@
+import os
+import re
+import time
+import uuid
+import sqlite3
+import threading
+import concurrent.futures
+import numpy as np
+from datetime import datetime
+from typing import Dict, List, Optional
+from flask import Blueprint, request, jsonify
+import matching_service
+import messaging
+from inventory_store import BLOOD_GROUPS
+from waitlist import ABO_COMPATIBLE
+from donor_replies import reply_tracker
+from suppression import suppression
+from operator_auth import operator_request
+from sos_events import SOS_EVENTS_PATH, sos_events, stream_token
+from emergency_sos_system import sos_system
+from structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+# --- Broadcast Configuration ---
+BROADCAST_BLUEPRINT = Blueprint('broadcast', __name__)
+
+BROADCAST_PATH = os.environ.get('BROADCAST_PATH', 'broadcast.sqlite')
+DEFAULT_BROADCAST_RADIUS_KM = 10
+MAX_BROADCAST_RADIUS_KM = 100
+# Recipients checkpointed and handed to the router per step
+BROADCAST_BATCH_SIZE = 100
+# Provider pacing when the provider does not declare its own rate_limit
+BROADCAST_MESSAGES_PER_SECOND = 20
+# A batch no provider accepted is retried this many times before its recipients are failed
+BATCH_RETRIES = 5
+BATCH_RETRY_SECONDS = 5
+# Broadcasts run at most this many at a time on their own pool; their sends
+# use the router's bulk workers, never the pool hedged SOS alerts run on
+BROADCAST_WORKERS = 2
+# Longest place name put in the SMS body; anything but plain address characters is dropped
+MAX_PLACE_CHARS = 40
+
+BROADCAST_TEMPLATE = (
+    "MASS EMERGENCY: {blood_group}-compatible blood donors are urgently needed near {place}. "
+    "If you can donate now, reply YES. Reply STOP to opt out."
+)
+
+RUNNING, COMPLETED, CANCELLED = 'running', 'completed', 'cancelled'
+# Recipient states; SENDING is written before the provider call, so a crash
+# leaves those rows UNKNOWN on resume rather than messaging anyone twice
+PENDING, SENDING, SENT, FAILED, UNKNOWN, DUPLICATE = 'pending', 'sending', 'sent', 'failed', 'unknown', 'duplicate'
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS broadcasts (broadcast_id TEXT PRIMARY KEY, blood_group TEXT, lat REAL, lon REAL, "
+    "radius_km REAL, body TEXT, sos_id TEXT, status TEXT, total INTEGER, created_at TEXT, finished_at TEXT)",
+    "CREATE TABLE IF NOT EXISTS broadcast_recipients (broadcast_id TEXT, rank INTEGER, donor_id TEXT, "
+    "contact_number TEXT, status TEXT, provider TEXT, message_id TEXT, PRIMARY KEY (broadcast_id, rank))",
+    "CREATE INDEX IF NOT EXISTS broadcast_recipients_status ON broadcast_recipients (broadcast_id, status, rank)",
+)
+BROADCAST_FIELDS = ('broadcast_id', 'blood_group', 'lat', 'lon', 'radius_km', 'body', 'sos_id', 'status', 'total',
+                    'created_at', 'finished_at')
+
+# Red-cell compatibility: ABO as for organs, and Rh+ donors only give to Rh+ recipients
+RED_CELL_COMPATIBLE = ABO_COMPATIBLE & np.array(
+    [[donor.endswith('-') or recipient.endswith('+') for recipient in BLOOD_GROUPS] for donor in BLOOD_GROUPS])
+
+
+def stream_id(broadcast_id: str) -> str:
+    """The event stream a broadcast reports progress on, separate from any SOS stream."""
+    return f"broadcast_{broadcast_id}"
+
+
+def events_url(broadcast_id: str) -> str:
+    stream = stream_id(broadcast_id)
+    return f"{SOS_EVENTS_PATH}{stream}?token={stream_token(stream)}"
+
+
+def clean_place(place: Optional[str]) -> str:
+    """Place name safe to put in the SMS body: letters, digits and basic punctuation, truncated."""
+    place = re.sub(r"[^\w ,.\-]", '', place or '', flags=re.ASCII)
+    place = ' '.join(place.split())[:MAX_PLACE_CHARS].strip()
+    return place or 'your location'
+
+
+class RateLimiter:
+    """Blocking token bucket; acquire(n) sleeps until n messages fit the rate."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, n: int = 1) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            # Taking more than is available reserves future tokens; later callers queue behind
+            self.tokens -= n
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class BroadcastManager:
+    """Geofenced mass SOS broadcasts to every compatible donor within a radius.
+
+    Recipients come from one radius query on the blood donor grid index,
+    filtered to compatible groups and donors who are eligible and not
+    suppressed, nearest first. The whole list is checkpointed to SQLite up
+    front; sending then walks it in batches, each marked as sending before
+    the provider call and as sent or failed after it. Batches go through
+    the message router's batch path (bulk APIs where a provider has one),
+    paced by a token bucket per provider. A restart resumes running
+    broadcasts from the first pending recipient. Progress goes to the
+    broadcast's own event stream (stream_id()), which closes when the
+    broadcast completes or is cancelled.
+    """
+
+    def __init__(self, path: str = BROADCAST_PATH, router: Optional[messaging.MessageRouter] = None,
+                 batch_size: int = BROADCAST_BATCH_SIZE, workers: int = BROADCAST_WORKERS):
+        self.path = path
+        self.router = router
+        self.batch_size = batch_size
+        # Opened by resume() or the first query, not at import
+        self._conn: Optional[sqlite3.Connection] = None
+        self._open_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._limiters: Dict[str, RateLimiter] = {}
+        self._cancelled = set()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='broadcast')
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """The SQLite connection, opened (and the schema created) on first use."""
+        if self._conn is None:
+            with self._open_lock:
+                if self._conn is None:
+                    conn = sqlite3.connect(self.path, check_same_thread=False)
+                    for statement in SCHEMA:
+                        conn.execute(statement)
+                    self._conn = conn
+        return self._conn
+
+    # --- Recipients ---
+
+    def recipients(self, blood_group: str, lat: float, lon: float, radius_km: float, today=None) -> List[str]:
+        """Donor IDs of every compatible, contactable donor within `radius_km`, nearest first."""
+        today = today or datetime.today()
+        donors = matching_service.blood_donors
+        rows, _ = matching_service.blood_spatial.within(lat, lon, radius_km)
+        rows = rows[rows < len(donors)]
+        # Unknown groups are coded -1, which would index the last (AB-) column
+        rows = rows[donors.group[rows] >= 0]
+        compatible = RED_CELL_COMPATIBLE[:, BLOOD_GROUPS.index(blood_group)]
+        keep = (compatible[donors.group[rows]]
+                & matching_service.eligibility.eligible_mask(today)[rows]
+                & ~suppression.mask(today)[rows])
+        return [str(d) for d in donors.donor_id[rows[keep]]]
+
+    # --- Lifecycle ---
+
+    def start(self, blood_group: str, lat: float, lon: float, radius_km: float = DEFAULT_BROADCAST_RADIUS_KM,
+              place: str = 'your location', sos_id: Optional[str] = None) -> Dict:
+        if blood_group not in BLOOD_GROUPS:
+            raise ValueError(f"blood_group must be one of: {', '.join(BLOOD_GROUPS)}")
+        if not 0 < radius_km <= MAX_BROADCAST_RADIUS_KM:
+            raise ValueError(f"radius_km must be in (0, {MAX_BROADCAST_RADIUS_KM}]")
+        donor_ids = self.recipients(blood_group, lat, lon, radius_km)
+        broadcast = {
+            'broadcast_id': uuid.uuid4().hex[:12], 'blood_group': blood_group, 'lat': float(lat), 'lon': float(lon),
+            'radius_km': float(radius_km), 'body': BROADCAST_TEMPLATE.format(blood_group=blood_group, place=clean_place(place)),
+            'sos_id': sos_id, 'status': RUNNING, 'total': len(donor_ids),
+            'created_at': datetime.now().isoformat(timespec='seconds'), 'finished_at': None,
+        }
+        with self._lock, self.conn:
+            self.conn.execute(f"INSERT INTO broadcasts ({', '.join(BROADCAST_FIELDS)}) "
+                               f"VALUES ({', '.join('?' * len(BROADCAST_FIELDS))})",
+                               [broadcast[f] for f in BROADCAST_FIELDS])
+            self.conn.executemany(
+                "INSERT INTO broadcast_recipients (broadcast_id, rank, donor_id, status) VALUES (?, ?, ?, ?)",
+                ((broadcast['broadcast_id'], rank, donor_id, PENDING) for rank, donor_id in enumerate(donor_ids)))
+        logger.info("Broadcast started", extra={k: broadcast[k] for k in ('broadcast_id', 'blood_group', 'radius_km',
+                                                                            'total', 'sos_id')})
+        sos_events.open(stream_id(broadcast['broadcast_id']))
+        self._executor.submit(self._run_logged, broadcast['broadcast_id'])
+        return broadcast
+
+    def resume(self) -> List[str]:
+        """Restarts running broadcasts; recipients caught mid-send are never retried."""
+        with self._lock, self.conn:
+            self.conn.execute("UPDATE broadcast_recipients SET status = ? WHERE status = ?", (UNKNOWN, SENDING))
+            running = [row[0] for row in self.conn.execute(
+                "SELECT broadcast_id FROM broadcasts WHERE status = ? ORDER BY created_at", (RUNNING,))]
+        for broadcast_id in running:
+            self._executor.submit(self._run_logged, broadcast_id)
+        if running:
+            logger.info("Broadcasts resumed", extra={'broadcasts': len(running)})
+        return running
+
+    def cancel(self, broadcast_id: str) -> bool:
+        with self._lock, self.conn:
+            updated = self.conn.execute("UPDATE broadcasts SET status = ?, finished_at = ? "
+                                         "WHERE broadcast_id = ? AND status = ?",
+                                         (CANCELLED, datetime.now().isoformat(timespec='seconds'), broadcast_id,
+                                          RUNNING)).rowcount
+            if updated:
+                self._cancelled.add(broadcast_id)
+        if updated:
+            self._publish(broadcast_id, 'cancelled', final=True)
+        return bool(updated)
+
+    def status(self, broadcast_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self.conn.execute(f"SELECT {', '.join(BROADCAST_FIELDS)} FROM broadcasts WHERE broadcast_id = ?",
+                                     (broadcast_id,)).fetchone()
+            if row is None:
+                return None
+            counts = dict(self.conn.execute("SELECT status, COUNT(*) FROM broadcast_recipients "
+                                             "WHERE broadcast_id = ? GROUP BY status", (broadcast_id,)).fetchall())
+        broadcast = dict(zip(BROADCAST_FIELDS, row))
+        broadcast.pop('body')
+        broadcast['recipients'] = {state: counts.get(state, 0)
+                                   for state in (PENDING, SENDING, SENT, FAILED, UNKNOWN, DUPLICATE)}
+        return broadcast
+
+    # --- Sending ---
+
+    def _run_logged(self, broadcast_id: str) -> None:
+        try:
+            self._run(broadcast_id)
+        except Exception as e:
+            logger.exception("Broadcast failed: %s", e, extra={'broadcast_id': broadcast_id})
+
+    def _run(self, broadcast_id: str) -> None:
+        with self._lock:
+            row = self.conn.execute("SELECT body, sos_id FROM broadcasts WHERE broadcast_id = ?",
+                                     (broadcast_id,)).fetchone()
+            # Numbers already messaged by this broadcast, so shared phones get one alert
+            messaged = {number for (number,) in self.conn.execute(
+                "SELECT contact_number FROM broadcast_recipients WHERE broadcast_id = ? AND status IN (?, ?) "
+                "AND contact_number IS NOT NULL", (broadcast_id, SENT, UNKNOWN))}
+        body, sos_id = row
+        # Streams live in memory; a resumed broadcast reopens its own
+        sos_events.open(stream_id(broadcast_id))
+        retries = 0
+        while broadcast_id not in self._cancelled:
+            with self._lock:
+                batch = self.conn.execute(
+                    "SELECT rank, donor_id FROM broadcast_recipients WHERE broadcast_id = ? AND status = ? "
+                    "ORDER BY rank LIMIT ?", (broadcast_id, PENDING, self.batch_size)).fetchall()
+            if not batch:
+                self._finish(broadcast_id)
+                return
+            sent = self._send_batch(broadcast_id, batch, body, messaged)
+            if sent is None:
+                retries += 1
+                if retries <= BATCH_RETRIES:
+                    time.sleep(BATCH_RETRY_SECONDS)
+                    continue
+                self._mark(broadcast_id, [(FAILED, None, None, None, rank) for rank, _ in batch])
+            retries = 0
+            self._publish(broadcast_id, 'progress')
+
+    def _send_batch(self, broadcast_id: str, batch, body: str, messaged: set) -> Optional[int]:
+        """Sends one checkpointed batch; None if no provider took it (rows are left pending)."""
+        contacts = matching_service.blood_pii.hydrate([donor_id for _, donor_id in batch], ('contact_number',))
+        numbers = contacts['contact_number'].to_dict()
+        targets, skipped = [], []
+        for rank, donor_id in batch:
+            number = numbers.get(donor_id)
+            if not number or number in messaged:
+                skipped.append((DUPLICATE, number, None, None, rank))
+            else:
+                messaged.add(number)
+                targets.append((rank, donor_id, number))
+        self._mark(broadcast_id, skipped + [(SENDING, number, None, None, rank) for rank, _, number in targets])
+        if not targets:
+            return 0
+
+        router = self.router or messaging.router
+        result = router.send_batch([number for _, _, number in targets], body, before_send=self._pace)
+        if result['provider'] is None:
+            for _, _, number in targets:
+                messaged.discard(number)
+            self._mark(broadcast_id, [(PENDING, None, None, None, rank) for rank, _, _ in targets])
+            logger.warning("Broadcast batch not accepted: %s", result['error'], extra={'broadcast_id': broadcast_id})
+            return None
+
+        updates = []
+        for (rank, donor_id, number), message_id in zip(targets, result['message_ids']):
+            updates.append((SENT if message_id else FAILED, number, result['provider'], message_id, rank))
+            if message_id:
+                suppression.mark_messaged(donor_id)
+                reply_tracker.record_sent(donor_id, number, broadcast_id)
+        self._mark(broadcast_id, updates)
+        return sum(1 for u in updates if u[0] == SENT)
+
+    def _pace(self, provider: messaging.Provider, n: int) -> None:
+        limiter = self._limiters.get(provider.name)
+        if limiter is None:
+            limiter = self._limiters.setdefault(
+                provider.name, RateLimiter(provider.rate_limit or BROADCAST_MESSAGES_PER_SECOND))
+        limiter.acquire(n)
+
+    def _mark(self, broadcast_id: str, updates) -> None:
+        # updates: (status, contact_number, provider, message_id, rank)
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "UPDATE broadcast_recipients SET status = ?, contact_number = ?, provider = ?, message_id = ? "
+                "WHERE broadcast_id = ? AND rank = ?", [(*u[:4], broadcast_id, u[4]) for u in updates])
+
+    def _finish(self, broadcast_id: str) -> None:
+        with self._lock, self.conn:
+            self.conn.execute("UPDATE broadcasts SET status = ?, finished_at = ? WHERE broadcast_id = ? "
+                               "AND status = ?", (COMPLETED, datetime.now().isoformat(timespec='seconds'),
+                                                  broadcast_id, RUNNING))
+        logger.info("Broadcast finished", extra={'broadcast_id': broadcast_id,
+                                                 **self.status(broadcast_id)['recipients']})
+        self._publish(broadcast_id, 'completed', final=True)
+
+    def _publish(self, broadcast_id: str, event_type: str, final: bool = False) -> None:
+        stream = stream_id(broadcast_id)
+        if not sos_events.closed(stream):
+            sos_events.publish(stream, event_type, self.status(broadcast_id), final=final)
+
+
+# Global manager; resume() runs once donors are loaded
+broadcasts = BroadcastManager()
+
+
+def _broadcast_for_sos(sos_id: str, sos_data: Dict) -> None:
+    # Blood SOS requests with broadcast_radius_km also alert every compatible donor nearby; the SOS
+    # endpoint only lets that field through with the operator token. The caller's free-text
+    # address never reaches donors.
+    if sos_data.get('emergency_type') != 'blood' or not sos_data.get('broadcast_radius_km'):
+        return
+    location = sos_data['user_location']
+    try:
+        broadcast = broadcasts.start(sos_data.get('blood_group'), float(location['latitude']),
+                                     float(location['longitude']), float(sos_data['broadcast_radius_km']),
+                                     sos_id=sos_id)
+    except (KeyError, TypeError, ValueError) as e:
+        sos_events.publish(sos_id, 'broadcast', {'status': 'failed', 'error': str(e)})
+        return
+    # The SOS stream closes long before a broadcast ends; point its subscribers at the broadcast's stream
+    sos_events.publish(sos_id, 'broadcast', {**broadcasts.status(broadcast['broadcast_id']),
+                                             'events_url': events_url(broadcast['broadcast_id'])})
+
+
+sos_system.subscribe(_broadcast_for_sos)
+
+# --- Flask API Endpoints ---
+
+@BROADCAST_BLUEPRINT.route('/api/emergency/broadcast', methods=['POST'])
+def start_broadcast():
+    """Alerts every compatible donor within radius_km (JSON: blood_group, lat, lon, optional radius_km, place).
+
+    Needs 'Authorization: Bearer <OPERATOR_API_TOKEN>'. The response carries
+    an events_url for following progress on the broadcast's event stream.
+    """
+    if not operator_request():
+        return jsonify({"error": "Unauthorized"}), 401
+    data = request.get_json(silent=True) or {}
+    try:
+        broadcast = broadcasts.start(data['blood_group'], float(data['lat']), float(data['lon']),
+                                     radius_km=float(data.get('radius_km', DEFAULT_BROADCAST_RADIUS_KM)),
+                                     place=data.get('place', 'your location'), sos_id=data.get('sos_id'))
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid or incomplete JSON input: {e}"}), 400
+    return jsonify({**broadcasts.status(broadcast['broadcast_id']),
+                    'events_url': events_url(broadcast['broadcast_id'])}), 202
+
+
+@BROADCAST_BLUEPRINT.route('/api/emergency/broadcast/<broadcast_id>', methods=['GET'])
+def get_broadcast(broadcast_id):
+    broadcast = broadcasts.status(broadcast_id)
+    if not broadcast:
+        return jsonify({"error": "Broadcast not found"}), 404
+    return jsonify(broadcast), 200
+
+
+@BROADCAST_BLUEPRINT.route('/api/emergency/broadcast/<broadcast_id>', methods=['DELETE'])
+def cancel_broadcast(broadcast_id):
+    if not operator_request():
+        return jsonify({"error": "Unauthorized"}), 401
+    if not broadcasts.cancel(broadcast_id):
+        return jsonify({"error": "No running broadcast with this ID"}), 404
+    return jsonify(broadcasts.status(broadcast_id)), 200
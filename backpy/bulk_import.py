@@ -0,0 +1,209 @@
+import sys
+import time
+import numpy as np
+import pandas as pd
+from typing import Dict, Iterable, Optional, Tuple
+from flask import Blueprint, request, jsonify
+import matching_service
+from donor_replies import normalize_number
+from inventory_store import BLOOD_GROUPS
+from operator_auth import operator_request
+from update_donor_status import DATASET_LOCK
+from structured_logging import configure_logging, get_logger
+
+logger = get_logger(__name__)
+
+# --- Bulk Import Configuration ---
+IMPORT_BLUEPRINT = Blueprint('bulk_import', __name__)
+
+IMPORT_CHUNK_ROWS = 50_000
+
+# Per registry: required columns, defaults for optional ones, dedupe keys
+REGISTRIES = {
+    'blood': {
+        'required': ['donor_id', 'name', 'contact_number', 'city', 'blood_group'],
+        'defaults': {'availability': 'Yes', 'months_since_first_donation': 0,
+                     'number_of_donation': 0, 'pints_donated': 0},
+        'dedupe_on': ('donor_id', 'contact_number'),
+        'contact_column': 'contact_number',
+    },
+    'organ': {
+        'required': ['donor_id', 'name', 'donor_type', 'organ_available', 'blood_group',
+                     'time_available_utc', 'city', 'hospital_contact_number'],
+        'defaults': {'hla_match_score': 0.0, 'tissue_size_factor': 1.0, 'contact_method': 'Call Center'},
+        # Hospitals share contact numbers, so organ rows dedupe on donor_id only
+        'dedupe_on': ('donor_id',),
+        'contact_column': 'hospital_contact_number',
+    },
+}
+
+
+class Gazetteer:
+    """Offline city -> (lat, lon) lookup built from the registries already loaded."""
+
+    def __init__(self, coordinates: Dict[str, Tuple[float, float]]):
+        self.coordinates = coordinates
+
+    @classmethod
+    def from_frames(cls, *frames: Optional[pd.DataFrame]) -> 'Gazetteer':
+        located = pd.concat([f[['city', 'latitude', 'longitude']] for f in frames if f is not None])
+        means = located.dropna().groupby(located['city'].str.strip().str.lower())[['latitude', 'longitude']].mean()
+        return cls({city: (row.latitude, row.longitude) for city, row in means.iterrows()})
+
+    def geocode(self, chunk: pd.DataFrame) -> np.ndarray:
+        """Fills missing coordinates from the city centroid; returns the rows it filled."""
+        for col in ('latitude', 'longitude'):
+            if col not in chunk.columns:
+                chunk[col] = np.nan
+        missing = (chunk['latitude'].isna() | chunk['longitude'].isna()).to_numpy()
+        if missing.any():
+            cities = chunk.loc[missing, 'city'].str.strip().str.lower()
+            lookup = pd.DataFrame.from_dict(self.coordinates, orient='index', columns=['latitude', 'longitude'])
+            found = lookup.reindex(cities)
+            chunk.loc[missing, 'latitude'] = found['latitude'].to_numpy()
+            chunk.loc[missing, 'longitude'] = found['longitude'].to_numpy()
+        filled = missing & chunk['latitude'].notna().to_numpy()
+        return filled
+
+
+def _validate(chunk: pd.DataFrame, registry: Dict) -> Tuple[pd.DataFrame, Dict[str, int]]:
+    """Drops invalid rows; returns the survivors and rejection counts by reason."""
+    missing_columns = [c for c in registry['required'] if c not in chunk.columns]
+    if missing_columns:
+        raise ValueError(f"Missing required column(s): {', '.join(missing_columns)}")
+
+    checks = {
+        'missing_required': chunk[registry['required']].isna().any(axis=1).to_numpy(),
+        'invalid_blood_group': ~chunk['blood_group'].isin(BLOOD_GROUPS).to_numpy(),
+    }
+    if 'latitude' in chunk.columns and 'longitude' in chunk.columns:
+        lat = pd.to_numeric(chunk['latitude'], errors='coerce')
+        lon = pd.to_numeric(chunk['longitude'], errors='coerce')
+        checks['invalid_coordinates'] = ((lat.abs() > 90) | (lon.abs() > 180)).to_numpy()
+        chunk['latitude'], chunk['longitude'] = lat, lon
+    if 'time_available_utc' in chunk.columns:
+        checks['invalid_time'] = pd.to_datetime(chunk['time_available_utc'], errors='coerce').isna().to_numpy()
+
+    rejected = np.zeros(len(chunk), dtype=bool)
+    counts = {}
+    for reason, bad in checks.items():
+        # Each row is counted under the first check it fails
+        bad = bad & ~rejected
+        if bad.any():
+            counts[reason] = int(bad.sum())
+        rejected |= bad
+    return chunk[~rejected].copy(), counts
+
+
+def _dedupe_keys(values: pd.Series, column: str, registry: Dict) -> pd.Series:
+    keys = values.astype(str).str.strip()
+    if column == registry['contact_column']:
+        keys = keys.map(normalize_number)
+    return keys
+
+
+def import_registry(source, kind: str = 'blood', chunksize: int = IMPORT_CHUNK_ROWS,
+                    dedupe_on: Optional[Iterable[str]] = None, persist: bool = True) -> Dict:
+    """Streams a CSV into the live blood or organ registry.
+
+    Rows are read `chunksize` at a time, validated, geocoded from the city
+    gazetteer when coordinates are missing, deduped against the live registry
+    and earlier chunks, then appended to the in-memory table and its indexes
+    (and to the dataset CSV when `persist`). Memory is bounded by the chunk
+    size plus one hashed key set per dedupe column.
+    """
+    if kind not in REGISTRIES:
+        raise ValueError(f"Unknown registry '{kind}'. Use one of: {', '.join(REGISTRIES)}")
+    registry = REGISTRIES[kind]
+    dedupe_on = tuple(dedupe_on or registry['dedupe_on'])
+    if matching_service.blood_pii is None or matching_service.organ_df is None:
+        raise RuntimeError("Resources are not loaded; call load_resources() first")
+    donors = matching_service.blood_donors
+    if kind == 'blood':
+        append, dataset = matching_service.append_blood_donors, matching_service.BLOOD_DATASET_PATH
+        # Contact numbers are PII, so they come from the PII store rather than the hot arrays
+        existing = {'donor_id': pd.Series(donors.donor_id),
+                    'contact_number': pd.Series(matching_service.blood_pii.values('contact_number'))}
+    else:
+        append, dataset = matching_service.append_organ_donors, matching_service.ORGAN_DATASET_PATH
+        existing = matching_service.organ_df
+
+    gazetteer = Gazetteer.from_frames(donors.frame(np.arange(len(donors))), matching_service.organ_df)
+    seen = {column: set(_dedupe_keys(existing[column], column, registry)) for column in dedupe_on}
+    # Columns as they appear in the dataset file (derived columns are not persisted)
+    file_columns = list(pd.read_csv(dataset, nrows=0).columns) if persist else None
+
+    report = {'registry': kind, 'rows_read': 0, 'rows_imported': 0, 'geocoded': 0,
+              'duplicates': 0, 'rejected': {}}
+    started = time.perf_counter()
+    for chunk in pd.read_csv(source, chunksize=chunksize, dtype={'donor_id': str, registry['contact_column']: str}):
+        report['rows_read'] += len(chunk)
+        chunk, rejected = _validate(chunk, registry)
+        for reason, count in rejected.items():
+            report['rejected'][reason] = report['rejected'].get(reason, 0) + count
+
+        report['geocoded'] += int(gazetteer.geocode(chunk).sum())
+        located = chunk['latitude'].notna().to_numpy()
+        if not located.all():
+            report['rejected']['ungeocodable'] = report['rejected'].get('ungeocodable', 0) + int((~located).sum())
+            chunk = chunk[located]
+
+        duplicate = np.zeros(len(chunk), dtype=bool)
+        keys = {column: _dedupe_keys(chunk[column], column, registry) for column in dedupe_on}
+        for column, values in keys.items():
+            duplicate |= (values.isin(seen[column]) | values.duplicated()).to_numpy()
+        report['duplicates'] += int(duplicate.sum())
+        chunk = chunk[~duplicate].copy()
+        if chunk.empty:
+            continue
+        for column, values in keys.items():
+            seen[column].update(values[~duplicate])
+
+        for column, default in registry['defaults'].items():
+            chunk[column] = chunk[column].fillna(default) if column in chunk.columns else default
+
+        append(chunk)
+        if persist:
+            with DATASET_LOCK:
+                chunk.reindex(columns=file_columns).to_csv(dataset, mode='a', header=False, index=False)
+        report['rows_imported'] += len(chunk)
+        logger.info("Import chunk appended", extra={'registry': kind, 'rows_imported': report['rows_imported']})
+
+    elapsed = time.perf_counter() - started
+    report['elapsed_seconds'] = round(elapsed, 3)
+    report['rows_per_second'] = round(report['rows_read'] / elapsed, 1) if elapsed else None
+    logger.info("Import finished", extra=report)
+    return report
+
+# --- Flask API Endpoints ---
+
+@IMPORT_BLUEPRINT.route('/api/import/<kind>', methods=['POST'])
+def import_endpoint(kind):
+    """Multipart upload ('file') of a blood or organ registry CSV.
+
+    Needs 'Authorization: Bearer <OPERATOR_API_TOKEN>': rows go straight into
+    the live matching tables and the master CSV.
+    """
+    if not operator_request():
+        return jsonify({"error": "Unauthorized"}), 401
+    upload = request.files.get('file')
+    if upload is None:
+        return jsonify({"error": "Missing CSV upload in 'file'."}), 400
+    try:
+        chunksize = int(request.args.get('chunksize', IMPORT_CHUNK_ROWS))
+        if chunksize <= 0:
+            raise ValueError("chunksize must be a positive integer")
+        report = import_registry(upload.stream, kind, chunksize=chunksize)
+    except ValueError as e:
+        return jsonify({"error": f"Import rejected: {e}"}), 400
+    except RuntimeError as e:
+        # Resources not loaded yet; the caller can retry once start-up finishes
+        return jsonify({"error": str(e)}), 503
+    return jsonify(report), 200
+
+
+if __name__ == '__main__':
+    # Usage: python bulk_import.py <blood|organ> <path.csv>
+    configure_logging()
+    matching_service.load_resources()
+    import_registry(sys.argv[2], sys.argv[1])
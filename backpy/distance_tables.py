@@ -0,0 +1,200 @@
+import os
+import re
+import zlib
+import atexit
+import threading
+import numpy as np
+from typing import Dict, Optional, Tuple
+from spatial_index import haversine_km
+from structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+# --- Distance Table Configuration ---
+DISTANCE_TABLES_DIR = os.environ.get('DISTANCE_TABLES_DIR', 'distance_tables')
+# Requests carry hospital coordinates, not keys; ~10 m is the same site
+COORDINATE_DECIMALS = 4
+# Changed tables are written this long after the first change, not only at exit
+FLUSH_DELAY_SECONDS = float(os.environ.get('DISTANCE_TABLES_FLUSH_SECONDS', 30))
+
+
+def _coordinate_key(lat: float, lon: float) -> Tuple[float, float]:
+    return round(float(lat), COORDINATE_DECIMALS), round(float(lon), COORDINATE_DECIMALS)
+
+
+def _fingerprint(lat: np.ndarray, lon: np.ndarray) -> int:
+    """Cheap checksum of a point set, so a persisted table is only reused for the same rows."""
+    return zlib.crc32(lon.tobytes(), zlib.crc32(lat.tobytes()))
+
+
+class HospitalDistanceTables:
+    """Precomputed distances from each registered hospital to every donor row.
+
+    Per hospital and per table kind ('blood' rows of the donor arrays,
+    'organ' rows of organ_df) this holds a float32 distance vector aligned
+    with the table and an int32 row order, nearest first. A query from a
+    registered hospital reads distances[rows] instead of running haversine.
+    Appended rows are merged into the order with one searchsorted, and a
+    moved row is re-slotted, so neither needs a full re-sort. Vectors and
+    point sets are replaced rather than resized or written in place, so a
+    reader holding one keeps a consistent view. Changed tables are persisted
+    per hospital FLUSH_DELAY_SECONDS after the first change (and at exit) and
+    reused on restart when the rows they were built from are unchanged.
+    """
+
+    def __init__(self, directory: Optional[str] = DISTANCE_TABLES_DIR):
+        self.directory = directory
+        self.hospitals: Dict[str, Tuple[float, float]] = {}
+        self._by_coordinates: Dict[Tuple[float, float], str] = {}
+        self._points: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._distance: Dict[Tuple[str, str], np.ndarray] = {}
+        self._order: Dict[Tuple[str, str], np.ndarray] = {}
+        self._dirty = set()
+        self._flush_timer: Optional[threading.Timer] = None
+        self._lock = threading.RLock()
+
+    # --- Hospitals and tables ---
+
+    def register(self, key: str, lat: float, lon: float) -> None:
+        """Adds a hospital and builds its tables for every kind already loaded."""
+        with self._lock:
+            self.hospitals[key] = (float(lat), float(lon))
+            self._by_coordinates[_coordinate_key(lat, lon)] = key
+            for kind in self._points:
+                self._build(key, kind)
+
+    def rebuild(self, kind: str, lat, lon) -> None:
+        """Replaces the point set of one table kind and rebuilds every hospital's tables for it."""
+        with self._lock:
+            # Copied: the caller's arrays must not alias the point set
+            self._points[kind] = (np.array(lat, dtype=np.float32), np.array(lon, dtype=np.float32))
+            for key in self.hospitals:
+                self._build(key, kind)
+        logger.info("Distance tables built", extra={'kind': kind, 'rows': len(self._points[kind][0]),
+                                                    'hospitals': len(self.hospitals)})
+
+    def _build(self, key: str, kind: str) -> None:
+        lat, lon = self._points[kind]
+        fingerprint = _fingerprint(lat, lon)
+        saved = self._load(key, kind, fingerprint)
+        if saved is not None:
+            self._distance[key, kind], self._order[key, kind] = saved
+            return
+        h_lat, h_lon = self.hospitals[key]
+        distance = haversine_km(lat.astype(np.float64), lon.astype(np.float64), h_lat, h_lon).astype(np.float32)
+        self._distance[key, kind] = distance
+        self._order[key, kind] = np.argsort(distance, kind='stable').astype(np.int32)
+        self._mark_dirty(key)
+
+    def extend(self, kind: str, lat, lon) -> None:
+        """Adds distances for rows appended to the end of a table."""
+        lat = np.asarray(lat, dtype=np.float32)
+        lon = np.asarray(lon, dtype=np.float32)
+        with self._lock:
+            if kind not in self._points:
+                return
+            old_lat, old_lon = self._points[kind]
+            start = len(old_lat)
+            rows = np.arange(start, start + len(lat), dtype=np.int32)
+            for key, (h_lat, h_lon) in self.hospitals.items():
+                distance = self._distance[key, kind]
+                order = self._order[key, kind]
+                added = haversine_km(lat.astype(np.float64), lon.astype(np.float64), h_lat, h_lon).astype(np.float32)
+                new_order = np.argsort(added, kind='stable')
+                # Ties go after existing rows, matching a stable sort of the whole vector
+                slots = np.searchsorted(distance[order], added[new_order], side='right')
+                self._order[key, kind] = np.insert(order, slots, rows[new_order])
+                self._distance[key, kind] = np.concatenate([distance, added])
+                self._mark_dirty(key)
+            self._points[kind] = (np.concatenate([old_lat, lat]), np.concatenate([old_lon, lon]))
+
+    def move(self, kind: str, row: int, lat: float, lon: float) -> None:
+        """Updates one row whose coordinates changed."""
+        with self._lock:
+            if kind not in self._points:
+                return
+            points_lat, points_lon = (points.copy() for points in self._points[kind])
+            points_lat[row], points_lon[row] = lat, lon
+            self._points[kind] = (points_lat, points_lon)
+            for key, (h_lat, h_lon) in self.hospitals.items():
+                distance = self._distance[key, kind].copy()
+                # From the stored float32 point, as _build() would compute it
+                distance[row] = haversine_km(float(points_lat[row]), float(points_lon[row]), h_lat, h_lon)
+                order = self._order[key, kind]
+                order = order[order != row]
+                slot = np.searchsorted(distance[order], distance[row], side='right')
+                self._order[key, kind] = np.insert(order, slot, row)
+                self._distance[key, kind] = distance
+                self._mark_dirty(key)
+
+    # --- Queries ---
+
+    def hospital_at(self, lat: float, lon: float) -> Optional[str]:
+        return self._by_coordinates.get(_coordinate_key(lat, lon))
+
+    def lookup(self, kind: str, lat: float, lon: float) -> Optional[np.ndarray]:
+        """The distance vector for a registered hospital at (lat, lon), else None."""
+        key = self.hospital_at(lat, lon)
+        if key is None:
+            return None
+        return self._distance.get((key, kind))
+
+    def near(self, key: str, kind: str, radius_km: float) -> Tuple[np.ndarray, np.ndarray]:
+        """(rows, distances_km) within `radius_km` of a registered hospital, nearest first."""
+        with self._lock:
+            distance, order = self._distance[key, kind], self._order[key, kind]
+        ordered = distance[order]
+        end = np.searchsorted(ordered, radius_km, side='right')
+        return order[:end], ordered[:end].astype(np.float64)
+
+    # --- Persistence ---
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, re.sub(r'[^A-Za-z0-9]+', '_', key).strip('_').lower() + '.npz')
+
+    def _load(self, key: str, kind: str, fingerprint: int):
+        if not self.directory or not os.path.exists(self._path(key)):
+            return None
+        with np.load(self._path(key)) as saved:
+            if (f'{kind}_distance' not in saved or int(saved[f'{kind}_fingerprint']) != fingerprint
+                    or tuple(saved['hospital']) != self.hospitals[key]):
+                return None
+            return saved[f'{kind}_distance'], saved[f'{kind}_order']
+
+    def _mark_dirty(self, key: str) -> None:
+        self._dirty.add(key)
+        if self.directory and self._flush_timer is None:
+            self._flush_timer = threading.Timer(FLUSH_DELAY_SECONDS, self._timed_flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def _timed_flush(self) -> None:
+        try:
+            self.flush()
+        except Exception as e:
+            logger.exception("Distance table flush failed: %s", e)
+
+    def flush(self) -> None:
+        """Writes the tables of every hospital that changed since the last flush."""
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if not self.directory or not self._dirty:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            for key in self._dirty:
+                arrays = {'hospital': np.array(self.hospitals[key])}
+                for kind, (lat, lon) in self._points.items():
+                    arrays[f'{kind}_distance'] = self._distance[key, kind]
+                    arrays[f'{kind}_order'] = self._order[key, kind]
+                    arrays[f'{kind}_fingerprint'] = np.int64(_fingerprint(lat, lon))
+                tmp = self._path(key) + '.tmp.npz'
+                np.savez(tmp, **arrays)
+                os.replace(tmp, self._path(key))
+            self._dirty.clear()
+
+
+# Global tables; matching_service keeps the point sets in step with its tables
+hospital_distances = HospitalDistanceTables()
+atexit.register(hospital_distances.flush)
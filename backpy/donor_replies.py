@@ -0,0 +1,192 @@
+import os
+import re
+import hmac
+import base64
+import hashlib
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Mapping, Optional
+from flask import Blueprint, request, jsonify, Response
+import messaging
+from outreach_jobs import outreach_jobs
+from structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+# --- Reply Webhook Configuration ---
+REPLIES_BLUEPRINT = Blueprint('replies', __name__)
+
+SENT, ACCEPTED, DECLINED, OPTED_OUT = 'sent', 'accepted', 'declined', 'opted_out'
+
+# First word of the reply -> state it moves the donor to
+REPLY_KEYWORDS = {
+    'YES': ACCEPTED, 'Y': ACCEPTED, 'ACCEPT': ACCEPTED,
+    'NO': DECLINED, 'N': DECLINED, 'DECLINE': DECLINED,
+    'STOP': OPTED_OUT, 'UNSUBSCRIBE': OPTED_OUT, 'CANCEL': OPTED_OUT, 'END': OPTED_OUT, 'QUIT': OPTED_OUT,
+}
+
+# Allowed transitions; anything else (e.g. a repeated YES) is a no-op.
+# DECLINED -> ACCEPTED is deliberate: a donor who said NO may change their
+# mind while the request is still open
+TRANSITIONS = {
+    SENT: {ACCEPTED, DECLINED, OPTED_OUT},
+    ACCEPTED: {OPTED_OUT},
+    DECLINED: {ACCEPTED, OPTED_OUT},
+    OPTED_OUT: set(),
+}
+
+# Donors may quote the ID from the outreach message, e.g. "YES a6a3f7fe55"
+DONOR_ID_PATTERN = re.compile(r"\b[0-9a-f]{10}\b")
+
+EMPTY_TWIML = '<?xml version="1.0" encoding="UTF-8"?><Response></Response>'
+
+SIGNATURE_HEADER = 'X-Twilio-Signature'
+# Public URL Twilio posts to, when it differs from what Flask sees behind a proxy
+SMS_INBOUND_URL = os.environ.get('SMS_INBOUND_URL')
+
+
+def twilio_signature(auth_token: str, url: str, params: Mapping[str, str]) -> str:
+    """Twilio's request signature: base64 HMAC-SHA1 of the URL plus sorted form fields."""
+    payload = url + ''.join(f"{key}{params[key]}" for key in sorted(params))
+    digest = hmac.new(auth_token.encode(), payload.encode(), hashlib.sha1).digest()
+    return base64.b64encode(digest).decode()
+
+
+def valid_signature(auth_token: Optional[str], url: str, params: Mapping[str, str],
+                    signature: Optional[str]) -> bool:
+    """False when no token is configured, so an unconfigured webhook accepts nothing."""
+    if not auth_token or not signature:
+        return False
+    return hmac.compare_digest(twilio_signature(auth_token, url, params), signature)
+
+
+def normalize_number(number: str) -> str:
+    """Last ten digits, so '+91 8591768921' and '918591768921' correlate."""
+    return re.sub(r"\D", "", number or '')[-10:]
+
+
+def parse_reply(body: str) -> Optional[str]:
+    """Maps an SMS body to the state it requests, or None if unrecognised."""
+    words = (body or '').strip().upper().split()
+    return REPLY_KEYWORDS.get(words[0].strip('.!')) if words else None
+
+
+class ReplyTracker:
+    """Per-donor outreach state driven by inbound replies.
+
+    record_sent() indexes each queued message by donor and by phone number,
+    so an inbound reply resolves to its donor and outreach job with dict
+    lookups. Subscribers are called with every state transition.
+    """
+
+    def __init__(self):
+        self.states: Dict[str, Dict] = {}
+        self._by_number: Dict[str, List[str]] = {}
+        self._subscribers: List[Callable[[Dict], None]] = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback: Callable[[Dict], None]) -> None:
+        """Registers a callback invoked with every state transition."""
+        self._subscribers.append(callback)
+
+    def record_sent(self, donor_id: str, contact_number: str, job_id: str) -> None:
+        number = normalize_number(contact_number)
+        with self._lock:
+            previous = self.states.get(donor_id)
+            if previous and previous['state'] == OPTED_OUT:
+                return
+            self.states[donor_id] = {
+                'donor_id': donor_id,
+                'job_id': job_id,
+                'contact_number': contact_number,
+                'state': SENT,
+                'updated_at': datetime.now().isoformat(),
+            }
+            donors = self._by_number.setdefault(number, [])
+            if donor_id in donors:
+                donors.remove(donor_id)
+            donors.append(donor_id)
+
+    def resolve(self, from_number: str, body: str) -> Optional[str]:
+        """The donor a reply is from: a quoted donor ID wins, else the latest message to that number."""
+        donors = self._by_number.get(normalize_number(from_number), [])
+        quoted = DONOR_ID_PATTERN.search((body or '').lower())
+        if quoted and quoted.group() in donors:
+            return quoted.group()
+        return donors[-1] if donors else None
+
+    def handle_reply(self, from_number: str, body: str) -> Dict:
+        """Applies one inbound reply; returns what happened to it."""
+        new_state = parse_reply(body)
+        if new_state is None:
+            return {'status': 'ignored', 'reason': 'unrecognised reply'}
+
+        with self._lock:
+            donor_id = self.resolve(from_number, body)
+            entry = self.states.get(donor_id) if donor_id else None
+            if entry is None:
+                return {'status': 'ignored', 'reason': 'no outreach for this number'}
+            if new_state not in TRANSITIONS[entry['state']]:
+                return {'status': 'unchanged', 'donor_id': donor_id, 'state': entry['state']}
+            transition = {
+                'donor_id': donor_id,
+                'job_id': entry['job_id'],
+                'from_state': entry['state'],
+                'state': new_state,
+            }
+            entry['state'] = new_state
+            entry['updated_at'] = datetime.now().isoformat()
+
+        job = outreach_jobs.get(transition['job_id'])
+        if job is not None:
+            job.setdefault('replies', {})[donor_id] = new_state
+
+        logger.info("Donor reply applied", extra=transition)
+        for callback in self._subscribers:
+            try:
+                callback(transition)
+            except Exception as e:
+                logger.exception("Reply subscriber failed: %s", e)
+        return dict(transition, status='applied')
+
+    def get(self, donor_id: str) -> Optional[Dict]:
+        return self.states.get(donor_id)
+
+
+# Global tracker shared by the outreach loop and the webhook; matching_service
+# subscribes to apply opt-outs and acceptance holds
+reply_tracker = ReplyTracker()
+
+# --- Flask API Endpoints ---
+
+@REPLIES_BLUEPRINT.route('/api/sms/inbound', methods=['POST'])
+def sms_inbound():
+    """CPaaS inbound-message webhook (form fields From/Body).
+
+    Requests must carry a valid X-Twilio-Signature made with TWILIO_AUTH_TOKEN.
+    The signature covers the URL and form fields only, so other bodies
+    (e.g. JSON) are refused: their signature would not cover From or Body.
+    """
+    if request.mimetype != 'application/x-www-form-urlencoded':
+        return jsonify({"error": "Expected a form-encoded body"}), 415
+    params = request.form.to_dict()
+    if not valid_signature(messaging.TWILIO_AUTH_TOKEN, SMS_INBOUND_URL or request.url, params,
+                           request.headers.get(SIGNATURE_HEADER)):
+        logger.warning("Inbound SMS rejected: bad or missing signature")
+        return jsonify({"error": "Invalid signature"}), 403
+
+    from_number = params.get('From')
+    if not from_number:
+        return jsonify({"error": "Missing 'From'."}), 400
+
+    reply_tracker.handle_reply(from_number, params.get('Body', ''))
+    # The provider only needs a 200 and an empty TwiML document
+    return Response(EMPTY_TWIML, mimetype='application/xml')
+
+
+@REPLIES_BLUEPRINT.route('/api/sms/replies/<donor_id>', methods=['GET'])
+def get_reply_state(donor_id):
+    state = reply_tracker.get(donor_id)
+    if not state:
+        return jsonify({"error": "No outreach recorded for this donor"}), 404
+    return jsonify(state), 200
@@ -0,0 +1,195 @@
+import os
+import sys
+import sqlite3
+import threading
+import numpy as np
+import pandas as pd
+from typing import Dict, Iterable, List, Optional, Sequence
+from inventory_store import BLOOD_GROUPS
+from structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+# --- Donor Store Configuration ---
+DONOR_PII_PATH = os.environ.get('DONOR_PII_PATH', 'donor_pii.sqlite')
+
+# Personal data is kept out of the ranking arrays and fetched only for results
+PII_COLUMNS = ('name', 'email', 'contact_number')
+# Never read into the service at all
+EXCLUDED_COLUMNS = ('password',)
+# Stay under SQLite's bound-parameter limit when hydrating many donors
+HYDRATE_BATCH = 500
+
+# Numeric model inputs held in the hot arrays, with their storage types
+NUMERIC_COLUMNS = {
+    'months_since_first_donation': np.int16,
+    'number_of_donation': np.int16,
+    'pints_donated': np.int32,
+}
+
+
+class DonorColumns:
+    """Ranking-only donor data as typed, row-aligned NumPy arrays.
+
+    Blood groups are int8 codes into BLOOD_GROUPS, cities int16 codes into
+    `cities`, coordinates float32 and the last donation an int32 day number,
+    so a ranking scan touches a few bytes per donor instead of a row of
+    Python strings. Instances are never resized in place: extended() returns
+    a new instance, so a reader holding one always sees equal-length arrays.
+    """
+
+    def __init__(self, donor_id: np.ndarray, group: np.ndarray, city: np.ndarray, cities: List[str],
+                 latitude: np.ndarray, longitude: np.ndarray, numeric: Dict[str, np.ndarray],
+                 last_donation_day: np.ndarray, sex: np.ndarray):
+        self.donor_id = donor_id
+        self.group = group
+        self.city = city
+        self.cities = cities
+        self.latitude = latitude
+        self.longitude = longitude
+        self.numeric = numeric
+        self.last_donation_day = last_donation_day
+        self.sex = sex
+        self.row_of: Dict[str, int] = {d: i for i, d in enumerate(donor_id)}
+
+    def __len__(self) -> int:
+        return len(self.donor_id)
+
+    @classmethod
+    def empty(cls) -> 'DonorColumns':
+        return cls.from_frame(pd.DataFrame(columns=['donor_id', 'blood_group', 'city', 'latitude', 'longitude',
+                                                    'last_donation_date', *NUMERIC_COLUMNS]))
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, cities: Optional[List[str]] = None) -> 'DonorColumns':
+        cities = list(cities or [])
+        known = {city: i for i, city in enumerate(cities)}
+        for city in pd.unique(df['city'].dropna()):
+            if city not in known:
+                known[city] = len(cities)
+                cities.append(city)
+        last = df['last_donation_date'].fillna(pd.Timestamp(0)).to_numpy(dtype='datetime64[D]').astype(np.int64)
+        return cls(
+            donor_id=df['donor_id'].to_numpy(dtype=object),
+            group=pd.Categorical(df['blood_group'], categories=BLOOD_GROUPS).codes.astype(np.int8),
+            city=df['city'].map(known).fillna(-1).to_numpy(dtype=np.int16),
+            cities=cities,
+            latitude=df['latitude'].to_numpy(dtype=np.float32),
+            longitude=df['longitude'].to_numpy(dtype=np.float32),
+            numeric={col: df[col].fillna(0).to_numpy(dtype=dtype) if col in df.columns
+                     else np.zeros(len(df), dtype=dtype) for col, dtype in NUMERIC_COLUMNS.items()},
+            last_donation_day=last.astype(np.int32),
+            sex=(df['sex'].fillna('U').astype(str).str.upper().str[0].to_numpy(dtype='<U1')
+                 if 'sex' in df.columns else np.full(len(df), 'U', dtype='<U1')),
+        )
+
+    def extended(self, df: pd.DataFrame) -> 'DonorColumns':
+        """A new instance with `df`'s rows appended."""
+        tail = DonorColumns.from_frame(df, self.cities)
+        return DonorColumns(
+            donor_id=np.concatenate([self.donor_id, tail.donor_id]),
+            group=np.concatenate([self.group, tail.group]),
+            city=np.concatenate([self.city, tail.city]),
+            cities=tail.cities,
+            latitude=np.concatenate([self.latitude, tail.latitude]),
+            longitude=np.concatenate([self.longitude, tail.longitude]),
+            numeric={col: np.concatenate([self.numeric[col], tail.numeric[col]]) for col in NUMERIC_COLUMNS},
+            last_donation_day=np.concatenate([self.last_donation_day, tail.last_donation_day]),
+            sex=np.concatenate([self.sex, tail.sex]),
+        )
+
+    def group_code(self, blood_group: str) -> int:
+        return BLOOD_GROUPS.index(blood_group) if blood_group in BLOOD_GROUPS else -2
+
+    def features(self, rows: np.ndarray, feature_names: Sequence[str]) -> np.ndarray:
+        """Model input matrix for `rows`: numeric columns, coordinates and city one-hots."""
+        X = np.zeros((len(rows), len(feature_names)), dtype=np.float64)
+        sources = dict(self.numeric, latitude=self.latitude, longitude=self.longitude)
+        city_column = np.full(len(self.cities) + 1, -1, dtype=np.int64)  # last slot: unknown city
+        for j, name in enumerate(feature_names):
+            if name in sources:
+                X[:, j] = sources[name][rows]
+            elif name.startswith('city_') and name[5:] in self.cities:
+                city_column[self.cities.index(name[5:])] = j
+        columns = city_column[self.city[rows]]
+        hot = columns >= 0
+        X[np.flatnonzero(hot), columns[hot]] = 1
+        return X
+
+    def frame(self, rows: np.ndarray) -> pd.DataFrame:
+        """Decoded hot columns for `rows` (no personal data)."""
+        cities = np.array(self.cities + [None], dtype=object)
+        groups = np.array(BLOOD_GROUPS + (None,), dtype=object)
+        return pd.DataFrame({
+            'donor_id': self.donor_id[rows],
+            'blood_group': groups[self.group[rows]],
+            'city': cities[self.city[rows]],
+            # float32 holds ~1 m precision; round so responses do not show float noise
+            'latitude': self.latitude[rows].astype(np.float64).round(5),
+            'longitude': self.longitude[rows].astype(np.float64).round(5),
+        }, index=rows)
+
+    def nbytes(self) -> int:
+        """Approximate memory held: the typed arrays plus the donor_id strings and row_of index.
+
+        donor_id is an object array, so its own nbytes is only the pointers;
+        the strings it points to and the row_of dict are counted separately.
+        """
+        arrays = [self.group, self.city, self.latitude, self.longitude, self.last_donation_day, self.sex,
+                  *self.numeric.values()]
+        ids = self.donor_id.nbytes + sum(sys.getsizeof(d) for d in self.donor_id)
+        return sum(a.nbytes for a in arrays) + ids + sys.getsizeof(self.row_of)
+
+
+class PIIStore:
+    """Donor personal data in a local SQLite file, read only to hydrate results."""
+
+    def __init__(self, path: str = DONOR_PII_PATH):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS donor_pii (donor_id TEXT PRIMARY KEY, "
+            + ", ".join(f"{col} TEXT" for col in PII_COLUMNS) + ")")
+        self._lock = threading.Lock()
+
+    def replace_all(self, df: pd.DataFrame) -> None:
+        """Rebuilds the table from the dataset (which stays the source of truth)."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM donor_pii")
+            self._insert(df)
+
+    def append(self, df: pd.DataFrame) -> None:
+        with self._lock, self._conn:
+            self._insert(df)
+
+    def _insert(self, df: pd.DataFrame) -> None:
+        columns = ['donor_id', *PII_COLUMNS]
+        values = df.reindex(columns=columns).astype(object).where(df.reindex(columns=columns).notna(), None)
+        self._conn.executemany(
+            f"INSERT OR REPLACE INTO donor_pii ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            values.itertuples(index=False, name=None))
+
+    def hydrate(self, donor_ids: Iterable[str], columns: Sequence[str] = ('name', 'contact_number')) -> pd.DataFrame:
+        """PII for `donor_ids`, indexed by donor_id (missing donors are absent)."""
+        donor_ids = list(donor_ids)
+        unknown = [c for c in columns if c not in PII_COLUMNS]
+        if unknown:
+            raise ValueError(f"Not a PII column: {', '.join(unknown)}")
+        if not donor_ids:
+            return pd.DataFrame(columns=list(columns))
+        rows = []
+        with self._lock:
+            for start in range(0, len(donor_ids), HYDRATE_BATCH):
+                batch = donor_ids[start:start + HYDRATE_BATCH]
+                rows += self._conn.execute(
+                    f"SELECT donor_id, {', '.join(columns)} FROM donor_pii "
+                    f"WHERE donor_id IN ({', '.join('?' * len(batch))})", batch).fetchall()
+        return pd.DataFrame(rows, columns=['donor_id', *columns]).set_index('donor_id')
+
+    def values(self, column: str) -> List[str]:
+        """Every stored value of one PII column (e.g. contact numbers for dedupe)."""
+        if column not in PII_COLUMNS:
+            raise ValueError(f"Not a PII column: {column}")
+        with self._lock:
+            return [row[0] for row in self._conn.execute(f"SELECT {column} FROM donor_pii")]
+
@@ -0,0 +1,146 @@
+import os
+import threading
+import numpy as np
+import pandas as pd
+from typing import Dict, Optional, Tuple
+from suppression import day_number
+from structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+# --- Eligibility Configuration ---
+DEFAULT_DONATION_TYPE = 'whole_blood'
+UNKNOWN_SEX = 'U'
+
+# Excel stores dates as days since this day (the sample CSV's created_at is one)
+EXCEL_EPOCH = '1899-12-30'
+
+# Minimum days between a donation and the donor's next one, by (donation type, sex).
+# '*' matches any value; an unknown sex falls back to the strictest rule for the type.
+RULE_SETS: Dict[str, Dict[Tuple[str, str], int]] = {
+    # NBTC (India) guidance
+    'nbtc': {
+        ('whole_blood', 'M'): 90,
+        ('whole_blood', 'F'): 120,
+        ('double_red_cells', '*'): 112,
+        ('platelets', '*'): 14,
+        ('plasma', '*'): 14,
+    },
+    # The original fixed cooldown (eligible once more than 30 days have passed)
+    'legacy': {
+        ('*', '*'): 31,
+    },
+}
+# The datasets have no sex or donation_type columns yet, under which 'nbtc' would
+# defer every donor by its strictest (120-day) rule; keep the baseline until they do
+ELIGIBILITY_RULE_SET = os.environ.get('ELIGIBILITY_RULE_SET', 'legacy')
+
+
+def parse_donation_dates(values: pd.Series) -> pd.Series:
+    """Datetimes from date strings or Excel serial day numbers (e.g. 42811), NaT if neither."""
+    numeric = pd.to_numeric(values, errors='coerce')
+    serial = pd.to_datetime(numeric, unit='D', origin=EXCEL_EPOCH)
+    text = pd.to_datetime(values.where(numeric.isna()), errors='coerce', format='mixed')
+    return serial.fillna(text)
+
+
+class EligibilityRules:
+    """Looks up deferral periods in one rule set."""
+
+    def __init__(self, rules: Dict[Tuple[str, str], int]):
+        self.rules = rules
+
+    @classmethod
+    def named(cls, name: str = ELIGIBILITY_RULE_SET) -> 'EligibilityRules':
+        try:
+            return cls(RULE_SETS[name])
+        except KeyError:
+            raise ValueError(f"Unknown eligibility rule set '{name}'")
+
+    def knows(self, donation_type) -> bool:
+        """Whether deferral_days() has a rule for this donation type."""
+        return isinstance(donation_type, str) and any(kind in (donation_type, '*') for kind, _ in self.rules)
+
+    def deferral_days(self, donation_type: str = DEFAULT_DONATION_TYPE, sex: str = UNKNOWN_SEX) -> int:
+        for key in ((donation_type, sex), (donation_type, '*'), ('*', sex), ('*', '*')):
+            if key in self.rules:
+                return self.rules[key]
+        candidates = [days for (kind, _), days in self.rules.items() if kind in (donation_type, '*')]
+        if not candidates:
+            raise ValueError(f"No eligibility rule for donation type '{donation_type}'")
+        return max(candidates)
+
+    def deferral_days_for(self, donation_types: np.ndarray, sexes: np.ndarray) -> np.ndarray:
+        """Vectorised deferral_days() over aligned arrays (one lookup per distinct pair)."""
+        pairs = pd.MultiIndex.from_arrays([donation_types, sexes])
+        codes, uniques = pd.factorize(pairs)
+        table = np.array([self.deferral_days(kind, sex) for kind, sex in uniques], dtype=np.int32)
+        return table[codes]
+
+
+class EligibilityIndex:
+    """next_eligible_date (int32 day numbers) for every donor, plus a date-sorted index.
+
+    Ranking compares the column against today's day number; upcoming
+    eligibility is a searchsorted over the sorted copy, rebuilt lazily after
+    donations are recorded.
+    """
+
+    def __init__(self, rules: Optional[EligibilityRules] = None):
+        self.rules = rules or EligibilityRules.named()
+        self.next_eligible = np.zeros(0, dtype=np.int32)
+        self._order = np.zeros(0, dtype=np.int64)
+        self._sorted = np.zeros(0, dtype=np.int32)
+        self._stale = False
+        self._lock = threading.Lock()
+
+    def compute(self, donors: pd.DataFrame) -> np.ndarray:
+        """Builds the column from last_donation_date and the optional donation_type/sex columns."""
+        next_eligible = self._next_eligible(donors)
+        with self._lock:
+            self.next_eligible = next_eligible
+            self._stale = True
+        return next_eligible
+
+    def extend(self, donors: pd.DataFrame) -> np.ndarray:
+        """Appends the column for rows added to the end of the donor table."""
+        next_eligible = self._next_eligible(donors)
+        with self._lock:
+            self.next_eligible = np.concatenate([self.next_eligible, next_eligible])
+            self._stale = True
+        return next_eligible
+
+    def _next_eligible(self, donors: pd.DataFrame) -> np.ndarray:
+        n = len(donors)
+        # Donors with no recorded donation are eligible from the epoch
+        last = (donors['last_donation_date'].fillna(pd.Timestamp(0))
+                .to_numpy(dtype='datetime64[D]').astype(np.int64))
+        donation_types = (donors['donation_type'].fillna(DEFAULT_DONATION_TYPE).to_numpy()
+                          if 'donation_type' in donors.columns else np.full(n, DEFAULT_DONATION_TYPE))
+        sexes = (donors['sex'].fillna(UNKNOWN_SEX).str.upper().str[0].to_numpy()
+                 if 'sex' in donors.columns else np.full(n, UNKNOWN_SEX))
+        return (last + self.rules.deferral_days_for(donation_types, sexes)).astype(np.int32)
+
+    def record_donation(self, row: int, donated_on, donation_type: str = DEFAULT_DONATION_TYPE,
+                        sex: str = UNKNOWN_SEX) -> int:
+        """Moves one donor's eligibility forward; returns the new day number."""
+        next_day = day_number(donated_on) + self.rules.deferral_days(donation_type, sex)
+        with self._lock:
+            self.next_eligible[row] = next_day
+            self._stale = True
+        return next_day
+
+    def eligible_mask(self, today) -> np.ndarray:
+        return self.next_eligible <= day_number(today)
+
+    def becoming_eligible(self, start, end) -> np.ndarray:
+        """Rows whose next_eligible_date falls in [start, end], soonest first."""
+        with self._lock:
+            if self._stale:
+                self._order = np.argsort(self.next_eligible, kind='stable')
+                self._sorted = self.next_eligible[self._order]
+                self._stale = False
+            order, ordered = self._order, self._sorted
+        lo = np.searchsorted(ordered, day_number(start), side='left')
+        hi = np.searchsorted(ordered, day_number(end), side='right')
+        return order[lo:hi]
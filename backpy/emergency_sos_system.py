@@ -1,20 +1,22 @@
-import json
-import requests
+import uuid
 from datetime import datetime
-from typing import List, Dict
-from flask import Blueprint, request, jsonify
+from typing import Callable, List, Dict, Optional
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+import contextvars
 import concurrent.futures
 from math import radians, sin, cos, sqrt, asin
+import messaging
+from operator_auth import operator_request
+from sos_events import sos_events, format_sse, request_token, stream_token, valid_stream_token, SSE_HEARTBEAT_SECONDS
+from structured_logging import get_logger, log_context
+
+logger = get_logger(__name__)
 
 # --- SOS Configuration ---
 SOS_BLUEPRINT = Blueprint('sos', __name__)
-'''
-# Twilio Configuration (use your existing credentials)
-TWILIO_ACCOUNT_SID = "AC7f54ae9012bfa1296d94fa3b73bc4f3c"
-TWILIO_AUTH_TOKEN = "7ea2777041e3341ceeb9978f36fbfc7e"
-TWILIO_PHONE_NUMBER = "+18623552189"
-CPASS_URL = "https://api.twilio.com/2010-04-01/Accounts/AC7f54ae9012bfa1296d94fa3b73bc4f3c/Messages.json"
-'''
+# Workers for SOS requests submitted with ?async=true
+SOS_PIPELINE_WORKERS = 4
+
 # Hospital Directory with emergency contact numbers
 HOSPITAL_DATA = [
     {
@@ -45,6 +47,9 @@ class EmergencySOSSystem:
     
     def __init__(self):
         self.active_sos_requests = {}  # Track active SOS requests
+        self._subscribers = []
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=SOS_PIPELINE_WORKERS, thread_name_prefix='sos-pipeline')
 
     def haversine(self, lat1, lon1, lat2, lon2):
         """Calculates the distance between two lat/lon points in kilometers."""
@@ -76,43 +81,46 @@ class EmergencySOSSystem:
         if len(sos_data['emergency_contacts']) > 5:
             return False, "Maximum 5 emergency contacts allowed"
         
+        radius = sos_data.get('broadcast_radius_km')
+        if radius is not None and (not isinstance(radius, (int, float)) or radius <= 0):
+            return False, "broadcast_radius_km must be a positive number"
+        
         return True, "Valid"
     
     def send_emergency_sms(self, phone_number: str, message: str) -> Dict:
-        """Sends emergency SMS to a single contact."""
-        try:
-            response = requests.post(
-                CPASS_URL,
-                auth=(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN),
-                data={
-                    'From': TWILIO_PHONE_NUMBER,
-                    'To': phone_number,
-                    'Body': message
-                },
-                timeout=10
-            )
-            
-            return {
-                'phone_number': phone_number,
-                'success': response.status_code == 201,
-                'status_code': response.status_code,
-                'message_sid': response.json().get('sid') if response.status_code == 201 else None,
-                'error': None if response.status_code == 201 else response.text
-            }
-        except requests.exceptions.RequestException as e:
-            return {
-                'phone_number': phone_number,
-                'success': False,
-                'status_code': None,
-                'message_sid': None,
-                'error': str(e)
-            }
+        """Sends emergency SMS to a single contact.
+
+        The send is hedged across providers (SMS, WhatsApp, voice): if the
+        first has not answered quickly the next one is started too, and
+        providers with an open circuit breaker are skipped.
+        """
+        result = messaging.router.send(phone_number, message, channels=messaging.SOS_CHANNELS, hedge=True)
+        if not result['success']:
+            logger.warning("Emergency alert failed on every provider: %s", result['error'])
+        return {
+            'phone_number': phone_number,
+            'success': result['success'],
+            'provider': result['provider'],
+            'channel': result['channel'],
+            'message_sid': result['message_id'],
+            'error': result['error']
+        }
     
-    def send_emergency_call_alerts(self, phone_numbers: List[str], message: str) -> List[Dict]:
-        """Sends emergency alerts to multiple contacts simultaneously using threading."""
+    def send_emergency_call_alerts(self, phone_numbers: List[str], message: str,
+                                   on_result: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+        """Sends emergency alerts to multiple contacts simultaneously using threading.
+
+        `on_result` is called with each contact's result as soon as it completes.
+        """
         with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-            future_to_phone = {executor.submit(self.send_emergency_sms, phone, message): phone for phone in phone_numbers}
-            results = [future.result() for future in concurrent.futures.as_completed(future_to_phone)]
+            # Each send runs in a copy of this context, so its logs keep the sos_id
+            future_to_phone = {executor.submit(contextvars.copy_context().run, self.send_emergency_sms, phone, message): phone
+                               for phone in phone_numbers}
+            results = []
+            for future in concurrent.futures.as_completed(future_to_phone):
+                results.append(future.result())
+                if on_result:
+                    on_result(results[-1])
         return results
 
     def alert_nearest_hospital(self, sos_data: Dict) -> Dict:
@@ -180,27 +188,63 @@ class EmergencySOSSystem:
         message += "This is an automated emergency alert. Please contact them immediately."
         return message
     
-    def execute_sos_request(self, sos_data: Dict) -> Dict:
-        """Main SOS execution function - coordinates all emergency response actions."""
-        sos_id = f"sos_{sos_data['user_id']}_{int(datetime.now().timestamp())}"
-        
-        print(f"🚨 EXECUTING SOS REQUEST {sos_id}")
-        
+    def subscribe(self, callback: Callable[[str, Dict], None]) -> None:
+        """Registers a callback invoked with (sos_id, sos_data) once an SOS has alerted its contacts and hospital."""
+        self._subscribers.append(callback)
+
+    def open_sos_request(self, sos_data: Dict) -> str:
+        """Registers an SOS as processing and opens its event stream."""
+        sos_id = f"sos_{sos_data['user_id']}_{int(datetime.now().timestamp())}_{uuid.uuid4().hex[:6]}"
         self.active_sos_requests[sos_id] = {
             'start_time': datetime.now(),
             'status': 'processing',
             'data': sos_data
         }
+        sos_events.open(sos_id)
+        sos_events.publish(sos_id, 'accepted', {'sos_id': sos_id, 'status': 'processing',
+                                                'total_contacts': len(sos_data['emergency_contacts'])})
+        return sos_id
+
+    def submit_sos_request(self, sos_data: Dict) -> str:
+        """Queues an SOS on the background pipeline; progress is published as events."""
+        sos_id = self.open_sos_request(sos_data)
+        self._executor.submit(self._execute_logged, sos_data, sos_id)
+        return sos_id
+
+    def _execute_logged(self, sos_data: Dict, sos_id: str) -> None:
+        try:
+            self.execute_sos_request(sos_data, sos_id)
+        except Exception as e:
+            logger.exception("SOS request failed: %s", e, extra={'sos_id': sos_id})
+            self.active_sos_requests[sos_id]['status'] = 'failed'
+            sos_events.publish(sos_id, 'completed', {'sos_id': sos_id, 'overall_status': 'failed',
+                                                     'error': str(e)}, final=True)
+
+    def execute_sos_request(self, sos_data: Dict, sos_id: Optional[str] = None) -> Dict:
+        """Main SOS execution function - coordinates all emergency response actions."""
+        sos_id = sos_id or self.open_sos_request(sos_data)
+        # Every log below, including the router's, carries the sos_id
+        with log_context(sos_id=sos_id):
+            return self._execute(sos_data, sos_id)
+
+    def _execute(self, sos_data: Dict, sos_id: str) -> Dict:
+        logger.info("Executing SOS request")
         
         # Create emergency message for personal contacts
         contact_message = self.create_emergency_message_for_contacts(sos_data)
         
-        # Step 1: Send alerts to emergency contacts (parallel)
+        # Step 1: Send alerts to emergency contacts (parallel), one event per delivery
         contact_numbers = [contact['phone_number'] for contact in sos_data['emergency_contacts']]
-        sms_results = self.send_emergency_call_alerts(contact_numbers, contact_message)
+        sms_results = self.send_emergency_call_alerts(
+            contact_numbers, contact_message, on_result=lambda result: sos_events.publish(sos_id, 'contact', result))
         
         # Step 2: Alert the nearest hospital (parallel)
         hospital_alert_results = self.alert_nearest_hospital(sos_data)
+        sos_events.publish(sos_id, 'hospital', hospital_alert_results)
+        
+        # Subscribers (e.g. mass broadcasts) start only once the alerts above are out
+        for callback in self._subscribers:
+            callback(sos_id, sos_data)
         
         # Compile results
         successful_sms = [r for r in sms_results if r['success']]
@@ -220,6 +264,15 @@ class EmergencySOSSystem:
         
         self.active_sos_requests[sos_id]['status'] = sos_response['overall_status']
         self.active_sos_requests[sos_id]['results'] = sos_response
+        sos_events.publish(sos_id, 'completed', {
+            'sos_id': sos_id,
+            'overall_status': sos_response['overall_status'],
+            'successful_alerts': len(successful_sms),
+        }, final=True)
+        logger.info("SOS request finished", extra={
+            'overall_status': sos_response['overall_status'],
+            'successful_alerts': len(successful_sms),
+        })
         
         return sos_response
 
@@ -230,15 +283,33 @@ sos_system = EmergencySOSSystem()
 
 @SOS_BLUEPRINT.route('/api/emergency/sos', methods=['POST'])
 def trigger_emergency_sos():
-    """Main SOS endpoint - triggers alerts to contacts and the nearest hospital."""
+    """Main SOS endpoint - triggers alerts to contacts and the nearest hospital.
+
+    Runs the SOS inline and returns its results (200). With ?async=true it
+    returns 202 once the SOS is queued, with the stream token needed to
+    follow it on the sos-events stream.
+    """
     try:
         sos_data = request.json
         is_valid, error_msg = sos_system.validate_sos_request(sos_data)
         if not is_valid:
             return jsonify({"error": f"Invalid SOS request: {error_msg}"}), 400
+        # A broadcast texts every compatible donor in the radius; only operators may ask for one
+        if sos_data.get('broadcast_radius_km') is not None and not operator_request():
+            return jsonify({"error": "broadcast_radius_km requires the operator token"}), 401
         
-        results = sos_system.execute_sos_request(sos_data)
-        return jsonify(results), 200
+        if request.args.get('async', '').lower() not in ('1', 'true'):
+            results = sos_system.execute_sos_request(sos_data)
+            return jsonify(results), 200
+        sos_id = sos_system.submit_sos_request(sos_data)
+        token = stream_token(sos_id)
+        return jsonify({
+            'sos_id': sos_id,
+            'status': 'processing',
+            'stream_token': token,
+            'events_url': f"/api/emergency/sos-events/{sos_id}?token={token}",
+            'status_url': f"/api/emergency/sos-status/{sos_id}",
+        }), 202
     except Exception as e:
         return jsonify({"error": f"Critical error during SOS execution: {str(e)}"}), 500
 
@@ -255,4 +326,38 @@ def get_sos_status(sos_id):
         'start_time': request_info['start_time'].isoformat(),
         'results': request_info.get('results', 'Processing...'),
         'elapsed_time_seconds': (datetime.now() - request_info['start_time']).total_seconds()
-    }), 200
\ No newline at end of file
+    }), 200
+
+
+@SOS_BLUEPRINT.route('/api/emergency/sos-events/<sos_id>', methods=['GET'])
+def stream_sos_events(sos_id):
+    """Server-Sent Events for one SOS (resume with Last-Event-ID).
+
+    Needs the SOS's stream token (?token= or Authorization: Bearer). This
+    route holds a server thread per subscriber; large audiences should use
+    the same path on the asyncio stream server (sos_events.SOS_STREAM_PORT).
+    """
+    headers = {'authorization': request.headers.get('Authorization', '')}
+    if not valid_stream_token(sos_id, request_token(request.args.to_dict(flat=False), headers)):
+        return jsonify({"error": "Missing or invalid stream token"}), 401
+    if not sos_events.exists(sos_id):
+        return jsonify({"error": "SOS request not found"}), 404
+    after = request.headers.get('Last-Event-ID') or request.args.get('after', '0')
+    after = int(after) if after.isdigit() else 0
+
+    def generate(after):
+        while True:
+            events, closed = sos_events.wait(sos_id, after, SSE_HEARTBEAT_SECONDS)
+            if not events:
+                if closed:
+                    return
+                yield ": heartbeat\n\n"
+                continue
+            for event in events:
+                yield format_sse(event)
+            after = events[-1]['id']
+            if closed and events[-1]['final']:
+                return
+
+    return Response(stream_with_context(generate(after)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'})
@@ -0,0 +1,131 @@
+import re
+import threading
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Mapping, Optional, Union
+
+# --- HLA Matching Configuration ---
+LOCI = ('A', 'B', 'DR')
+# Two antigens per locus, in LOCI order
+HLA_COLUMNS = ('hla_a1', 'hla_a2', 'hla_b1', 'hla_b2', 'hla_dr1', 'hla_dr2')
+# DR mismatches weigh most on graft survival
+LOCUS_WEIGHTS = np.array([1, 1, 2], dtype=np.int64)
+MAX_WEIGHTED_MISMATCHES = int(2 * LOCUS_WEIGHTS.sum())
+
+UNTYPED = 0
+
+_TYPING_TOKEN = re.compile(r"^(DRB1|DR|A|B)\*?(\d+)", re.IGNORECASE)
+
+
+def normalize_antigen(value, locus: str) -> Optional[str]:
+    """Antigen-level name for one typing value, e.g. 'A*02:01', 'A2' and '02' at locus A -> 'A2'."""
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    text = str(value).strip().upper()
+    if not text:
+        return None
+    for prefix in (('DRB1', 'DR') if locus == 'DR' else (locus,)):
+        if text.startswith(prefix):
+            text = text[len(prefix):]
+            break
+    field = text.lstrip('*').split(':')[0]
+    if not field.isdigit():
+        return None
+    return f"{locus}{int(field)}"
+
+
+def parse_typing(text: str) -> Dict[str, str]:
+    """HLA_COLUMNS mapping from a typing string such as 'A2,A24,B7,B8,DR15,DR4'."""
+    found: Dict[str, List[str]] = {locus: [] for locus in LOCI}
+    for token in re.split(r"[\s,;]+", text or ''):
+        match = _TYPING_TOKEN.match(token)
+        if match:
+            locus = match.group(1).upper()
+            found['DR' if locus.startswith('DR') else locus].append(token)
+    typing = {}
+    for locus in LOCI:
+        antigens = found[locus][:2]
+        if len(antigens) == 1:
+            # A single antigen at a locus is read as homozygous
+            antigens = antigens * 2
+        for i, antigen in enumerate(antigens, start=1):
+            typing[f"hla_{locus.lower()}{i}"] = antigen
+    return typing
+
+
+class HLACodes:
+    """Shared antigen vocabulary mapping typings to (n, 6) uint16 code arrays.
+
+    Columns follow HLA_COLUMNS; code 0 is an untyped antigen. Donors and
+    recipients must be encoded by the same instance for codes to compare.
+    """
+
+    def __init__(self):
+        self._codes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _code(self, antigen: Optional[str]) -> int:
+        if antigen is None:
+            return UNTYPED
+        code = self._codes.get(antigen)
+        if code is None:
+            with self._lock:
+                code = self._codes.setdefault(antigen, len(self._codes) + 1)
+        return code
+
+    def encode(self, df: pd.DataFrame) -> np.ndarray:
+        """Codes for the HLA_COLUMNS of a frame (absent columns are untyped)."""
+        codes = np.zeros((len(df), len(HLA_COLUMNS)), dtype=np.uint16)
+        for j, column in enumerate(HLA_COLUMNS):
+            if column not in df.columns:
+                continue
+            locus = LOCI[j // 2]
+            values = df[column]
+            # Encode each distinct value once rather than per row
+            lookup = {value: self._code(normalize_antigen(value, locus)) for value in pd.unique(values.dropna())}
+            codes[:, j] = values.map(lookup).fillna(UNTYPED).to_numpy(dtype=np.uint16)
+        return codes
+
+    def encode_typing(self, typing: Union[str, Mapping, None]) -> np.ndarray:
+        """Codes for one typing (an HLA_COLUMNS mapping or a typing string)."""
+        if isinstance(typing, str):
+            typing = parse_typing(typing)
+        return self.encode(pd.DataFrame([dict(typing or {})]))[0]
+
+
+def typed(codes: np.ndarray) -> np.ndarray:
+    """True where every locus has at least one typed antigen."""
+    codes = codes.reshape(-1, len(LOCI), 2)
+    return (codes != UNTYPED).any(axis=2).all(axis=1)
+
+
+def mismatches(donor: np.ndarray, recipient: np.ndarray) -> np.ndarray:
+    """Donor antigens absent from the recipient, per locus (shape (..., 3)).
+
+    Either side may be a single (6,) typing broadcast against an (n, 6)
+    array. A homozygous donor antigen counts once, and untyped antigens
+    never count as mismatches.
+    """
+    donor = np.asarray(donor).reshape(*np.shape(donor)[:-1], len(LOCI), 2)
+    recipient = np.asarray(recipient).reshape(*np.shape(recipient)[:-1], len(LOCI), 2)
+    d1, d2 = donor[..., 0], donor[..., 1]
+    r1, r2 = recipient[..., 0], recipient[..., 1]
+    first = (d1 != UNTYPED) & (d1 != r1) & (d1 != r2)
+    second = (d2 != UNTYPED) & (d2 != d1) & (d2 != r1) & (d2 != r2)
+    return first.astype(np.int8) + second.astype(np.int8)
+
+
+def hla_scores(donor: np.ndarray, recipient: np.ndarray, fallback) -> np.ndarray:
+    """0-100 match score from weighted mismatches, on the hla_match_score scale.
+
+    Pairs where either side is not fully typed keep `fallback` (the static
+    hla_match_score column).
+    """
+    weighted = mismatches(donor, recipient) @ LOCUS_WEIGHTS
+    score = 100.0 * (1 - weighted / MAX_WEIGHTED_MISMATCHES)
+    both_typed = typed(np.asarray(donor)) & typed(np.asarray(recipient))
+    return np.where(both_typed, score, np.asarray(fallback, dtype=np.float64))
+
+
+# Global vocabulary shared by the organ offers and the waitlist
+hla_codes = HLACodes()
@@ -0,0 +1,288 @@
+import io
+import os
+import time
+import pstats
+import cProfile
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Tuple
+from flask import Blueprint, Response, g, request, has_request_context
+
+# --- Instrumentation Configuration ---
+METRICS_BLUEPRINT = Blueprint('metrics', __name__)
+
+# Per-request profiling is opt-in twice: the process must allow it and the
+# caller must send the header (any value other than "0").
+PROFILE_HEADER = 'X-Profile'
+PROFILING_ALLOWED = os.environ.get('ALLOW_REQUEST_PROFILING', '0') == '1'
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+PROFILE_TOP_N = 25
+PROFILE_SKIPPED_HEADER = 'X-Profile-Skipped'
+
+# Histogram buckets in seconds (sub-millisecond stages up to slow CPaaS calls)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Thread-safe labelled histogram rendered in Prometheus text format."""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...],
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series: Dict[Tuple[str, ...], List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels) -> None:
+        key = tuple(str(label) for label in labels)
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # [per-bucket counts (+Inf last), sum, count]
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][idx] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {k: (list(v[0]), v[1], v[2]) for k, v in self._series.items()}
+        for key, (counts, total, count) in sorted(snapshot.items()):
+            base = _format_labels(self.labelnames, key)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames + ('le',), key + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{base} {total}")
+            lines.append(f"{self.name}_count{base} {count}")
+        return lines
+
+
+class Counter:
+    """Thread-safe labelled monotonic counter."""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        key = tuple(str(label) for label in labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            snapshot = dict(self._values)
+        for key, value in sorted(snapshot.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge:
+    """Thread-safe labelled gauge for values that go up and down (queue depths)."""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, *labels) -> None:
+        key = tuple(str(label) for label in labels)
+        with self._lock:
+            self._values[key] = value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            snapshot = dict(self._values)
+        for key, value in sorted(snapshot.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds every metric exported on /metrics."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def histogram(self, name, help_text, labelnames, buckets=LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help_text, tuple(labelnames), buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labelnames) -> Counter:
+        metric = Counter(name, help_text, tuple(labelnames))
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name, help_text, labelnames) -> Gauge:
+        metric = Gauge(name, help_text, tuple(labelnames))
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(names, values) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# --- Global Registry and Core Metrics ---
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'ranking_stage_seconds', 'Time spent in each stage of a ranking function.',
+    ('function', 'stage'))
+PROVIDER_SECONDS = REGISTRY.histogram(
+    'outreach_provider_seconds', 'Latency of outbound messaging provider calls.',
+    ('provider', 'outcome'))
+REQUEST_SECONDS = REGISTRY.histogram(
+    'http_request_seconds', 'End-to-end Flask request latency.',
+    ('endpoint', 'status'))
+
+
+@contextmanager
+def stage(function: str, name: str):
+    """Times one stage of a ranking function.
+
+    The duration goes to the stage histogram and, inside a request, to the
+    request's Server-Timing header.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, function, name)
+        if has_request_context():
+            timings = g.setdefault('server_timings', [])
+            timings.append((name, elapsed))
+
+
+def observe_provider_latency(provider: str, seconds: float, ok: bool) -> None:
+    """Records the latency of one outbound provider call (SMS, voice, ...)."""
+    PROVIDER_SECONDS.observe(seconds, provider, 'success' if ok else 'failure')
+
+
+@contextmanager
+def provider_call(provider: str):
+    """Times an outbound provider call; the caller flips ``result['ok']``."""
+    result = {'ok': False}
+    start = time.perf_counter()
+    try:
+        yield result
+    finally:
+        observe_provider_latency(provider, time.perf_counter() - start, result['ok'])
+
+
+def _server_timing_header(timings) -> str:
+    # Repeated stages (e.g. several outreach calls) are summed per name
+    totals: Dict[str, float] = {}
+    for name, elapsed in timings:
+        totals[name] = totals.get(name, 0.0) + elapsed
+    return ", ".join(f"{name};dur={elapsed * 1000:.3f}" for name, elapsed in totals.items())
+
+
+# One profiled request at a time: a second cProfile.enable() while another
+# profiler is active raises, and overlapping profiles would be unreadable anyway
+_profile_lock = threading.Lock()
+
+
+def _profiling_requested() -> bool:
+    return PROFILING_ALLOWED and request.headers.get(PROFILE_HEADER, '0') not in ('', '0')
+
+
+def _stop_profiler():
+    """Disables this request's profiler, if any, and frees the profiling slot."""
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        _profile_lock.release()
+    return profiler
+
+
+def _write_profile(profiler: cProfile.Profile) -> str:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    endpoint = (request.endpoint or 'unknown').replace('.', '_')
+    path = os.path.join(PROFILE_DIR, f"{endpoint}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.prof")
+    profiler.dump_stats(path)
+    return path
+
+
+def profile_summary(path: str, top_n: int = PROFILE_TOP_N) -> str:
+    """Renders the top cumulative-time entries of a saved profile."""
+    buffer = io.StringIO()
+    pstats.Stats(path, stream=buffer).sort_stats('cumulative').print_stats(top_n)
+    return buffer.getvalue()
+
+
+def init_app(app) -> None:
+    """Installs request timing, Server-Timing headers and the profiler hook."""
+
+    @app.before_request
+    def _start_request_timer():
+        g.request_start = time.perf_counter()
+        if _profiling_requested():
+            # Never wait: a request that cannot be profiled still runs, unprofiled
+            if _profile_lock.acquire(blocking=False):
+                g.profiler = cProfile.Profile()
+                g.profiler.enable()
+            else:
+                g.profile_skipped = True
+
+    @app.after_request
+    def _finish_request_timer(response):
+        profiler = _stop_profiler()
+        if profiler is not None:
+            response.headers['X-Profile-File'] = _write_profile(profiler)
+        elif g.pop('profile_skipped', False):
+            response.headers[PROFILE_SKIPPED_HEADER] = 'another request is being profiled'
+
+        start = g.get('request_start')
+        if start is not None:
+            elapsed = time.perf_counter() - start
+            REQUEST_SECONDS.observe(elapsed, request.endpoint or 'unknown', response.status_code)
+            timings = g.get('server_timings', []) + [('total', elapsed)]
+            response.headers['Server-Timing'] = _server_timing_header(timings)
+        return response
+
+    @app.teardown_request
+    def _release_profiler(exc):
+        # after_request does not run when the response itself failed
+        _stop_profiler()
+
+    app.register_blueprint(METRICS_BLUEPRINT)
+
+
+# --- Flask API Endpoints ---
+
+@METRICS_BLUEPRINT.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus scrape endpoint."""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
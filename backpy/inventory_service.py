@@ -0,0 +1,276 @@
+import heapq
+import atexit
+import itertools
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+from flask import Blueprint, request, jsonify
+from inventory_store import BLOOD_GROUPS, INVENTORY_LOG_PATH, InventoryStore
+from structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+# --- Inventory Configuration ---
+INVENTORY_BLUEPRINT = Blueprint('inventory', __name__)
+
+# Blood bank inventory thresholds (units)
+DEFAULT_THRESHOLDS = {
+    'O+': 20, 'O-': 15, 'A+': 25, 'A-': 12,
+    'B+': 20, 'B-': 10, 'AB+': 15, 'AB-': 8
+}
+DEFAULT_HOSPITAL = 'mumbai_central'
+
+# Hospitals that may report inventory (example - replace with real data)
+HOSPITAL_LOCATIONS = {
+    'mumbai_central': {'lat': 19.0760, 'lon': 72.8777, 'name': 'Mumbai Central Hospital'},
+    'delhi_aiims': {'lat': 28.5672, 'lon': 77.2100, 'name': 'AIIMS Delhi'},
+    'bangalore_nimhans': {'lat': 12.9432, 'lon': 77.5969, 'name': 'NIMHANS Bangalore'}
+}
+
+# A blood group that triggered outreach is not re-triggered inside this window
+DEBOUNCE_WINDOW = timedelta(minutes=30)
+
+# With a store attached, a group still above threshold is queued early when
+# its consumption trend crosses the threshold within this many days
+FORECAST_HORIZON_DAYS = 1.0
+
+
+class InventoryService:
+    """Holds current unit counts and turns threshold crossings into shortage events.
+
+    Producers call update(); every change is pushed to subscribers, and a level
+    below threshold enqueues a shortage event (debounced per hospital and blood
+    group) on a priority queue ordered by severity. A dispatcher thread, or
+    drain(), hands events to the outreach handler as soon as they arrive.
+
+    When an InventoryStore is attached every reading is also kept as a time
+    series, and groups forecast to cross their threshold within
+    `forecast_horizon_days` are queued as predicted shortages.
+    """
+
+    def __init__(self, thresholds: Optional[Dict[str, int]] = None,
+                 debounce_window: timedelta = DEBOUNCE_WINDOW,
+                 store: Optional[InventoryStore] = None,
+                 forecast_horizon_days: float = FORECAST_HORIZON_DAYS):
+        self.thresholds = dict(thresholds or DEFAULT_THRESHOLDS)
+        self.debounce_window = debounce_window
+        self.store = store
+        self.forecast_horizon_days = forecast_horizon_days
+        self._levels: Dict[tuple, Dict] = {}
+        self._last_triggered: Dict[tuple, datetime] = {}
+        self._pending = set()
+        self._queue: List[tuple] = []
+        self._sequence = itertools.count()
+        self._subscribers: List[Callable[[Dict], None]] = []
+        self._cond = threading.Condition()
+        self._dispatcher: Optional[threading.Thread] = None
+        self._running = False
+
+    # --- Change feed ---
+
+    def subscribe(self, callback: Callable[[Dict], None]) -> None:
+        """Registers a callback invoked with every inventory change."""
+        self._subscribers.append(callback)
+
+    def update(self, hospital: str, blood_group: str, units: int,
+               timestamp: Optional[datetime] = None) -> Optional[Dict]:
+        """Records a new unit count; returns the shortage event if one was queued.
+
+        With a store attached, a reading older than the latest one for the
+        same group raises ValueError and changes nothing.
+        """
+        timestamp = timestamp or datetime.now()
+        threshold = self.thresholds.get(blood_group)
+        key = (hospital, blood_group)
+        event = None
+
+        days_to_threshold = None
+        if self.store is not None:
+            self.store.append(hospital, blood_group, units, timestamp.timestamp())
+            if threshold is not None and units >= threshold:
+                rate = self.store.consumption_rate(hospital, blood_group, now=timestamp.timestamp())
+                if rate > 0:
+                    days_to_threshold = (units - threshold) / rate
+
+        with self._cond:
+            previous = self._levels.get(key)
+            self._levels[key] = {'current_units': units, 'threshold': threshold, 'updated_at': timestamp}
+
+            below = threshold is not None and units < threshold
+            predicted = days_to_threshold is not None and days_to_threshold <= self.forecast_horizon_days
+            if (below or predicted) and key not in self._pending:
+                last = self._last_triggered.get(key)
+                if last is None or timestamp - last >= self.debounce_window:
+                    event = {
+                        'hospital': hospital,
+                        'blood_group': blood_group,
+                        'current_units': units,
+                        'threshold': threshold,
+                        # Predicted shortages rank below every actual one
+                        'shortage_severity': (threshold - units) / threshold if below else 0.0,
+                        'predicted': not below,
+                        'days_to_threshold': None if below else round(days_to_threshold, 2),
+                        'detected_at': timestamp.isoformat(),
+                    }
+                    self._last_triggered[key] = timestamp
+                    self._pending.add(key)
+                    heapq.heappush(self._queue, (-event['shortage_severity'], next(self._sequence), event))
+                    self._cond.notify()
+
+        change = {
+            'hospital': hospital,
+            'blood_group': blood_group,
+            'previous_units': previous['current_units'] if previous else None,
+            'current_units': units,
+            'threshold': threshold,
+            'shortage_queued': event is not None,
+        }
+        for callback in self._subscribers:
+            try:
+                callback(change)
+            except Exception as e:
+                logger.exception("Inventory subscriber failed: %s", e)
+
+        if event:
+            logger.warning("Shortage queued", extra={
+                'hospital': hospital, 'blood_group': blood_group,
+                'shortage_severity': round(event['shortage_severity'], 3)})
+        return event
+
+    def snapshot(self, hospital: Optional[str] = None) -> Dict[str, Dict]:
+        """Current levels keyed by blood group (for one hospital) or 'hospital/group'."""
+        with self._cond:
+            items = list(self._levels.items())
+        if hospital is not None:
+            return {group: dict(level) for (h, group), level in items if h == hospital}
+        return {f"{h}/{group}": dict(level) for (h, group), level in items}
+
+    def reset_debounce(self, hospital: str, blood_group: str) -> None:
+        """Allows the next update for this group to trigger outreach again."""
+        with self._cond:
+            self._last_triggered.pop((hospital, blood_group), None)
+
+    # --- Shortage queue ---
+
+    def next_shortage(self, timeout: Optional[float] = None) -> Optional[Dict]:
+        """Pops the most severe pending shortage, waiting up to `timeout` seconds."""
+        with self._cond:
+            if not self._queue:
+                self._cond.wait(timeout)
+            if not self._queue:
+                return None
+            _, _, event = heapq.heappop(self._queue)
+            self._pending.discard((event['hospital'], event['blood_group']))
+            return event
+
+    def drain(self, handler: Callable[[Dict], object]) -> List:
+        """Synchronously handles every pending shortage, most severe first."""
+        results = []
+        while True:
+            event = self.next_shortage(timeout=0)
+            if event is None:
+                return results
+            results.append(handler(event))
+
+    def start_dispatcher(self, handler: Callable[[Dict], object]) -> None:
+        """Runs `handler` on a background thread for each shortage as it is queued."""
+        if self.dispatching:
+            return
+        self._running = True
+
+        def dispatch():
+            while self._running:
+                event = self.next_shortage(timeout=1.0)
+                if event is None:
+                    continue
+                try:
+                    handler(event)
+                except Exception as e:
+                    logger.exception("Shortage handler failed: %s", e,
+                                     extra={'blood_group': event['blood_group']})
+
+        self._dispatcher = threading.Thread(target=dispatch, name='inventory-dispatcher', daemon=True)
+        self._dispatcher.start()
+
+    def stop_dispatcher(self) -> None:
+        self._running = False
+        with self._cond:
+            self._cond.notify_all()
+        if self._dispatcher is not None:
+            self._dispatcher.join(timeout=5)
+            self._dispatcher = None
+
+    @property
+    def dispatching(self) -> bool:
+        return self._dispatcher is not None and self._dispatcher.is_alive()
+
+    @property
+    def pending_count(self) -> int:
+        with self._cond:
+            return len(self._queue)
+
+
+# Global inventory service instance, persisted to the append-only log
+inventory_store = InventoryStore(INVENTORY_LOG_PATH)
+inventory_service = InventoryService(store=inventory_store)
+atexit.register(inventory_store.flush)
+
+
+def parse_levels(levels) -> Dict[str, int]:
+    """Validates a whole {"group": units} payload before any of it is applied.
+
+    Raises ValueError for an unknown blood group or a unit count that is not
+    a non-negative integer, so a bad entry never leaves a partial update.
+    """
+    if not isinstance(levels, dict) or not levels:
+        raise ValueError("levels must be a non-empty object of blood group -> units")
+    parsed = {}
+    for group, units in levels.items():
+        if group not in BLOOD_GROUPS:
+            raise ValueError(f"Unknown blood group: {group}")
+        value = int(units)
+        if isinstance(units, bool) or (isinstance(units, float) and value != units):
+            raise ValueError(f"Units for {group} must be an integer")
+        if value < 0:
+            raise ValueError(f"Units for {group} must not be negative")
+        parsed[group] = value
+    return parsed
+
+
+# --- Flask API Endpoints ---
+
+@INVENTORY_BLUEPRINT.route('/api/inventory/update', methods=['POST'])
+def update_inventory():
+    """Change-feed ingestion: {"hospital": ..., "levels": {"O-": 9, ...}}."""
+    try:
+        data = request.json or {}
+        hospital = data.get('hospital', DEFAULT_HOSPITAL)
+        if hospital not in HOSPITAL_LOCATIONS:
+            return jsonify({"error": f"Unknown hospital: {hospital}",
+                            "hospitals": list(HOSPITAL_LOCATIONS)}), 400
+        levels = parse_levels(data['levels'])
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid inventory update: {e}"}), 400
+
+    queued = [event for event in (
+        inventory_service.update(hospital, group, units) for group, units in levels.items()
+    ) if event]
+
+    return jsonify({
+        "status": "accepted",
+        "hospital": hospital,
+        "shortages_queued": queued,
+        "pending_shortages": inventory_service.pending_count
+    }), 200
+
+
+@INVENTORY_BLUEPRINT.route('/api/inventory/forecast', methods=['GET'])
+def get_inventory_forecast():
+    """Consumption rate, days of supply and days to threshold for every hospital."""
+    return jsonify(inventory_store.forecast(inventory_service.thresholds)), 200
+
+
+@INVENTORY_BLUEPRINT.route('/api/inventory', methods=['GET'])
+def get_inventory():
+    """Current unit counts, optionally for one hospital."""
+    return jsonify(inventory_service.snapshot(request.args.get('hospital'))), 200
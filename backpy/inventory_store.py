@@ -0,0 +1,301 @@
+import os
+import json
+import time
+import threading
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+# --- Inventory Store Configuration ---
+BLOOD_GROUPS = ('O+', 'O-', 'A+', 'A-', 'B+', 'B-', 'AB+', 'AB-')
+GROUP_INDEX = {group: i for i, group in enumerate(BLOOD_GROUPS)}
+
+INVENTORY_LOG_PATH = os.environ.get('INVENTORY_LOG_PATH', 'inventory_log.bin')
+RING_CAPACITY = 1024          # Samples kept in memory per hospital and blood group
+FLUSH_EVERY = 64              # Pending samples that trigger an append to the log
+FLUSH_INTERVAL_SECONDS = 1.0  # Longest a sample waits in memory before it is appended
+COMPACT_RATIO = 2             # Rewrite the log once it holds this many times the retained samples
+CONSUMPTION_WINDOW_HOURS = 72 # History used to fit the consumption trend
+
+# One fixed-size record per sample in the append-only log
+RECORD_DTYPE = np.dtype([('ts', '<i8'), ('hospital', '<u2'), ('group', 'u1'), ('units', '<i4')])
+
+
+class InventoryStore:
+    """Per-hospital, per-blood-group unit counts as in-memory ring buffers.
+
+    Samples live in dense (hospital, group, sample) NumPy arrays so that range
+    queries are a searchsorted and consumption/days-of-supply figures for every
+    hospital come out of one vectorised pass. New samples are appended to a
+    binary log (RECORD_DTYPE) and replayed on start-up. Pending samples are
+    appended and fsynced once FLUSH_EVERY accumulate or FLUSH_INTERVAL_SECONDS
+    after the first one, whichever comes first; once the log holds
+    COMPACT_RATIO times what the rings retain it is rewritten with just the
+    retained samples.
+
+    `path` is required so that two stores never share a log by accident; pass
+    None for a memory-only store. Each series only accepts samples in time
+    order, which keeps the rings sorted for range().
+    """
+
+    def __init__(self, path: Optional[str], capacity: int = RING_CAPACITY):
+        self.path = path
+        self.capacity = capacity
+        self.hospitals: List[str] = []
+        self._hospital_index: Dict[str, int] = {}
+        self._times = np.zeros((0, len(BLOOD_GROUPS), capacity), dtype=np.int64)
+        self._units = np.zeros((0, len(BLOOD_GROUPS), capacity), dtype=np.int32)
+        self._counts = np.zeros((0, len(BLOOD_GROUPS)), dtype=np.int64)
+        self._pending: List[tuple] = []
+        self._flush_timer: Optional[threading.Timer] = None
+        self._log_records = 0
+        self._lock = threading.RLock()
+        if path:
+            self._load()
+
+    # --- Writes ---
+
+    def _hospital_slot(self, hospital: str) -> int:
+        idx = self._hospital_index.get(hospital)
+        if idx is not None:
+            return idx
+        idx = len(self.hospitals)
+        self.hospitals.append(hospital)
+        self._hospital_index[hospital] = idx
+        if idx >= self._times.shape[0]:
+            grow = max(4, self._times.shape[0])
+            self._times = np.concatenate([self._times, np.zeros((grow,) + self._times.shape[1:], np.int64)])
+            self._units = np.concatenate([self._units, np.zeros((grow,) + self._units.shape[1:], np.int32)])
+            self._counts = np.concatenate([self._counts, np.zeros((grow, len(BLOOD_GROUPS)), np.int64)])
+        if self.path:
+            self._write_hospitals()
+        return idx
+
+    def _put(self, h: int, g: int, ts: int, units: int) -> None:
+        pos = self._counts[h, g] % self.capacity
+        self._times[h, g, pos] = ts
+        self._units[h, g, pos] = units
+        self._counts[h, g] += 1
+
+    def append(self, hospital: str, blood_group: str, units: int, ts: Optional[float] = None) -> None:
+        """Records one reading; `ts` is a Unix timestamp (defaults to now).
+
+        Raises ValueError if `ts` is older than the series' latest sample.
+        """
+        g = GROUP_INDEX[blood_group]
+        ts = int(ts if ts is not None else time.time())
+        with self._lock:
+            latest = self.latest_time(hospital, blood_group)
+            if latest is not None and ts < latest:
+                raise ValueError(f"Out-of-order sample for {hospital}/{blood_group}: {ts} < {latest}")
+            h = self._hospital_slot(hospital)
+            self._put(h, g, ts, units)
+            if self.path:
+                self._pending.append((ts, h, g, units))
+                if len(self._pending) >= FLUSH_EVERY:
+                    self.flush()
+                elif self._flush_timer is None:
+                    self._flush_timer = threading.Timer(FLUSH_INTERVAL_SECONDS, self._timed_flush)
+                    self._flush_timer.daemon = True
+                    self._flush_timer.start()
+
+    def _timed_flush(self) -> None:
+        try:
+            self.flush()
+        except Exception as e:
+            logger.exception("Inventory log flush failed: %s", e)
+
+    def flush(self) -> None:
+        """Appends pending samples to the on-disk log and syncs it to disk."""
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if not self.path or not self._pending:
+                return
+            records = np.array(self._pending, dtype=RECORD_DTYPE)
+            with open(self.path, 'ab') as f:
+                records.tofile(f)
+                f.flush()
+                os.fsync(f.fileno())
+            self._pending = []
+            self._log_records += len(records)
+            if self._log_records > COMPACT_RATIO * self.retained_samples:
+                self.compact()
+
+    @property
+    def retained_samples(self) -> int:
+        """Samples currently held in the rings across every series."""
+        with self._lock:
+            return int(np.minimum(self._counts[:len(self.hospitals)], self.capacity).sum())
+
+    def compact(self) -> None:
+        """Rewrites the log with only the samples the rings still hold."""
+        with self._lock:
+            if not self.path:
+                return
+            self.flush()
+            times, units, valid = self._chronological()
+            h, g, _ = np.nonzero(valid)
+            records = np.empty(len(h), dtype=RECORD_DTYPE)
+            records['ts'] = times[valid]
+            records['hospital'] = h
+            records['group'] = g
+            records['units'] = units[valid]
+            tmp = self.path + '.tmp'
+            with open(tmp, 'wb') as f:
+                records.tofile(f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            self._log_records = len(records)
+        logger.info("Inventory log compacted", extra={'samples': len(records)})
+
+    def _hospitals_path(self) -> str:
+        return f"{self.path}.hospitals.json"
+
+    def _write_hospitals(self) -> None:
+        tmp = self._hospitals_path() + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.hospitals, f)
+        os.replace(tmp, self._hospitals_path())
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path) or not os.path.exists(self._hospitals_path()):
+            return
+        with open(self._hospitals_path()) as f:
+            for hospital in json.load(f):
+                self._hospital_slot(hospital)
+        records = np.fromfile(self.path, dtype=RECORD_DTYPE)
+        self._log_records = len(records)
+        if len(records):
+            n_groups = len(BLOOD_GROUPS)
+            keys = records['hospital'].astype(np.int64) * n_groups + records['group']
+            # Series order, then time order (logs written before append()
+            # enforced ordering may hold late samples)
+            order = np.lexsort((records['ts'], keys))
+            keys, records = keys[order], records[order]
+            totals = np.bincount(keys, minlength=len(self.hospitals) * n_groups)
+            seq = np.arange(len(records)) - (np.cumsum(totals) - totals)[keys]
+            # Only the newest `capacity` samples per series survive in the rings
+            keep = seq >= totals[keys] - self.capacity
+            h, g = np.divmod(keys[keep], n_groups)
+            pos = seq[keep] % self.capacity
+            self._times[h, g, pos] = records['ts'][keep]
+            self._units[h, g, pos] = records['units'][keep]
+            self._counts[:len(self.hospitals)] = totals.reshape(-1, n_groups)
+        logger.info("Inventory log replayed", extra={'samples': len(records), 'hospitals': len(self.hospitals)})
+
+    # --- Reads ---
+
+    def latest_time(self, hospital: str, blood_group: str) -> Optional[int]:
+        """Timestamp of the newest sample in a series, or None if it is empty."""
+        with self._lock:
+            h = self._hospital_index.get(hospital)
+            if h is None:
+                return None
+            count = int(self._counts[h, GROUP_INDEX[blood_group]])
+            if not count:
+                return None
+            return int(self._times[h, GROUP_INDEX[blood_group], (count - 1) % self.capacity])
+
+    def _chronological(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(times, units, valid) for every series, oldest sample first."""
+        n_h = len(self.hospitals)
+        counts = self._counts[:n_h]
+        filled = np.minimum(counts, self.capacity)
+        offsets = np.arange(self.capacity)
+        positions = ((counts - filled)[..., None] + offsets) % self.capacity
+        times = np.take_along_axis(self._times[:n_h], positions, axis=2)
+        units = np.take_along_axis(self._units[:n_h], positions, axis=2)
+        valid = offsets < filled[..., None]
+        return times, units, valid
+
+    def range(self, hospital: str, blood_group: str, start: float, end: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Timestamps and unit counts recorded in [start, end]."""
+        with self._lock:
+            h = self._hospital_index.get(hospital)
+            if h is None:
+                return np.empty(0, np.int64), np.empty(0, np.int32)
+            g = GROUP_INDEX[blood_group]
+            count = int(self._counts[h, g])
+            filled = min(count, self.capacity)
+            order = (count - filled + np.arange(filled)) % self.capacity
+            times = self._times[h, g, order]
+            units = self._units[h, g, order]
+        lo = np.searchsorted(times, start, side='left')
+        hi = np.searchsorted(times, end, side='right')
+        return times[lo:hi], units[lo:hi]
+
+    def current_levels(self) -> np.ndarray:
+        """(hospital, group) matrix of the latest unit count (-1 where unknown)."""
+        with self._lock:
+            n_h = len(self.hospitals)
+            counts = self._counts[:n_h]
+            last = (counts - 1) % self.capacity
+            levels = np.take_along_axis(self._units[:n_h], last[..., None], axis=2)[..., 0]
+            return np.where(counts > 0, levels, -1)
+
+    def consumption_rates(self, now: Optional[float] = None,
+                          window_hours: float = CONSUMPTION_WINDOW_HOURS) -> np.ndarray:
+        """Units consumed per day for every (hospital, group), via a least-squares trend.
+
+        Restocks show up as upward jumps and pull the fitted trend up, so the
+        figure is conservative; series with fewer than two samples in the
+        window, or a rising trend, report zero consumption.
+        """
+        now = now if now is not None else time.time()
+        with self._lock:
+            times, units, valid = self._chronological()
+        mask = valid & (times >= now - window_hours * 3600)
+        k = mask.sum(axis=2)
+        t = np.where(mask, (times - now) / 86400.0, 0.0)  # days, relative to now
+        u = np.where(mask, units.astype(np.float64), 0.0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            t_mean = t.sum(axis=2) / k
+            u_mean = u.sum(axis=2) / k
+            dt = np.where(mask, t - t_mean[..., None], 0.0)
+            du = np.where(mask, u - u_mean[..., None], 0.0)
+            slope = (dt * du).sum(axis=2) / (dt * dt).sum(axis=2)
+        slope = np.where((k >= 2) & np.isfinite(slope), slope, 0.0)
+        return np.clip(-slope, 0.0, None)
+
+    def days_of_supply(self, now: Optional[float] = None) -> np.ndarray:
+        """Days until each (hospital, group) runs out at its current consumption rate."""
+        rates = self.consumption_rates(now)
+        levels = self.current_levels().astype(np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(rates > 0, np.maximum(levels, 0) / rates, np.inf)
+
+    def consumption_rate(self, hospital: str, blood_group: str, now: Optional[float] = None,
+                         window_hours: float = CONSUMPTION_WINDOW_HOURS) -> float:
+        """Consumption rate (units/day) for a single series."""
+        now = now if now is not None else time.time()
+        times, units = self.range(hospital, blood_group, now - window_hours * 3600, now)
+        if len(times) < 2 or times[-1] == times[0]:
+            return 0.0
+        slope = np.polyfit((times - now) / 86400.0, units.astype(np.float64), 1)[0]
+        return max(0.0, -float(slope))
+
+    def forecast(self, thresholds: Dict[str, int], now: Optional[float] = None) -> List[Dict]:
+        """Days of supply and days until threshold for every known series."""
+        rates = self.consumption_rates(now)
+        levels = self.current_levels()
+        threshold_row = np.array([thresholds.get(g, 0) for g in BLOOD_GROUPS], dtype=np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            supply = np.where(rates > 0, np.maximum(levels, 0) / rates, np.inf)
+            to_threshold = np.where(rates > 0, np.maximum(levels - threshold_row, 0) / rates, np.inf)
+
+        report = []
+        for h, g in zip(*np.nonzero(levels >= 0)):
+            report.append({
+                'hospital': self.hospitals[h],
+                'blood_group': BLOOD_GROUPS[g],
+                'current_units': int(levels[h, g]),
+                'consumption_per_day': round(float(rates[h, g]), 3),
+                'days_of_supply': None if np.isinf(supply[h, g]) else round(float(supply[h, g]), 2),
+                'days_to_threshold': None if np.isinf(to_threshold[h, g]) else round(float(to_threshold[h, g]), 2),
+            })
+        return report
@@ -0,0 +1,539 @@
+import pandas as pd
+import numpy as np
+import joblib
+import os
+import threading
+from datetime import datetime, timedelta
+from instrumentation import stage
+import messaging
+from outreach_jobs import outreach_jobs, contact_ledger, hospital_key
+from donor_replies import reply_tracker, ACCEPTED, OPTED_OUT
+from suppression import suppression, day_number
+from eligibility import EligibilityIndex, DEFAULT_DONATION_TYPE, parse_donation_dates
+from spatial_index import GridIndex
+from distance_tables import hospital_distances
+from transport_matrix import TransportMatrix
+from hla import hla_codes, hla_scores, mismatches, typed, HLA_COLUMNS
+import parallel_scoring
+from donor_store import DonorColumns, PIIStore, EXCLUDED_COLUMNS
+from structured_logging import get_logger, get_sampled_logger
+
+logger = get_logger(__name__)
+# Donor failovers repeat for every ranked donor while a provider is down
+FAILOVER_LOG_EVERY = 10
+failover_logger = get_sampled_logger(__name__, FAILOVER_LOG_EVERY)
+
+# --- CPaaS Configuration ---
+# Credentials and providers live in messaging (TWILIO_* environment variables)
+AUTH_SID = messaging.TWILIO_ACCOUNT_SID
+AUTH_TOKEN = messaging.TWILIO_AUTH_TOKEN
+CPASS_URL = f"https://api.twilio.com/2010-04-01/Accounts/{AUTH_SID}/Messages.json"
+
+# Define the message template for outreach
+SMS_MESSAGE_TEMPLATE = (
+    "URGENT BLOOD DONOR NEEDED. Your blood group ({blood_group}) is urgently "
+    "required at a hospital near your location. Reply YES to accept or NO to decline. "
+    "Reply STOP to opt out. [Donor ID: {donor_id}]"
+)
+
+# A donor who replied YES is held out of further outreach this long, or
+# until confirm-donation starts their cooldown
+ACCEPTANCE_HOLD_DAYS = 2
+
+BLOOD_DATASET_PATH = 'final_indian_blood_donor_dataset.csv'
+ORGAN_DATASET_PATH = 'indian_organ_donor_dataset.csv'
+
+# Cold ischemia limits in hours (as in rnnorgan.py); transport must fit inside them
+MAX_VIABILITY_HOURS = {'Kidney': 12, 'Heart': 4, 'Liver': 10, 'Lung': 6}
+DEFAULT_VIABILITY_HOURS = 12
+# The sample dataset's availability times are fixed, so by default transport is
+# checked against the full window rather than what is left of it
+COUNT_ELAPSED_ISCHEMIA = os.environ.get('COUNT_ELAPSED_ISCHEMIA', '').lower() in ('1', 'true', 'yes')
+
+# --- Global Variables for Loaded Resources ---
+# These will hold the donor data and models after load_resources() runs.
+blood_model = None
+blood_features = None
+organ_df = None
+
+# City-pair transport times and the city code of each organ_df row
+organ_transport = None
+organ_city_codes = np.zeros(0, dtype=np.int16)
+# Integer-coded HLA-A/B/DR typing of each organ_df row (0 = untyped)
+organ_hla = np.zeros((0, len(HLA_COLUMNS)), dtype=np.uint16)
+
+# Ranking-only blood donor arrays; names and contact details live in blood_pii
+blood_donors = DonorColumns.empty()
+blood_pii = None
+
+# next_eligible_date per blood donor row under the configured deferral rules
+eligibility = EligibilityIndex()
+
+# Grid indexes over blood donor / organ_df rows for radius queries
+blood_spatial = GridIndex()
+organ_spatial = GridIndex()
+
+# Serialises appends from bulk imports; readers never take it
+_append_lock = threading.Lock()
+
+# Callbacks invoked with each batch of newly appended organ offers
+_organ_offer_subscribers = []
+# Callbacks invoked with the rows of blood donors that were added or moved
+_donor_change_subscribers = []
+# Callbacks invoked with outreach requests that found no eligible donor
+_unfilled_outreach_subscribers = []
+
+# --- Resource Loading Function ---
+def load_resources():
+    """Loads all necessary data and models into memory once."""
+    global blood_donors, blood_pii, blood_model, blood_features
+    global organ_df, organ_transport, organ_city_codes, organ_hla
+
+    logger.info("Loading resources")
+    try:
+        # Blood Donation Resources (plaintext passwords are never read)
+        blood_df = pd.read_csv(BLOOD_DATASET_PATH, usecols=lambda col: col not in EXCLUDED_COLUMNS)
+        blood_model = joblib.load('indian_donor_likelihood_model_v3.joblib')
+        blood_features = joblib.load('indian_model_features_v3.joblib')
+        
+        # Organ Donation Resources
+        organ_df = pd.read_csv(ORGAN_DATASET_PATH)
+        # Typing columns are optional in the dataset; imported offers may carry them
+        organ_df = organ_df.reindex(columns=[*organ_df.columns, *(c for c in HLA_COLUMNS if c not in organ_df.columns)])
+        organ_hla = hla_codes.encode(organ_df)
+        organ_spatial.rebuild(organ_df['latitude'], organ_df['longitude'])
+        hospital_distances.rebuild('organ', organ_df['latitude'], organ_df['longitude'])
+        organ_transport = TransportMatrix.load()
+        organ_city_codes = organ_transport.city_codes(organ_df['city'])
+        
+        # Pre-process blood donor data, then split it into hot arrays and PII
+        blood_df = _prepare_blood_rows(blood_df)
+        eligibility.compute(blood_df)
+        # Suppression flags are row-aligned with the donor arrays for vectorised filtering
+        suppression.attach(blood_df['donor_id'])
+        blood_spatial.rebuild(blood_df['latitude'], blood_df['longitude'])
+        hospital_distances.rebuild('blood', blood_df['latitude'], blood_df['longitude'])
+        blood_pii = blood_pii or PIIStore()
+        blood_pii.replace_all(blood_df)
+        blood_donors = DonorColumns.from_frame(blood_df)
+        
+        logger.info("All resources loaded successfully", extra={
+            'blood_donors': len(blood_donors), 'hot_bytes_per_donor': round(blood_donors.nbytes() / max(len(blood_donors), 1), 1)})
+    except Exception as e:
+        # Critical error if files are missing or corrupted
+        logger.critical("Fatal error loading resources: %s", e)
+        raise
+
+def _prepare_blood_rows(df):
+    if 'last_donation_date' not in df.columns:
+        df['last_donation_date'] = df['created_at'] if 'created_at' in df.columns else pd.NaT
+    df['last_donation_date'] = parse_donation_dates(df['last_donation_date'])
+    return df
+
+
+def append_blood_donors(rows):
+    """Appends validated donor rows to the live arrays, PII store and row-aligned indexes.
+
+    The row-aligned arrays grow before blood_donors is swapped, so a
+    concurrent ranking query sees either the old donors or the new ones,
+    never more donors than its masks cover.
+    """
+    global blood_donors
+    rows = _prepare_blood_rows(rows.reset_index(drop=True))
+    with _append_lock:
+        blood_pii.append(rows)
+        eligibility.extend(rows)
+        suppression.extend(rows['donor_id'])
+        blood_spatial.extend(rows['latitude'], rows['longitude'])
+        hospital_distances.extend('blood', rows['latitude'], rows['longitude'])
+        start = len(blood_donors)
+        blood_donors = blood_donors.extended(rows)
+    _notify_donor_changes(np.arange(start, start + len(rows)))
+    return len(rows)
+
+
+def append_organ_donors(rows):
+    """Appends validated organ donor rows to the live table and its spatial index."""
+    global organ_df, organ_city_codes, organ_hla
+    rows = rows.reset_index(drop=True).reindex(columns=organ_df.columns)
+    with _append_lock:
+        organ_spatial.extend(rows['latitude'], rows['longitude'])
+        hospital_distances.extend('organ', rows['latitude'], rows['longitude'])
+        organ_city_codes = np.concatenate([organ_city_codes, organ_transport.city_codes(rows['city'])])
+        organ_hla = np.concatenate([organ_hla, hla_codes.encode(rows)])
+        start = len(organ_df)
+        organ_df = pd.concat([organ_df, rows], ignore_index=True)
+    rows.index = pd.RangeIndex(start, start + len(rows))
+    for callback in _organ_offer_subscribers:
+        callback(rows)
+    return len(rows)
+
+
+def subscribe_organ_offers(callback):
+    """Registers a callback invoked with new organ offers (indexed by their organ_df row)."""
+    _organ_offer_subscribers.append(callback)
+
+
+def update_donor_location(donor_id, lat, lon):
+    """Moves one blood donor in the live arrays, spatial index and hospital distance tables."""
+    with _append_lock:
+        donors = blood_donors
+        row = donors.row_of.get(donor_id)
+        if row is None:
+            return False
+        blood_spatial.move(row, lat, lon)
+        hospital_distances.move('blood', row, lat, lon)
+        donors.latitude[row], donors.longitude[row] = lat, lon
+    _notify_donor_changes(np.array([row]))
+    return True
+
+
+def subscribe_donor_changes(callback):
+    """Registers a callback invoked with the rows of blood donors that were added or moved."""
+    _donor_change_subscribers.append(callback)
+
+
+def subscribe_unfilled_outreach(callback):
+    """Registers a callback invoked with outreach requests that found no eligible donor.
+
+    A callback may return an ID under which it keeps the request open; the
+    outreach result reports it as standing_query_id.
+    """
+    _unfilled_outreach_subscribers.append(callback)
+
+
+def _notify_donor_changes(rows):
+    for callback in _donor_change_subscribers:
+        callback(rows)
+
+
+def _apply_reply(transition):
+    if transition['state'] == OPTED_OUT:
+        suppression.set_opted_out(transition['donor_id'])
+    elif transition['state'] == ACCEPTED:
+        # Accepting is not donating: the donation is counted, and the cooldown
+        # started, only by confirm-donation
+        suppression.hold(transition['donor_id'], datetime.today().date() + timedelta(days=ACCEPTANCE_HOLD_DAYS))
+
+
+reply_tracker.subscribe(_apply_reply)
+
+
+def valid_donation_type(donation_type):
+    """Whether the active eligibility rule set can defer a donation of this type."""
+    return eligibility.rules.knows(donation_type)
+
+
+def record_donation(donor_id, donated_on=None, donation_type=DEFAULT_DONATION_TYPE):
+    """Updates the in-memory donor row after a confirmed donation.
+
+    update_donor_record() persists the same change to the CSV; this keeps the
+    loaded arrays and their eligibility dates in step without a reload.
+    """
+    donors = blood_donors
+    row = donors.row_of.get(donor_id)
+    if row is None:
+        return False
+    donated_on = donated_on or datetime.today().replace(hour=0, minute=0, second=0, microsecond=0)
+    eligibility.record_donation(row, donated_on, donation_type, donors.sex[row])
+    donors.last_donation_day[row] = day_number(donated_on)
+    return True
+
+
+def donors_becoming_eligible(start, end, blood_group=None):
+    """Donors whose cooldown ends in [start, end], soonest first (for proactive outreach)."""
+    donors = blood_donors
+    rows = eligibility.becoming_eligible(start, end)
+    rows = rows[rows < len(donors)]
+    if blood_group:
+        rows = rows[donors.group[rows] == donors.group_code(blood_group)]
+    result = donors.frame(rows)[['donor_id', 'blood_group', 'city']]
+    pii = blood_pii.hydrate(result['donor_id']).reindex(result['donor_id'])
+    result.insert(1, 'name', pii['name'].to_numpy())
+    result['contact_number'] = pii['contact_number'].to_numpy()
+    next_day = eligibility.next_eligible[rows].astype('datetime64[D]')
+    result['next_eligible_date'] = np.datetime_as_string(next_day, unit='D')
+    return result
+
+# --- Utility Functions (Haversine Distance) ---
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Calculates great-circle distance in kilometers using numpy for vectorization."""
+    R = 6371  # Earth radius in kilometers
+
+    # Use np.radians and np.sin/cos/sqrt for vectorization across Pandas Series
+    lat1, lon1, lat2, lon2 = map(np.radians, [lat1, lon1, lat2, lon2])
+    
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+    a = np.sin(dlat/2.0)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon/2.0)**2
+    c = 2 * np.arcsin(np.sqrt(a))
+    
+    return R * c
+
+# --- Blood Donor Matching Logic ---
+
+def find_top_blood_donors(blood_group, hospital_lat, hospital_long, today_date, top_n=5):
+    """Finds top blood donors based on cooldown and suitability score.
+
+    The scan runs over the typed donor arrays; names and contact numbers are
+    fetched from the PII store for the top_n rows only.
+    """
+    
+    # Use global data loaded previously
+    with stage('find_top_blood_donors', 'filter'):
+        # Cooldown is one comparison against the precomputed next_eligible_date;
+        # opted-out, deferred and recently messaged donors are masked out too
+        donors = blood_donors
+        n = len(donors)
+        eligible = eligibility.eligible_mask(today_date)[:n] & ~suppression.mask(today_date)[:n]
+        rows = np.flatnonzero((donors.group == donors.group_code(blood_group)) & eligible)
+    
+    if len(rows) == 0: return pd.DataFrame()
+
+    # Requests from a registered hospital read precomputed distances (None otherwise)
+    distances = hospital_distances.lookup('blood', hospital_lat, hospital_long)
+    scored = rank_blood_candidates(donors, rows, hospital_lat, hospital_long, top_n, blood_model, blood_features,
+                                   distances)
+    with stage('find_top_blood_donors', 'hydrate'):
+        return hydrate_blood_results(donors, blood_pii, scored)
+
+
+def rank_blood_candidates(donors, rows, hospital_lat, hospital_long, top_n, model, features, distances=None):
+    """Scores candidate rows; returns (rows, distance_km, likelihood, score) for the top_n, best first.
+
+    Large partitions are scored in parallel chunks (see parallel_scoring).
+    """
+    return parallel_scoring.rank_candidates(donors, rows, hospital_lat, hospital_long, top_n, model, features,
+                                            distances=distances)
+
+
+def hydrate_blood_results(donors, pii_store, scored):
+    """Result frame for scored rows, with names and contact numbers from the PII store."""
+    rows, distance_km, likelihood, suitability_score = scored
+    result = donors.frame(rows)[['donor_id', 'latitude', 'longitude']]
+    pii = pii_store.hydrate(result['donor_id']).reindex(result['donor_id'])
+    result.insert(1, 'name', pii['name'].to_numpy())
+    result.insert(4, 'contact_number', pii['contact_number'].to_numpy())
+    result['distance_km'] = distance_km
+    result['likelihood'] = likelihood
+    result['suitability_score'] = suitability_score
+    return result
+
+# --- Organ Match Ranking Logic ---
+
+def find_best_organ_match(required_organ, recipient_lat, recipient_long, current_time_utc, top_n=5,
+                          recipient_hla=None):
+    """Ranks organ offers that can reach the recipient within the organ's viability window.
+
+    With the recipient's HLA typing (a typing string such as
+    'A2,A24,B7,B8,DR15,DR4' or an HLA_COLUMNS mapping), typed offers are
+    scored on their mismatches with that recipient.
+    """
+    
+    # Use global data loaded previously; the row-aligned arrays are read after
+    # organ_df so they are never shorter than it
+    organs = organ_df
+    distances = hospital_distances.lookup('organ', recipient_lat, recipient_long)
+    hla = organ_hla
+    recipient_codes = hla_codes.encode_typing(recipient_hla) if recipient_hla else None
+    return rank_organ_donors(organs, required_organ, recipient_lat, recipient_long, current_time_utc, top_n,
+                             distances, organ_transport, organ_city_codes, recipient_codes, hla)
+
+
+def viability_hours_remaining(required_organ, offers, current_time_utc):
+    """Hours each offer has left to reach the recipient."""
+    limit = MAX_VIABILITY_HOURS.get(required_organ, DEFAULT_VIABILITY_HOURS)
+    if not COUNT_ELAPSED_ISCHEMIA or current_time_utc is None:
+        return np.full(len(offers), float(limit))
+    elapsed = current_time_utc - pd.to_datetime(offers['time_available_utc'])
+    return limit - elapsed.dt.total_seconds().to_numpy() / 3600
+
+
+def rank_organ_donors(organ_df, required_organ, recipient_lat, recipient_long, current_time_utc, top_n=5,
+                      distances=None, transport=None, city_codes=None, recipient_hla=None, hla=None):
+    """Ranks one organ donor table (the national one, or a shard's partition).
+
+    With a transport matrix, offers whose city-to-city transport time exceeds
+    the remaining viability are dropped; `city_codes` are the table's
+    precomputed row city codes (derived from the city column if omitted).
+    With `recipient_hla` codes, hla_match_score is recomputed per offer from
+    its typing (`hla`, row-aligned codes) wherever both sides are typed.
+    """
+    with stage('find_best_organ_match', 'filter'):
+        df_eligible = organ_df[
+            (organ_df['organ_available'] == required_organ) & 
+            (organ_df['donor_type'] == 'Deceased')
+        ].copy()
+    
+    if df_eligible.empty: 
+        return pd.DataFrame()
+    
+    # Calculate Distance only (ignore time constraints for demo)
+    with stage('find_best_organ_match', 'distance'):
+        if distances is not None:
+            # Precomputed from a registered hospital, indexed by organ_df row
+            df_eligible['distance_km'] = distances[df_eligible.index.to_numpy()].astype(np.float64)
+        else:
+            df_eligible['distance_km'] = df_eligible.apply(
+                lambda row: haversine(row['latitude'], row['longitude'], recipient_lat, recipient_long), axis=1
+            )
+    
+    if transport is not None:
+        with stage('find_best_organ_match', 'transport'):
+            if city_codes is not None:
+                codes = city_codes[df_eligible.index.to_numpy()]
+            else:
+                codes = transport.city_codes(df_eligible['city'])
+            destination = transport.nearest_city(recipient_lat, recipient_long)
+            df_eligible['transport_hours'] = transport.transport_hours(
+                codes, destination, df_eligible['distance_km'].to_numpy())
+            df_eligible['transport_mode'] = transport.mode(codes, destination)
+            reachable = df_eligible['transport_hours'].to_numpy() <= viability_hours_remaining(
+                required_organ, df_eligible, current_time_utc)
+            df_eligible = df_eligible[reachable]
+        if df_eligible.empty:
+            return pd.DataFrame()
+
+    if recipient_hla is not None:
+        with stage('find_best_organ_match', 'hla'):
+            donor_hla = hla[df_eligible.index.to_numpy()] if hla is not None else hla_codes.encode(df_eligible)
+            df_eligible['hla_match_score'] = hla_scores(donor_hla, recipient_hla, df_eligible['hla_match_score'])
+            df_eligible['hla_mismatches'] = np.where(typed(donor_hla) & typed(recipient_hla),
+                                                     mismatches(donor_hla, recipient_hla).sum(axis=1), np.nan)
+
+    # Score based on HLA and distance only
+    with stage('find_best_organ_match', 'rank'):
+        df_eligible['suitability_score'] = (
+            df_eligible['hla_match_score'] * df_eligible['tissue_size_factor']
+        ) / (df_eligible['distance_km'] + 1)
+        
+        df_ranked = df_eligible.sort_values(by='suitability_score', ascending=False)
+        
+        result_cols = ['name', 'latitude', 'longitude', 'hospital_contact_number', 'hla_match_score', 'distance_km', 'suitability_score']
+        if transport is not None:
+            result_cols += ['transport_hours', 'transport_mode']
+        if recipient_hla is not None:
+            result_cols.insert(result_cols.index('hla_match_score') + 1, 'hla_mismatches')
+        
+        return df_ranked[result_cols].head(top_n)
+
+# --- Outreach Logic ---
+
+# Message templates by urgency (1-10 scale); below HIGH uses SMS_MESSAGE_TEMPLATE
+CRITICAL_MESSAGE_TEMPLATE = (
+    "🚨 CRITICAL BLOOD EMERGENCY 🚨 Your {blood_group} blood is URGENTLY needed "
+    "at a nearby hospital. IMMEDIATE response required. Reply YES to save a life or NO to decline. "
+    "Reply STOP to opt out. [Donor ID: {donor_id}] [Emergency Level: CRITICAL]"
+)
+HIGH_MESSAGE_TEMPLATE = (
+    "URGENT BLOOD DONOR NEEDED. Your blood group ({blood_group}) is urgently "
+    "required at a hospital near your location. Reply YES to accept or NO to decline. "
+    "Reply STOP to opt out. [Donor ID: {donor_id}] [Emergency Level: HIGH]"
+)
+CPAAS_FROM_NUMBER = messaging.TWILIO_PHONE_NUMBER
+NO_ELIGIBLE_DONORS = "No eligible donors found."
+
+def message_template_for(urgency_level):
+    if urgency_level is not None and urgency_level >= 8:
+        return CRITICAL_MESSAGE_TEMPLATE
+    if urgency_level is not None and urgency_level >= 6:
+        return HIGH_MESSAGE_TEMPLATE
+    return SMS_MESSAGE_TEMPLATE
+
+
+def send_outreach_sms(contact_number, message_body):
+    """Queues one donor message through the messaging router; returns its result dict.
+
+    The router fails over between providers (SMS, then WhatsApp) and skips
+    any whose circuit breaker is open.
+    """
+    with stage('initiate_outreach', 'outreach'):
+        return messaging.router.send(contact_number, message_body, channels=messaging.DEFAULT_CHANNELS)
+
+
+def initiate_outreach(blood_group, lat, lon, urgency_level=None, ai_reasoning='', top_n=5,
+                      hospital=None):
+    """Ranks donors and messages them in rank order until one SMS is queued.
+
+    Called directly by the Flask routes and by the in-process agent runtime.
+    Triggers for the same hospital and blood group inside one idempotency
+    window collapse into a single outreach job, and donors messaged within
+    the cool-off window are skipped.
+    """
+    def work(job):
+        result = _run_outreach(job['job_id'], blood_group, lat, lon, urgency_level, ai_reasoning, top_n)
+        if result.get('reason') == NO_ELIGIBLE_DONORS:
+            request = {'blood_group': blood_group, 'lat': lat, 'lon': lon, 'urgency_level': urgency_level,
+                       'ai_reasoning': ai_reasoning, 'top_n': top_n, 'hospital': hospital}
+            for callback in _unfilled_outreach_subscribers:
+                query_id = callback(request)
+                if query_id:
+                    result['standing_query_id'] = query_id
+        return result
+
+    job, created = outreach_jobs.run(hospital_key(hospital, lat, lon), blood_group, work)
+    result = dict(job['result'] or {"status": "running"})
+    result.update(job_id=job['job_id'], deduplicated=not created)
+    return result
+
+
+def _run_outreach(job_id, blood_group, lat, lon, urgency_level, ai_reasoning, top_n):
+    today = datetime.today().replace(hour=0, minute=0, second=0, microsecond=0)
+    # Recently messaged donors are already suppressed inside the ranking
+    top_donors_df = find_top_blood_donors(blood_group, lat, lon, today, top_n=top_n)
+
+    if top_donors_df.empty:
+        return {"status": "failed", "reason": NO_ELIGIBLE_DONORS}
+
+    message_template = message_template_for(urgency_level)
+    contacted_donors = []
+
+    # Failover Loop and CPaaS Integration
+    for rank, donor in enumerate(top_donors_df.itertuples(index=False), start=1):
+        # Claim the donor first so a concurrent job that ranked before this
+        # one's send landed in the suppression list cannot message them too
+        if not contact_ledger.try_reserve(donor.donor_id, job_id):
+            continue
+        message_body = message_template.format(
+            blood_group=blood_group,
+            donor_id=donor.donor_id # Use Donor ID for easy tracking in the reply
+        )
+        attempt = {
+            'donor_id': donor.donor_id,
+            'name': donor.name,
+            'contact_number': donor.contact_number,
+            'suitability_score': float(donor.suitability_score)
+        }
+
+        sent = send_outreach_sms(donor.contact_number, message_body)
+
+        if sent['success']: # Message queued with one of the providers
+            logger.info("SMS initiated", extra={'donor_id': donor.donor_id, 'rank_used': rank,
+                                                'urgency_level': urgency_level, 'provider': sent['provider']})
+            contacted_donors.append(dict(attempt, status='success', provider=sent['provider']))
+            reply_tracker.record_sent(donor.donor_id, donor.contact_number, job_id)
+            suppression.mark_messaged(donor.donor_id)
+            # Queuing the SMS completes step 1; the donor's reply arrives via
+            # /api/sms/inbound and advances their state in donor_replies.
+            return {
+                "status": "success",
+                "donor_contacted": donor.name,
+                "contact_number": donor.contact_number,
+                "urgency_level": urgency_level,
+                "ai_reasoning": ai_reasoning,
+                "rank_used": rank,
+                "all_contacted": contacted_donors
+            }
+
+        contact_ledger.release(donor.donor_id, job_id)
+        failover_logger.warning("Messaging error %s, failing over to next donor", sent['error'],
+                       extra={'donor_id': donor.donor_id})
+        contacted_donors.append(dict(attempt, status='failed', error=sent['error']))
+
+    # Final Failover (If all failed)
+    return {
+        "status": "failed",
+        "reason": f"All top {len(top_donors_df)} donors failed to queue SMS.",
+        "all_contacted": contacted_donors
+    }
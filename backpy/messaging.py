@@ -0,0 +1,490 @@
+import os
+import json
+import time
+import uuid
+import smtplib
+import threading
+import contextvars
+import concurrent.futures
+import requests
+from abc import ABC, abstractmethod
+from email.message import EmailMessage
+from typing import Callable, Dict, List, Optional, Sequence
+from xml.sax.saxutils import escape
+from instrumentation import REGISTRY, provider_call
+from structured_logging import get_logger, get_sampled_logger
+
+logger = get_logger(__name__)
+
+# --- Messaging Provider Configuration ---
+# Credentials come from the environment only. Without them there are no SMS or
+# voice providers and every send fails, unless fakes are asked for explicitly.
+TWILIO_ACCOUNT_SID = os.environ.get('TWILIO_ACCOUNT_SID', '')
+TWILIO_AUTH_TOKEN = os.environ.get('TWILIO_AUTH_TOKEN', '')
+TWILIO_PHONE_NUMBER = os.environ.get('TWILIO_PHONE_NUMBER', '')
+# WhatsApp needs an approved sender; the channel is skipped without one
+TWILIO_WHATSAPP_NUMBER = os.environ.get('TWILIO_WHATSAPP_NUMBER', '')
+# Twilio Notify sends one body to many numbers per request (mass broadcasts)
+TWILIO_NOTIFY_SERVICE_SID = os.environ.get('TWILIO_NOTIFY_SERVICE_SID', '')
+NOTIFY_MAX_BINDINGS = 1000
+# Account send rates: a long-code number takes about one message and one call
+# per second; raise these for short codes, toll-free numbers or messaging services
+TWILIO_MESSAGES_PER_SECOND = float(os.environ.get('TWILIO_MESSAGES_PER_SECOND', 1.0))
+TWILIO_CALLS_PER_SECOND = float(os.environ.get('TWILIO_CALLS_PER_SECOND', 1.0))
+# Local runs and drills only: in-process providers that "deliver" nothing
+MESSAGING_FAKE_PROVIDERS = os.environ.get('MESSAGING_FAKE_PROVIDERS', '') == '1'
+SMTP_HOST = os.environ.get('SMTP_HOST', '')
+SMTP_PORT = int(os.environ.get('SMTP_PORT', 587))
+SMTP_SENDER = os.environ.get('SMTP_SENDER', 'alerts@localhost')
+
+SMS, VOICE, WHATSAPP, EMAIL = 'sms', 'voice', 'whatsapp', 'email'
+# Organ dataset contact_method values -> preferred channels, best first
+CONTACT_METHOD_CHANNELS = {
+    'Call Center': (VOICE, SMS),
+    'Email': (EMAIL, SMS),
+}
+DEFAULT_CHANNELS = (SMS, WHATSAPP)
+SOS_CHANNELS = (SMS, WHATSAPP, VOICE)
+
+PROVIDER_TIMEOUT_SECONDS = 5
+# Circuit breaker: open after this many consecutive failures, probe again after the cool-off
+BREAKER_FAILURE_THRESHOLD = 3
+BREAKER_COOLOFF_SECONDS = 30
+# A call slower than this counts against the provider's health even if it succeeds
+SLOW_CALL_SECONDS = 2.0
+# Health score smoothing (weight of the newest call)
+HEALTH_ALPHA = 0.2
+# Hedged sends start the next provider if the current one has not answered by then
+HEDGE_DELAY_SECONDS = 0.75
+# Separate worker pools so a large batch never queues SOS hedges behind it
+PRIORITY_WORKERS = 8
+BULK_WORKERS = 8
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+# Per-send failures can be thousands a minute in an outage; breaker and metrics see every one
+SEND_FAILURE_LOG_EVERY = 20
+send_failure_logger = get_sampled_logger(__name__, SEND_FAILURE_LOG_EVERY)
+
+BREAKER_STATE = REGISTRY.gauge(
+    'messaging_circuit_open', '1 while a provider circuit breaker is open.', ('provider',))
+HEALTH_SCORE = REGISTRY.gauge(
+    'messaging_provider_health', 'Routing health score of each messaging provider (0-1).', ('provider',))
+
+
+class ProviderError(Exception):
+    pass
+
+
+class Provider(ABC):
+    """One outbound channel of one vendor; send() returns a message id or raises."""
+
+    name = 'provider'
+    channel = SMS
+    # Recipients per send_batch() call; only bulk/notify APIs go above 1
+    max_batch = 1
+    # Messages per second the account allows; None leaves pacing to the caller
+    rate_limit: Optional[float] = None
+
+    def accepts(self, to: str) -> bool:
+        return '@' not in to if self.channel != EMAIL else '@' in to
+
+    @abstractmethod
+    def send(self, to: str, body: str, timeout: float) -> str:
+        """Sends one message and returns its id; raises ProviderError on failure."""
+
+    def send_batch(self, to_list: Sequence[str], body: str, timeout: float) -> List[Optional[str]]:
+        """One body to up to max_batch recipients; a message id (or None) per recipient.
+
+        The default sends one by one; providers with a bulk API override it.
+        """
+        return [self.send(to, body, timeout) for to in to_list]
+
+
+class TwilioProvider(Provider):
+    """Twilio Messages (SMS, WhatsApp) and Calls (voice, reading the body aloud)."""
+
+    def __init__(self, channel: str = SMS, account_sid: str = TWILIO_ACCOUNT_SID,
+                 auth_token: str = TWILIO_AUTH_TOKEN, from_number: str = TWILIO_PHONE_NUMBER):
+        self.channel = channel
+        self.name = f"twilio_{channel}"
+        self.rate_limit = TWILIO_CALLS_PER_SECOND if channel == VOICE else TWILIO_MESSAGES_PER_SECOND
+        self.auth = (account_sid, auth_token)
+        self.from_number = from_number
+        self.base_url = f"https://api.twilio.com/2010-04-01/Accounts/{account_sid}"
+
+    def send(self, to: str, body: str, timeout: float) -> str:
+        if self.channel == VOICE:
+            url = f"{self.base_url}/Calls.json"
+            data = {'From': self.from_number, 'To': to,
+                    'Twiml': f"<Response><Say>{escape(body)}</Say></Response>"}
+        else:
+            url = f"{self.base_url}/Messages.json"
+            prefix = 'whatsapp:' if self.channel == WHATSAPP else ''
+            data = {'From': prefix + self.from_number, 'To': prefix + to, 'Body': body}
+        response = requests.post(url, auth=self.auth, data=data, timeout=timeout)
+        if response.status_code != 201:
+            raise ProviderError(f"HTTP {response.status_code}: {response.text[:200]}")
+        return response.json().get('sid')
+
+
+class TwilioNotifyProvider(Provider):
+    """Twilio Notify: one request delivers the same SMS to up to NOTIFY_MAX_BINDINGS numbers."""
+
+    name = 'twilio_notify'
+    channel = SMS
+    max_batch = NOTIFY_MAX_BINDINGS
+    # Notify fans out through the same numbers, so recipients are paced like single messages
+    rate_limit = TWILIO_MESSAGES_PER_SECOND
+
+    def __init__(self, service_sid: str = TWILIO_NOTIFY_SERVICE_SID, account_sid: str = TWILIO_ACCOUNT_SID,
+                 auth_token: str = TWILIO_AUTH_TOKEN):
+        self.url = f"https://notify.twilio.com/v1/Services/{service_sid}/Notifications"
+        self.auth = (account_sid, auth_token)
+
+    def send(self, to: str, body: str, timeout: float) -> str:
+        return self.send_batch([to], body, timeout)[0]
+
+    def send_batch(self, to_list: Sequence[str], body: str, timeout: float) -> List[Optional[str]]:
+        bindings = [json.dumps({'binding_type': 'sms', 'address': to}) for to in to_list]
+        response = requests.post(self.url, auth=self.auth, data={'ToBinding': bindings, 'Body': body},
+                                 timeout=timeout)
+        if response.status_code != 201:
+            raise ProviderError(f"HTTP {response.status_code}: {response.text[:200]}")
+        sid = response.json().get('sid')
+        return [sid] * len(to_list)
+
+
+class SMTPEmailProvider(Provider):
+    name = 'smtp_email'
+    channel = EMAIL
+
+    def __init__(self, host: str = SMTP_HOST, port: int = SMTP_PORT, sender: str = SMTP_SENDER):
+        self.host = host
+        self.port = port
+        self.sender = sender
+
+    def send(self, to: str, body: str, timeout: float) -> str:
+        message = EmailMessage()
+        message['From'], message['To'] = self.sender, to
+        message['Subject'] = body.split('\n', 1)[0][:78]
+        message.set_content(body)
+        message_id = f"<{uuid.uuid4().hex}@{self.host}>"
+        message['Message-ID'] = message_id
+        with smtplib.SMTP(self.host, self.port, timeout=timeout) as smtp:
+            smtp.starttls()
+            smtp.send_message(message)
+        return message_id
+
+
+class FakeProvider(Provider):
+    """In-process provider for local runs and outage drills.
+
+    Set `down` to fail every call, `latency` to delay each call and
+    `fail_every` to fail one call in n; sent messages are kept in `sent`.
+    """
+
+    def __init__(self, name: str, channel: str = SMS, latency: float = 0.0, down: bool = False,
+                 fail_every: int = 0, max_batch: int = 1):
+        self.name = name
+        self.channel = channel
+        self.max_batch = max_batch
+        self.latency = latency
+        self.down = down
+        self.fail_every = fail_every
+        self.calls = 0
+        self.sent: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def send(self, to: str, body: str, timeout: float) -> str:
+        with self._lock:
+            self.calls += 1
+            calls = self.calls
+        if self.latency:
+            time.sleep(min(self.latency, timeout))
+            if self.latency > timeout:
+                raise ProviderError(f"{self.name} timed out after {timeout}s")
+        if self.down or (self.fail_every and calls % self.fail_every == 0):
+            raise ProviderError(f"{self.name} unavailable")
+        message_id = f"{self.name}-{calls}"
+        with self._lock:
+            self.sent.append({'to': to, 'body': body, 'message_id': message_id})
+        return message_id
+
+    def send_batch(self, to_list: Sequence[str], body: str, timeout: float) -> List[Optional[str]]:
+        if self.latency:
+            time.sleep(min(self.latency, timeout))
+        if self.down or self.latency > timeout:
+            with self._lock:
+                self.calls += 1
+            raise ProviderError(f"{self.name} unavailable")
+        return [self.send(to, body, timeout) for to in to_list]
+
+
+class CircuitBreaker:
+    """Closed -> open after consecutive failures -> half-open single probe after the cool-off."""
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 cooloff: float = BREAKER_COOLOFF_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooloff = cooloff
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self, now: Optional[float] = None) -> bool:
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if self.state == OPEN and now - self.opened_at >= self.cooloff:
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record(self, ok: bool) -> None:
+        with self._lock:
+            if ok:
+                self.state, self.failures, self._probing = CLOSED, 0, False
+            else:
+                self.failures += 1
+                if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                    if self.state != OPEN:
+                        logger.warning("Circuit opened", extra={'provider': self.name, 'failures': self.failures})
+                    self.state, self.opened_at, self._probing = OPEN, time.monotonic(), False
+            BREAKER_STATE.set(int(self.state == OPEN), self.name)
+
+
+class ProviderHealth:
+    """Smoothed success rate and latency; score = success / (1 + latency / SLOW_CALL_SECONDS)."""
+
+    def __init__(self):
+        self.success = 1.0
+        self.latency = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, ok: bool, seconds: float) -> None:
+        with self._lock:
+            self.success += HEALTH_ALPHA * ((1.0 if ok and seconds <= SLOW_CALL_SECONDS else 0.0) - self.success)
+            self.latency += HEALTH_ALPHA * (seconds - self.latency)
+
+    @property
+    def score(self) -> float:
+        return self.success / (1 + self.latency / SLOW_CALL_SECONDS)
+
+
+class MessageRouter:
+    """Sends a message over the healthiest available provider, failing over on errors.
+
+    Providers are tried in the caller's channel order, best health score
+    first within a channel, skipping any whose circuit breaker is open, so
+    an outage costs one timeout per breaker trip instead of one per
+    message. hedge=True (SOS) also starts the next provider whenever the
+    current one has not answered within HEDGE_DELAY_SECONDS and returns
+    the first success; a recipient may then get the alert twice.
+
+    Hedged sends run on their own priority pool and send_batch() fans out
+    on a bulk pool, so a broadcast cannot hold up an SOS. Failover only
+    helps across independent vendors: with the default providers every
+    channel is Twilio, so a Twilio outage trips all the breakers together.
+    """
+
+    def __init__(self, providers: Sequence[Provider], timeout: float = PROVIDER_TIMEOUT_SECONDS,
+                 hedge_delay: float = HEDGE_DELAY_SECONDS, priority_workers: int = PRIORITY_WORKERS,
+                 bulk_workers: int = BULK_WORKERS):
+        self.providers = list(providers)
+        self.timeout = timeout
+        self.hedge_delay = hedge_delay
+        self.breakers = {p.name: CircuitBreaker(p.name) for p in self.providers}
+        self.health = {p.name: ProviderHealth() for p in self.providers}
+        self._priority_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=priority_workers, thread_name_prefix='messaging-priority')
+        self._bulk_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=bulk_workers, thread_name_prefix='messaging-bulk')
+
+    def candidates(self, to: str, channels: Sequence[str] = DEFAULT_CHANNELS,
+                   prefer_bulk: bool = False) -> List[Provider]:
+        rank = {channel: i for i, channel in enumerate(channels)}
+        usable = [p for p in self.providers if p.channel in rank and p.accepts(to)]
+        return sorted(usable, key=lambda p: (rank[p.channel], prefer_bulk and p.max_batch == 1,
+                                             -self.health[p.name].score))
+
+    def send(self, to: str, body: str, channels: Sequence[str] = DEFAULT_CHANNELS, hedge: bool = False) -> Dict:
+        """Result dict: success, provider, channel, message_id, error, attempts."""
+        providers = self.candidates(to, channels)
+        if hedge:
+            return self._send_hedged(to, body, providers)
+        attempts = []
+        for provider in providers:
+            result = self._attempt(provider, to, body)
+            if result is None:
+                continue
+            attempts.append(result)
+            if result['success']:
+                break
+        return self._result(to, attempts)
+
+    def _send_hedged(self, to: str, body: str, providers: List[Provider]) -> Dict:
+        attempts, running = [], set()
+        remaining = list(providers)
+        while remaining or running:
+            # Start the next provider: nothing is in flight, the last one failed, or the hedge delay passed
+            while remaining:
+                provider = remaining.pop(0)
+                if self.breakers[provider.name].allow():
+                    running.add(self._priority_executor.submit(
+                        contextvars.copy_context().run, self._call, provider, to, body))
+                    break
+            if not running:
+                break
+            done, running = concurrent.futures.wait(
+                running, timeout=self.hedge_delay if remaining else None,
+                return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                attempts.append(future.result())
+                if attempts[-1]['success']:
+                    # Slower hedges still finish and update provider health
+                    return self._result(to, attempts)
+        return self._result(to, attempts)
+
+    def send_batch(self, to_list: Sequence[str], body: str, channels: Sequence[str] = DEFAULT_CHANNELS,
+                   before_send: Optional[Callable[[Provider, int], None]] = None) -> Dict:
+        """Sends one body to many recipients on the first provider that takes the batch.
+
+        Bulk providers get max_batch recipients per request; others are sent
+        one by one on the router's bulk workers. `before_send(provider, n)` runs
+        before every provider request with the n recipients it carries (1 per
+        message on non-bulk providers), e.g. to wait on that provider's rate
+        limit; that wait does not count against the provider's health.
+        Result: provider, channel, message_ids (None per failed recipient), error.
+        """
+        to_list = list(to_list)
+        error = 'No messaging provider available'
+        for provider in (self.candidates(to_list[0], channels, prefer_bulk=True) if to_list else []):
+            if not self.breakers[provider.name].allow():
+                continue
+            seconds = []
+            with provider_call(provider.name) as call:
+                try:
+                    if provider.max_batch > 1:
+                        message_ids = []
+                        for i in range(0, len(to_list), provider.max_batch):
+                            chunk = to_list[i:i + provider.max_batch]
+                            if before_send:
+                                before_send(provider, len(chunk))
+                            start = time.perf_counter()
+                            message_ids += provider.send_batch(chunk, body, self.timeout)
+                            seconds.append(time.perf_counter() - start)
+                    else:
+                        sent = list(self._bulk_executor.map(
+                            lambda to: self._send_one(provider, to, body, before_send), to_list))
+                        message_ids = [message_id for message_id, _ in sent]
+                        seconds = [elapsed for _, elapsed in sent]
+                        if not any(message_ids):
+                            raise ProviderError(f"{provider.name} failed every recipient")
+                    call['ok'] = True
+                except Exception as e:
+                    error = str(e)
+            self._record(provider, call['ok'], sum(seconds) / len(seconds) if seconds else 0.0)
+            if call['ok']:
+                return {'provider': provider.name, 'channel': provider.channel, 'message_ids': message_ids,
+                        'error': None}
+            logger.warning("Provider batch failed: %s", error, extra={'provider': provider.name,
+                                                                      'recipients': len(to_list)})
+        return {'provider': None, 'channel': None, 'message_ids': [None] * len(to_list), 'error': error}
+
+    def _send_one(self, provider: Provider, to: str, body: str,
+                  before_send: Optional[Callable[[Provider, int], None]] = None) -> tuple:
+        """(message id or None, seconds the provider took) for one recipient of a batch."""
+        if before_send:
+            before_send(provider, 1)
+        start = time.perf_counter()
+        try:
+            return provider.send(to, body, self.timeout), time.perf_counter() - start
+        except Exception:
+            return None, time.perf_counter() - start
+
+    def _attempt(self, provider: Provider, to: str, body: str) -> Optional[Dict]:
+        if not self.breakers[provider.name].allow():
+            return None
+        return self._call(provider, to, body)
+
+    def _call(self, provider: Provider, to: str, body: str) -> Dict:
+        start = time.perf_counter()
+        with provider_call(provider.name) as call:
+            try:
+                message_id, error = provider.send(to, body, self.timeout), None
+                call['ok'] = True
+            except Exception as e:
+                message_id, error = None, str(e)
+        elapsed = time.perf_counter() - start
+        self._record(provider, call['ok'], elapsed)
+        if error:
+            send_failure_logger.warning("Provider send failed: %s", error, extra={'provider': provider.name})
+        return {'provider': provider.name, 'channel': provider.channel, 'success': call['ok'],
+                'message_id': message_id, 'error': error, 'seconds': round(elapsed, 4)}
+
+    def _record(self, provider: Provider, ok: bool, seconds: float) -> None:
+        self.breakers[provider.name].record(ok)
+        self.health[provider.name].record(ok, seconds)
+        HEALTH_SCORE.set(round(self.health[provider.name].score, 4), provider.name)
+
+    @staticmethod
+    def _result(to: str, attempts: List[Dict]) -> Dict:
+        winner = next((a for a in attempts if a['success']), None)
+        last = winner or (attempts[-1] if attempts else {})
+        return {
+            'to': to,
+            'success': winner is not None,
+            'provider': last.get('provider'),
+            'channel': last.get('channel'),
+            'message_id': last.get('message_id'),
+            'error': None if winner else (last.get('error') or 'No messaging provider available'),
+            'attempts': attempts,
+        }
+
+    def status(self) -> List[Dict]:
+        return [{'provider': p.name, 'channel': p.channel, 'circuit': self.breakers[p.name].state,
+                 'health': round(self.health[p.name].score, 4)} for p in self.providers]
+
+
+def default_providers() -> List[Provider]:
+    """Twilio SMS and voice, plus Notify, WhatsApp and email when configured.
+
+    With MESSAGING_FAKE_PROVIDERS=1 SMS and voice go to FakeProviders
+    instead. Missing Twilio credentials fail closed: no SMS or voice
+    provider is registered, so sends report failure rather than success.
+    Every Twilio channel shares one vendor (and one account), so failover
+    between them does not survive a Twilio-wide outage; email is the only
+    independent path.
+    """
+    if MESSAGING_FAKE_PROVIDERS:
+        logger.warning("MESSAGING_FAKE_PROVIDERS=1: messages are not delivered")
+        providers: List[Provider] = [FakeProvider('fake_sms', SMS), FakeProvider('fake_voice', VOICE)]
+    elif not (TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN and TWILIO_PHONE_NUMBER):
+        logger.error("TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN and TWILIO_PHONE_NUMBER must be set; "
+                     "SMS and voice sends will fail")
+        providers = []
+    else:
+        providers = [TwilioProvider(SMS), TwilioProvider(VOICE)]
+        if TWILIO_NOTIFY_SERVICE_SID:
+            providers.append(TwilioNotifyProvider())
+        if TWILIO_WHATSAPP_NUMBER:
+            providers.append(TwilioProvider(WHATSAPP, from_number=TWILIO_WHATSAPP_NUMBER))
+    if SMTP_HOST:
+        providers.append(SMTPEmailProvider())
+    return providers
+
+
+def channels_for(contact_method: Optional[str]) -> Sequence[str]:
+    return CONTACT_METHOD_CHANNELS.get(contact_method, DEFAULT_CHANNELS)
+
+
+# Global router used by donor outreach and the SOS system
+router = MessageRouter(default_providers())
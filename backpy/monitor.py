@@ -1,6 +1,8 @@
 import requests
-import time
-from datetime import datetime
+from inventory_service import InventoryService
+from structured_logging import configure_logging, get_logger, log_context
+
+logger = get_logger(__name__)
 
 # --- Configuration ---
 API_URL = "http://127.0.0.1:5000/api/blood/initiate-call"
@@ -10,49 +12,61 @@ INVENTORY_DB_MOCK = {
     # Add other blood types here...
 }
 HOSPITAL_LOCATION = {'lat': 19.0760, 'lon': 72.8777} # Mumbai
+HOSPITAL_KEY = 'mumbai_central'
+
+inventory = InventoryService(
+    thresholds={group: levels['threshold'] for group, levels in INVENTORY_DB_MOCK.items()}
+)
 
 def check_inventory_and_act():
-    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Checking inventory...")
-    
-    shortages_found = []
+    logger.info("Checking inventory")
     
-    # 1. Simulate Checking Inventory Database
-    for blood_group, inventory in INVENTORY_DB_MOCK.items():
-        if inventory['current_units'] < inventory['threshold']:
-            print(f"--- SHORTAGE DETECTED: {blood_group} ---")
-            shortages_found.append(blood_group)
+    # 1. Push the inventory database into the change feed; groups below
+    # threshold are queued as shortages (most severe first, debounced)
+    for blood_group, levels in INVENTORY_DB_MOCK.items():
+        inventory.update(HOSPITAL_KEY, blood_group, levels['current_units'])
 
     # 2. Autonomous Outreach (Calling the API)
-    for group in shortages_found:
-        print(f"Initiating autonomous call outreach for {group}...")
-        
-        payload = {
-            "blood_group": group,
-            "lat": HOSPITAL_LOCATION['lat'],
-            "lon": HOSPITAL_LOCATION['lon']
-        }
+    inventory.drain(handle_shortage)
+
+
+def handle_shortage(event):
+    with log_context(blood_group=event['blood_group']):
+        request_outreach(event['blood_group'])
+
+
+def request_outreach(group):
+    logger.info("Initiating autonomous call outreach")
+    
+    payload = {
+        "blood_group": group,
+        "hospital": HOSPITAL_KEY,
+        "lat": HOSPITAL_LOCATION['lat'],
+        "lon": HOSPITAL_LOCATION['lon']
+    }
+    
+    try:
+        # POST request to your API to start the call loop
+        response = requests.post(API_URL, json=payload)
         
-        try:
-            # POST request to your API to start the call loop
-            response = requests.post(API_URL, json=payload)
+        if response.status_code == 200:
+            result = response.json()
+            logger.info("API response status: %s", result.get('status'))
+            if result.get('status') == 'success':
+                logger.info("Contacted and confirmed donor")
+                # In a real system, you would update the inventory here.
+            elif result.get('reason'):
+                logger.warning("Outreach failed: %s", result.get('reason'))
+        else:
+            logger.error("API returned status %s", response.status_code)
             
-            if response.status_code == 200:
-                result = response.json()
-                print(f"  API Response Status: {result.get('status')}")
-                if result.get('status') == 'success':
-                    print(f"  SUCCESS: Contacted and confirmed donor {result.get('donor_contacted')}.")
-                    # In a real system, you would update the inventory here.
-                elif result.get('reason'):
-                     print(f"  FAILURE: {result.get('reason')}")
-            else:
-                print(f"  ERROR: API returned status {response.status_code}")
-                
-        except requests.exceptions.ConnectionError:
-            print(f"  ERROR: Could not connect to API at {API_URL}. Is Flask running?")
-        except Exception as e:
-            print(f"  An unexpected error occurred: {e}")
+    except requests.exceptions.ConnectionError:
+        logger.error("Could not connect to API at %s. Is Flask running?", API_URL)
+    except Exception as e:
+        logger.exception("An unexpected error occurred: %s", e)
 
 if __name__ == "__main__":
-    # In a real setup, you would use a scheduler here.
-    # For a simple test, just run it once.
+    # For a simple test, just run it once. A long-running setup would call
+    # inventory.start_dispatcher(handle_shortage) and feed inventory.update().
+    configure_logging()
     check_inventory_and_act()
\ No newline at end of file
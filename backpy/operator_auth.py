@@ -0,0 +1,22 @@
+import os
+import hmac
+from typing import Optional
+from flask import request
+
+# --- Operator API Configuration ---
+# Bearer token for operator-only actions (mass broadcasts, bulk imports). With
+# no token configured those endpoints accept nothing.
+OPERATOR_API_TOKEN = os.environ.get('OPERATOR_API_TOKEN', '')
+
+
+def authorized(authorization: Optional[str], token: Optional[str] = None) -> bool:
+    """True for 'Bearer <OPERATOR_API_TOKEN>'; False for everything when no token is configured."""
+    token = OPERATOR_API_TOKEN if token is None else token
+    if not token or not authorization or not authorization.startswith('Bearer '):
+        return False
+    return hmac.compare_digest(authorization[len('Bearer '):].strip(), token)
+
+
+def operator_request() -> bool:
+    """Whether the current Flask request carries the operator token."""
+    return authorized(request.headers.get('Authorization'))
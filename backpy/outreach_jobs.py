@@ -0,0 +1,166 @@
+import time
+import uuid
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Callable, Dict, Optional, Tuple
+from flask import Blueprint, jsonify
+from structured_logging import get_logger, log_context
+
+logger = get_logger(__name__)
+
+# --- Outreach Job Configuration ---
+OUTREACH_BLUEPRINT = Blueprint('outreach', __name__)
+
+# A trigger within this long of a running or successful job for the same
+# hospital and blood group shares that job; finished jobs are forgotten
+# once they are this old
+IDEMPOTENCY_WINDOW_SECONDS = 30 * 60
+# A donor who was messaged is not messaged again inside this window
+DONOR_COOL_OFF_SECONDS = 24 * 60 * 60
+
+
+def hospital_key(hospital: Optional[str], lat: float, lon: float) -> str:
+    """Identifies the requesting site; ad-hoc callers are keyed by ~100 m cell."""
+    return hospital or f"{round(float(lat), 3)},{round(float(lon), 3)}"
+
+
+class ContactLedger:
+    """Per-donor record of the last message, for O(1) cool-off checks."""
+
+    def __init__(self, cool_off_seconds: float = DONOR_COOL_OFF_SECONDS):
+        self.cool_off_seconds = cool_off_seconds
+        self._last_contact: Dict[str, Tuple[float, str]] = {}
+        self._lock = threading.Lock()
+
+    def can_contact(self, donor_id: str, now: Optional[float] = None) -> bool:
+        entry = self._last_contact.get(donor_id)
+        return entry is None or (now or time.time()) - entry[0] >= self.cool_off_seconds
+
+    def try_reserve(self, donor_id: str, job_id: str, now: Optional[float] = None) -> bool:
+        """Atomically claims a donor for a job; False if inside the cool-off."""
+        now = now or time.time()
+        with self._lock:
+            if not self.can_contact(donor_id, now):
+                return False
+            self._last_contact[donor_id] = (now, job_id)
+            return True
+
+    def release(self, donor_id: str, job_id: str) -> None:
+        """Undoes a reservation whose message was never queued."""
+        with self._lock:
+            entry = self._last_contact.get(donor_id)
+            if entry and entry[1] == job_id:
+                del self._last_contact[donor_id]
+
+    def last_contact(self, donor_id: str) -> Optional[Dict]:
+        entry = self._last_contact.get(donor_id)
+        if entry is None:
+            return None
+        return {'contacted_at': datetime.fromtimestamp(entry[0]).isoformat(), 'job_id': entry[1]}
+
+
+class OutreachJobManager:
+    """Collapses duplicate outreach triggers into one job per hospital and blood group.
+
+    A trigger gets the existing job back, without waiting for it, while
+    that job is running or succeeded less than `window_seconds` before the
+    trigger (a sliding window from the job's start); a failed job may be
+    retried at once. Finished jobs are evicted `window_seconds` after they
+    finish.
+    """
+
+    def __init__(self, window_seconds: float = IDEMPOTENCY_WINDOW_SECONDS,
+                 clock: Callable[[], float] = time.time):
+        self.window_seconds = window_seconds
+        self.clock = clock
+        self.jobs: Dict[str, Dict] = {}
+        self._by_key: Dict[tuple, str] = {}
+        self._started: Dict[str, float] = {}
+        # (finished at, job_id) in finishing order, for eviction
+        self._finished: deque = deque()
+        self._lock = threading.Lock()
+
+    def _duplicate_of(self, key: tuple, now: float) -> Optional[Dict]:
+        # Caller holds the lock
+        job = self.jobs.get(self._by_key.get(key))
+        if job is None or job['status'] == 'failed':
+            return None
+        if job['status'] == 'running' or now - self._started[job['job_id']] < self.window_seconds:
+            return job
+        return None
+
+    def _evict(self, now: float) -> None:
+        # Caller holds the lock
+        while self._finished and now - self._finished[0][0] >= self.window_seconds:
+            _, job_id = self._finished.popleft()
+            job = self.jobs.pop(job_id, None)
+            self._started.pop(job_id, None)
+            if job is not None:
+                key = (job['hospital'], job['blood_group'])
+                if self._by_key.get(key) == job_id:
+                    del self._by_key[key]
+
+    def run(self, hospital: str, blood_group: str, work: Callable[[Dict], Dict]) -> Tuple[Dict, bool]:
+        """Runs `work(job)` unless an equivalent job exists.
+
+        Returns (job, created). A duplicate returns immediately with the
+        existing job, which may still be running; callers poll get().
+        """
+        key = (hospital, blood_group)
+        now = self.clock()
+        with self._lock:
+            self._evict(now)
+            existing = self._duplicate_of(key, now)
+            if existing is None:
+                job = {
+                    'job_id': uuid.uuid4().hex[:12],
+                    'hospital': hospital,
+                    'blood_group': blood_group,
+                    'status': 'running',
+                    'created_at': datetime.fromtimestamp(now).isoformat(),
+                    'duplicate_triggers': 0,
+                    'result': None,
+                }
+                self.jobs[job['job_id']] = job
+                self._by_key[key] = job['job_id']
+                self._started[job['job_id']] = now
+            else:
+                existing['duplicate_triggers'] += 1
+
+        if existing is not None:
+            logger.info("Duplicate outreach trigger collapsed", extra={
+                'job_id': existing['job_id'], 'hospital': hospital, 'blood_group': blood_group})
+            return existing, False
+
+        with log_context(job_id=job['job_id'], blood_group=blood_group):
+            try:
+                job['result'] = work(job)
+                job['status'] = 'succeeded' if job['result'].get('status') == 'success' else 'failed'
+            except Exception as e:
+                logger.exception("Outreach job failed: %s", e)
+                job['result'] = {'status': 'failed', 'reason': str(e)}
+                job['status'] = 'failed'
+            finally:
+                finished = self.clock()
+                job['finished_at'] = datetime.fromtimestamp(finished).isoformat()
+                with self._lock:
+                    self._finished.append((finished, job['job_id']))
+        return job, True
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        return self.jobs.get(job_id)
+
+
+# Global job manager and contact ledger shared by every outreach path
+outreach_jobs = OutreachJobManager()
+contact_ledger = ContactLedger()
+
+# --- Flask API Endpoints ---
+
+@OUTREACH_BLUEPRINT.route('/api/outreach/jobs/<job_id>', methods=['GET'])
+def get_outreach_job(job_id):
+    job = outreach_jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "Outreach job not found"}), 404
+    return jsonify(job), 200
@@ -0,0 +1,101 @@
+import json
+import pandas as pd
+from typing import List, Optional
+from flask import Response
+
+# orjson is optional; without it responses fall back to the stdlib encoder.
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the deployment
+    orjson = None
+
+# --- Serialisation Configuration ---
+RESPONSE_FORMATS = ('records', 'columns')
+JSON_MIMETYPE = 'application/json'
+
+
+def dumps(payload) -> bytes:
+    """Encodes a payload to JSON bytes, NumPy arrays and scalars included."""
+    if orjson is not None:
+        # default= covers what orjson rejects natively, e.g. pandas Timestamps
+        return orjson.dumps(payload, default=_numpy_default,
+                            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, default=_numpy_default).encode('utf-8')
+
+
+def _numpy_default(value):
+    # Stdlib fallback for NumPy arrays/scalars and pandas timestamps
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def parse_fields(raw: Optional[str], available: List[str]) -> Optional[List[str]]:
+    """Parses a ``fields=a,b,c`` projection, keeping the caller's order.
+
+    Returns None when no projection was requested; raises ValueError for
+    columns that the result does not have.
+    """
+    if not raw:
+        return None
+    fields = [f.strip() for f in raw.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in available]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}. Available: {', '.join(available)}")
+    return fields
+
+
+def _python_values(series) -> list:
+    """Column values as Python objects, with missing values as None.
+
+    Pandas holds a missing string as NaN, which the stdlib encoder would
+    write as the invalid JSON token NaN; None always encodes as null.
+    """
+    values = series.to_numpy()
+    if series.hasnans:
+        values = values.astype(object)
+        values[pd.isna(values)] = None
+    return values.tolist()
+
+
+def _column_values(series):
+    values = series.to_numpy()
+    # orjson serialises numeric/bool arrays natively; object arrays (strings,
+    # timestamps) must go through tolist(), which also unboxes NumPy scalars.
+    if orjson is not None and values.dtype.kind in 'biuf' and not series.hasnans:
+        return values
+    return _python_values(series)
+
+
+def encode_frame(df, fields: Optional[List[str]] = None, fmt: str = 'records') -> bytes:
+    """Encodes a ranking result without building per-row dicts of NumPy scalars.
+
+    ``records`` returns a list of row objects (the historical shape);
+    ``columns`` returns ``{"columns": [...], "count": n, "data": {col: [...]}}``
+    for bulk consumers.
+    """
+    if fmt not in RESPONSE_FORMATS:
+        raise ValueError(f"Unknown format '{fmt}'. Use one of: {', '.join(RESPONSE_FORMATS)}")
+    columns = fields or list(df.columns)
+
+    if fmt == 'columns':
+        return dumps({
+            'columns': columns,
+            'count': len(df),
+            'data': {col: _column_values(df[col]) for col in columns},
+        })
+
+    column_lists = [_python_values(df[col]) for col in columns]
+    return dumps([dict(zip(columns, row)) for row in zip(*column_lists)])
+
+
+def frame_response(df, fields: Optional[List[str]] = None, fmt: str = 'records', status: int = 200) -> Response:
+    """Flask response for a result frame (see encode_frame)."""
+    return Response(encode_frame(df, fields, fmt), status=status, mimetype=JSON_MIMETYPE)
+
+
+def json_response(payload, status: int = 200) -> Response:
+    """Flask response for an arbitrary payload through the fast encoder."""
+    return Response(dumps(payload), status=status, mimetype=JSON_MIMETYPE)
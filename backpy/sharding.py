@@ -0,0 +1,277 @@
+import time
+import threading
+import multiprocessing
+import concurrent.futures
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+import matching_service
+from donor_store import DonorColumns, PIIStore, DONOR_PII_PATH, EXCLUDED_COLUMNS
+from eligibility import EligibilityIndex
+from instrumentation import stage
+from spatial_index import haversine_km
+from transport_matrix import TransportMatrix
+from hla import hla_codes, HLA_COLUMNS
+from suppression import suppression
+from structured_logging import configure_logging, get_logger
+
+logger = get_logger(__name__)
+
+# --- Sharding Configuration ---
+DEFAULT_SHARDS = 3
+DEFAULT_SEARCH_RADIUS_KM = 300
+SHARD_TIMEOUT_SECONDS = 10
+LOAD_CHUNK_ROWS = 100_000
+
+
+def plan_shards(city_counts: Dict[str, int], n_shards: int) -> List[List[str]]:
+    """Assigns whole cities to shards, largest first onto the lightest shard."""
+    shards = [[] for _ in range(min(n_shards, len(city_counts)) or 1)]
+    loads = [0] * len(shards)
+    for city, count in sorted(city_counts.items(), key=lambda item: -item[1]):
+        lightest = loads.index(min(loads))
+        shards[lightest].append(city)
+        loads[lightest] += count
+    return shards
+
+
+def _read_partition(path: str, cities: Sequence[str], **read_csv_args) -> pd.DataFrame:
+    """The rows of a dataset CSV whose city is in `cities`, read in bounded chunks."""
+    parts = [chunk[chunk['city'].isin(cities)]
+             for chunk in pd.read_csv(path, chunksize=LOAD_CHUNK_ROWS, **read_csv_args)]
+    return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+
+
+class ShardState:
+    """One region's blood and organ donors, as loaded inside a shard process."""
+
+    def __init__(self, shard_id: int, cities: Sequence[str]):
+        self.shard_id = shard_id
+        self.cities = list(cities)
+        blood = _read_partition(matching_service.BLOOD_DATASET_PATH, self.cities,
+                                usecols=lambda col: col not in EXCLUDED_COLUMNS)
+        blood = matching_service._prepare_blood_rows(blood)
+        self.eligibility = EligibilityIndex()
+        self.eligibility.compute(blood)
+        self.pii = PIIStore(f"{DONOR_PII_PATH}.shard{shard_id}")
+        self.pii.replace_all(blood)
+        self.donors = DonorColumns.from_frame(blood)
+        self.organs = _read_partition(matching_service.ORGAN_DATASET_PATH, self.cities)
+        # Not saved from shards, so concurrent shard starts never race on the matrix file
+        self.transport = TransportMatrix.load(matrix_path=None)
+        self.organ_city_codes = self.transport.city_codes(self.organs['city'])
+        self.organ_hla = hla_codes.encode(self.organs.reindex(columns=list(HLA_COLUMNS)))
+        self.model = matching_service.joblib.load('indian_donor_likelihood_model_v3.joblib')
+        self.features = matching_service.joblib.load('indian_model_features_v3.joblib')
+        self.regions = self._regions(blood)
+
+    def _regions(self, blood: pd.DataFrame) -> List[Dict]:
+        """Centroid and extent of every city, so the coordinator can skip far shards."""
+        located = pd.concat([blood[['city', 'latitude', 'longitude']], self.organs[['city', 'latitude', 'longitude']]])
+        regions = []
+        for city, points in located.groupby('city'):
+            lat, lon = points['latitude'].mean(), points['longitude'].mean()
+            extent = float(haversine_km(points['latitude'].to_numpy(), points['longitude'].to_numpy(), lat, lon).max())
+            regions.append({'city': city, 'lat': float(lat), 'lon': float(lon), 'extent_km': extent})
+        return regions
+
+    def find_blood(self, blood_group, lat, lon, today, top_n, excluded) -> pd.DataFrame:
+        donors = self.donors
+        eligible = self.eligibility.eligible_mask(today)
+        for donor_id in excluded:
+            row = donors.row_of.get(donor_id)
+            if row is not None:
+                eligible[row] = False
+        rows = np.flatnonzero((donors.group == donors.group_code(blood_group)) & eligible)
+        if len(rows) == 0:
+            return pd.DataFrame()
+        scored = matching_service.rank_blood_candidates(donors, rows, lat, lon, top_n, self.model, self.features)
+        return matching_service.hydrate_blood_results(donors, self.pii, scored)
+
+    def find_organ(self, organ, lat, lon, current_time_utc, top_n, recipient_hla=None) -> pd.DataFrame:
+        # Typings travel as text: HLA codes are only comparable within one process's vocabulary
+        recipient_codes = hla_codes.encode_typing(recipient_hla) if recipient_hla else None
+        return matching_service.rank_organ_donors(self.organs, organ, lat, lon, current_time_utc, top_n,
+                                                  transport=self.transport, city_codes=self.organ_city_codes,
+                                                  recipient_hla=recipient_codes, hla=self.organ_hla)
+
+
+def _shard_main(shard_id: int, cities: Sequence[str], conn) -> None:
+    """Shard process loop: load the partition, then answer queries until told to stop."""
+    configure_logging()
+    try:
+        state = ShardState(shard_id, cities)
+        conn.send({'status': 'ready', 'regions': state.regions, 'donors': len(state.donors),
+                   'organs': len(state.organs)})
+    except Exception as e:
+        conn.send({'status': 'error', 'error': str(e)})
+        return
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        if message['op'] == 'stop':
+            return
+        start = time.perf_counter()
+        try:
+            if message['op'] == 'blood':
+                result = state.find_blood(**message['args'])
+            else:
+                result = state.find_organ(**message['args'])
+            reply = {'status': 'ok', 'result': result}
+        except Exception as e:
+            logger.exception("Shard query failed: %s", e)
+            reply = {'status': 'error', 'error': str(e)}
+        reply['elapsed'] = time.perf_counter() - start
+        conn.send(reply)
+
+
+class ShardHandle:
+    """Coordinator-side end of one shard process."""
+
+    def __init__(self, shard_id: int, cities: Sequence[str], context):
+        self.shard_id = shard_id
+        self.cities = list(cities)
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=_shard_main, args=(shard_id, self.cities, child),
+                                       name=f'shard-{shard_id}', daemon=True)
+        self.lock = threading.Lock()
+        self.regions: List[Dict] = []
+        self.process.start()
+
+    def wait_ready(self, timeout: float) -> Dict:
+        if not self.conn.poll(timeout):
+            raise TimeoutError(f"Shard {self.shard_id} did not start within {timeout}s")
+        ready = self.conn.recv()
+        if ready['status'] != 'ready':
+            raise RuntimeError(f"Shard {self.shard_id} failed to load: {ready.get('error')}")
+        self.regions = ready['regions']
+        return ready
+
+    def covers(self, lat: float, lon: float, radius_km: Optional[float]) -> bool:
+        if radius_km is None:
+            return True
+        return any(haversine_km(r['lat'], r['lon'], lat, lon) - r['extent_km'] <= radius_km for r in self.regions)
+
+    def query(self, op: str, args: Dict, timeout: float) -> Dict:
+        with self.lock:
+            self.conn.send({'op': op, 'args': args})
+            if not self.conn.poll(timeout):
+                # The reply would arrive out of step with the next query; drop the shard
+                self.process.terminate()
+                raise TimeoutError(f"Shard {self.shard_id} timed out after {timeout}s")
+            return self.conn.recv()
+
+    def stop(self) -> None:
+        try:
+            with self.lock:
+                self.conn.send({'op': 'stop'})
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=5)
+
+
+class ShardCoordinator:
+    """Scatter-gather matching across region shards running as local processes.
+
+    Each query is sent only to shards with a city within `radius_km` of the
+    request, runs on those shards in parallel, and their top-k lists are
+    merged by suitability score. Every result carries the latency of each
+    shard it asked.
+    """
+
+    def __init__(self, shards: List[ShardHandle], timeout: float = SHARD_TIMEOUT_SECONDS):
+        self.shards = shards
+        self.timeout = timeout
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=max(len(shards), 1),
+                                                           thread_name_prefix='shard-gather')
+
+    @classmethod
+    def start_local(cls, n_shards: int = DEFAULT_SHARDS, startup_timeout: float = 120) -> 'ShardCoordinator':
+        """Partitions the datasets by city and starts one process per shard."""
+        city_counts = pd.concat([
+            pd.read_csv(matching_service.BLOOD_DATASET_PATH, usecols=['city'])['city'],
+            pd.read_csv(matching_service.ORGAN_DATASET_PATH, usecols=['city'])['city'],
+        ]).value_counts().to_dict()
+        # Spawned rather than forked: the parent runs Flask and worker threads
+        context = multiprocessing.get_context('spawn')
+        shards = [ShardHandle(i, cities, context) for i, cities in enumerate(plan_shards(city_counts, n_shards))]
+        for shard in shards:
+            ready = shard.wait_ready(startup_timeout)
+            logger.info("Shard ready", extra={'shard': shard.shard_id, 'cities': shard.cities,
+                                              'donors': ready['donors'], 'organs': ready['organs']})
+        return cls(shards)
+
+    def _gather(self, op: str, args: Dict, lat: float, lon: float, radius_km: Optional[float],
+                top_n: int, function: str):
+        targets = [s for s in self.shards if s.covers(lat, lon, radius_km)]
+        timings = []
+
+        def ask(shard):
+            start = time.perf_counter()
+            with stage(function, f'shard_{shard.shard_id}'):
+                try:
+                    reply = shard.query(op, args, self.timeout)
+                except Exception as e:
+                    reply = {'status': 'error', 'error': str(e)}
+            reply['latency'] = time.perf_counter() - start
+            return shard, reply
+
+        frames = []
+        for shard, reply in self._pool.map(ask, targets):
+            result = reply.get('result')
+            timings.append({
+                'shard': shard.shard_id,
+                'cities': shard.cities,
+                'status': reply['status'],
+                'latency_ms': round(reply['latency'] * 1000, 2),
+                'compute_ms': round(reply.get('elapsed', 0) * 1000, 2),
+                'candidates': 0 if result is None else len(result),
+            })
+            if reply['status'] != 'ok':
+                logger.warning("Shard query failed: %s", reply.get('error'), extra={'shard': shard.shard_id})
+            elif not result.empty:
+                frames.append(result)
+
+        if not frames:
+            return pd.DataFrame(), timings
+        merged = pd.concat(frames, ignore_index=True)
+        merged = merged.sort_values('suitability_score', ascending=False, kind='stable').head(top_n)
+        return merged.reset_index(drop=True), timings
+
+    def find_top_blood_donors(self, blood_group, hospital_lat, hospital_long, today_date, top_n=5,
+                              radius_km: Optional[float] = DEFAULT_SEARCH_RADIUS_KM):
+        """Returns (ranked frame, per-shard timings)."""
+        # Suppression lives with the coordinator; shards mask the listed donors out
+        suppressed = suppression.suppressed_ids(today_date)
+        args = {'blood_group': blood_group, 'lat': hospital_lat, 'lon': hospital_long,
+                'today': today_date, 'top_n': top_n, 'excluded': suppressed}
+        return self._gather('blood', args, hospital_lat, hospital_long, radius_km, top_n,
+                            'sharded_find_top_blood_donors')
+
+    def find_best_organ_match(self, required_organ, recipient_lat, recipient_long, current_time_utc, top_n=5,
+                              radius_km: Optional[float] = DEFAULT_SEARCH_RADIUS_KM, recipient_hla=None):
+        """Returns (ranked frame, per-shard timings)."""
+        args = {'organ': required_organ, 'lat': recipient_lat, 'lon': recipient_long,
+                'current_time_utc': current_time_utc, 'top_n': top_n, 'recipient_hla': recipient_hla}
+        return self._gather('organ', args, recipient_lat, recipient_long, radius_km, top_n,
+                            'sharded_find_best_organ_match')
+
+    def stop(self) -> None:
+        for shard in self.shards:
+            shard.stop()
+        self._pool.shutdown(wait=False)
+
+
+if __name__ == '__main__':
+    configure_logging()
+    coordinator = ShardCoordinator.start_local()
+    try:
+        today = datetime.today().replace(hour=0, minute=0, second=0, microsecond=0)
+        results, timings = coordinator.find_top_blood_donors('O-', 19.0760, 72.8777, today)
+        logger.info("Sharded query finished", extra={'results': len(results), 'shards': timings})
+    finally:
+        coordinator.stop()
@@ -0,0 +1,378 @@
+import os
+import hmac
+import json
+import base64
+import asyncio
+import hashlib
+import secrets
+import binascii
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit, parse_qs
+from structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+# --- SOS Event Stream Configuration ---
+# Finished streams kept for late subscribers and Last-Event-ID replay
+SOS_STREAM_RETENTION = 10_000
+SSE_HEARTBEAT_SECONDS = 15
+# Loopback by default; expose it through the reverse proxy that fronts Flask
+SOS_STREAM_HOST = os.environ.get('SOS_STREAM_HOST', '127.0.0.1')
+SOS_STREAM_PORT = int(os.environ.get('SOS_STREAM_PORT', 5001))
+SOS_EVENTS_PATH = '/api/emergency/sos-events/'
+# Browser origins allowed to open a stream (comma-separated); requests
+# without an Origin header (non-browser clients) are not restricted by it
+SOS_STREAM_ORIGINS = tuple(origin.strip() for origin in
+                           os.environ.get('SOS_STREAM_ORIGINS', 'http://localhost:5173').split(',')
+                           if origin.strip())
+# Signs the per-SOS stream tokens. Streams live in memory, so a random
+# per-process secret only loses tokens that had nothing left to stream
+SOS_STREAM_SECRET = os.environ.get('SOS_STREAM_SECRET') or secrets.token_hex(32)
+# Client frames are only ever control frames or small text; anything larger is dropped
+MAX_CLIENT_FRAME_BYTES = 4096
+
+_WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+
+def stream_token(sos_id: str) -> str:
+    """Bearer token for one SOS stream; events carry contact phone numbers."""
+    return hmac.new(SOS_STREAM_SECRET.encode(), sos_id.encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def valid_stream_token(sos_id: str, token: Optional[str]) -> bool:
+    return bool(token) and hmac.compare_digest(stream_token(sos_id), token)
+
+
+def request_token(query: Dict[str, List[str]], headers: Dict[str, str]) -> Optional[str]:
+    """?token= (EventSource cannot set headers) or an Authorization: Bearer header."""
+    authorization = headers.get('authorization', '')
+    if authorization.lower().startswith('bearer '):
+        return authorization[7:].strip()
+    return query.get('token', [None])[0]
+
+
+def origin_allowed(origin: Optional[str]) -> bool:
+    return origin is None or origin in SOS_STREAM_ORIGINS
+
+
+def format_sse(event: Dict) -> str:
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
+
+
+class SOSEventBus:
+    """Per-SOS event log with blocking and asyncio subscribers.
+
+    The SOS pipeline publishes from worker threads. Thread subscribers (the
+    Flask SSE route) wait on a condition; asyncio subscribers get one
+    call_soon_threadsafe per event for the whole loop, which then fans the
+    event out to every queue on that stream, so thousands of open
+    connections cost no threads. Events carry increasing ids per stream;
+    a subscriber resumes from any id and skips ids it has already seen.
+    """
+
+    def __init__(self, retention: int = SOS_STREAM_RETENTION):
+        self.retention = retention
+        self._streams: 'OrderedDict[str, List[Dict]]' = OrderedDict()
+        self._closed = set()
+        self._cond = threading.Condition()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queues: Dict[str, set] = {}
+
+    def open(self, sos_id: str) -> None:
+        with self._cond:
+            self._streams.setdefault(sos_id, [])
+            while len(self._streams) > self.retention:
+                old, _ = self._streams.popitem(last=False)
+                self._closed.discard(old)
+
+    def publish(self, sos_id: str, event_type: str, data: Dict, final: bool = False) -> Dict:
+        with self._cond:
+            events = self._streams.setdefault(sos_id, [])
+            event = {'id': len(events) + 1, 'event': event_type, 'data': data, 'final': final}
+            events.append(event)
+            if final:
+                self._closed.add(sos_id)
+            self._cond.notify_all()
+            loop = self._loop if sos_id in self._queues else None
+        if loop is not None:
+            loop.call_soon_threadsafe(self._fanout, sos_id, event)
+        return event
+
+    def exists(self, sos_id: str) -> bool:
+        return sos_id in self._streams
+
+    def closed(self, sos_id: str) -> bool:
+        return sos_id in self._closed
+
+    def events(self, sos_id: str, after: int = 0) -> Tuple[List[Dict], bool]:
+        """(events with id > after, stream closed)."""
+        with self._cond:
+            return self._streams.get(sos_id, [])[after:], sos_id in self._closed
+
+    def wait(self, sos_id: str, after: int, timeout: float) -> Tuple[List[Dict], bool]:
+        """Blocks until an event after `after` arrives, the stream closes, or `timeout` passes."""
+        with self._cond:
+            self._cond.wait_for(lambda: len(self._streams.get(sos_id, ())) > after or sos_id in self._closed,
+                                timeout)
+            return self._streams.get(sos_id, [])[after:], sos_id in self._closed
+
+    # --- asyncio side; call from the bound loop only ---
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+
+    def subscribe(self, sos_id: str, after: int = 0) -> Tuple[List[Dict], asyncio.Queue]:
+        """(backlog after `after`, queue of later events). Pair with unsubscribe()."""
+        queue: asyncio.Queue = asyncio.Queue()
+        with self._cond:
+            self._queues.setdefault(sos_id, set()).add(queue)
+            backlog = self._streams.get(sos_id, [])[after:]
+        return backlog, queue
+
+    def unsubscribe(self, sos_id: str, queue: asyncio.Queue) -> None:
+        queues = self._queues.get(sos_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                self._queues.pop(sos_id, None)
+
+    def _fanout(self, sos_id: str, event: Dict) -> None:
+        for queue in self._queues.get(sos_id, ()):
+            queue.put_nowait(event)
+
+
+class SOSStreamServer:
+    """Asyncio HTTP server streaming SOS events over SSE or WebSocket.
+
+    GET /api/emergency/sos-events/<sos_id> streams Server-Sent Events (resume
+    with Last-Event-ID or ?after=); the same path with an Upgrade: websocket
+    header streams one JSON text frame per event, answers pings and closes
+    when the client does. Every request needs the SOS's stream_token, and
+    browser requests an Origin from SOS_STREAM_ORIGINS. It runs its own
+    event loop on a daemon thread next to the Flask app.
+    """
+
+    def __init__(self, bus: SOSEventBus, host: str = SOS_STREAM_HOST, port: int = SOS_STREAM_PORT,
+                 heartbeat: float = SSE_HEARTBEAT_SECONDS):
+        self.bus = bus
+        self.host = host
+        self.port = port
+        self.heartbeat = heartbeat
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._ready = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._server = None
+
+    def start(self, timeout: float = 5.0) -> None:
+        """Starts the server thread; raises RuntimeError if it is not listening within `timeout`."""
+        if self.loop is not None:
+            return
+        self.loop = asyncio.new_event_loop()
+        self._error = None
+        threading.Thread(target=self._run, name='sos-stream-server', daemon=True).start()
+        if not self._ready.wait(timeout) or self._error is not None:
+            loop, self.loop = self.loop, None
+            loop.call_soon_threadsafe(loop.stop)
+            raise RuntimeError(f"SOS stream server failed to start on {self.host}:{self.port}: "
+                               f"{self._error or 'timed out'}") from self._error
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        try:
+            self._server = self.loop.run_until_complete(asyncio.start_server(self._handle, self.host, self.port))
+        except Exception as e:
+            # Surfaced by start(); the thread just ends
+            self._error = e
+            self._ready.set()
+            return
+        self.port = self._server.sockets[0].getsockname()[1]
+        self.bus.bind_loop(self.loop)
+        logger.info("SOS stream server listening", extra={'host': self.host, 'port': self.port})
+        self._ready.set()
+        self.loop.run_forever()
+
+    def stop(self) -> None:
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            method, target, headers = await self._read_request(reader)
+            url = urlsplit(target)
+            query = parse_qs(url.query)
+            sos_id = url.path[len(SOS_EVENTS_PATH):] if url.path.startswith(SOS_EVENTS_PATH) else ''
+            origin = headers.get('origin')
+            if not origin_allowed(origin):
+                await self._respond(writer, '403 Forbidden', {'error': 'Origin not allowed'})
+                return
+            cors = f"Access-Control-Allow-Origin: {origin}\r\nVary: Origin\r\n" if origin else ''
+            if method != 'GET' or not sos_id:
+                await self._respond(writer, '404 Not Found', {'error': 'Not found'}, cors)
+                return
+            if not valid_stream_token(sos_id, request_token(query, headers)):
+                await self._respond(writer, '401 Unauthorized', {'error': 'Missing or invalid stream token'}, cors)
+                return
+            if not self.bus.exists(sos_id):
+                await self._respond(writer, '404 Not Found', {'error': 'SOS request not found'}, cors)
+                return
+            after = headers.get('last-event-id') or query.get('after', ['0'])[0]
+            after = int(after) if str(after).isdigit() else 0
+            if headers.get('upgrade', '').lower() == 'websocket':
+                if not _valid_handshake(headers):
+                    await self._respond(writer, '400 Bad Request', {'error': 'Invalid WebSocket handshake'}, cors)
+                    return
+                await self._stream_websocket(reader, writer, headers, sos_id, after)
+            else:
+                await self._stream_sse(writer, sos_id, after, cors)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader: asyncio.StreamReader):
+        head = await reader.readuntil(b'\r\n\r\n')
+        lines = head.decode('latin-1').split('\r\n')
+        method, target, _ = lines[0].split(' ', 2)
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        return method, target, headers
+
+    @staticmethod
+    async def _respond(writer: asyncio.StreamWriter, status: str, body: Dict, cors: str = '') -> None:
+        payload = json.dumps(body).encode()
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(payload)}\r\n"
+                     f"{cors}Connection: close\r\n\r\n".encode() + payload)
+        await writer.drain()
+
+    async def _events(self, sos_id: str, after: int):
+        """Yields events after `after` until the final one; None on each idle heartbeat."""
+        backlog, queue = self.bus.subscribe(sos_id, after)
+        last = after
+        try:
+            pending = list(backlog)
+            if not pending and self.bus.events(sos_id, after)[1]:
+                return
+            while True:
+                if not pending:
+                    try:
+                        pending.append(await asyncio.wait_for(queue.get(), self.heartbeat))
+                    except asyncio.TimeoutError:
+                        yield None
+                        continue
+                event = pending.pop(0)
+                if event['id'] <= last:
+                    continue
+                last = event['id']
+                yield event
+                if event['final']:
+                    return
+        finally:
+            self.bus.unsubscribe(sos_id, queue)
+
+    async def _stream_sse(self, writer: asyncio.StreamWriter, sos_id: str, after: int, cors: str = '') -> None:
+        writer.write(f"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+                     f"{cors}Connection: close\r\n\r\n".encode())
+        async for event in self._events(sos_id, after):
+            writer.write(b": heartbeat\n\n" if event is None else format_sse(event).encode())
+            await writer.drain()
+
+    async def _stream_websocket(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, headers: Dict,
+                                sos_id: str, after: int) -> None:
+        key = headers['sec-websocket-key']
+        accept = base64.b64encode(hashlib.sha1((key + _WEBSOCKET_GUID).encode()).digest()).decode()
+        writer.write(f"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                     f"Sec-WebSocket-Accept: {accept}\r\n\r\n".encode())
+        sender = asyncio.ensure_future(self._send_events(writer, sos_id, after))
+        receiver = asyncio.ensure_future(self._receive_frames(reader, writer))
+        try:
+            await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+            if sender.done():
+                sender.result()
+                writer.write(_websocket_frame(b'\x03\xe8', opcode=0x8))    # close, 1000
+                await writer.drain()
+                # Give the client a moment to answer the close handshake
+                await asyncio.wait({receiver}, timeout=1.0)
+            else:
+                close_payload = receiver.result()
+                if close_payload is not None:
+                    writer.write(_websocket_frame(close_payload[:2], opcode=0x8))
+                    await writer.drain()
+        finally:
+            for task in (sender, receiver):
+                task.cancel()
+
+    async def _send_events(self, writer: asyncio.StreamWriter, sos_id: str, after: int) -> None:
+        async for event in self._events(sos_id, after):
+            if event is None:
+                writer.write(_websocket_frame(b'', opcode=0x9))    # ping
+            else:
+                writer.write(_websocket_frame(json.dumps(
+                    {k: event[k] for k in ('id', 'event', 'data')}, default=str).encode()))
+            await writer.drain()
+
+    @staticmethod
+    async def _receive_frames(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> Optional[bytes]:
+        """Answers client pings until the client closes; returns its close payload (None on EOF)."""
+        while True:
+            try:
+                opcode, payload = await _read_client_frame(reader)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                return None
+            except ValueError:
+                return b'\x03\xea'    # 1002, protocol error
+            if opcode == 0x8:
+                return payload or b'\x03\xe8'
+            if opcode == 0x9:
+                writer.write(_websocket_frame(payload, opcode=0xA))    # pong
+                await writer.drain()
+            # Text, binary and pong frames from the client are ignored
+
+
+def _valid_handshake(headers: Dict[str, str]) -> bool:
+    """RFC 6455 client handshake: Connection: Upgrade, version 13 and a 16-byte key."""
+    if 'upgrade' not in headers.get('connection', '').lower() or headers.get('sec-websocket-version') != '13':
+        return False
+    try:
+        return len(base64.b64decode(headers.get('sec-websocket-key', ''), validate=True)) == 16
+    except (binascii.Error, ValueError):
+        return False
+
+
+async def _read_client_frame(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+    """(opcode, unmasked payload) of one client frame; client frames must be masked."""
+    head = await reader.readexactly(2)
+    opcode, masked, length = head[0] & 0x0F, head[1] & 0x80, head[1] & 0x7F
+    if not masked:
+        raise ValueError("Unmasked client frame")
+    if length == 126:
+        length = int.from_bytes(await reader.readexactly(2), 'big')
+    elif length == 127:
+        length = int.from_bytes(await reader.readexactly(8), 'big')
+    if length > MAX_CLIENT_FRAME_BYTES:
+        raise ValueError("Client frame too large")
+    mask = await reader.readexactly(4)
+    payload = await reader.readexactly(length)
+    return opcode, bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+
+
+def _websocket_frame(payload: bytes, opcode: int = 0x1) -> bytes:
+    # Server frames are never masked
+    n = len(payload)
+    if n < 126:
+        header = bytes([0x80 | opcode, n])
+    elif n < 1 << 16:
+        header = bytes([0x80 | opcode, 126]) + n.to_bytes(2, 'big')
+    else:
+        header = bytes([0x80 | opcode, 127]) + n.to_bytes(8, 'big')
+    return header + payload
+
+
+# Global bus shared by the SOS pipeline, the Flask SSE route and the stream server
+sos_events = SOSEventBus()
+sos_stream_server = SOSStreamServer(sos_events)
@@ -0,0 +1,99 @@
+import math
+import threading
+import numpy as np
+from typing import Dict, List, Tuple
+
+# --- Spatial Index Configuration ---
+EARTH_RADIUS_KM = 6371
+DEFAULT_CELL_DEGREES = 0.1    # ~11 km of latitude per cell
+
+
+class GridIndex:
+    """Uniform lat/lon grid over table rows for radius queries.
+
+    Each cell holds the row numbers of the points inside it, so a radius
+    query only measures points in the cells overlapping its bounding box.
+    Rows are appended as the table grows; row numbers are the table's
+    positional index.
+    """
+
+    def __init__(self, cell_degrees: float = DEFAULT_CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self._cells: Dict[Tuple[int, int], List[np.ndarray]] = {}
+        self._lat = np.zeros(0, dtype=np.float64)
+        self._lon = np.zeros(0, dtype=np.float64)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._lat)
+
+    def extend(self, lat, lon) -> None:
+        """Indexes the next len(lat) rows."""
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        with self._lock:
+            start = len(self._lat)
+            rows = np.arange(start, start + len(lat))
+            ci = np.floor(lat / self.cell_degrees).astype(np.int64)
+            cj = np.floor(lon / self.cell_degrees).astype(np.int64)
+            # Group the new rows by cell in one sort instead of a per-row insert
+            order = np.lexsort((cj, ci))
+            ci, cj, rows = ci[order], cj[order], rows[order]
+            boundaries = np.flatnonzero((np.diff(ci) != 0) | (np.diff(cj) != 0)) + 1
+            for chunk_i, chunk_j, chunk in zip(np.split(ci, boundaries), np.split(cj, boundaries),
+                                               np.split(rows, boundaries)):
+                if len(chunk):
+                    self._cells.setdefault((int(chunk_i[0]), int(chunk_j[0])), []).append(chunk)
+            self._lat = np.concatenate([self._lat, lat])
+            self._lon = np.concatenate([self._lon, lon])
+
+    def move(self, row: int, lat: float, lon: float) -> None:
+        """Re-files one row whose coordinates changed."""
+        with self._lock:
+            old = (math.floor(self._lat[row] / self.cell_degrees), math.floor(self._lon[row] / self.cell_degrees))
+            new = (math.floor(lat / self.cell_degrees), math.floor(lon / self.cell_degrees))
+            if old != new:
+                # Chunks are shared with in-flight queries, so replace rather than edit them
+                chunks = [chunk[chunk != row] for chunk in self._cells.get(old, [])]
+                self._cells[old] = [chunk for chunk in chunks if len(chunk)]
+                self._cells.setdefault(new, []).append(np.array([row]))
+            self._lat[row], self._lon[row] = lat, lon
+
+    def rebuild(self, lat, lon) -> None:
+        with self._lock:
+            self._cells = {}
+            self._lat = np.zeros(0, dtype=np.float64)
+            self._lon = np.zeros(0, dtype=np.float64)
+        self.extend(lat, lon)
+
+    def within(self, lat: float, lon: float, radius_km: float) -> Tuple[np.ndarray, np.ndarray]:
+        """(rows, distances_km) of every point within `radius_km`, nearest first."""
+        dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+        # Longitude degrees shrink towards the poles; clamp to stay finite
+        dlon = dlat / max(math.cos(math.radians(lat)), 1e-6)
+        i0, i1 = math.floor((lat - dlat) / self.cell_degrees), math.floor((lat + dlat) / self.cell_degrees)
+        j0, j1 = math.floor((lon - dlon) / self.cell_degrees), math.floor((lon + dlon) / self.cell_degrees)
+
+        with self._lock:
+            if (i1 - i0 + 1) * (j1 - j0 + 1) > len(self._cells):
+                parts = [chunk for (i, j), chunks in self._cells.items()
+                         if i0 <= i <= i1 and j0 <= j <= j1 for chunk in chunks]
+            else:
+                parts = [chunk for i in range(i0, i1 + 1) for j in range(j0, j1 + 1)
+                         for chunk in self._cells.get((i, j), ())]
+            lat_all, lon_all = self._lat, self._lon
+        if not parts:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+
+        rows = np.concatenate(parts)
+        distances = haversine_km(lat_all[rows], lon_all[rows], lat, lon)
+        inside = distances <= radius_km
+        rows, distances = rows[inside], distances[inside]
+        order = np.argsort(distances, kind='stable')
+        return rows[order], distances[order]
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, [lat1, lon1, lat2, lon2])
+    a = np.sin((lat2 - lat1) / 2.0) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2.0) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
@@ -0,0 +1,337 @@
+import os
+import uuid
+import sqlite3
+import threading
+import concurrent.futures
+import numpy as np
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+from flask import Blueprint, request, jsonify
+import matching_service
+from inventory_store import BLOOD_GROUPS
+from outreach_jobs import hospital_key
+from spatial_index import GridIndex, haversine_km
+from suppression import suppression
+from structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+# --- Standing Query Configuration ---
+STANDING_BLUEPRINT = Blueprint('standing_queries', __name__)
+
+STANDING_QUERIES_PATH = os.environ.get('STANDING_QUERIES_PATH', 'standing_queries.sqlite')
+DEFAULT_RADIUS_KM = 50
+STANDING_QUERY_TTL_HOURS = 72
+# How often the eligibility queue is drained and expired queries closed
+STANDING_TICK_SECONDS = 300
+# Changed donors are grouped into grid cells of this size before the query lookup
+DONOR_CELL_DEGREES = 0.1
+DONOR_CELL_SLACK_KM = 16    # half the diagonal of a 0.1 degree cell, rounded up
+
+OPEN, FULFILLED, EXPIRED, CANCELLED = 'open', 'fulfilled', 'expired', 'cancelled'
+
+FIELDS = ('query_id', 'blood_group', 'lat', 'lon', 'radius_km', 'hospital', 'urgency_level', 'ai_reasoning',
+          'top_n', 'status', 'created_at', 'expires_at', 'attempts', 'last_attempt_at', 'fulfilled_at', 'job_id')
+SCHEMA = ("CREATE TABLE IF NOT EXISTS standing_queries (query_id TEXT PRIMARY KEY, blood_group TEXT, lat REAL, "
+          "lon REAL, radius_km REAL, hospital TEXT, urgency_level INTEGER, ai_reasoning TEXT, top_n INTEGER, "
+          "status TEXT, created_at TEXT, expires_at TEXT, attempts INTEGER, last_attempt_at TEXT, "
+          "fulfilled_at TEXT, job_id TEXT)")
+
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec='seconds')
+
+
+class StandingQueryEngine:
+    """Open blood requests that are re-evaluated when matching donors appear.
+
+    Each open query is a point in a grid index over query locations. A donor
+    change (new donor, moved donor, or a cooldown that has just ended) is
+    looked up in that grid, so only the queries whose group and radius cover
+    a newly eligible donor are re-run; their outreach goes through
+    initiate_outreach on a single worker. Cost follows the number of changed
+    donors and the queries near them, not open queries x donors. Queries
+    are kept in SQLite and survive restarts.
+    """
+
+    def __init__(self, path: str = STANDING_QUERIES_PATH):
+        self.path = path
+        # Opened by load() or the first query, not at import
+        self._conn: Optional[sqlite3.Connection] = None
+        self._open_lock = threading.Lock()
+        self.queries: Dict[str, Dict] = {}
+        self._by_key: Dict[tuple, str] = {}
+        # Row-aligned with the grid: one row per query ever indexed
+        self._grid = GridIndex(cell_degrees=1.0)
+        self._row_ids: List[str] = []
+        self._row_group = np.zeros(0, dtype=np.int8)
+        self._row_radius = np.zeros(0, dtype=np.float64)
+        self._row_open = np.zeros(0, dtype=bool)
+        self._max_radius = 0.0
+        self._eligible_through = None
+        self._lock = threading.RLock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='standing-query')
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """The SQLite connection, opened (and the schema created) on first use."""
+        if self._conn is None:
+            with self._open_lock:
+                if self._conn is None:
+                    conn = sqlite3.connect(self.path, check_same_thread=False)
+                    conn.execute(SCHEMA)
+                    self._conn = conn
+        return self._conn
+
+    # --- Registration ---
+
+    def load(self) -> None:
+        """Loads open queries and re-runs each once to catch changes made while stopped."""
+        cursor = self.conn.execute(f"SELECT {', '.join(FIELDS)} FROM standing_queries WHERE status = ?", (OPEN,))
+        with self._lock:
+            for row in cursor.fetchall():
+                self._index(dict(zip(FIELDS, row)))
+            self._eligible_through = datetime.today().date()
+            pending = list(self.queries)
+        logger.info("Standing queries loaded", extra={'open': len(pending)})
+        self._submit(pending)
+
+    def register(self, blood_group: str, lat: float, lon: float, radius_km: float = DEFAULT_RADIUS_KM,
+                 hospital: Optional[str] = None, urgency_level=None, ai_reasoning: str = '', top_n: int = 5,
+                 ttl_hours: float = STANDING_QUERY_TTL_HOURS) -> Dict:
+        """Opens a query, or returns the open one for the same site and blood group."""
+        if blood_group not in BLOOD_GROUPS:
+            raise ValueError(f"blood_group must be one of: {', '.join(BLOOD_GROUPS)}")
+        key = (hospital_key(hospital, lat, lon), blood_group)
+        with self._lock:
+            existing = self.queries.get(self._by_key.get(key))
+            if existing is not None and existing['status'] == OPEN:
+                return existing
+            query = {
+                'query_id': uuid.uuid4().hex[:12], 'blood_group': blood_group, 'lat': float(lat), 'lon': float(lon),
+                'radius_km': float(radius_km), 'hospital': hospital, 'urgency_level': urgency_level,
+                'ai_reasoning': ai_reasoning, 'top_n': int(top_n), 'status': OPEN, 'created_at': _now(),
+                'expires_at': (datetime.now() + timedelta(hours=ttl_hours)).isoformat(timespec='seconds'),
+                'attempts': 0, 'last_attempt_at': None, 'fulfilled_at': None, 'job_id': None,
+            }
+            self._index(query)
+            self._save(query)
+        logger.info("Standing query opened", extra={k: query[k] for k in ('query_id', 'blood_group', 'radius_km')})
+        return query
+
+    def _index(self, query: Dict) -> None:
+        self.queries[query['query_id']] = query
+        self._by_key[(hospital_key(query['hospital'], query['lat'], query['lon']), query['blood_group'])] = \
+            query['query_id']
+        query['_row'] = len(self._row_ids)
+        self._row_ids.append(query['query_id'])
+        self._grid.extend([query['lat']], [query['lon']])
+        self._row_group = np.append(self._row_group, np.int8(BLOOD_GROUPS.index(query['blood_group'])))
+        self._row_radius = np.append(self._row_radius, query['radius_km'])
+        self._row_open = np.append(self._row_open, True)
+        self._max_radius = max(self._max_radius, query['radius_km'])
+
+    def _close(self, query: Dict, status: str) -> None:
+        with self._lock:
+            query['status'] = status
+            self._row_open[query['_row']] = False
+            if status == FULFILLED:
+                query['fulfilled_at'] = _now()
+            self._save(query)
+
+    def _save(self, query: Dict) -> None:
+        with self.conn:
+            self.conn.execute(
+                f"INSERT OR REPLACE INTO standing_queries ({', '.join(FIELDS)}) "
+                f"VALUES ({', '.join('?' * len(FIELDS))})", [query[f] for f in FIELDS])
+
+    def cancel(self, query_id: str) -> bool:
+        query = self.queries.get(query_id)
+        if query is None or query['status'] != OPEN:
+            return False
+        self._close(query, CANCELLED)
+        return True
+
+    def get(self, query_id: str) -> Optional[Dict]:
+        query = self.queries.get(query_id)
+        if query is None:
+            row = self.conn.execute(f"SELECT {', '.join(FIELDS)} FROM standing_queries WHERE query_id = ?",
+                                     (query_id,)).fetchone()
+            return dict(zip(FIELDS, row)) if row else None
+        return {f: query[f] for f in FIELDS}
+
+    def open_queries(self) -> List[Dict]:
+        return [{f: q[f] for f in FIELDS} for q in self.queries.values() if q['status'] == OPEN]
+
+    # --- Incremental evaluation ---
+
+    def affected_by(self, rows: np.ndarray, today=None) -> List[str]:
+        """Open queries with a newly eligible donor among `rows` inside their radius."""
+        if not self._row_open.any() or len(rows) == 0:
+            return []
+        today = today or datetime.today()
+        donors = matching_service.blood_donors
+        rows = np.asarray(rows)
+        rows = rows[rows < len(donors)]
+        eligible = (matching_service.eligibility.eligible_mask(today)[rows]
+                    & ~suppression.mask(today)[rows])
+        rows = rows[eligible]
+        if len(rows) == 0:
+            return []
+
+        lat = donors.latitude[rows].astype(np.float64)
+        lon = donors.longitude[rows].astype(np.float64)
+        group = donors.group[rows]
+        # One grid lookup per occupied cell, however many donors changed inside it
+        cells = np.stack([np.floor(lat / DONOR_CELL_DEGREES), np.floor(lon / DONOR_CELL_DEGREES)], axis=1)
+        unique_cells, cell_of = np.unique(cells, axis=0, return_inverse=True)
+        affected = set()
+        with self._lock:
+            for c, (ci, cj) in enumerate(unique_cells):
+                center_lat, center_lon = (ci + 0.5) * DONOR_CELL_DEGREES, (cj + 0.5) * DONOR_CELL_DEGREES
+                candidates, _ = self._grid.within(center_lat, center_lon, self._max_radius + DONOR_CELL_SLACK_KM)
+                candidates = candidates[self._row_open[candidates]]
+                if len(candidates) == 0:
+                    continue
+                in_cell = np.flatnonzero(cell_of.ravel() == c)
+                for q in candidates:
+                    same_group = in_cell[group[in_cell] == self._row_group[q]]
+                    if len(same_group) == 0:
+                        continue
+                    query = self.queries[self._row_ids[q]]
+                    distance = haversine_km(lat[same_group], lon[same_group], query['lat'], query['lon'])
+                    if (distance <= self._row_radius[q]).any():
+                        affected.add(query['query_id'])
+        return sorted(affected)
+
+    def on_donor_change(self, rows: np.ndarray) -> None:
+        self._submit(self.affected_by(rows))
+
+    def tick(self, now: Optional[datetime] = None) -> List[str]:
+        """Drains donors whose cooldown ended since the last tick and expires old queries."""
+        now = now or datetime.now()
+        today = now.date()
+        with self._lock:
+            for query in list(self.queries.values()):
+                if query['status'] == OPEN and query['expires_at'] <= now.isoformat(timespec='seconds'):
+                    self._close(query, EXPIRED)
+            start = self._eligible_through
+            self._eligible_through = today
+        if start is None or start >= today:
+            return []
+        rows = matching_service.eligibility.becoming_eligible(start + timedelta(days=1), today)
+        affected = self.affected_by(rows, today)
+        self._submit(affected)
+        return affected
+
+    def _submit(self, query_ids: Iterable[str]) -> None:
+        if self._closed:
+            return
+        for query_id in query_ids:
+            self._executor.submit(self._attempt, query_id)
+
+    def _attempt(self, query_id: str) -> None:
+        # Status and attempt fields are shared with tick()/cancel(); only the
+        # outreach call itself runs outside the lock
+        with self._lock:
+            query = self.queries.get(query_id)
+            if query is None or query['status'] != OPEN:
+                return
+            query['attempts'] += 1
+            query['last_attempt_at'] = _now()
+            args = (query['blood_group'], query['lat'], query['lon'], query['urgency_level'],
+                    query['ai_reasoning'], query['top_n'])
+            hospital = query['hospital']
+        try:
+            result = matching_service.initiate_outreach(*args, hospital=hospital)
+        except Exception as e:
+            logger.exception("Standing query outreach failed: %s", e, extra={'query_id': query_id})
+            return
+        with self._lock:
+            query['job_id'] = result.get('job_id')
+            fulfilled = result.get('status') == 'success' and query['status'] == OPEN
+            if fulfilled:
+                self._close(query, FULFILLED)
+            else:
+                self._save(query)
+        if fulfilled:
+            logger.info("Standing query fulfilled", extra={'query_id': query_id, 'job_id': query['job_id']})
+
+    # --- Background tick ---
+
+    def start(self, interval: float = STANDING_TICK_SECONDS) -> None:
+        if self._closed:
+            raise RuntimeError("Standing query engine has been stopped")
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.tick()
+                except Exception as e:
+                    logger.exception("Standing query tick failed: %s", e)
+
+        self._thread = threading.Thread(target=loop, name='standing-query-tick', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops the tick thread and the outreach worker; the engine is not restartable."""
+        self._stop.set()
+        self._closed = True
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self._executor.shutdown(wait=True)
+
+
+# Global engine; load() and start() run once resources are loaded
+standing_queries = StandingQueryEngine()
+
+
+def _open_for_unfilled(outreach_request: Dict) -> Optional[str]:
+    return standing_queries.register(**outreach_request)['query_id']
+
+
+matching_service.subscribe_donor_changes(standing_queries.on_donor_change)
+matching_service.subscribe_unfilled_outreach(_open_for_unfilled)
+
+# --- Flask API Endpoints ---
+
+@STANDING_BLUEPRINT.route('/api/standing-queries', methods=['POST'])
+def open_standing_query():
+    """Opens a standing query (JSON: blood_group, lat, lon, optional radius_km, hospital, urgency_level)."""
+    data = request.get_json(silent=True) or {}
+    try:
+        query = standing_queries.register(
+            data['blood_group'], float(data['lat']), float(data['lon']),
+            radius_km=float(data.get('radius_km', DEFAULT_RADIUS_KM)), hospital=data.get('hospital'),
+            urgency_level=data.get('urgency_level'), ai_reasoning=data.get('ai_reasoning', ''),
+            top_n=int(data.get('top_n', 5)))
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid or incomplete JSON input: {e}"}), 400
+    return jsonify(standing_queries.get(query['query_id'])), 201
+
+
+@STANDING_BLUEPRINT.route('/api/standing-queries', methods=['GET'])
+def list_standing_queries():
+    return jsonify(standing_queries.open_queries()), 200
+
+
+@STANDING_BLUEPRINT.route('/api/standing-queries/<query_id>', methods=['GET'])
+def get_standing_query(query_id):
+    query = standing_queries.get(query_id)
+    if not query:
+        return jsonify({"error": "Standing query not found"}), 404
+    return jsonify(query), 200
+
+
+@STANDING_BLUEPRINT.route('/api/standing-queries/<query_id>', methods=['DELETE'])
+def cancel_standing_query(query_id):
+    if not standing_queries.cancel(query_id):
+        return jsonify({"error": "No open standing query with this ID"}), 404
+    return jsonify({"query_id": query_id, "status": CANCELLED}), 200
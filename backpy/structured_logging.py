@@ -0,0 +1,147 @@
+import os
+import sys
+import json
+import queue
+import atexit
+import logging
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# --- Logging Configuration ---
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_QUEUE_SIZE = 10000  # Records beyond this are dropped instead of blocking a request
+
+# Correlation ids (sos_id, job_id, donor_id, ...) carried on every record
+# emitted inside a log_context()
+_correlation = contextvars.ContextVar('log_correlation', default={})
+
+# Attributes every LogRecord has; anything else came in through `extra=`
+_RESERVED_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'correlation'}
+
+_listener = None
+_configure_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """Renders a record as one JSON line (runs on the listener thread)."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        entry.update(getattr(record, 'correlation', {}))
+        for key, value in vars(record).items():
+            if key not in _RESERVED_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Hands records to the listener without formatting them in the caller.
+
+    The stdlib QueueHandler formats in prepare(); here the request thread only
+    snapshots the correlation context and enqueues, so its cost stays flat.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.correlation = _correlation.get()
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class SampledLogger:
+    """Logs every ``every``-th call; meant for per-row or per-request hot paths."""
+
+    def __init__(self, logger: logging.Logger, every: int):
+        self.logger = logger
+        self.every = max(1, every)
+        self._calls = itertools.count()
+
+    def _log(self, level: int, msg: str, *args, **kwargs) -> None:
+        if next(self._calls) % self.every == 0 and self.logger.isEnabledFor(level):
+            extra = kwargs.setdefault('extra', {})
+            extra['sample_every'] = self.every
+            self.logger.log(level, msg, *args, **kwargs)
+
+    def debug(self, msg, *args, **kwargs):
+        self._log(logging.DEBUG, msg, *args, **kwargs)
+
+    def info(self, msg, *args, **kwargs):
+        self._log(logging.INFO, msg, *args, **kwargs)
+
+    def warning(self, msg, *args, **kwargs):
+        self._log(logging.WARNING, msg, *args, **kwargs)
+
+
+def configure_logging(level: str = LOG_LEVEL, stream=None) -> None:
+    """Routes the root logger through a queue to a JSON stream handler.
+
+    Safe to call more than once; only the first call installs handlers.
+    """
+    global _listener
+    with _configure_lock:
+        if _listener is not None:
+            return
+        log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(JsonFormatter())
+
+        root = logging.getLogger()
+        root.handlers = [NonBlockingQueueHandler(log_queue)]
+        root.setLevel(level)
+
+        _listener = QueueListener(log_queue, output, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """Flushes queued records and stops the listener thread."""
+    global _listener
+    with _configure_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(name)
+
+
+def get_sampled_logger(name: str, every: int) -> SampledLogger:
+    return SampledLogger(logging.getLogger(name), every)
+
+
+@contextmanager
+def log_context(**ids):
+    """Attaches correlation ids (sos_id, job_id, donor_id, ...) to nested logs."""
+    merged = dict(_correlation.get())
+    merged.update({k: v for k, v in ids.items() if v is not None})
+    token = _correlation.set(merged)
+    try:
+        yield merged
+    finally:
+        _correlation.reset(token)
+
+
+def current_context() -> dict:
+    """Returns the active correlation ids (e.g. to hand to a worker thread)."""
+    return dict(_correlation.get())
@@ -0,0 +1,235 @@
+import os
+import time
+import atexit
+import threading
+import numpy as np
+import pandas as pd
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional
+from flask import Blueprint, request, jsonify
+from structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+# --- Suppression Configuration ---
+SUPPRESSION_BLUEPRINT = Blueprint('suppression', __name__)
+
+SUPPRESSION_PATH = os.environ.get('SUPPRESSION_PATH', 'suppression.npz')
+# A donor messaged within this window is left out of ranking
+RECENTLY_MESSAGED_SECONDS = 24 * 60 * 60
+
+EPOCH = date(1970, 1, 1)
+
+
+def day_number(day) -> int:
+    """Days since the Unix epoch, the unit of `deferred_until`."""
+    if isinstance(day, datetime):
+        day = day.date()
+    return (day - EPOCH).days
+
+
+class SuppressionList:
+    """Per-donor suppression flags stored as arrays aligned with the donor table.
+
+    opted_out (bool), deferred_until (int32 day number, 0 = not deferred) and
+    last_messaged (uint32 Unix seconds, 0 = never) share the donor table's row
+    order, so mask() is a handful of vectorised comparisons that ranking can
+    AND into its filter. Flags are keyed by donor_id on disk, so they survive
+    restarts and reordering of the dataset.
+    """
+
+    def __init__(self, path: Optional[str] = SUPPRESSION_PATH,
+                 recently_messaged_seconds: float = RECENTLY_MESSAGED_SECONDS):
+        self.path = path
+        self.recently_messaged_seconds = recently_messaged_seconds
+        self._index: Dict[str, int] = {}
+        self._donor_ids = np.empty(0, dtype=object)
+        self.opted_out = np.zeros(0, dtype=bool)
+        self.deferred_until = np.zeros(0, dtype=np.int32)
+        self.last_messaged = np.zeros(0, dtype=np.uint32)
+        self._dirty = False
+        self._lock = threading.Lock()
+        # Serialises file writes, which run outside _lock
+        self._flush_lock = threading.Lock()
+
+    def attach(self, donor_ids) -> None:
+        """Aligns the flag arrays with `donor_ids` (the ranking table's row order)."""
+        donor_ids = np.asarray(donor_ids, dtype=object)
+        with self._lock:
+            previous = (self._donor_ids, self.opted_out, self.deferred_until, self.last_messaged)
+            self._donor_ids = donor_ids
+            self._index = {donor_id: i for i, donor_id in enumerate(donor_ids)}
+            self.opted_out = np.zeros(len(donor_ids), dtype=bool)
+            self.deferred_until = np.zeros(len(donor_ids), dtype=np.int32)
+            self.last_messaged = np.zeros(len(donor_ids), dtype=np.uint32)
+            if self.path and os.path.exists(self.path):
+                with np.load(self.path) as saved:
+                    self._merge(saved['donor_id'], saved['opted_out'], saved['deferred_until'], saved['last_messaged'])
+            # Runtime updates made before this (re-)attach are carried over too
+            self._merge(*previous)
+        logger.info("Suppression list attached", extra={
+            'donors': len(donor_ids), 'opted_out': int(self.opted_out.sum())})
+
+    def extend(self, donor_ids) -> None:
+        """Adds unflagged rows for donors appended to the end of the table."""
+        donor_ids = np.asarray(donor_ids, dtype=object)
+        n = len(donor_ids)
+        with self._lock:
+            start = len(self._donor_ids)
+            self._index.update((donor_id, start + i) for i, donor_id in enumerate(donor_ids))
+            self._donor_ids = np.concatenate([self._donor_ids, donor_ids])
+            self.opted_out = np.concatenate([self.opted_out, np.zeros(n, dtype=bool)])
+            self.deferred_until = np.concatenate([self.deferred_until, np.zeros(n, dtype=np.int32)])
+            self.last_messaged = np.concatenate([self.last_messaged, np.zeros(n, dtype=np.uint32)])
+
+    def _merge(self, donor_ids, opted_out, deferred_until, last_messaged) -> None:
+        rows = pd.Index(self._donor_ids).get_indexer(donor_ids)
+        found = rows >= 0
+        rows = rows[found]
+        self.opted_out[rows] |= opted_out[found]
+        self.deferred_until[rows] = np.maximum(self.deferred_until[rows], deferred_until[found])
+        self.last_messaged[rows] = np.maximum(self.last_messaged[rows], last_messaged[found])
+
+    # --- Runtime updates ---
+
+    def _row(self, donor_id: str) -> Optional[int]:
+        row = self._index.get(donor_id)
+        if row is None:
+            logger.warning("Suppression update for unknown donor", extra={'donor_id': donor_id})
+        return row
+
+    def set_opted_out(self, donor_id: str, opted_out: bool = True) -> bool:
+        with self._lock:
+            row = self._row(donor_id)
+            if row is None:
+                return False
+            self.opted_out[row] = opted_out
+            self._dirty = True
+        self.flush()
+        return True
+
+    def defer(self, donor_id: str, until: Optional[date]) -> bool:
+        """Suppresses the donor up to and including `until` (None lifts the deferral)."""
+        with self._lock:
+            row = self._row(donor_id)
+            if row is None:
+                return False
+            self.deferred_until[row] = day_number(until) if until else 0
+            self._dirty = True
+        self.flush()
+        return True
+
+    def hold(self, donor_id: str, until: date) -> bool:
+        """Defers the donor up to `until` unless they are already deferred for longer."""
+        with self._lock:
+            row = self._row(donor_id)
+            if row is None:
+                return False
+            self.deferred_until[row] = max(int(self.deferred_until[row]), day_number(until))
+            self._dirty = True
+        self.flush()
+        return True
+
+    def mark_messaged(self, donor_id: str, ts: Optional[float] = None) -> None:
+        # Frequent and recoverable, so persisted with the next flush rather than now
+        with self._lock:
+            row = self._index.get(donor_id)
+            if row is not None:
+                self.last_messaged[row] = int(ts if ts is not None else time.time())
+                self._dirty = True
+
+    # --- Reads ---
+
+    def _snapshot(self) -> tuple:
+        # attach() and extend() swap in new arrays under the lock, so taking
+        # the references under it gives four arrays of one length
+        with self._lock:
+            return self._donor_ids, self.opted_out, self.deferred_until, self.last_messaged
+
+    def mask(self, today=None, now: Optional[float] = None) -> np.ndarray:
+        """Boolean array, True for every donor row that must not be contacted."""
+        return self._mask(self._snapshot(), today, now)
+
+    def _mask(self, snapshot: tuple, today=None, now: Optional[float] = None) -> np.ndarray:
+        _, opted_out, deferred_until, last_messaged = snapshot
+        today = day_number(today or date.today())
+        now = now if now is not None else time.time()
+        recent_after = max(0, int(now - self.recently_messaged_seconds))
+        return opted_out | (deferred_until >= today) | (last_messaged > recent_after)
+
+    def suppressed_ids(self, today=None) -> list:
+        """Donor IDs currently masked out (for rankers that do not share this row order)."""
+        snapshot = self._snapshot()
+        return snapshot[0][self._mask(snapshot, today)].tolist()
+
+    def status(self, donor_id: str) -> Optional[Dict]:
+        row = self._index.get(donor_id)
+        if row is None:
+            return None
+        deferred = int(self.deferred_until[row])
+        messaged = int(self.last_messaged[row])
+        return {
+            'donor_id': donor_id,
+            'opted_out': bool(self.opted_out[row]),
+            'deferred_until': (EPOCH + timedelta(days=deferred)).isoformat() if deferred else None,
+            'last_messaged': datetime.fromtimestamp(messaged).isoformat() if messaged else None,
+        }
+
+    # --- Persistence ---
+
+    def flush(self) -> None:
+        """Writes the flags to disk if anything changed since the last flush.
+
+        Only the copy happens under the flags lock; the write goes through a
+        temp file outside it, so mask() is not held up by disk I/O.
+        """
+        with self._flush_lock:
+            with self._lock:
+                if not self.path or not self._dirty:
+                    return
+                # donor_ids is swapped, never written in place; the flag arrays are
+                snapshot = dict(donor_id=self._donor_ids, opted_out=self.opted_out.copy(),
+                                deferred_until=self.deferred_until.copy(), last_messaged=self.last_messaged.copy())
+                self._dirty = False
+            tmp = self.path + '.tmp.npz'
+            try:
+                np.savez(tmp, **dict(snapshot, donor_id=snapshot['donor_id'].astype(str)))
+                os.replace(tmp, self.path)
+            except Exception:
+                with self._lock:
+                    self._dirty = True
+                raise
+
+
+# Global suppression list, aligned with the blood donor table by matching_service
+suppression = SuppressionList()
+atexit.register(suppression.flush)
+
+# --- Flask API Endpoints ---
+
+@SUPPRESSION_BLUEPRINT.route('/api/donors/<donor_id>/suppression', methods=['GET'])
+def get_suppression(donor_id):
+    status = suppression.status(donor_id)
+    if not status:
+        return jsonify({"error": "Donor not found"}), 404
+    return jsonify(status), 200
+
+
+@SUPPRESSION_BLUEPRINT.route('/api/donors/<donor_id>/suppression', methods=['POST'])
+def update_suppression(donor_id):
+    """Body: {"opted_out": bool, "deferred_until": "YYYY-MM-DD" | null} (either key optional)."""
+    data = request.json or {}
+    try:
+        deferred_until = data.get('deferred_until')
+        if deferred_until is not None:
+            deferred_until = date.fromisoformat(deferred_until)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid deferred_until: {e}"}), 400
+
+    if suppression.status(donor_id) is None:
+        return jsonify({"error": "Donor not found"}), 404
+    if 'opted_out' in data:
+        suppression.set_opted_out(donor_id, bool(data['opted_out']))
+    if 'deferred_until' in data:
+        suppression.defer(donor_id, deferred_until)
+    return jsonify(suppression.status(donor_id)), 200
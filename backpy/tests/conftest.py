@@ -0,0 +1,20 @@
+import os
+import sys
+import tempfile
+
+# Modules are imported flat from backpy/, as app.py does
+BACKPY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKPY_DIR)
+
+# Keep every store the modules open at import time out of the working tree
+_STATE_DIR = tempfile.mkdtemp(prefix='backpy-tests-')
+for var, name in (('INVENTORY_LOG_PATH', 'inventory_log.bin'),
+                  ('SUPPRESSION_PATH', 'suppression.npz'),
+                  ('DONOR_PII_PATH', 'donor_pii.sqlite'),
+                  ('WAITLIST_PATH', 'waitlist.sqlite'),
+                  ('STANDING_QUERIES_PATH', 'standing_queries.sqlite'),
+                  ('BROADCAST_PATH', 'broadcast.sqlite'),
+                  ('PROFILE_DIR', 'profiles'),
+                  ('DISTANCE_TABLES_DIR', 'distance_tables'),
+                  ('TRANSPORT_MATRIX_PATH', 'transport_matrix.npz')):
+    os.environ.setdefault(var, os.path.join(_STATE_DIR, name))
@@ -0,0 +1,61 @@
+from flask import Flask
+
+import admission_control
+from admission_control import AdmissionController, CALLER_HEADER, CALLER_TOKEN_HEADER, TokenBuckets, caller_key
+
+
+def make_client():
+    app = Flask(__name__)
+
+    @app.route('/api/blood/find-donors', endpoint='blood_donor_endpoint')
+    def blood_donor_endpoint():
+        return 'ok'
+
+    admission_control.init_app(app, AdmissionController())
+    return app.test_client()
+
+
+def test_token_bucket_refills_at_rate():
+    bucket = TokenBuckets(rate=2.0, burst=2)
+    assert bucket.take('a', now=0.0) == 0
+    assert bucket.take('a', now=0.0) == 0
+    assert bucket.take('a', now=0.0) == 0.5
+    assert bucket.take('a', now=0.5) == 0
+    assert bucket.take('b', now=0.5) == 0
+
+
+def exhaust(client, **kwargs):
+    burst = admission_control.ROUTE_CLASSES[admission_control.BULK]['burst']
+    for _ in range(burst):
+        assert client.get('/api/blood/find-donors', **kwargs).status_code == 200
+    shed = client.get('/api/blood/find-donors', **kwargs)
+    assert shed.status_code == 429
+    assert int(shed.headers['Retry-After']) >= 1
+
+
+def test_rotating_the_client_header_does_not_reset_the_bucket():
+    client = make_client()
+    exhaust(client)
+    response = client.get('/api/blood/find-donors', headers={CALLER_HEADER: 'someone-new'})
+    assert response.status_code == 429
+
+
+def test_service_with_its_token_gets_its_own_bucket(monkeypatch):
+    monkeypatch.setattr(admission_control, 'CALLER_TOKENS', {'node-backend': 's3cret'})
+    client = make_client()
+    exhaust(client)
+    headers = {CALLER_HEADER: 'node-backend', CALLER_TOKEN_HEADER: 's3cret'}
+    assert client.get('/api/blood/find-donors', headers=headers).status_code == 200
+
+
+def test_caller_key():
+    tokens = {'node-backend': 's3cret'}
+    assert caller_key({CALLER_HEADER: 'node-backend', CALLER_TOKEN_HEADER: 's3cret'}, '1.2.3.4', tokens) \
+        == 'client:node-backend'
+    assert caller_key({CALLER_HEADER: 'node-backend', CALLER_TOKEN_HEADER: 'guess'}, '1.2.3.4', tokens) == '1.2.3.4'
+    assert caller_key({CALLER_HEADER: 'node-backend'}, None, tokens) == 'unknown'
+
+
+def test_inbound_sms_is_rate_limited_outside_the_critical_class():
+    assert admission_control.route_class_for('replies.sms_inbound') == admission_control.WEBHOOK
+    assert admission_control.ROUTE_CLASSES[admission_control.WEBHOOK]['rate']
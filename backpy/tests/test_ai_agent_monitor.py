@@ -0,0 +1,138 @@
+import json
+import time
+
+import pytest
+
+from ai_agent_monitor import GoogleAIBloodBankAgent
+from agent_runtime import AgentRuntime
+from inventory_service import InventoryService
+from llm_client import LLMClient, StubLLMClient
+
+
+def make_agent(responder=None, delay=0.0, timeout=1.0):
+    outreach_calls = []
+
+    def outreach(payload):
+        outreach_calls.append(payload)
+        return {'status': 'success', 'donor_contacted': 'donor-1'}
+
+    inventory = InventoryService()
+    agent = GoogleAIBloodBankAgent('', inventory=inventory,
+                                   llm=StubLLMClient(responder, delay=delay, timeout=timeout),
+                                   outreach=outreach)
+    return agent, inventory, outreach_calls
+
+
+@pytest.fixture
+def agent():
+    agent, inventory, calls = make_agent()
+    yield agent, inventory, calls
+    agent.close()
+
+
+def queue_shortages(inventory):
+    inventory.update('delhi_aiims', 'O-', 2)
+    inventory.update('mumbai_central', 'A+', 20)
+    return inventory.drain(lambda event: event)
+
+
+def test_json_reply_wrapped_in_prose_is_parsed():
+    def responder(prompt):
+        return 'Here is my analysis:\n' + json.dumps({
+            'delhi_aiims/O-': {'urgency_level': 10, 'donors_to_contact': 12, 'reasoning': 'llm'},
+        }) + '\nLet me know if you need more.'
+
+    agent, inventory, _ = make_agent(responder)
+    try:
+        results = {r['hospital']: r for r in agent.process_shortages(queue_shortages(inventory))}
+    finally:
+        agent.close()
+
+    assert results['delhi_aiims']['ai_analysis']['urgency_level'] == 10
+    assert results['delhi_aiims']['ai_analysis']['donors_to_contact'] == 12
+    # Fields the model left out come from the rule-based baseline
+    assert results['delhi_aiims']['ai_analysis']['priority_locations'] == ['delhi_aiims']
+    # A shortage missing from the reply falls back rather than failing the cycle
+    assert results['mumbai_central']['ai_analysis']['reasoning'] == 'Fallback analysis due to AI error'
+
+
+def test_unparseable_reply_falls_back_to_rule_based_analysis():
+    agent, inventory, calls = make_agent(lambda prompt: 'Sorry, I cannot help with that.')
+    try:
+        results = agent.process_shortages(queue_shortages(inventory))
+    finally:
+        agent.close()
+
+    assert {r['ai_analysis']['reasoning'] for r in results} == {'Fallback analysis due to AI error'}
+    assert [c['hospital'] for c in calls] == ['delhi_aiims', 'mumbai_central']
+
+
+def test_slow_llm_does_not_hold_up_outreach():
+    agent, inventory, calls = make_agent(delay=0.5, timeout=0.1)
+    try:
+        start = time.perf_counter()
+        results = agent.process_shortages(queue_shortages(inventory))
+        elapsed = time.perf_counter() - start
+    finally:
+        agent.close()
+
+    assert elapsed < 0.5
+    assert len(calls) == 2
+    assert all(r['ai_analysis']['reasoning'] == 'Fallback analysis due to AI error' for r in results)
+
+
+def test_analysis_is_cached_per_hospital(agent):
+    agent, inventory, _ = agent
+    agent.process_shortages(queue_shortages(inventory))
+    assert len(agent.llm.calls) == 1
+
+    inventory.reset_debounce('delhi_aiims', 'O-')
+    inventory.update('delhi_aiims', 'O-', 2)
+    agent.process_shortages(inventory.drain(lambda event: event))
+    assert len(agent.llm.calls) == 1
+
+    # Same blood group and severity at another hospital is a cache miss
+    inventory.update('bangalore_nimhans', 'O-', 2)
+    agent.process_shortages(inventory.drain(lambda event: event))
+    assert len(agent.llm.calls) == 2
+
+
+def test_event_driven_loop_handles_shortages_through_stub(agent):
+    agent, inventory, calls = agent
+    agent.start_event_driven()
+    try:
+        inventory.update('delhi_aiims', 'B-', 1)
+        deadline = time.monotonic() + 5
+        while not calls and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        agent.stop_monitoring()
+
+    assert calls and calls[0]['hospital'] == 'delhi_aiims'
+    assert agent.shortages_handled == 1
+
+
+def test_runtime_restart_releases_previous_agent():
+    runtime = AgentRuntime(InventoryService())
+    assert runtime.start()
+    first = runtime.agent
+    assert runtime.stop()
+    assert first._outreach_pool._shutdown
+
+    assert runtime.start()
+    assert runtime.agent is not first
+    assert runtime.stop()
+
+
+def test_llm_client_subclasses_must_implement_call():
+    class Incomplete(LLMClient):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+    class Echo(LLMClient):
+        def _call(self, prompt):
+            return prompt.upper()
+
+    assert Echo().generate('ok', timeout=1) == 'OK'
@@ -0,0 +1,151 @@
+import pandas as pd
+import pytest
+from flask import Flask
+
+import broadcast as bc
+import matching_service
+import operator_auth
+from emergency_sos_system import SOS_BLUEPRINT
+from messaging import SMS, FakeProvider, MessageRouter
+from sos_events import sos_events, stream_token
+
+DONOR_IDS = [f"d{i}" for i in range(5)]
+
+
+class FakePII:
+    def hydrate(self, donor_ids, columns):
+        return pd.DataFrame({'contact_number': [f"+91990000000{d[1:]}" for d in donor_ids]},
+                            index=pd.Index(list(donor_ids), name='donor_id'))
+
+
+@pytest.fixture
+def manager(monkeypatch, tmp_path):
+    provider = FakeProvider('fake_sms', SMS)
+    manager = bc.BroadcastManager(str(tmp_path / 'broadcast.sqlite'), router=MessageRouter([provider]),
+                                  batch_size=2, workers=1)
+    manager.provider = provider
+    monkeypatch.setattr(manager, 'recipients', lambda *args, **kwargs: list(DONOR_IDS))
+    monkeypatch.setattr(matching_service, 'blood_pii', FakePII())
+    monkeypatch.setattr(bc, 'broadcasts', manager)
+    yield manager
+    manager._executor.shutdown(wait=True)
+
+
+def drain(manager):
+    # One worker: a no-op queued last finishes after the broadcast
+    manager._executor.submit(lambda: None).result(5)
+
+
+def make_client():
+    app = Flask(__name__)
+    app.register_blueprint(bc.BROADCAST_BLUEPRINT)
+    return app.test_client()
+
+
+def test_authorized_needs_a_configured_token():
+    assert not operator_auth.authorized('Bearer anything', token='')
+    assert not operator_auth.authorized(None, token='secret')
+    assert not operator_auth.authorized('Bearer wrong', token='secret')
+    assert operator_auth.authorized('Bearer secret', token='secret')
+
+
+def test_place_is_sanitised_for_the_sms_body():
+    assert bc.clean_place('Vashi, Navi Mumbai') == 'Vashi, Navi Mumbai'
+    assert bc.clean_place('x. Win $$$ at http://spam.example/?a=1') == 'x. Win at httpspam.examplea1'
+    assert len(bc.clean_place('a' * 500)) == bc.MAX_PLACE_CHARS
+    assert bc.clean_place('<<>>') == 'your location'
+
+
+def test_start_and_cancel_require_the_api_token(manager, monkeypatch):
+    monkeypatch.setattr(operator_auth, 'OPERATOR_API_TOKEN', 'secret')
+    client = make_client()
+    payload = {'blood_group': 'O-', 'lat': 19.07, 'lon': 72.87}
+    assert client.post('/api/emergency/broadcast', json=payload).status_code == 401
+    assert client.post('/api/emergency/broadcast', json=payload,
+                       headers={'Authorization': 'Bearer wrong'}).status_code == 401
+
+    response = client.post('/api/emergency/broadcast', json=payload, headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 202
+    broadcast_id = response.get_json()['broadcast_id']
+    assert response.get_json()['events_url'] == bc.events_url(broadcast_id)
+    assert client.delete(f'/api/emergency/broadcast/{broadcast_id}').status_code == 401
+
+
+def test_progress_streams_on_the_broadcast_channel_after_sos_closes(manager):
+    sos_events.open('sos_bc')
+    sos_events.publish('sos_bc', 'completed', {}, final=True)
+
+    broadcast = manager.start('O-', 19.07, 72.87, sos_id='sos_bc')
+    drain(manager)
+
+    events, closed = sos_events.events(bc.stream_id(broadcast['broadcast_id']))
+    assert closed
+    assert [e['event'] for e in events] == ['progress', 'progress', 'progress', 'completed']
+    assert events[-1]['data']['recipients']['sent'] == len(DONOR_IDS)
+    assert len(manager.provider.sent) == len(DONOR_IDS)
+    # The SOS stream stays as it was
+    assert len(sos_events.events('sos_bc')[0]) == 1
+    assert stream_token(bc.stream_id(broadcast['broadcast_id'])) in bc.events_url(broadcast['broadcast_id'])
+
+
+def test_sos_broadcast_starts_after_contact_alerts(manager, monkeypatch):
+    from emergency_sos_system import EmergencySOSSystem
+    order = []
+    system = EmergencySOSSystem()
+    monkeypatch.setattr(system, 'send_emergency_call_alerts',
+                        lambda numbers, message, on_result=None: order.append('contacts') or [])
+    monkeypatch.setattr(system, 'alert_nearest_hospital', lambda data: order.append('hospital') or {})
+    system.subscribe(lambda sos_id, data: order.append('broadcast'))
+    system.execute_sos_request({'user_id': 'u', 'emergency_type': 'blood', 'emergency_contacts': [],
+                                'user_location': {'latitude': 19.07, 'longitude': 72.87}})
+    assert order == ['contacts', 'hospital', 'broadcast']
+
+
+def test_sos_broadcast_requires_the_operator_token(monkeypatch):
+    import emergency_sos_system
+    monkeypatch.setattr(operator_auth, 'OPERATOR_API_TOKEN', 'secret')
+    executed = []
+    monkeypatch.setattr(emergency_sos_system.sos_system, 'execute_sos_request',
+                        lambda data: executed.append(data) or {'overall_status': 'success'})
+    app = Flask(__name__)
+    app.register_blueprint(SOS_BLUEPRINT)
+    client = app.test_client()
+    payload = {'user_id': 'u', 'emergency_type': 'blood', 'blood_group': 'O-', 'broadcast_radius_km': 100,
+               'user_location': {'latitude': 19.07, 'longitude': 72.87, 'address': 'Buy now!'},
+               'emergency_contacts': [{'phone_number': '+911'}]}
+    assert client.post('/api/emergency/sos', json=payload).status_code == 401
+    assert not executed
+    response = client.post('/api/emergency/sos', json=payload, headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 200 and len(executed) == 1
+    # Plain SOS needs no token
+    del payload['broadcast_radius_km']
+    assert client.post('/api/emergency/sos', json=payload).status_code == 200
+
+
+def test_sos_broadcast_ignores_caller_address(manager):
+    bc._broadcast_for_sos('sos_addr', {'emergency_type': 'blood', 'blood_group': 'O-', 'broadcast_radius_km': 5,
+                                       'user_location': {'latitude': 19.07, 'longitude': 72.87,
+                                                         'address': 'Call 555 for a prize'}})
+    drain(manager)
+    assert manager.provider.sent and all('prize' not in m['body'] for m in manager.provider.sent)
+
+
+def test_recipients_skip_donors_with_an_unknown_group(monkeypatch):
+    from datetime import datetime
+    from donor_store import DonorColumns
+    from eligibility import EligibilityIndex
+    from spatial_index import GridIndex
+    from suppression import SuppressionList
+    donors = pd.DataFrame({'donor_id': ['ab', 'unknown'], 'blood_group': ['AB-', None], 'city': ['Mumbai'] * 2,
+                           'latitude': [19.07, 19.07], 'longitude': [72.87, 72.87],
+                           'last_donation_date': pd.to_datetime(['2020-01-01'] * 2)})
+    eligibility, flags, grid = EligibilityIndex(), SuppressionList(path=None), GridIndex()
+    eligibility.compute(donors)
+    flags.attach(donors['donor_id'])
+    grid.extend(donors['latitude'].to_numpy(), donors['longitude'].to_numpy())
+    monkeypatch.setattr(matching_service, 'blood_donors', DonorColumns.from_frame(donors))
+    monkeypatch.setattr(matching_service, 'blood_spatial', grid)
+    monkeypatch.setattr(matching_service, 'eligibility', eligibility)
+    monkeypatch.setattr(bc, 'suppression', flags)
+    manager = bc.BroadcastManager(path=':memory:')
+    assert manager.recipients('AB-', 19.07, 72.87, 5, today=datetime(2026, 1, 1)) == ['ab']
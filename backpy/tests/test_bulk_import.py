@@ -0,0 +1,118 @@
+import io
+
+import pandas as pd
+import pytest
+from flask import Flask
+
+import matching_service
+import operator_auth
+from bulk_import import IMPORT_BLUEPRINT, Gazetteer, import_registry
+from donor_store import DonorColumns, PIIStore
+
+EXISTING = pd.DataFrame({
+    'donor_id': ['aaaaaaaaaa', 'bbbbbbbbbb'],
+    'name': ['Asha', 'Bilal'],
+    'email': ['a@example.com', 'b@example.com'],
+    'contact_number': ['+91 98200 00001', '+91 98200 00002'],
+    'city': ['Mumbai', 'Pune'],
+    'blood_group': ['O-', 'A+'],
+    'latitude': [19.0, 18.5],
+    'longitude': [72.8, 73.8],
+    'last_donation_date': pd.to_datetime(['2025-01-01', '2025-02-01']),
+})
+
+
+@pytest.fixture
+def appended(monkeypatch, tmp_path):
+    pii = PIIStore(str(tmp_path / 'pii.sqlite'))
+    pii.replace_all(EXISTING)
+    organs = pd.DataFrame({'donor_id': ['o1'], 'city': ['Delhi'], 'latitude': [28.6], 'longitude': [77.2]})
+    chunks = []
+    monkeypatch.setattr(matching_service, 'blood_pii', pii)
+    monkeypatch.setattr(matching_service, 'blood_donors', DonorColumns.from_frame(EXISTING))
+    monkeypatch.setattr(matching_service, 'organ_df', organs)
+    monkeypatch.setattr(matching_service, 'append_blood_donors', chunks.append)
+    return chunks
+
+
+def csv(text):
+    return io.StringIO(text.strip() + '\n')
+
+
+def test_rows_are_validated_geocoded_and_deduped_against_pii(appended):
+    source = csv("""
+donor_id,name,contact_number,city,blood_group,latitude,longitude
+cccccccccc,Chitra,+91 98200 00003,Mumbai,B+,,
+aaaaaaaaaa,Repeat ID,+91 98200 00009,Mumbai,O-,19.1,72.9
+dddddddddd,Same Phone,919820000001,Pune,AB-,18.5,73.8
+eeeeeeeeee,Bad Group,+91 98200 00004,Pune,Q+,18.5,73.8
+ffffffffff,,+91 98200 00005,Pune,O+,18.5,73.8
+gggggggggg,Nowhere,+91 98200 00006,Atlantis,O+,,
+hhhhhhhhhh,Delhi Donor,+91 98200 00007, delhi ,A-,,
+hhhhhhhhhh,In-file Dupe,+91 98200 00008,Delhi,A-,28.6,77.2
+""")
+    report = import_registry(source, 'blood', chunksize=3, persist=False)
+
+    imported = pd.concat(appended)
+    assert imported['donor_id'].tolist() == ['cccccccccc', 'hhhhhhhhhh']
+    assert report['rows_read'] == 8
+    assert report['rows_imported'] == 2
+    assert report['duplicates'] == 3
+    assert report['rejected'] == {'invalid_blood_group': 1, 'missing_required': 1, 'ungeocodable': 1}
+    assert report['geocoded'] == 2
+    # Missing coordinates come from the city centroid of the loaded registries
+    chitra = imported.set_index('donor_id').loc['cccccccccc']
+    assert (chitra['latitude'], chitra['longitude']) == (19.0, 72.8)
+    # Optional columns are filled with the registry defaults
+    assert chitra['number_of_donation'] == 0 and chitra['availability'] == 'Yes'
+
+
+def test_gazetteer_is_case_and_whitespace_insensitive():
+    gazetteer = Gazetteer.from_frames(EXISTING, None)
+    chunk = pd.DataFrame({'city': ['  MUMBAI', 'Pune', 'Nowhere'], 'latitude': [None, 10.0, None],
+                          'longitude': [None, 20.0, None]})
+    filled = gazetteer.geocode(chunk)
+    assert filled.tolist() == [True, False, False]
+    assert chunk['latitude'].tolist()[:2] == [19.0, 10.0]
+    assert pd.isna(chunk['latitude'].iloc[2])
+
+
+def test_missing_required_column_is_rejected(appended):
+    with pytest.raises(ValueError, match='contact_number'):
+        import_registry(csv("donor_id,name,city,blood_group\nx,y,Pune,O+"), 'blood', persist=False)
+
+
+def test_unknown_registry_is_rejected(appended):
+    with pytest.raises(ValueError, match='Unknown registry'):
+        import_registry(csv("donor_id\nx"), 'plasma', persist=False)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(operator_auth, 'OPERATOR_API_TOKEN', 'secret')
+    app = Flask(__name__)
+    app.register_blueprint(IMPORT_BLUEPRINT)
+    return app.test_client()
+
+
+def upload(client, query='', token='secret'):
+    return client.post(f'/api/import/blood{query}', content_type='multipart/form-data',
+                       data={'file': (io.BytesIO(b'donor_id\n'), 'donors.csv')},
+                       headers={'Authorization': f'Bearer {token}'} if token else {})
+
+
+@pytest.mark.parametrize('token', [None, 'wrong'])
+def test_endpoint_requires_the_operator_token(client, appended, token):
+    assert upload(client, token=token).status_code == 401
+    assert not appended
+
+
+@pytest.mark.parametrize('query', ['?chunksize=lots', '?chunksize=0'])
+def test_endpoint_rejects_bad_chunksize(client, appended, query):
+    assert upload(client, query).status_code == 400
+
+
+def test_endpoint_returns_503_before_resources_load(client, monkeypatch):
+    monkeypatch.setattr(matching_service, 'blood_pii', None)
+    response = upload(client)
+    assert response.status_code == 503
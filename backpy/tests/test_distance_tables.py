@@ -0,0 +1,100 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+import distance_tables as module
+from distance_tables import HospitalDistanceTables
+from spatial_index import haversine_km
+
+HOSPITALS = {'mumbai': (19.0760, 72.8777), 'pune': (18.5204, 73.8567)}
+
+
+def points(n, seed):
+    rng = np.random.default_rng(seed)
+    return rng.uniform(18.0, 20.0, n).astype(np.float32), rng.uniform(72.5, 74.5, n).astype(np.float32)
+
+
+def assert_aligned(tables, kind, lat, lon):
+    """Every hospital's vector and order match a fresh build over the same rows."""
+    for key, (h_lat, h_lon) in HOSPITALS.items():
+        expected = haversine_km(lat.astype(np.float64), lon.astype(np.float64), h_lat, h_lon).astype(np.float32)
+        distance = tables._distance[key, kind]
+        order = tables._order[key, kind]
+        np.testing.assert_allclose(distance, expected, rtol=1e-6)
+        assert sorted(order.tolist()) == list(range(len(lat)))
+        assert (np.diff(distance[order]) >= 0).all()
+        np.testing.assert_array_equal(tables.lookup(kind, h_lat, h_lon), distance)
+
+
+@pytest.fixture
+def tables():
+    tables = HospitalDistanceTables(directory=None)
+    for key, (lat, lon) in HOSPITALS.items():
+        tables.register(key, lat, lon)
+    return tables
+
+
+def test_register_after_rebuild_builds_the_new_hospital():
+    lat, lon = points(50, 1)
+    tables = HospitalDistanceTables(directory=None)
+    tables.register('mumbai', *HOSPITALS['mumbai'])
+    tables.rebuild('blood', lat, lon)
+    tables.register('pune', *HOSPITALS['pune'])
+    assert_aligned(tables, 'blood', lat, lon)
+
+
+def test_extend_and_move_keep_rows_aligned(tables):
+    lat, lon = points(200, 2)
+    tables.rebuild('blood', lat, lon)
+    more_lat, more_lon = points(30, 3)
+    tables.extend('blood', more_lat, more_lon)
+    lat, lon = np.concatenate([lat, more_lat]), np.concatenate([lon, more_lon])
+    assert_aligned(tables, 'blood', lat, lon)
+
+    for row, (new_lat, new_lon) in [(0, HOSPITALS['pune']), (150, (19.5, 73.0)), (229, HOSPITALS['mumbai'])]:
+        tables.move('blood', row, new_lat, new_lon)
+        lat[row], lon[row] = new_lat, new_lon
+    assert_aligned(tables, 'blood', lat, lon)
+    rows, distances = tables.near('mumbai', 'blood', 0.5)
+    assert rows.tolist() == [229] and distances[0] < 0.5
+
+
+def test_move_never_writes_into_arrays_a_caller_or_reader_holds(tables):
+    lat, lon = points(20, 4)
+    original = lat.copy()
+    tables.rebuild('blood', lat, lon)
+    held_points = tables._points['blood'][0]
+    held_distance = tables.lookup('blood', *HOSPITALS['mumbai'])
+    before = held_distance.copy()
+
+    tables.move('blood', 3, *HOSPITALS['mumbai'])
+    np.testing.assert_array_equal(lat, original)
+    np.testing.assert_array_equal(held_points, original)
+    np.testing.assert_array_equal(held_distance, before)
+    assert tables._points['blood'][0][3] == np.float32(HOSPITALS['mumbai'][0])
+
+
+def test_tables_are_flushed_after_a_delay_and_reused_on_restart(tmp_path, monkeypatch):
+    monkeypatch.setattr(module, 'FLUSH_DELAY_SECONDS', 0.05)
+    lat, lon = points(40, 5)
+    tables = HospitalDistanceTables(directory=str(tmp_path))
+    tables.register('mumbai', *HOSPITALS['mumbai'])
+    tables.rebuild('blood', lat, lon)
+    tables.move('blood', 7, *HOSPITALS['pune'])
+
+    path = tables._path('mumbai')
+    deadline = time.time() + 5
+    while not os.path.exists(path) and time.time() < deadline:
+        time.sleep(0.01)
+    assert os.path.exists(path)
+    assert not tables._dirty
+
+    lat[7], lon[7] = HOSPITALS['pune']
+    restarted = HospitalDistanceTables(directory=str(tmp_path))
+    restarted.register('mumbai', *HOSPITALS['mumbai'])
+    restarted.rebuild('blood', lat, lon)
+    # Reused from disk rather than rebuilt, so nothing is pending
+    assert not restarted._dirty
+    np.testing.assert_array_equal(restarted._order['mumbai', 'blood'], tables._order['mumbai', 'blood'])
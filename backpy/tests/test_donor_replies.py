@@ -0,0 +1,125 @@
+import pytest
+from flask import Flask
+
+import donor_replies
+import matching_service
+import update_donor_status
+from donor_replies import (ACCEPTED, DECLINED, OPTED_OUT, SENT, REPLIES_BLUEPRINT, ReplyTracker,
+                           parse_reply, twilio_signature)
+from suppression import suppression
+
+TOKEN = 'test-auth-token'
+INBOUND_URL = 'http://localhost/api/sms/inbound'
+
+
+@pytest.fixture
+def tracker():
+    tracker = ReplyTracker()
+    tracker.record_sent('a6a3f7fe55', '+91 85917 68921', 'job-1')
+    return tracker
+
+
+@pytest.mark.parametrize('body, state', [
+    ('YES', ACCEPTED), ('y.', ACCEPTED), ('No thanks', DECLINED), ('STOP', OPTED_OUT),
+    ('maybe later', None), ('', None),
+])
+def test_parse_reply(body, state):
+    assert parse_reply(body) == state
+
+
+def test_reply_resolves_by_normalised_number(tracker):
+    result = tracker.handle_reply('918591768921', 'YES')
+    assert result['status'] == 'applied'
+    assert (result['from_state'], result['state']) == (SENT, ACCEPTED)
+    assert tracker.get('a6a3f7fe55')['state'] == ACCEPTED
+
+
+def test_quoted_donor_id_wins_over_latest_message(tracker):
+    tracker.record_sent('0123456789', '+918591768921', 'job-2')
+    assert tracker.handle_reply('+918591768921', 'YES a6a3f7fe55')['donor_id'] == 'a6a3f7fe55'
+    assert tracker.handle_reply('+918591768921', 'NO')['donor_id'] == '0123456789'
+
+
+def test_repeated_and_disallowed_replies_are_no_ops(tracker):
+    tracker.handle_reply('+918591768921', 'YES')
+    assert tracker.handle_reply('+918591768921', 'YES')['status'] == 'unchanged'
+    assert tracker.handle_reply('+918591768921', 'NO')['status'] == 'unchanged'
+    assert tracker.get('a6a3f7fe55')['state'] == ACCEPTED
+
+
+def test_declined_donor_may_still_accept(tracker):
+    tracker.handle_reply('+918591768921', 'NO')
+    assert tracker.handle_reply('+918591768921', 'YES')['state'] == ACCEPTED
+
+
+def test_opt_out_is_final_and_survives_new_outreach(tracker):
+    tracker.handle_reply('+918591768921', 'STOP')
+    tracker.record_sent('a6a3f7fe55', '+918591768921', 'job-3')
+    assert tracker.get('a6a3f7fe55')['state'] == OPTED_OUT
+    assert tracker.handle_reply('+918591768921', 'YES')['status'] == 'unchanged'
+
+
+def test_unknown_number_and_unrecognised_text_are_ignored(tracker):
+    assert tracker.handle_reply('+10000000000', 'YES')['status'] == 'ignored'
+    assert tracker.handle_reply('+918591768921', 'what?')['status'] == 'ignored'
+
+
+def test_subscribers_see_every_transition(tracker):
+    seen = []
+    tracker.subscribe(seen.append)
+    tracker.handle_reply('+918591768921', 'NO')
+    tracker.handle_reply('+918591768921', 'YES')
+    assert [(t['from_state'], t['state']) for t in seen] == [(SENT, DECLINED), (DECLINED, ACCEPTED)]
+
+
+def test_acceptance_holds_donor_without_recording_a_donation(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError('acceptance must not touch donation records')
+
+    monkeypatch.setattr(update_donor_status, 'update_donor_record', fail)
+    monkeypatch.setattr(matching_service, 'record_donation', fail)
+    suppression.attach(['b7c8d9e0f1'])
+
+    matching_service._apply_reply({'donor_id': 'b7c8d9e0f1', 'job_id': 'job-1',
+                                   'from_state': SENT, 'state': ACCEPTED})
+    status = suppression.status('b7c8d9e0f1')
+    assert status['deferred_until'] is not None
+    assert not status['opted_out']
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(donor_replies.messaging, 'TWILIO_AUTH_TOKEN', TOKEN)
+    app = Flask(__name__)
+    app.register_blueprint(REPLIES_BLUEPRINT)
+    return app.test_client()
+
+
+def test_webhook_accepts_signed_request(client):
+    form = {'From': '+10000000001', 'Body': 'YES'}
+    response = client.post('/api/sms/inbound', data=form,
+                           headers={'X-Twilio-Signature': twilio_signature(TOKEN, INBOUND_URL, form)})
+    assert response.status_code == 200
+    assert response.mimetype == 'application/xml'
+
+
+@pytest.mark.parametrize('signature', [None, 'bm90LXRoZS1zaWduYXR1cmU='])
+def test_webhook_rejects_missing_or_bad_signature(client, signature):
+    headers = {'X-Twilio-Signature': signature} if signature else {}
+    response = client.post('/api/sms/inbound', data={'From': '+10000000001', 'Body': 'YES'}, headers=headers)
+    assert response.status_code == 403
+
+
+def test_webhook_rejects_everything_without_a_token(client, monkeypatch):
+    monkeypatch.setattr(donor_replies.messaging, 'TWILIO_AUTH_TOKEN', '')
+    form = {'From': '+10000000001', 'Body': 'YES'}
+    response = client.post('/api/sms/inbound', data=form,
+                           headers={'X-Twilio-Signature': twilio_signature('x', INBOUND_URL, form)})
+    assert response.status_code == 403
+
+
+def test_webhook_refuses_json_even_with_a_url_signature(client):
+    # A URL-only signature is the same for every request, so it cannot vouch for From/Body
+    response = client.post('/api/sms/inbound', json={'From': '+10000000001', 'Body': 'STOP'},
+                           headers={'X-Twilio-Signature': twilio_signature(TOKEN, INBOUND_URL, {})})
+    assert response.status_code == 415
@@ -0,0 +1,75 @@
+import sys
+
+import numpy as np
+import pandas as pd
+
+from donor_store import DonorColumns, PIIStore
+
+FEATURES = ['months_since_first_donation', 'number_of_donation', 'pints_donated', 'latitude', 'longitude',
+            'city_Mumbai', 'city_Pune', 'city_Delhi', 'city_Chennai']
+
+DONORS = pd.DataFrame({
+    'donor_id': [f'donor-{i:04d}' for i in range(6)],
+    'blood_group': ['O+', 'A-', 'B+', 'O+', 'AB-', 'O-'],
+    # Nashik and a missing city have no feature column; Chennai has no donors
+    'city': ['Mumbai', 'Pune', 'Nashik', 'Delhi', None, 'Mumbai'],
+    'latitude': [19.07, 18.52, 19.99, 28.70, 12.97, 19.10],
+    'longitude': [72.87, 73.85, 73.79, 77.10, 77.59, 72.90],
+    'last_donation_date': pd.to_datetime(['2025-01-01', None, '2025-06-01', '2025-02-01', None, '2025-03-01']),
+    'months_since_first_donation': [12, 3, 40, 7, 0, 25],
+    'number_of_donation': [4, 1, 10, 2, 0, 6],
+    'pints_donated': [4, 1, 10, 2, 0, 6],
+})
+
+
+def baseline_features(df: pd.DataFrame) -> pd.DataFrame:
+    """The model input as built before DonorColumns: numerics plus pd.get_dummies city one-hots."""
+    X = pd.get_dummies(df['city'], prefix='city', dtype=np.float64).reindex(columns=FEATURES, fill_value=0.0)
+    for col in ['months_since_first_donation', 'number_of_donation', 'pints_donated']:
+        X[col] = df[col]
+    # DonorColumns keeps coordinates as float32
+    X['latitude'] = df['latitude'].astype(np.float32)
+    X['longitude'] = df['longitude'].astype(np.float32)
+    return X.astype(np.float64)
+
+
+def test_features_match_the_get_dummies_baseline():
+    donors = DonorColumns.from_frame(DONORS)
+    rows = np.array([5, 0, 2, 4, 3, 1])
+    np.testing.assert_array_equal(donors.features(rows, FEATURES),
+                                  baseline_features(DONORS.iloc[rows]).to_numpy())
+
+
+def test_features_match_the_baseline_after_extend_with_new_cities():
+    head, tail = DONORS.iloc[:3], DONORS.iloc[3:].assign(city=['Chennai', 'Delhi', 'Surat'])
+    donors = DonorColumns.from_frame(head).extended(tail)
+    combined = pd.concat([head, tail])
+    rows = np.arange(len(combined))
+    np.testing.assert_array_equal(donors.features(rows, FEATURES), baseline_features(combined).to_numpy())
+
+
+def test_frame_decodes_groups_and_cities():
+    donors = DonorColumns.from_frame(DONORS)
+    frame = donors.frame(np.array([2, 4]))
+    assert frame['blood_group'].tolist() == ['B+', 'AB-']
+    assert frame.loc[2, 'city'] == 'Nashik' and pd.isna(frame.loc[4, 'city'])
+    assert frame['donor_id'].tolist() == ['donor-0002', 'donor-0004']
+
+
+def test_nbytes_counts_donor_id_strings():
+    donors = DonorColumns.from_frame(DONORS)
+    strings = sum(sys.getsizeof(d) for d in DONORS['donor_id'])
+    pointers_only = sum(a.nbytes for a in [donors.group, donors.city, donors.latitude, donors.longitude,
+                                           donors.last_donation_day, donors.sex, *donors.numeric.values(),
+                                           donors.donor_id])
+    assert donors.nbytes() >= pointers_only + strings
+    longer = DonorColumns.from_frame(DONORS.assign(donor_id=DONORS['donor_id'] + 'x' * 100))
+    assert longer.nbytes() - donors.nbytes() == 100 * len(DONORS)
+
+
+def test_pii_hydrate_returns_only_known_donors(tmp_path):
+    pii = PIIStore(str(tmp_path / 'pii.sqlite'))
+    pii.replace_all(DONORS.assign(name=DONORS['donor_id'].str.upper(), contact_number='+910000000000'))
+    hydrated = pii.hydrate(['donor-0003', 'missing', 'donor-0001'])
+    assert sorted(hydrated.index) == ['donor-0001', 'donor-0003']
+    assert hydrated.loc['donor-0003', 'name'] == 'DONOR-0003'
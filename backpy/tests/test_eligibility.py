@@ -0,0 +1,63 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from eligibility import ELIGIBILITY_RULE_SET, EligibilityIndex, EligibilityRules, parse_donation_dates
+from suppression import day_number
+
+
+def test_default_rule_set_is_the_30_day_baseline():
+    assert ELIGIBILITY_RULE_SET == 'legacy'
+    index = EligibilityIndex()
+    donors = pd.DataFrame({'last_donation_date': pd.to_datetime(['2026-01-01', '2025-12-01'])})
+    index.compute(donors)
+    assert index.eligible_mask(date(2026, 1, 31)).tolist() == [False, True]
+    assert index.eligible_mask(date(2026, 2, 1)).tolist() == [True, True]
+
+
+def test_nbtc_rules_by_donation_type_and_sex():
+    rules = EligibilityRules.named('nbtc')
+    assert rules.deferral_days('whole_blood', 'M') == 90
+    assert rules.deferral_days('whole_blood', 'U') == 120
+    assert rules.deferral_days('platelets', 'F') == 14
+    assert rules.deferral_days_for(np.array(['whole_blood', 'plasma']), np.array(['F', 'M'])).tolist() == [120, 14]
+    with pytest.raises(ValueError):
+        EligibilityRules.named('unknown')
+
+
+def test_excel_serial_dates_are_converted():
+    parsed = parse_donation_dates(pd.Series([42811, '42685', '2025-10-01', None], dtype=object))
+    assert parsed.iloc[0] == pd.Timestamp('2017-03-17')
+    assert parsed.iloc[1] == pd.Timestamp('2016-11-11')
+    assert parsed.iloc[2] == pd.Timestamp('2025-10-01')
+    assert pd.isna(parsed.iloc[3])
+
+
+def test_record_donation_and_becoming_eligible():
+    index = EligibilityIndex()
+    index.compute(pd.DataFrame({'last_donation_date': pd.to_datetime(['2026-01-01', '2026-01-10', None])}))
+    assert index.becoming_eligible(date(2026, 2, 1), date(2026, 2, 28)).tolist() == [0, 1]
+
+    index.record_donation(2, date(2026, 2, 5))
+    assert index.next_eligible[2] == day_number(date(2026, 2, 5)) + 31
+    assert index.becoming_eligible(date(2026, 3, 1), date(2026, 3, 31)).tolist() == [2]
+
+
+def test_rules_know_only_their_donation_types():
+    nbtc = EligibilityRules.named('nbtc')
+    assert nbtc.knows('platelets') and not nbtc.knows('granulocytes') and not nbtc.knows(None)
+    assert EligibilityRules.named('legacy').knows('granulocytes')
+
+
+def test_confirm_donation_rejects_unknown_type_before_writing(monkeypatch):
+    import app as app_module
+    import matching_service
+    writes = []
+    monkeypatch.setattr(matching_service, 'eligibility', EligibilityIndex(EligibilityRules.named('nbtc')))
+    monkeypatch.setattr(app_module, 'update_donor_record', lambda *args, **kwargs: writes.append(args) or True)
+    client = app_module.app.test_client()
+    response = client.post('/api/blood/confirm-donation', json={'donor_id': 'd0', 'donation_type': 'granulocytes'})
+    assert response.status_code == 400
+    assert not writes
@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from hla import (HLA_COLUMNS, UNTYPED, HLACodes, hla_scores, mismatches, normalize_antigen,
+                 parse_typing, typed)
+
+
+@pytest.mark.parametrize('value, locus, expected', [
+    ('A*02:01', 'A', 'A2'),
+    ('A2', 'A', 'A2'),
+    ('02', 'A', 'A2'),
+    ('DRB1*15:01', 'DR', 'DR15'),
+    ('dr4', 'DR', 'DR4'),
+    ('', 'B', None),
+    (None, 'B', None),
+    (float('nan'), 'B', None),
+    ('Bw4', 'B', None),
+])
+def test_normalize_antigen(value, locus, expected):
+    assert normalize_antigen(value, locus) == expected
+
+
+def test_parse_typing_splits_loci_and_reads_single_antigens_as_homozygous():
+    assert parse_typing('A*02:01, A24; B7 DRB1*15:01,DR4') == {
+        'hla_a1': 'A*02:01', 'hla_a2': 'A24',
+        'hla_b1': 'B7', 'hla_b2': 'B7',
+        'hla_dr1': 'DRB1*15:01', 'hla_dr2': 'DR4',
+    }
+    # Unknown tokens are ignored and a missing locus stays absent
+    assert parse_typing('A1 A3 Cw7 junk') == {'hla_a1': 'A1', 'hla_a2': 'A3'}
+    assert parse_typing('') == {}
+
+
+def test_same_antigen_in_any_notation_encodes_to_one_code():
+    codes = HLACodes()
+    a = codes.encode_typing('A2,A24,B7,B8,DR15,DR4')
+    b = codes.encode_typing({'hla_a1': 'A*02:01', 'hla_a2': '24', 'hla_b1': 'B*07', 'hla_b2': 'B8',
+                             'hla_dr1': 'DRB1*15:01', 'hla_dr2': 'DR4'})
+    assert a.tolist() == b.tolist()
+    assert (a != UNTYPED).all()
+    # Absent columns are untyped
+    frame = codes.encode(pd.DataFrame({'hla_a1': ['A2', None]}))
+    assert frame.shape == (2, len(HLA_COLUMNS))
+    assert frame[0].tolist() == [a[0], 0, 0, 0, 0, 0]
+    assert (frame[1] == UNTYPED).all()
+
+
+@pytest.fixture
+def codes():
+    return HLACodes()
+
+
+def test_mismatch_counts_per_locus(codes):
+    donor = codes.encode_typing('A1,A2,B7,B8,DR4,DR15')
+    recipients = np.stack([
+        codes.encode_typing('A1,A2,B7,B8,DR4,DR15'),   # identical
+        codes.encode_typing('A2,A1,B8,B7,DR15,DR4'),   # same antigens, other order
+        codes.encode_typing('A1,A3,B7,B8,DR4,DR15'),   # A2 missing
+        codes.encode_typing('A3,A11,B44,B51,DR1,DR3'),  # everything missing
+        codes.encode_typing('A1,A2,B7,B8,DR4'),        # homozygous DR4: DR15 missing
+    ])
+    assert mismatches(donor, recipients).tolist() == [
+        [0, 0, 0], [0, 0, 0], [1, 0, 0], [2, 2, 2], [0, 0, 1]]
+
+
+def test_homozygous_donor_antigen_counts_once(codes):
+    donor = codes.encode_typing('A1,B7,B8,DR4,DR15')
+    recipient = codes.encode_typing('A3,A11,B7,B8,DR4,DR15')
+    assert mismatches(donor, recipient).tolist() == [1, 0, 0]
+
+
+def test_untyped_donor_antigens_never_count(codes):
+    donor = codes.encode_typing({'hla_a1': 'A1', 'hla_b1': 'B7', 'hla_b2': 'B8'})
+    recipient = codes.encode_typing('A3,A11,B44,B51,DR1,DR3')
+    assert mismatches(donor, recipient).tolist() == [1, 2, 0]
+
+
+def test_scores_weight_dr_double_and_fall_back_when_untyped(codes):
+    donor = codes.encode_typing('A1,A2,B7,B8,DR4,DR15')
+    recipients = np.stack([
+        codes.encode_typing('A1,A2,B7,B8,DR4,DR15'),   # 0 weighted mismatches
+        codes.encode_typing('A1,A3,B7,B8,DR4,DR15'),   # 1 (A)
+        codes.encode_typing('A1,A2,B7,B8,DR1,DR15'),   # 2 (one DR, weight 2)
+        codes.encode_typing('A3,A11,B44,B51,DR1,DR3'),  # 2 + 2 + 4 = 8, the maximum
+        codes.encode_typing('A1,A2,B7,B8'),            # DR untyped: fallback
+    ])
+    fallback = np.array([11.0, 22.0, 33.0, 44.0, 55.0])
+    scores = hla_scores(donor, recipients, fallback)
+    assert scores.tolist() == pytest.approx([100.0, 87.5, 75.0, 0.0, 55.0])
+    assert typed(recipients).tolist() == [True, True, True, True, False]
+
+
+def test_untyped_donor_keeps_every_fallback(codes):
+    donor = codes.encode_typing({})
+    recipients = np.stack([codes.encode_typing('A1,A2,B7,B8,DR4,DR15')] * 2)
+    assert hla_scores(donor, recipients, [60.0, 70.0]).tolist() == [60.0, 70.0]
@@ -0,0 +1,142 @@
+import os
+import re
+import threading
+
+import pytest
+from flask import Flask
+
+import instrumentation
+from instrumentation import MetricsRegistry, stage
+
+
+def test_histogram_renders_cumulative_buckets_sum_and_count():
+    registry = MetricsRegistry()
+    histogram = registry.histogram('job_seconds', 'Job time.', ('kind',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        histogram.observe(value, 'sms')
+    histogram.observe(0.1, 'voice')
+
+    assert registry.render().splitlines() == [
+        '# HELP job_seconds Job time.',
+        '# TYPE job_seconds histogram',
+        'job_seconds_bucket{kind="sms",le="0.1"} 1',
+        'job_seconds_bucket{kind="sms",le="1.0"} 3',
+        'job_seconds_bucket{kind="sms",le="+Inf"} 4',
+        'job_seconds_sum{kind="sms"} 4.05',
+        'job_seconds_count{kind="sms"} 4',
+        # A value equal to a bound falls in that bucket (le is inclusive)
+        'job_seconds_bucket{kind="voice",le="0.1"} 1',
+        'job_seconds_bucket{kind="voice",le="1.0"} 1',
+        'job_seconds_bucket{kind="voice",le="+Inf"} 1',
+        'job_seconds_sum{kind="voice"} 0.1',
+        'job_seconds_count{kind="voice"} 1',
+    ]
+
+
+def test_counter_and_gauge_render_and_escape_labels():
+    registry = MetricsRegistry()
+    counter = registry.counter('sends_total', 'Sends.', ('provider',))
+    gauge = registry.gauge('queue_depth', 'Depth.', ('queue',))
+    counter.inc('twilio')
+    counter.inc('twilio', amount=2)
+    gauge.set(7, 'bulk "low"\npriority')
+    gauge.set(3, 'bulk "low"\npriority')
+
+    lines = registry.render().splitlines()
+    assert 'sends_total{provider="twilio"} 3' in lines
+    assert 'queue_depth{queue="bulk \\"low\\"\\npriority"} 3' in lines
+    assert '# TYPE queue_depth gauge' in lines
+
+
+@pytest.fixture
+def app(monkeypatch, tmp_path):
+    monkeypatch.setattr(instrumentation, 'PROFILE_DIR', str(tmp_path / 'profiles'))
+    app = Flask(__name__)
+    events = {}
+
+    @app.route('/rank')
+    def rank():
+        with stage('find_top_blood_donors', 'features'):
+            pass
+        with stage('find_top_blood_donors', 'predict'):
+            pass
+        with stage('find_top_blood_donors', 'predict'):
+            pass
+        return 'ok'
+
+    @app.route('/slow')
+    def slow():
+        events['entered'].set()
+        events['release'].wait(5)
+        return 'ok'
+
+    @app.route('/boom')
+    def boom():
+        raise RuntimeError('boom')
+
+    instrumentation.init_app(app)
+    app.events = events
+    return app
+
+
+def test_server_timing_sums_repeated_stages_and_adds_total(app):
+    response = app.test_client().get('/rank')
+    header = response.headers['Server-Timing']
+    assert [entry.split(';')[0] for entry in header.split(', ')] == ['features', 'predict', 'total']
+    assert all(re.fullmatch(r'\w+;dur=\d+\.\d{3}', entry) for entry in header.split(', '))
+
+
+def test_metrics_endpoint_exposes_request_and_stage_histograms(app):
+    client = app.test_client()
+    client.get('/rank')
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    body = response.get_data(as_text=True)
+    assert '# TYPE http_request_seconds histogram' in body
+    assert re.search(r'^http_request_seconds_count\{endpoint="rank",status="200"\} \d+$', body, re.M)
+    assert re.search(r'^ranking_stage_seconds_count\{function="find_top_blood_donors",stage="predict"\} \d+$',
+                     body, re.M)
+
+
+def test_profiling_needs_both_the_setting_and_the_header(app, monkeypatch):
+    client = app.test_client()
+    assert 'X-Profile-File' not in client.get('/rank', headers={'X-Profile': '1'}).headers
+    monkeypatch.setattr(instrumentation, 'PROFILING_ALLOWED', True)
+    assert 'X-Profile-File' not in client.get('/rank', headers={'X-Profile': '0'}).headers
+    path = client.get('/rank', headers={'X-Profile': '1'}).headers['X-Profile-File']
+    assert os.path.exists(path)
+    assert 'function calls' in instrumentation.profile_summary(path)
+
+
+def test_concurrent_profiling_requests_are_serialised(app, monkeypatch):
+    monkeypatch.setattr(instrumentation, 'PROFILING_ALLOWED', True)
+    app.events.update(entered=threading.Event(), release=threading.Event())
+    first = {}
+
+    def profiled_slow_request():
+        first['response'] = app.test_client().get('/slow', headers={'X-Profile': '1'})
+
+    thread = threading.Thread(target=profiled_slow_request)
+    thread.start()
+    try:
+        assert app.events['entered'].wait(5)
+        second = app.test_client().get('/rank', headers={'X-Profile': '1'})
+    finally:
+        app.events['release'].set()
+        thread.join(5)
+
+    assert second.status_code == 200
+    assert 'X-Profile-File' not in second.headers
+    assert instrumentation.PROFILE_SKIPPED_HEADER in second.headers
+    assert 'X-Profile-File' in first['response'].headers
+    # The slot is free again once the first request finishes
+    assert 'X-Profile-File' in app.test_client().get('/rank', headers={'X-Profile': '1'}).headers
+
+
+def test_failed_request_frees_the_profiling_slot(app, monkeypatch):
+    monkeypatch.setattr(instrumentation, 'PROFILING_ALLOWED', True)
+    client = app.test_client()
+    assert client.get('/boom', headers={'X-Profile': '1'}).status_code == 500
+    assert not instrumentation._profile_lock.locked()
+    assert 'X-Profile-File' in client.get('/rank', headers={'X-Profile': '1'}).headers
@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+
+import inventory_service as inv
+from inventory_service import InventoryService
+from inventory_store import InventoryStore
+
+START = datetime(2026, 1, 1)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    service = InventoryService(store=InventoryStore(None))
+    monkeypatch.setattr(inv, 'inventory_service', service)
+    monkeypatch.setattr(inv, 'inventory_store', service.store)
+    app = Flask(__name__)
+    app.register_blueprint(inv.INVENTORY_BLUEPRINT)
+    return app.test_client(), service
+
+
+@pytest.mark.parametrize('levels', [
+    {'O+': 30, 'A+': -1},
+    {'O+': 30, 'A+': 'many'},
+    {'O+': 30, 'A+': 2.5},
+    {'O+': 30, 'Q+': 4},
+    {},
+])
+def test_update_rejects_the_whole_payload_before_applying_any_of_it(client, levels):
+    client, service = client
+    response = client.post('/api/inventory/update', json={'hospital': 'mumbai_central', 'levels': levels})
+    assert response.status_code == 400
+    assert service.snapshot() == {}
+    assert service.store.hospitals == []
+
+
+def test_update_applies_every_group_and_queues_shortages(client):
+    client, service = client
+    response = client.post('/api/inventory/update',
+                           json={'hospital': 'delhi_aiims', 'levels': {'O+': 30, 'O-': '3', 'A+': 10.0}})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert sorted(event['blood_group'] for event in body['shortages_queued']) == ['A+', 'O-']
+    assert {group: level['current_units'] for group, level in service.snapshot('delhi_aiims').items()} == \
+        {'O+': 30, 'O-': 3, 'A+': 10}
+
+
+def test_shortages_are_debounced_and_ordered_by_severity():
+    service = InventoryService(thresholds={'O-': 10, 'A+': 10})
+    service.update('h', 'A+', 8, START)
+    service.update('h', 'O-', 2, START)
+    # Still pending: no second event for the same group
+    assert service.update('h', 'O-', 1, START + timedelta(minutes=1)) is None
+
+    handled = service.drain(lambda event: event['blood_group'])
+    assert handled == ['O-', 'A+']
+    # Inside the debounce window nothing is re-queued, after it the group triggers again
+    assert service.update('h', 'O-', 1, START + timedelta(minutes=10)) is None
+    assert service.update('h', 'O-', 1, START + timedelta(minutes=40)) is not None
+
+
+def test_ring_buffer_keeps_only_the_newest_samples_per_series():
+    service = InventoryService(store=InventoryStore(None, capacity=4), thresholds={'O+': 0})
+    for day in range(6):
+        service.update('h', 'O+', 100 - day, START + timedelta(days=day))
+
+    times, units = service.store.range('h', 'O+', 0, float('inf'))
+    assert units.tolist() == [98, 97, 96, 95]
+    assert times.tolist() == [int((START + timedelta(days=d)).timestamp()) for d in range(2, 6)]
+
+
+def test_falling_trend_queues_a_predicted_shortage_above_threshold():
+    service = InventoryService(store=InventoryStore(None), thresholds={'O+': 20})
+    # 10 units/day: after the third reading 30 units left, one day to threshold
+    assert service.update('h', 'O+', 50, START) is None
+    assert service.update('h', 'O+', 40, START + timedelta(days=1)) is None
+    event = service.update('h', 'O+', 30, START + timedelta(days=2))
+
+    assert event['predicted'] is True
+    assert event['shortage_severity'] == 0.0
+    assert event['days_to_threshold'] == pytest.approx(1.0)
+
+    now = (START + timedelta(days=2)).timestamp()
+    [report] = service.store.forecast(service.thresholds, now=now)
+    assert report['consumption_per_day'] == pytest.approx(10.0)
+    assert report['days_of_supply'] == pytest.approx(3.0)
+    assert report['days_to_threshold'] == pytest.approx(1.0)
@@ -0,0 +1,97 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+import inventory_store as module
+from inventory_store import GROUP_INDEX, RECORD_DTYPE, InventoryStore
+
+DAY = 86400
+T0 = 1_700_000_000
+
+
+def test_ring_wraps_around_and_keeps_the_newest_samples():
+    store = InventoryStore(None, capacity=4)
+    for i in range(7):
+        store.append('h', 'O+', 100 - i, T0 + i * DAY)
+
+    times, units = store.range('h', 'O+', 0, T0 + 10 * DAY)
+    assert units.tolist() == [97, 96, 95, 94]
+    assert times.tolist() == [T0 + i * DAY for i in range(3, 7)]
+    assert store.latest_time('h', 'O+') == T0 + 6 * DAY
+    assert store.current_levels()[0, GROUP_INDEX['O+']] == 94
+    # Range bounds are inclusive and searched on the wrapped ring
+    assert store.range('h', 'O+', T0 + 4 * DAY, T0 + 5 * DAY)[1].tolist() == [96, 95]
+
+
+def test_out_of_order_samples_are_rejected():
+    store = InventoryStore(None)
+    store.append('h', 'A-', 5, T0)
+    with pytest.raises(ValueError):
+        store.append('h', 'A-', 4, T0 - 1)
+    assert store.range('h', 'A-', 0, T0)[1].tolist() == [5]
+
+
+def test_log_replays_into_an_identical_store(tmp_path):
+    path = str(tmp_path / 'inventory.bin')
+    store = InventoryStore(path, capacity=4)
+    for i in range(6):
+        store.append('h1', 'O+', 50 - i, T0 + i * DAY)
+        store.append('h2', 'B-', 10 + i, T0 + i * DAY)
+    store.flush()
+
+    replayed = InventoryStore(path, capacity=4)
+    assert replayed.hospitals == ['h1', 'h2']
+    for hospital, group in (('h1', 'O+'), ('h2', 'B-')):
+        expected = store.range(hospital, group, 0, T0 + 10 * DAY)
+        actual = replayed.range(hospital, group, 0, T0 + 10 * DAY)
+        assert actual[0].tolist() == expected[0].tolist()
+        assert actual[1].tolist() == expected[1].tolist()
+    assert np.array_equal(replayed.current_levels(), store.current_levels())
+
+
+def test_pending_samples_are_flushed_on_a_timer(tmp_path, monkeypatch):
+    monkeypatch.setattr(module, 'FLUSH_INTERVAL_SECONDS', 0.05)
+    path = str(tmp_path / 'inventory.bin')
+    store = InventoryStore(path)
+    store.append('h', 'O+', 12, T0)
+
+    deadline = time.time() + 5
+    while store._pending and time.time() < deadline:
+        time.sleep(0.01)
+    assert not store._pending
+    assert np.fromfile(path, dtype=RECORD_DTYPE)['units'].tolist() == [12]
+
+
+def test_log_is_compacted_to_the_retained_samples(tmp_path, monkeypatch):
+    monkeypatch.setattr(module, 'FLUSH_EVERY', 1)
+    path = str(tmp_path / 'inventory.bin')
+    store = InventoryStore(path, capacity=4)
+    for i in range(20):
+        store.append('h', 'AB+', i, T0 + i)
+
+    assert os.path.getsize(path) <= module.COMPACT_RATIO * 4 * RECORD_DTYPE.itemsize
+    replayed = InventoryStore(path, capacity=4)
+    assert replayed.range('h', 'AB+', 0, T0 + 100)[1].tolist() == [16, 17, 18, 19]
+
+
+def test_consumption_rate_fits_the_trend_inside_the_window():
+    store = InventoryStore(None)
+    now = T0 + 10 * DAY
+    # Outside the 72h window: ignored
+    store.append('h', 'O-', 500, now - 5 * DAY)
+    for i, units in enumerate([40, 34, 28, 22]):
+        store.append('h', 'O-', units, now - (3 - i) * DAY)
+    store.append('h', 'A+', 10, now - DAY)
+    store.append('h', 'A+', 15, now)
+
+    assert store.consumption_rate('h', 'O-', now=now) == pytest.approx(6.0)
+    # A rising trend and a single sample both count as no consumption
+    assert store.consumption_rate('h', 'A+', now=now) == 0.0
+    assert store.consumption_rate('h', 'B+', now=now) == 0.0
+
+    rates = store.consumption_rates(now=now)
+    assert rates[0, GROUP_INDEX['O-']] == pytest.approx(6.0)
+    assert rates[0, GROUP_INDEX['A+']] == 0.0
+    assert store.days_of_supply(now=now)[0, GROUP_INDEX['O-']] == pytest.approx(22 / 6)
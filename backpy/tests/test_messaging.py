@@ -0,0 +1,144 @@
+import time
+
+import pytest
+
+import messaging
+from messaging import (CLOSED, HALF_OPEN, OPEN, SMS, VOICE, CircuitBreaker, FakeProvider, MessageRouter, Provider,
+                       ProviderError)
+
+
+def test_breaker_opens_probes_once_and_closes():
+    breaker = CircuitBreaker('p', failure_threshold=2, cooloff=30)
+    breaker.record(False)
+    assert breaker.state == CLOSED and breaker.allow()
+    breaker.record(False)
+    assert breaker.state == OPEN and not breaker.allow()
+
+    later = breaker.opened_at + 30
+    assert breaker.allow(now=later)
+    assert breaker.state == HALF_OPEN
+    # Only one probe while half-open
+    assert not breaker.allow(now=later)
+    breaker.record(True)
+    assert breaker.state == CLOSED and breaker.failures == 0 and breaker.allow()
+
+
+def test_failed_probe_reopens_breaker():
+    breaker = CircuitBreaker('p', failure_threshold=3, cooloff=30)
+    for _ in range(3):
+        breaker.record(False)
+    first_open = breaker.opened_at
+    assert breaker.allow(now=first_open + 30)
+    breaker.record(False)
+    assert breaker.state == OPEN and breaker.opened_at >= first_open
+    assert not breaker.allow(now=breaker.opened_at + 1)
+
+
+def test_send_fails_over_and_skips_open_breaker():
+    down, backup = FakeProvider('down', SMS, down=True), FakeProvider('backup', VOICE)
+    router = MessageRouter([down, backup])
+    result = router.send('+911234567890', 'hi', channels=(SMS, VOICE))
+    assert result['success'] and result['provider'] == 'backup'
+    assert [a['provider'] for a in result['attempts']] == ['down', 'backup']
+
+    for _ in range(messaging.BREAKER_FAILURE_THRESHOLD):
+        router.send('+911234567890', 'hi', channels=(SMS, VOICE))
+    calls = down.calls
+    result = router.send('+911234567890', 'hi', channels=(SMS, VOICE))
+    assert result['provider'] == 'backup' and down.calls == calls
+
+
+def test_hedged_send_returns_first_success_from_backup():
+    slow, fast = FakeProvider('slow', SMS, latency=1.0), FakeProvider('fast', VOICE)
+    router = MessageRouter([slow, fast], hedge_delay=0.05)
+    start = time.perf_counter()
+    result = router.send('+911234567890', 'SOS', channels=(SMS, VOICE), hedge=True)
+    assert result['success'] and result['provider'] == 'fast'
+    assert time.perf_counter() - start < 0.5
+    assert len(fast.sent) == 1
+
+
+def test_hedged_send_moves_on_immediately_after_failure():
+    down, backup = FakeProvider('down', SMS, down=True), FakeProvider('backup', VOICE)
+    router = MessageRouter([down, backup], hedge_delay=10)
+    start = time.perf_counter()
+    result = router.send('+911234567890', 'SOS', channels=(SMS, VOICE), hedge=True)
+    assert result['success'] and result['provider'] == 'backup'
+    assert time.perf_counter() - start < 1
+
+
+def test_send_batch_reports_failed_recipients():
+    flaky = FakeProvider('flaky', SMS, fail_every=2)
+    router = MessageRouter([flaky], bulk_workers=1)
+    to_list = [f"+9100000000{i}" for i in range(4)]
+    result = router.send_batch(to_list, 'drive', channels=(SMS,))
+    assert result['provider'] == 'flaky' and result['error'] is None
+    assert [m is not None for m in result['message_ids']] == [True, False, True, False]
+    assert len(flaky.sent) == 2
+
+
+def test_send_batch_falls_back_when_a_provider_fails_everyone():
+    down, backup = FakeProvider('down', SMS, down=True), FakeProvider('backup', VOICE)
+    router = MessageRouter([down, backup])
+    result = router.send_batch(['+911', '+912'], 'drive', channels=(SMS, VOICE))
+    assert result['provider'] == 'backup' and all(result['message_ids'])
+
+
+def test_default_providers_fail_closed_without_credentials(monkeypatch):
+    monkeypatch.setattr(messaging, 'TWILIO_ACCOUNT_SID', '')
+    monkeypatch.setattr(messaging, 'MESSAGING_FAKE_PROVIDERS', False)
+    monkeypatch.setattr(messaging, 'SMTP_HOST', '')
+    assert messaging.default_providers() == []
+    result = MessageRouter([]).send('+911234567890', 'SOS', channels=messaging.SOS_CHANNELS, hedge=True)
+    assert not result['success'] and result['error'] == 'No messaging provider available'
+
+
+def test_fake_providers_only_when_asked_for(monkeypatch):
+    monkeypatch.setattr(messaging, 'TWILIO_ACCOUNT_SID', '')
+    monkeypatch.setattr(messaging, 'MESSAGING_FAKE_PROVIDERS', True)
+    monkeypatch.setattr(messaging, 'SMTP_HOST', '')
+    providers = messaging.default_providers()
+    assert all(isinstance(p, FakeProvider) for p in providers)
+    assert {p.channel for p in providers} == {SMS, VOICE}
+
+
+def test_send_batch_paces_every_provider_request():
+    single, bulk = FakeProvider('single', SMS), FakeProvider('bulk', VOICE, max_batch=2)
+    to_list = [f"+9100000000{i}" for i in range(5)]
+    paced = []
+
+    MessageRouter([single]).send_batch(to_list, 'drive', channels=(SMS,),
+                                       before_send=lambda provider, n: paced.append((provider.name, n)))
+    assert paced == [('single', 1)] * 5
+
+    paced.clear()
+    MessageRouter([bulk]).send_batch(to_list, 'drive', channels=(VOICE,),
+                                     before_send=lambda provider, n: paced.append((provider.name, n)))
+    assert paced == [('bulk', 2), ('bulk', 2), ('bulk', 1)]
+
+
+def test_twilio_providers_declare_account_rates():
+    assert messaging.TwilioProvider(SMS).rate_limit == messaging.TWILIO_MESSAGES_PER_SECOND
+    assert messaging.TwilioProvider(VOICE).rate_limit == messaging.TWILIO_CALLS_PER_SECOND
+    assert messaging.TwilioNotifyProvider.rate_limit == messaging.TWILIO_MESSAGES_PER_SECOND
+
+
+def test_provider_needs_send_and_batches_through_it_by_default():
+    class Incomplete(Provider):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+    class Numbered(Provider):
+        name = 'numbered'
+
+        def send(self, to, body, timeout):
+            if to == 'bad':
+                raise ProviderError('rejected')
+            return f'id-{to}'
+
+    provider = Numbered()
+    assert provider.send_batch(['a', 'b'], 'hi', 1.0) == ['id-a', 'id-b']
+    with pytest.raises(ProviderError):
+        provider.send_batch(['a', 'bad'], 'hi', 1.0)
@@ -0,0 +1,105 @@
+import threading
+
+from outreach_jobs import ContactLedger, OutreachJobManager
+
+
+class FakeClock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def succeed(job):
+    return {'status': 'success'}
+
+
+def fail(job):
+    return {'status': 'failed', 'reason': 'no donors'}
+
+
+def test_duplicate_inside_window_returns_existing_job():
+    clock = FakeClock()
+    jobs = OutreachJobManager(window_seconds=60, clock=clock)
+    first, created = jobs.run('h1', 'O-', succeed)
+    assert created and first['status'] == 'succeeded'
+
+    clock.now += 30
+    again, created = jobs.run('h1', 'O-', succeed)
+    assert not created
+    assert again is first and first['duplicate_triggers'] == 1
+
+
+def test_window_slides_from_job_start_not_fixed_buckets():
+    # Two triggers a second apart either side of a 60 s boundary collapse
+    clock = FakeClock(now=59.5)
+    jobs = OutreachJobManager(window_seconds=60, clock=clock)
+    first, _ = jobs.run('h1', 'O-', succeed)
+    clock.now = 60.5
+    _, created = jobs.run('h1', 'O-', succeed)
+    assert not created
+
+    # A trigger a full window after the successful job starts a new one
+    clock.now = 59.5 + 60
+    second, created = jobs.run('h1', 'O-', succeed)
+    assert created and second is not first
+
+
+def test_failed_job_can_be_retried_immediately():
+    jobs = OutreachJobManager(window_seconds=60, clock=FakeClock())
+    first, _ = jobs.run('h1', 'O-', fail)
+    retry, created = jobs.run('h1', 'O-', succeed)
+    assert created and retry is not first and retry['status'] == 'succeeded'
+
+
+def test_keys_are_per_hospital_and_blood_group():
+    jobs = OutreachJobManager(window_seconds=60, clock=FakeClock())
+    assert jobs.run('h1', 'O-', succeed)[1]
+    assert jobs.run('h2', 'O-', succeed)[1]
+    assert jobs.run('h1', 'A+', succeed)[1]
+
+
+def test_duplicate_of_running_job_returns_without_waiting():
+    jobs = OutreachJobManager(window_seconds=60, clock=FakeClock())
+    started, release = threading.Event(), threading.Event()
+
+    def slow(job):
+        started.set()
+        release.wait(5)
+        return {'status': 'success'}
+
+    worker = threading.Thread(target=jobs.run, args=('h1', 'O-', slow))
+    worker.start()
+    started.wait(5)
+    try:
+        duplicate, created = jobs.run('h1', 'O-', succeed)
+        assert not created and duplicate['status'] == 'running'
+    finally:
+        release.set()
+        worker.join(5)
+    assert duplicate['status'] == 'succeeded'
+
+
+def test_finished_jobs_are_evicted_after_window():
+    clock = FakeClock()
+    jobs = OutreachJobManager(window_seconds=60, clock=clock)
+    old, _ = jobs.run('h1', 'O-', succeed)
+    jobs.run('h2', 'B+', fail)
+
+    clock.now += 61
+    jobs.run('h3', 'A-', succeed)
+    assert jobs.get(old['job_id']) is None
+    assert set(job['hospital'] for job in jobs.jobs.values()) == {'h3'}
+    assert list(jobs._by_key) == [('h3', 'A-')]
+
+
+def test_contact_ledger_cool_off_and_release():
+    ledger = ContactLedger(cool_off_seconds=100)
+    assert ledger.try_reserve('d1', 'job-a', now=1000)
+    assert not ledger.try_reserve('d1', 'job-b', now=1050)
+    ledger.release('d1', 'job-b')  # not the holder: no effect
+    assert not ledger.can_contact('d1', now=1050)
+    ledger.release('d1', 'job-a')
+    assert ledger.try_reserve('d1', 'job-b', now=1050)
+    assert ledger.can_contact('d1', now=1150)
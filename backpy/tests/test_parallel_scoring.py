@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import parallel_scoring
+from donor_store import DonorColumns
+from parallel_scoring import _rank_serial, rank_candidates
+
+FEATURES = ['months_since_first_donation', 'number_of_donation', 'latitude', 'longitude',
+            'city_Mumbai', 'city_Pune']
+N = 5_000
+
+
+class LinearModel:
+    """Deterministic stand-in for the donor model: a logistic over fixed weights."""
+
+    weights = np.array([0.02, 0.1, 0.01, -0.01, 0.5, -0.3])
+
+    def predict_proba(self, X):
+        p = 1 / (1 + np.exp(-(X @ self.weights - 1)))
+        return np.stack([1 - p, p], axis=1)
+
+
+@pytest.fixture
+def donors():
+    rng = np.random.default_rng(7)
+    return DonorColumns.from_frame(pd.DataFrame({
+        'donor_id': [f'd{i}' for i in range(N)],
+        'blood_group': rng.choice(['O+', 'A+', 'B-'], N),
+        'city': rng.choice(['Mumbai', 'Pune', 'Nashik'], N),
+        'latitude': rng.uniform(18.0, 20.0, N),
+        'longitude': rng.uniform(72.5, 74.5, N),
+        'last_donation_date': pd.NaT,
+        'months_since_first_donation': rng.integers(0, 120, N),
+        'number_of_donation': rng.integers(0, 30, N),
+        'pints_donated': rng.integers(0, 30, N),
+    }))
+
+
+@pytest.fixture(autouse=True)
+def small_partitions(monkeypatch):
+    monkeypatch.setattr(parallel_scoring, 'PARALLEL_MIN_ROWS', 100)
+    monkeypatch.setattr(parallel_scoring, 'SCORING_CHUNK_ROWS', 300)
+
+
+def assert_same_ranking(parallel, serial):
+    for got, expected in zip(parallel, serial):
+        np.testing.assert_allclose(got, expected)
+
+
+@pytest.mark.parametrize('workers', [2, 64])
+@pytest.mark.parametrize('top_n', [1, 10, 50])
+def test_chunked_parallel_path_matches_serial_top_k(donors, workers, top_n):
+    rows = np.flatnonzero(donors.group == donors.group_code('O+'))
+    args = (donors, rows, 19.0760, 72.8777, top_n, LinearModel(), FEATURES)
+    serial = _rank_serial(*args)
+    assert len(serial[0]) == top_n
+    assert_same_ranking(rank_candidates(*args, workers=workers), serial)
+
+
+def test_parallel_path_matches_serial_with_precomputed_distances(donors):
+    rows = np.arange(N)
+    distances = np.random.default_rng(3).uniform(0, 200, N).astype(np.float32)
+    args = (donors, rows, 19.0760, 72.8777, 20, LinearModel(), FEATURES)
+    assert_same_ranking(rank_candidates(*args, workers=3, distances=distances),
+                        _rank_serial(*args, distances=distances))
+
+
+def test_chunks_smaller_than_top_n_still_merge_every_candidate(donors):
+    rows = np.arange(400)
+    args = (donors, rows, 19.0760, 72.8777, 400, LinearModel(), FEATURES)
+    parallel = rank_candidates(*args, workers=4)
+    assert sorted(parallel[0].tolist()) == rows.tolist()
+    assert_same_ranking(parallel, _rank_serial(*args))
@@ -0,0 +1,92 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import serialization
+from serialization import JSON_MIMETYPE, encode_frame, frame_response, json_response, parse_fields
+
+RESULTS = pd.DataFrame({
+    'donor_id': ['d1', 'd2', 'd3'],
+    'city': ['Mumbai', None, 'Pune'],
+    'distance_km': np.array([1.5, 12.25, 40.0], dtype=np.float64),
+    'rank': np.array([1, 2, 3], dtype=np.int64),
+    'eligible': np.array([True, False, True]),
+}, index=[10, 4, 7])
+COLUMNS = list(RESULTS.columns)
+
+
+@pytest.fixture(params=['orjson', 'stdlib'])
+def encoder(request, monkeypatch):
+    """Runs a test with orjson and again with the stdlib fallback."""
+    if request.param == 'stdlib':
+        monkeypatch.setattr(serialization, 'orjson', None)
+    elif serialization.orjson is None:
+        pytest.skip('orjson is not installed')
+    return request.param
+
+
+def test_parse_fields_keeps_order_and_ignores_blanks():
+    assert parse_fields(None, COLUMNS) is None
+    assert parse_fields('', COLUMNS) is None
+    assert parse_fields(' rank, donor_id,,', COLUMNS) == ['rank', 'donor_id']
+
+
+def test_parse_fields_rejects_unknown_fields():
+    with pytest.raises(ValueError, match=r"Unknown field\(s\): password, email\. Available: donor_id"):
+        parse_fields('donor_id,password,email', COLUMNS)
+
+
+def test_records_format_is_one_object_per_row(encoder):
+    body = json.loads(encode_frame(RESULTS))
+    assert body == [
+        {'donor_id': 'd1', 'city': 'Mumbai', 'distance_km': 1.5, 'rank': 1, 'eligible': True},
+        {'donor_id': 'd2', 'city': None, 'distance_km': 12.25, 'rank': 2, 'eligible': False},
+        {'donor_id': 'd3', 'city': 'Pune', 'distance_km': 40.0, 'rank': 3, 'eligible': True},
+    ]
+    assert json.loads(encode_frame(RESULTS, ['rank', 'donor_id'])) == [
+        {'rank': 1, 'donor_id': 'd1'}, {'rank': 2, 'donor_id': 'd2'}, {'rank': 3, 'donor_id': 'd3'}]
+
+
+def test_columns_format_holds_one_list_per_field(encoder):
+    body = json.loads(encode_frame(RESULTS, ['donor_id', 'distance_km', 'eligible'], fmt='columns'))
+    assert body == {
+        'columns': ['donor_id', 'distance_km', 'eligible'],
+        'count': 3,
+        'data': {'donor_id': ['d1', 'd2', 'd3'], 'distance_km': [1.5, 12.25, 40.0],
+                 'eligible': [True, False, True]},
+    }
+
+
+def test_empty_frame_in_both_formats(encoder):
+    empty = RESULTS.iloc[:0]
+    assert json.loads(encode_frame(empty)) == []
+    assert json.loads(encode_frame(empty, fmt='columns'))['count'] == 0
+
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError, match="Unknown format 'csv'"):
+        encode_frame(RESULTS, fmt='csv')
+
+
+def test_frame_response_sets_status_and_mimetype(encoder):
+    response = frame_response(RESULTS, ['rank'], 'columns', status=201)
+    assert response.status_code == 201
+    assert response.mimetype == JSON_MIMETYPE
+    assert json.loads(response.get_data()) == {'columns': ['rank'], 'count': 3, 'data': {'rank': [1, 2, 3]}}
+
+
+def test_json_response_encodes_numpy_values(encoder):
+    response = json_response({'count': np.int64(2), 'scores': np.array([0.5, 0.25]),
+                              'at': pd.Timestamp('2026-01-02T03:04:05')})
+    assert json.loads(response.get_data()) == {'count': 2, 'scores': [0.5, 0.25],
+                                               'at': '2026-01-02T03:04:05'}
+
+
+def test_missing_values_encode_as_null_in_both_formats(encoder):
+    frame = pd.DataFrame({'name': ['Asha', None], 'score': [0.5, np.nan]})
+    assert json.loads(encode_frame(frame)) == [{'name': 'Asha', 'score': 0.5}, {'name': None, 'score': None}]
+    body = encode_frame(frame, fmt='columns')
+    assert b'NaN' not in body
+    assert json.loads(body)['data'] == {'name': ['Asha', None], 'score': [0.5, None]}
@@ -0,0 +1,73 @@
+import pandas as pd
+
+from sharding import ShardCoordinator, _read_partition, plan_shards
+
+
+def test_plan_shards_balances_whole_cities():
+    counts = {'Mumbai': 500, 'Delhi': 400, 'Pune': 300, 'Nagpur': 200, 'Goa': 100}
+    shards = plan_shards(counts, 2)
+    assert sorted(city for shard in shards for city in shard) == sorted(counts)
+    assert sorted(sum(counts[city] for city in shard) for shard in shards) == [700, 800]
+
+
+def test_plan_shards_never_makes_empty_shards():
+    assert plan_shards({'Mumbai': 10}, 3) == [['Mumbai']]
+    assert plan_shards({}, 3) == [[]]
+
+
+def test_read_partition_keeps_only_listed_cities(tmp_path, monkeypatch):
+    monkeypatch.setattr('sharding.LOAD_CHUNK_ROWS', 2)
+    path = tmp_path / 'donors.csv'
+    pd.DataFrame({'donor_id': list('abcde'), 'city': ['Pune', 'Goa', 'Pune', 'Delhi', 'Goa']}).to_csv(path, index=False)
+    part = _read_partition(str(path), ['Goa', 'Delhi'])
+    assert part['donor_id'].tolist() == ['b', 'd', 'e']
+
+
+class FakeShard:
+    """Coordinator-facing stand-in for a ShardHandle."""
+
+    def __init__(self, shard_id, scores, covers=True, error=None):
+        self.shard_id = shard_id
+        self.cities = [f'city-{shard_id}']
+        self.scores = scores
+        self._covers = covers
+        self.error = error
+        self.asked = []
+
+    def covers(self, lat, lon, radius_km):
+        return self._covers
+
+    def query(self, op, args, timeout):
+        self.asked.append((op, args))
+        if self.error:
+            raise TimeoutError(self.error)
+        result = pd.DataFrame({'donor_id': [f'{self.shard_id}-{i}' for i in range(len(self.scores))],
+                               'suitability_score': self.scores})
+        return {'status': 'ok', 'result': result, 'elapsed': 0.001}
+
+
+def test_gather_merges_top_k_and_skips_far_and_failed_shards():
+    near = FakeShard(0, [0.9, 0.4])
+    other = FakeShard(1, [0.95, 0.5, 0.1])
+    far = FakeShard(2, [0.99], covers=False)
+    broken = FakeShard(3, [], error='shard timed out')
+    coordinator = ShardCoordinator([near, other, far, broken], timeout=1)
+    try:
+        results, timings = coordinator.find_best_organ_match('Kidney', 19.0, 72.8, pd.Timestamp('2026-01-01'),
+                                                             top_n=3)
+    finally:
+        coordinator._pool.shutdown()
+
+    assert results['donor_id'].tolist() == ['1-0', '0-0', '1-1']
+    assert not far.asked
+    assert {t['shard']: t['status'] for t in timings} == {0: 'ok', 1: 'ok', 3: 'error'}
+    assert {t['shard']: t['candidates'] for t in timings}[1] == 3
+
+
+def test_gather_with_no_results_returns_empty_frame():
+    coordinator = ShardCoordinator([FakeShard(0, [], covers=False)], timeout=1)
+    try:
+        results, timings = coordinator.find_best_organ_match('Heart', 0.0, 0.0, pd.Timestamp('2026-01-01'))
+    finally:
+        coordinator._pool.shutdown()
+    assert results.empty and timings == []
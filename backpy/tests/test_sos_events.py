@@ -0,0 +1,172 @@
+import json
+import os
+import socket
+import struct
+
+import pytest
+from flask import Flask
+
+from emergency_sos_system import SOS_BLUEPRINT
+from sos_events import SOSEventBus, SOSStreamServer, stream_token
+
+WS_KEY = 'dGhlIHNhbXBsZSBub25jZQ=='
+
+
+@pytest.fixture
+def stream():
+    bus = SOSEventBus()
+    server = SOSStreamServer(bus, host='127.0.0.1', port=0, heartbeat=0.2)
+    server.start()
+    yield bus, server
+    server.stop()
+
+
+def connect(server, path, headers=()):
+    sock = socket.create_connection(('127.0.0.1', server.port), timeout=5)
+    lines = [f"GET {path} HTTP/1.1", "Host: localhost", *headers, '', '']
+    sock.sendall('\r\n'.join(lines).encode())
+    return sock
+
+
+def read_head(sock):
+    data = b''
+    while b'\r\n\r\n' not in data:
+        chunk = sock.recv(1)
+        if not chunk:
+            break
+        data += chunk
+    return data.decode()
+
+
+def read_all(sock):
+    chunks = []
+    while True:
+        chunk = sock.recv(4096)
+        if not chunk:
+            return b''.join(chunks).decode()
+        chunks.append(chunk)
+
+
+def ws_headers(**overrides):
+    headers = {'Upgrade': 'websocket', 'Connection': 'Upgrade', 'Sec-WebSocket-Key': WS_KEY,
+               'Sec-WebSocket-Version': '13'}
+    headers.update(overrides)
+    return [f"{name}: {value}" for name, value in headers.items() if value is not None]
+
+
+def client_frame(opcode, payload=b''):
+    mask = os.urandom(4)
+    masked = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return bytes([0x80 | opcode, 0x80 | len(payload)]) + mask + masked
+
+
+def server_frame(sock):
+    first, length = sock.recv(1)[0], sock.recv(1)[0]
+    if length == 126:
+        length = struct.unpack('>H', sock.recv(2))[0]
+    payload = b''
+    while len(payload) < length:
+        payload += sock.recv(length - len(payload))
+    return first & 0x0F, payload
+
+
+def test_stream_requires_token(stream):
+    bus, server = stream
+    bus.open('sos_1')
+    assert read_head(connect(server, '/api/emergency/sos-events/sos_1')).startswith('HTTP/1.1 401')
+    assert read_head(connect(server, '/api/emergency/sos-events/sos_1?token=nope')).startswith('HTTP/1.1 401')
+    # A valid token for another SOS does not open this one
+    other = stream_token('sos_2')
+    assert read_head(connect(server, f'/api/emergency/sos-events/sos_1?token={other}')).startswith('HTTP/1.1 401')
+
+
+def test_foreign_origin_is_rejected_and_no_wildcard_cors(stream):
+    bus, server = stream
+    bus.open('sos_1')
+    path = f"/api/emergency/sos-events/sos_1?token={stream_token('sos_1')}"
+    assert read_head(connect(server, path, ['Origin: https://evil.example'])).startswith('HTTP/1.1 403')
+
+    bus.publish('sos_1', 'completed', {'ok': True}, final=True)
+    body = read_all(connect(server, path, ['Origin: http://localhost:5173']))
+    assert 'Access-Control-Allow-Origin: http://localhost:5173' in body
+    assert 'Access-Control-Allow-Origin: *' not in body
+    assert 'event: completed' in body
+
+
+def test_sse_accepts_bearer_token_and_replays_after_id(stream):
+    bus, server = stream
+    bus.open('sos_1')
+    for n in range(3):
+        bus.publish('sos_1', 'contact', {'n': n}, final=n == 2)
+    body = read_all(connect(server, '/api/emergency/sos-events/sos_1?after=1',
+                          [f"Authorization: Bearer {stream_token('sos_1')}"]))
+    assert 'id: 1\n' not in body and 'id: 2\n' in body and 'id: 3\n' in body
+
+
+@pytest.mark.parametrize('overrides', [
+    {'Sec-WebSocket-Version': '8'}, {'Sec-WebSocket-Key': None}, {'Sec-WebSocket-Key': 'c2hvcnQ='},
+    {'Connection': 'keep-alive'},
+])
+def test_bad_websocket_handshake_is_rejected(stream, overrides):
+    bus, server = stream
+    bus.open('sos_1')
+    sock = connect(server, f"/api/emergency/sos-events/sos_1?token={stream_token('sos_1')}",
+                   ws_headers(**overrides))
+    assert read_head(sock).startswith('HTTP/1.1 400')
+
+
+def test_websocket_answers_ping_and_client_close(stream):
+    bus, server = stream
+    bus.open('sos_1')
+    bus.publish('sos_1', 'accepted', {'status': 'processing'})
+    sock = connect(server, f"/api/emergency/sos-events/sos_1?token={stream_token('sos_1')}", ws_headers())
+    assert read_head(sock).startswith('HTTP/1.1 101')
+
+    opcode, payload = server_frame(sock)
+    assert opcode == 0x1 and json.loads(payload)['event'] == 'accepted'
+
+    sock.sendall(client_frame(0x9, b'hello'))
+    while True:
+        opcode, payload = server_frame(sock)
+        if opcode != 0x9:    # skip heartbeat pings
+            break
+    assert (opcode, payload) == (0xA, b'hello')
+
+    sock.sendall(client_frame(0x8, b'\x03\xe8'))
+    while True:
+        opcode, payload = server_frame(sock)
+        if opcode != 0x9:
+            break
+    assert (opcode, payload) == (0x8, b'\x03\xe8')
+    assert sock.recv(1) == b''
+
+
+def test_websocket_closes_after_final_event(stream):
+    bus, server = stream
+    bus.open('sos_1')
+    bus.publish('sos_1', 'completed', {'overall_status': 'success'}, final=True)
+    sock = connect(server, f"/api/emergency/sos-events/sos_1?token={stream_token('sos_1')}", ws_headers())
+    read_head(sock)
+    assert server_frame(sock)[0] == 0x1
+    assert server_frame(sock) == (0x8, b'\x03\xe8')
+
+
+def test_flask_sse_route_requires_token():
+    app = Flask(__name__)
+    app.register_blueprint(SOS_BLUEPRINT)
+    client = app.test_client()
+    from sos_events import sos_events
+    sos_events.open('sos_flask')
+    sos_events.publish('sos_flask', 'completed', {}, final=True)
+    assert client.get('/api/emergency/sos-events/sos_flask').status_code == 401
+    response = client.get(f"/api/emergency/sos-events/sos_flask?token={stream_token('sos_flask')}")
+    assert response.status_code == 200
+    assert b'event: completed' in response.data
+
+
+def test_start_raises_when_the_port_is_taken(stream):
+    _, server = stream
+    clash = SOSStreamServer(SOSEventBus(), host='127.0.0.1', port=server.port)
+    with pytest.raises(RuntimeError, match='failed to start'):
+        clash.start(timeout=2)
+    assert clash.loop is None
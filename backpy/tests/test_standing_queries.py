@@ -0,0 +1,163 @@
+import threading
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import matching_service
+import standing_queries as sq
+from donor_store import DonorColumns
+from eligibility import EligibilityIndex
+from standing_queries import CANCELLED, EXPIRED, FULFILLED, OPEN, StandingQueryEngine
+from suppression import SuppressionList
+
+TODAY = datetime(2026, 3, 1)
+MUMBAI = (19.0760, 72.8777)
+
+# Row 0: O- near Mumbai, eligible.   Row 1: O- near Mumbai, eligible on 2026-03-03.
+# Row 2: A+ near Mumbai, eligible.   Row 3: O- in Delhi, eligible.   Row 4: O- near Mumbai, opted out.
+DONORS = pd.DataFrame({
+    'donor_id': ['d0', 'd1', 'd2', 'd3', 'd4'],
+    'blood_group': ['O-', 'O-', 'A+', 'O-', 'O-'],
+    'city': ['Mumbai', 'Mumbai', 'Mumbai', 'Delhi', 'Mumbai'],
+    'latitude': [19.10, 19.05, 19.08, 28.61, 19.07],
+    'longitude': [72.90, 72.85, 72.88, 77.21, 72.87],
+    'last_donation_date': pd.to_datetime(['2025-01-01', '2026-01-31', '2025-01-01', '2025-01-01', '2025-01-01']),
+})
+
+
+@pytest.fixture
+def engine(monkeypatch, tmp_path):
+    eligibility = EligibilityIndex()
+    eligibility.compute(DONORS)
+    flags = SuppressionList(path=None)
+    flags.attach(DONORS['donor_id'])
+    flags.set_opted_out('d4')
+    outreach = []
+
+    def initiate_outreach(blood_group, lat, lon, urgency_level, ai_reasoning, top_n, hospital=None):
+        outreach.append((blood_group, hospital))
+        return {'status': 'success', 'job_id': f'job-{len(outreach)}'}
+
+    monkeypatch.setattr(matching_service, 'blood_donors', DonorColumns.from_frame(DONORS))
+    monkeypatch.setattr(matching_service, 'eligibility', eligibility)
+    monkeypatch.setattr(matching_service, 'initiate_outreach', initiate_outreach)
+    monkeypatch.setattr(sq, 'suppression', flags)
+    engine = StandingQueryEngine(str(tmp_path / 'standing.sqlite'))
+    engine.outreach = outreach
+    yield engine
+    engine.stop()
+
+
+def drain(engine):
+    # One worker: a no-op queued last finishes after every earlier attempt
+    engine._executor.submit(lambda: None).result(5)
+
+
+def test_register_dedupes_per_site_and_blood_group(engine):
+    first = engine.register('O-', *MUMBAI, hospital='mumbai_central')
+    assert engine.register('O-', *MUMBAI, hospital='mumbai_central') is first
+    assert engine.register('A+', *MUMBAI, hospital='mumbai_central') is not first
+    with pytest.raises(ValueError):
+        engine.register('Z', *MUMBAI)
+
+
+def test_only_matching_group_radius_and_eligible_donors_affect_a_query(engine):
+    near = engine.register('O-', *MUMBAI, radius_km=20, hospital='mumbai_central')
+    delhi = engine.register('O-', 28.6139, 77.2090, radius_km=20, hospital='delhi_aiims')
+    a_pos = engine.register('A+', *MUMBAI, radius_km=20, hospital='mumbai_central')
+
+    assert engine.affected_by(np.array([0]), TODAY) == [near['query_id']]
+    assert engine.affected_by(np.array([2]), TODAY) == [a_pos['query_id']]
+    assert engine.affected_by(np.array([3]), TODAY) == [delhi['query_id']]
+    # Still in cooldown, and opted out
+    assert engine.affected_by(np.array([1, 4]), TODAY) == []
+    # Rows past the end of the donor table are ignored
+    assert engine.affected_by(np.array([99]), TODAY) == []
+
+
+def test_closed_queries_are_not_matched(engine):
+    query = engine.register('O-', *MUMBAI, radius_km=20)
+    engine.cancel(query['query_id'])
+    assert engine.affected_by(np.array([0]), TODAY) == []
+
+
+def test_donor_change_runs_outreach_and_fulfils_query(engine, monkeypatch):
+    monkeypatch.setattr(sq, 'datetime', type('FixedDatetime', (datetime,), {'today': classmethod(lambda cls: TODAY)}))
+    query = engine.register('O-', *MUMBAI, radius_km=20, hospital='mumbai_central')
+    engine.on_donor_change(np.array([0, 3]))
+    drain(engine)
+
+    assert engine.outreach == [('O-', 'mumbai_central')]
+    stored = engine.get(query['query_id'])
+    assert stored['status'] == FULFILLED and stored['attempts'] == 1 and stored['job_id'] == 'job-1'
+    # A fulfilled query ignores later changes
+    engine.on_donor_change(np.array([0]))
+    drain(engine)
+    assert len(engine.outreach) == 1
+
+
+def test_tick_drains_donors_whose_cooldown_ended(engine):
+    query = engine.register('O-', *MUMBAI, radius_km=20, hospital='mumbai_central', ttl_hours=24 * 365 * 10)
+    engine._eligible_through = date(2026, 3, 1)
+
+    # d1's cooldown ends on 2026-03-03 (30-day rule)
+    assert engine.tick(datetime(2026, 3, 2, 12)) == []
+    assert engine.tick(datetime(2026, 3, 3, 12)) == [query['query_id']]
+    drain(engine)
+    assert engine.get(query['query_id'])['status'] == FULFILLED
+
+
+def test_tick_expires_queries_past_their_ttl(engine):
+    stale = engine.register('A+', *MUMBAI, ttl_hours=1)
+    fresh = engine.register('O-', *MUMBAI, ttl_hours=3)
+    engine.tick(datetime.now() + timedelta(hours=2))
+    assert engine.get(stale['query_id'])['status'] == EXPIRED
+    assert engine.get(fresh['query_id'])['status'] == OPEN
+    assert engine.affected_by(np.array([2]), TODAY) == []
+
+
+def test_open_queries_survive_a_restart(engine, tmp_path, monkeypatch):
+    query = engine.register('O-', *MUMBAI, radius_km=20)
+    monkeypatch.setattr(matching_service, 'initiate_outreach',
+                        lambda *args, **kwargs: {'status': 'failed', 'job_id': 'job-x'})
+    restarted = StandingQueryEngine(engine.path)
+    try:
+        restarted.load()
+        drain(restarted)
+        reloaded = restarted.get(query['query_id'])
+        assert reloaded['status'] == OPEN and reloaded['attempts'] == 1
+        assert restarted.affected_by(np.array([0]), TODAY) == [query['query_id']]
+    finally:
+        restarted.stop()
+
+
+def test_cancel_during_outreach_is_not_overwritten_by_the_result(engine, monkeypatch):
+    query = engine.register('O-', *MUMBAI, radius_km=20)
+    started, release = threading.Event(), threading.Event()
+
+    def slow_outreach(*args, **kwargs):
+        started.set()
+        release.wait(5)
+        return {'status': 'success', 'job_id': 'job-late'}
+
+    monkeypatch.setattr(matching_service, 'initiate_outreach', slow_outreach)
+    engine._submit([query['query_id']])
+    assert started.wait(5)
+    assert engine.cancel(query['query_id'])
+    release.set()
+    drain(engine)
+
+    stored = engine.get(query['query_id'])
+    assert stored['status'] == CANCELLED and stored['attempts'] == 1
+    assert stored['fulfilled_at'] is None
+
+
+def test_stop_shuts_down_the_outreach_worker(engine):
+    query = engine.register('O-', *MUMBAI, radius_km=20)
+    engine.stop()
+    assert engine._executor._shutdown
+    # Donor changes after shutdown are dropped instead of raising
+    engine.on_donor_change(np.array([0]))
+    assert engine.get(query['query_id'])['attempts'] == 0
@@ -0,0 +1,47 @@
+import logging
+
+import messaging
+from emergency_sos_system import EmergencySOSSystem
+from messaging import SMS, FakeProvider, MessageRouter
+from structured_logging import SampledLogger, current_context
+
+
+class Capture(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append((record.getMessage(), current_context(), getattr(record, 'sample_every', None)))
+
+
+def capture(name):
+    handler = Capture()
+    logger = logging.getLogger(name)
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    return logger, handler
+
+
+def test_sampled_logger_keeps_every_nth_record():
+    logger, handler = capture('test.sampled')
+    sampled = SampledLogger(logger, every=3)
+    for i in range(7):
+        sampled.info("tick %d", i)
+    assert [(msg, every) for msg, _, every in handler.records] == [('tick 0', 3), ('tick 3', 3), ('tick 6', 3)]
+
+
+def test_sos_id_reaches_logs_from_worker_threads(monkeypatch):
+    logger, handler = capture('emergency_sos_system')
+    monkeypatch.setattr(messaging, 'router', MessageRouter([FakeProvider('down', SMS, down=True)]))
+    system = EmergencySOSSystem()
+    monkeypatch.setattr(system, 'alert_nearest_hospital', lambda data: {})
+    result = system.execute_sos_request({
+        'user_id': 'u1', 'emergency_type': 'blood', 'user_location': {'latitude': 19.0, 'longitude': 72.8},
+        'emergency_contacts': [{'phone_number': '+911'}, {'phone_number': '+912'}]})
+    logger.removeHandler(handler)
+
+    failures = [ctx for msg, ctx, _ in handler.records if msg.startswith('Emergency alert failed')]
+    assert len(failures) == 2
+    assert all(ctx.get('sos_id') == result['sos_id'] for ctx in failures)
+    assert all(ctx.get('sos_id') == result['sos_id'] for _, ctx, _ in handler.records)
@@ -0,0 +1,81 @@
+import threading
+from datetime import date, timedelta
+
+from suppression import SuppressionList
+
+
+def test_mask_flags_opt_outs_deferrals_and_recent_messages():
+    flags = SuppressionList(path=None, recently_messaged_seconds=100)
+    flags.attach(['d0', 'd1', 'd2', 'd3'])
+    today = date(2026, 1, 10)
+    flags.set_opted_out('d1')
+    flags.defer('d2', today)
+    flags.mark_messaged('d3', ts=1_000)
+
+    assert flags.mask(today, now=1_050).tolist() == [False, True, True, True]
+    assert flags.mask(today + timedelta(days=1), now=1_200).tolist() == [False, True, False, False]
+    assert flags.suppressed_ids(today) == ['d1', 'd2']
+
+
+def test_hold_never_shortens_a_deferral():
+    flags = SuppressionList(path=None)
+    flags.attach(['d0'])
+    flags.defer('d0', date(2026, 3, 1))
+    flags.hold('d0', date(2026, 1, 5))
+    assert flags.status('d0')['deferred_until'] == '2026-03-01'
+    flags.hold('d0', date(2026, 4, 1))
+    assert flags.status('d0')['deferred_until'] == '2026-04-01'
+
+
+def test_mask_is_consistent_during_extend():
+    flags = SuppressionList(path=None)
+    flags.attach([f'd{i}' for i in range(1000)])
+    errors, stop = [], threading.Event()
+
+    def read():
+        while not stop.is_set():
+            try:
+                flags.mask()
+                flags.suppressed_ids()
+            except ValueError as e:
+                errors.append(e)
+                return
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    for batch in range(200):
+        flags.extend([f'x{batch}-{i}' for i in range(50)])
+    stop.set()
+    for reader in readers:
+        reader.join()
+
+    assert not errors
+    assert len(flags.mask()) == 1000 + 200 * 50
+
+
+def test_flush_round_trips_and_writes_outside_the_lock(tmp_path, monkeypatch):
+    import suppression as module
+    path = str(tmp_path / 'flags.npz')
+    flags = SuppressionList(path=path)
+    flags.attach(['d0', 'd1'])
+    writing, release = threading.Event(), threading.Event()
+    savez = module.np.savez
+
+    def slow_savez(*args, **kwargs):
+        writing.set()
+        release.wait(5)
+        savez(*args, **kwargs)
+
+    monkeypatch.setattr(module.np, 'savez', slow_savez)
+    flusher = threading.Thread(target=flags.set_opted_out, args=('d1',))
+    flusher.start()
+    assert writing.wait(5)
+    # Readers are not blocked by the write in progress
+    assert flags.mask().tolist() == [False, True]
+    release.set()
+    flusher.join(5)
+
+    reloaded = SuppressionList(path=path)
+    reloaded.attach(['d1', 'd0'])
+    assert reloaded.mask().tolist() == [True, False]
@@ -0,0 +1,95 @@
+import json
+
+import numpy as np
+import pytest
+
+from transport_matrix import ROAD_SPEED_KMH, UNKNOWN_CITY, TransportMatrix
+
+# Mumbai-Pune by road (the Mumbai-Pune flight loses once transfers are added),
+# Pune-Nagpur beats the direct Mumbai-Nagpur road, Mumbai-Delhi by air, and Goa
+# is in the graph but unconnected.
+GRAPH = {
+    'cities': [
+        {'name': 'Mumbai', 'latitude': 19.0760, 'longitude': 72.8777, 'local_hours': 0.5,
+         'airport_transfer_hours': 1.0},
+        {'name': 'Pune', 'latitude': 18.5204, 'longitude': 73.8567, 'local_hours': 0.5,
+         'airport_transfer_hours': 1.5},
+        {'name': 'Nagpur', 'latitude': 21.1458, 'longitude': 79.0882, 'local_hours': 0.5},
+        {'name': 'Delhi', 'latitude': 28.7041, 'longitude': 77.1025, 'local_hours': 1.0,
+         'airport_transfer_hours': 1.5},
+        {'name': 'Goa', 'latitude': 15.4909, 'longitude': 73.8278},
+    ],
+    'road': [['Mumbai', 'Pune', 3.0], ['Pune', 'Nagpur', 12.0], ['Mumbai', 'Nagpur', 16.0],
+             ['Nagpur', 'Delhi', 14.0]],
+    'air': [['Mumbai', 'Delhi', 2.0], ['Mumbai', 'Pune', 1.0]],
+}
+MUMBAI, PUNE, NAGPUR, DELHI, GOA = range(5)
+INF = np.inf
+
+# Hand-computed all-pairs hours
+EXPECTED_HOURS = np.array([
+    # Mumbai Pune  Nagpur Delhi Goa
+    [0.5,    3.0,  15.0,  4.5,  INF],   # Mumbai: Delhi = 1.0 + 2.0 + 1.5 by air
+    [3.0,    0.5,  12.0,  7.5,  INF],   # Pune: Delhi via Mumbai, road then air
+    [15.0,   12.0, 0.5,   14.0, INF],   # Nagpur: Mumbai via Pune; Delhi by road
+    [4.5,    7.5,  14.0,  1.0,  INF],
+    [INF,    INF,  INF,   INF,  0.0],   # Goa: no legs, no local_hours
+])
+
+
+@pytest.fixture
+def matrix():
+    return TransportMatrix.build(GRAPH)
+
+
+def test_build_finds_all_pairs_shortest_paths(matrix):
+    np.testing.assert_array_equal(matrix.hours, EXPECTED_HOURS.astype(np.float32))
+    assert matrix.hours.dtype == np.float32
+
+
+def test_air_flag_follows_the_chosen_path(matrix):
+    pairs = [(MUMBAI, DELHI), (PUNE, DELHI), (MUMBAI, PUNE), (MUMBAI, NAGPUR), (NAGPUR, DELHI)]
+    assert [bool(matrix.by_air[i, j]) for i, j in pairs] == [True, True, False, False, False]
+    assert (matrix.by_air == matrix.by_air.T).all()
+    assert matrix.mode([MUMBAI, NAGPUR, UNKNOWN_CITY], DELHI).tolist() == ['air', 'road', 'road']
+
+
+def test_city_codes_are_case_and_whitespace_insensitive(matrix):
+    assert matrix.city_codes([' mumbai', 'DELHI', 'Atlantis', None]).tolist() == [MUMBAI, DELHI, -1, -1]
+
+
+def test_nearest_city_within_range(matrix):
+    assert matrix.nearest_city(18.60, 73.80) == PUNE
+    assert matrix.nearest_city(19.0760, 72.8777) == MUMBAI
+    # Open sea, well over NEAREST_CITY_KM from every city
+    assert matrix.nearest_city(17.0, 70.0) == UNKNOWN_CITY
+    assert TransportMatrix([], np.zeros(0), np.zeros(0), np.zeros((0, 0)), np.zeros((0, 0), bool)) \
+        .nearest_city(19.0, 72.0) == UNKNOWN_CITY
+
+
+def test_transport_hours_gathers_known_pairs_and_estimates_the_rest(matrix):
+    hours = matrix.transport_hours([MUMBAI, PUNE, UNKNOWN_CITY, NAGPUR], DELHI, [1150.0, 1180.0, 90.0, 850.0])
+    assert hours.tolist() == pytest.approx([4.5, 7.5, 90.0 / ROAD_SPEED_KMH, 14.0])
+    # Scalar origin against an array of destinations
+    assert matrix.transport_hours(MUMBAI, [PUNE, UNKNOWN_CITY], 45.0).tolist() == [3.0, 1.0]
+
+
+def test_load_reuses_the_saved_matrix_until_the_graph_changes(matrix, tmp_path, monkeypatch):
+    graph_path, matrix_path = tmp_path / 'graph.json', str(tmp_path / 'matrix.npz')
+    graph_path.write_text(json.dumps(GRAPH))
+    built = TransportMatrix.load(str(graph_path), matrix_path)
+    np.testing.assert_array_equal(built.hours, matrix.hours)
+
+    def no_build(*args, **kwargs):
+        raise AssertionError("rebuilt an unchanged graph")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(TransportMatrix, 'build', classmethod(no_build))
+        reloaded = TransportMatrix.load(str(graph_path), matrix_path)
+    assert reloaded.cities == matrix.cities and reloaded.digest == built.digest
+    np.testing.assert_array_equal(reloaded.by_air, matrix.by_air)
+
+    changed = dict(GRAPH, road=GRAPH['road'] + [['Goa', 'Pune', 8.0]])
+    graph_path.write_text(json.dumps(changed))
+    rebuilt = TransportMatrix.load(str(graph_path), matrix_path)
+    assert rebuilt.hours[GOA, MUMBAI] == pytest.approx(11.0)
@@ -0,0 +1,112 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+from flask import Flask
+
+import waitlist as wl
+from transport_matrix import TransportMatrix
+
+TODAY = datetime(2026, 3, 1)
+GRAPH = {
+    'cities': [
+        {'name': 'Mumbai', 'latitude': 19.0760, 'longitude': 72.8777, 'local_hours': 1.0},
+        {'name': 'Pune', 'latitude': 18.5204, 'longitude': 73.8567, 'local_hours': 1.0},
+        {'name': 'Delhi', 'latitude': 28.7041, 'longitude': 77.1025, 'local_hours': 1.0},
+    ],
+    'road': [['Mumbai', 'Pune', 3.0], ['Mumbai', 'Delhi', 20.0]],
+}
+MATCHED = dict(hla_a1='A1', hla_a2='A2', hla_b1='B7', hla_b2='B8', hla_dr1='DR4', hla_dr2='DR15')
+
+
+def recipient(recipient_id, organ='Kidney', blood_group='A+', city='Mumbai', urgency=5, **extra):
+    return dict(recipient_id=recipient_id, name=recipient_id.title(), organ_needed=organ, blood_group=blood_group,
+                city=city, urgency=urgency, listed_at=TODAY.isoformat(), **extra)
+
+
+OFFER = dict(donor_id='offer1', organ_available='Kidney', blood_group='A+', city='Mumbai', latitude=19.0760,
+             longitude=72.8777, tissue_size_factor=1.0, hla_match_score=80.0, **MATCHED)
+
+
+@pytest.fixture
+def waitlist(monkeypatch, tmp_path):
+    waitlist = wl.Waitlist(str(tmp_path / 'waitlist.sqlite'))
+    waitlist.load(TransportMatrix.build(GRAPH))
+    monkeypatch.setattr(wl, 'waitlist', waitlist)
+    return waitlist
+
+
+def ranked_ids(offer=OFFER, **kwargs):
+    return wl.allocate(offer, today=TODAY, **kwargs)['recipient_id'].tolist()
+
+
+def test_abo_filter_for_solid_organs():
+    # Rh does not matter; ABO does
+    assert wl.ABO_COMPATIBLE[wl.BLOOD_GROUPS.index('O-'), wl.BLOOD_GROUPS.index('AB+')]
+    assert wl.ABO_COMPATIBLE[wl.BLOOD_GROUPS.index('A+'), wl.BLOOD_GROUPS.index('A-')]
+    assert not wl.ABO_COMPATIBLE[wl.BLOOD_GROUPS.index('A+'), wl.BLOOD_GROUPS.index('O+')]
+    assert not wl.ABO_COMPATIBLE[wl.BLOOD_GROUPS.index('AB-'), wl.BLOOD_GROUPS.index('B+')]
+
+
+def test_allocation_filters_organ_group_and_viability(waitlist):
+    waitlist.add(pd.DataFrame([
+        recipient('ok'),
+        recipient('wrong_organ', organ='Heart'),
+        recipient('incompatible', blood_group='O+'),
+        recipient('too_far', city='Delhi'),      # 20h by road, kidney viability is 12h
+        recipient('pune', city='Pune'),          # 3h by road
+    ]))
+    assert set(ranked_ids()) == {'ok', 'pune'}
+
+    heart = dict(OFFER, organ_available='Heart')
+    waitlist.add(pd.DataFrame([recipient('heart_pune', organ='Heart', city='Pune', urgency=9)]))
+    # 3h to Pune is inside the heart's 4h window
+    assert ranked_ids(heart) == ['wrong_organ', 'heart_pune']
+
+
+def test_allocation_scores_match_hand_computation(waitlist):
+    # Same city as the offer: distance ~0 km, so score = HLA score * size match * priority / 10
+    waitlist.add(pd.DataFrame([
+        recipient('matched', urgency=8, **MATCHED),
+        # Both DR antigens mismatched: weighted 2 * 2 = 4 of 12
+        recipient('dr_mismatch', urgency=4, **dict(MATCHED, hla_dr1='DR1', hla_dr2='DR3')),
+        recipient('untyped', urgency=6),
+    ]))
+    result = wl.allocate(OFFER, today=TODAY).set_index('recipient_id')
+    assert result.index.tolist() == ['matched', 'untyped', 'dr_mismatch']
+    assert result.loc['matched', 'allocation_score'] == pytest.approx(100 * 1.0 * 0.8, rel=1e-3)
+    assert result.loc['untyped', 'allocation_score'] == pytest.approx(80 * 1.0 * 0.6, rel=1e-3)
+    assert result.loc['dr_mismatch', 'allocation_score'] == pytest.approx(100 * (1 - 4 / 8) * 0.4, rel=1e-3)
+    assert result.loc['dr_mismatch', 'hla_mismatches'] == 2
+    assert pd.isna(result.loc['untyped', 'hla_mismatches'])
+    assert ranked_ids(top_n=1) == ['matched']
+
+
+def test_waiting_time_adds_priority(waitlist):
+    waitlist.add(pd.DataFrame([
+        recipient('new', urgency=5),
+        dict(recipient('waited', urgency=5), listed_at='2025-09-02'),   # 180 days: +2 points
+    ]))
+    result = wl.allocate(OFFER, today=TODAY).set_index('recipient_id')
+    assert result.index.tolist() == ['waited', 'new']
+    assert result.loc['waited', 'allocation_score'] == pytest.approx(80 * 0.7, rel=1e-3)
+
+
+def test_duplicate_recipient_ids_are_rejected(waitlist):
+    with pytest.raises(ValueError, match='Duplicate recipient_id'):
+        waitlist.add(pd.DataFrame([recipient('twice'), recipient('twice', urgency=9)]))
+    assert waitlist.get('twice') is None
+
+
+def test_hydrate_batches_lookups(waitlist, monkeypatch):
+    monkeypatch.setattr(wl, 'HYDRATE_BATCH', 2)
+    waitlist.add(pd.DataFrame([recipient(f'r{i}') for i in range(5)]))
+    assert sorted(waitlist.hydrate([f'r{i}' for i in range(5)]).index) == [f'r{i}' for i in range(5)]
+
+
+@pytest.mark.parametrize('top_n', ['lots', '0', '-3'])
+def test_allocation_endpoint_rejects_bad_top_n(top_n):
+    app = Flask(__name__)
+    app.register_blueprint(wl.WAITLIST_BLUEPRINT)
+    response = app.test_client().get(f'/api/organ/offers/offer1/allocation?top_n={top_n}')
+    assert response.status_code == 400
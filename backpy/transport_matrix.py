@@ -0,0 +1,147 @@
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional
+from spatial_index import haversine_km
+from structured_logging import configure_logging, get_logger
+
+logger = get_logger(__name__)
+
+# --- Transport Model Configuration ---
+TRANSPORT_GRAPH_PATH = os.environ.get('TRANSPORT_GRAPH_PATH', 'transport_graph.json')
+TRANSPORT_MATRIX_PATH = os.environ.get('TRANSPORT_MATRIX_PATH', 'transport_matrix.npz')
+# A recipient further than this from every graph city gets the road estimate
+NEAREST_CITY_KM = 60
+# Straight-line road estimate for cities outside the graph
+ROAD_SPEED_KMH = 45
+
+UNKNOWN_CITY = -1
+
+
+def _graph_digest(raw: bytes) -> str:
+    return hashlib.sha1(raw).hexdigest()
+
+
+class TransportMatrix:
+    """City-to-city organ transport times, precomputed from a local graph file.
+
+    The graph lists cities (with intra-city and airport transfer times), road
+    legs and flights between airport cities. build() runs all-pairs shortest
+    paths over both networks once; a flight leg costs the flight plus the
+    ground transfer at each end. The result is an n x n float32 hours matrix
+    indexed by int16 city codes, so a ranking query needs one array gather.
+    """
+
+    def __init__(self, cities: List[str], latitude: np.ndarray, longitude: np.ndarray,
+                 hours: np.ndarray, by_air: np.ndarray, digest: str = ''):
+        self.cities = cities
+        self.latitude = latitude
+        self.longitude = longitude
+        self.hours = hours
+        self.by_air = by_air
+        self.digest = digest
+        self.code_of: Dict[str, int] = {city.lower(): i for i, city in enumerate(cities)}
+
+    @classmethod
+    def build(cls, graph: Dict, digest: str = '') -> 'TransportMatrix':
+        cities = [c['name'] for c in graph['cities']]
+        code = {name: i for i, name in enumerate(cities)}
+        n = len(cities)
+        hours = np.full((n, n), np.inf)
+        by_air = np.zeros((n, n), dtype=bool)
+        np.fill_diagonal(hours, [c.get('local_hours', 0.0) for c in graph['cities']])
+
+        for a, b, leg in graph.get('road', []):
+            i, j = code[a], code[b]
+            hours[i, j] = hours[j, i] = min(hours[i, j], leg)
+        transfer = {c['name']: c.get('airport_transfer_hours', 0.0) for c in graph['cities']}
+        for a, b, flight in graph.get('air', []):
+            i, j = code[a], code[b]
+            leg = transfer[a] + flight + transfer[b]
+            if leg < hours[i, j]:
+                hours[i, j] = hours[j, i] = leg
+                by_air[i, j] = by_air[j, i] = True
+
+        # Floyd-Warshall, one vectorised relaxation per intermediate city
+        for k in range(n):
+            via = hours[:, k, None] + hours[None, k, :]
+            better = via < hours
+            hours = np.where(better, via, hours)
+            by_air = np.where(better, by_air[:, k, None] | by_air[None, k, :], by_air)
+
+        return cls(cities,
+                   np.array([c['latitude'] for c in graph['cities']], dtype=np.float64),
+                   np.array([c['longitude'] for c in graph['cities']], dtype=np.float64),
+                   hours.astype(np.float32), by_air, digest)
+
+    @classmethod
+    def load(cls, graph_path: str = TRANSPORT_GRAPH_PATH,
+             matrix_path: Optional[str] = TRANSPORT_MATRIX_PATH) -> 'TransportMatrix':
+        """The prebuilt matrix if it matches the graph file, else a fresh build (saved for next time)."""
+        with open(graph_path, 'rb') as f:
+            raw = f.read()
+        digest = _graph_digest(raw)
+        if matrix_path and os.path.exists(matrix_path):
+            with np.load(matrix_path) as saved:
+                if str(saved['digest']) == digest:
+                    return cls(saved['cities'].tolist(), saved['latitude'], saved['longitude'],
+                               saved['hours'], saved['by_air'], digest)
+        matrix = cls.build(json.loads(raw), digest)
+        if matrix_path:
+            matrix.save(matrix_path)
+        return matrix
+
+    def save(self, path: str = TRANSPORT_MATRIX_PATH) -> None:
+        tmp = path + '.tmp.npz'
+        np.savez(tmp, cities=np.array(self.cities), latitude=self.latitude, longitude=self.longitude,
+                 hours=self.hours, by_air=self.by_air, digest=np.array(self.digest))
+        os.replace(tmp, path)
+
+    # --- Lookups ---
+
+    def city_codes(self, cities) -> np.ndarray:
+        """int16 codes for a column of city names (UNKNOWN_CITY if not in the graph)."""
+        names = pd.Series(cities, dtype=object).astype(str).str.strip().str.lower()
+        return names.map(self.code_of).fillna(UNKNOWN_CITY).to_numpy(dtype=np.int16)
+
+    def nearest_city(self, lat: float, lon: float) -> int:
+        """Code of the graph city nearest to a point, or UNKNOWN_CITY if none is close."""
+        if not self.cities:
+            return UNKNOWN_CITY
+        distances = haversine_km(self.latitude, self.longitude, lat, lon)
+        nearest = int(np.argmin(distances))
+        return nearest if distances[nearest] <= NEAREST_CITY_KM else UNKNOWN_CITY
+
+    def transport_hours(self, origin_codes, destination_codes, distance_km) -> np.ndarray:
+        """Hours from each origin city to its destination city (either side may be a scalar).
+
+        Pairs outside the graph fall back to the straight-line road estimate.
+        """
+        origin, destination = np.broadcast_arrays(np.asarray(origin_codes), np.asarray(destination_codes))
+        hours = np.asarray(distance_km, dtype=np.float64) / ROAD_SPEED_KMH
+        hours = np.broadcast_to(hours, origin.shape).copy()
+        known = (origin >= 0) & (destination >= 0)
+        hours[known] = self.hours[origin[known], destination[known]]
+        return hours
+
+    def mode(self, origin_codes, destination_codes) -> np.ndarray:
+        """'air' or 'road' per pair, for display."""
+        origin, destination = np.broadcast_arrays(np.asarray(origin_codes), np.asarray(destination_codes))
+        known = (origin >= 0) & (destination >= 0)
+        air = known & self.by_air[np.maximum(origin, 0), np.maximum(destination, 0)]
+        return np.where(air, 'air', 'road').astype(object)
+
+
+if __name__ == '__main__':
+    # Offline build: python transport_matrix.py [graph.json] [matrix.npz]
+    import sys
+    configure_logging()
+    graph_path = sys.argv[1] if len(sys.argv) > 1 else TRANSPORT_GRAPH_PATH
+    matrix_path = sys.argv[2] if len(sys.argv) > 2 else TRANSPORT_MATRIX_PATH
+    with open(graph_path, 'rb') as f:
+        raw = f.read()
+    matrix = TransportMatrix.build(json.loads(raw), _graph_digest(raw))
+    matrix.save(matrix_path)
+    logger.info("Transport matrix built", extra={'cities': len(matrix.cities), 'path': matrix_path})
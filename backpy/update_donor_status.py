@@ -1,19 +1,30 @@
+import threading
 import pandas as pd
 from datetime import datetime
+from structured_logging import configure_logging, get_logger
+
+logger = get_logger(__name__)
 
 # --- Configuration ---
 FILE_NAME = 'final_indian_blood_donor_dataset.csv'
+# Held by every writer of the dataset CSV (this rewrite and bulk-import appends)
+DATASET_LOCK = threading.Lock()
 
 def update_donor_record(donor_id_to_update, pints_donated=1):
     """
     Updates a specific donor's record (history and last donation date)
     after a CONFIRMED successful donation.
     """
+    with DATASET_LOCK:
+        return _update_donor_record(donor_id_to_update, pints_donated)
+
+
+def _update_donor_record(donor_id_to_update, pints_donated):
     try:
         # Load the Master Dataset
         df = pd.read_csv(FILE_NAME)
     except FileNotFoundError:
-        print(f"Error: Dataset file '{FILE_NAME}' not found.")
+        logger.error("Dataset file '%s' not found", FILE_NAME)
         return False
 
     # Define today's date for the update
@@ -28,7 +39,7 @@ def update_donor_record(donor_id_to_update, pints_donated=1):
         # 1. Ensure 'last_donation_date' column exists (for robustness)
         if 'last_donation_date' not in df.columns:
             df['last_donation_date'] = df['created_at']
-            print(f"Added 'last_donation_date' column and initialized.")
+            logger.info("Added 'last_donation_date' column and initialized it")
 
         # 2. Apply the updates
         df.loc[idx, 'number_of_donation'] += 1
@@ -37,14 +48,17 @@ def update_donor_record(donor_id_to_update, pints_donated=1):
         
         # --- Save Changes Permanently ---
         df.to_csv(FILE_NAME, index=False)
-        print(f"\nSUCCESS: Donor ID {donor_id_to_update} updated in CSV.")
-        print(f"  New Donation Count: {df.loc[idx, 'number_of_donation']}, Last Donation Date: {TODAY}")
+        logger.info("Donor record updated in CSV", extra={
+            'donor_id': donor_id_to_update,
+            'number_of_donation': int(df.loc[idx, 'number_of_donation']),
+            'last_donation_date': TODAY})
         return True
     else:
-        print(f"Error: Donor ID {donor_id_to_update} not found.")
+        logger.error("Donor ID %s not found", donor_id_to_update)
         return False
 
 if __name__ == '__main__':
     # Example usage for direct testing:
     # NOTE: You must replace 'a6a3f7fe55' with a real donor_id from your CSV
+    configure_logging()
     update_donor_record(donor_id_to_update='a6a3f7fe55', pints_donated=1)
\ No newline at end of file
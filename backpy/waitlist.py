@@ -0,0 +1,374 @@
+import os
+import sqlite3
+import threading
+import concurrent.futures
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Mapping, Optional
+from flask import Blueprint, request, jsonify
+import matching_service
+from donor_store import HYDRATE_BATCH
+from hla import hla_codes, hla_scores, mismatches, typed, HLA_COLUMNS
+from inventory_store import BLOOD_GROUPS
+from instrumentation import stage
+from spatial_index import haversine_km
+from suppression import day_number
+from transport_matrix import TransportMatrix, UNKNOWN_CITY
+from structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+# --- Waitlist Configuration ---
+WAITLIST_BLUEPRINT = Blueprint('waitlist', __name__)
+
+WAITLIST_PATH = os.environ.get('WAITLIST_PATH', 'waitlist.sqlite')
+ALLOCATION_TOP_N = 10
+# Allocations kept for GET /api/organ/offers/<donor_id>/allocation
+ALLOCATION_CACHE_SIZE = 1000
+
+ORGANS = tuple(matching_service.MAX_VIABILITY_HOURS)
+REQUIRED_COLUMNS = ('recipient_id', 'name', 'organ_needed', 'blood_group', 'city', 'urgency')
+WAITING, ALLOCATED, REMOVED = 'waiting', 'allocated', 'removed'
+
+# Urgency is on the 1-10 scale used for blood requests; time on the list adds
+# one point per WAIT_DAYS_PER_POINT days, up to MAX_WAIT_POINTS
+WAIT_DAYS_PER_POINT = 90
+MAX_WAIT_POINTS = 3
+
+# Solid-organ ABO compatibility (Rh does not restrict organ allocation)
+ABO_RECIPIENTS = {'O': {'O', 'A', 'B', 'AB'}, 'A': {'A', 'AB'}, 'B': {'B', 'AB'}, 'AB': {'AB'}}
+ABO_COMPATIBLE = np.array([[recipient.rstrip('+-') in ABO_RECIPIENTS[donor.rstrip('+-')]
+                            for recipient in BLOOD_GROUPS] for donor in BLOOD_GROUPS], dtype=bool)
+
+SCHEMA = ("CREATE TABLE IF NOT EXISTS waitlist (recipient_id TEXT PRIMARY KEY, name TEXT, contact_number TEXT, "
+          "organ_needed TEXT, blood_group TEXT, " + ", ".join(f"{col} TEXT" for col in HLA_COLUMNS) + ", "
+          "size_factor REAL, urgency INTEGER, city TEXT, latitude REAL, longitude REAL, listed_at TEXT, status TEXT)")
+COLUMNS = ('recipient_id', 'name', 'contact_number', 'organ_needed', 'blood_group', *HLA_COLUMNS,
+           'size_factor', 'urgency', 'city', 'latitude', 'longitude', 'listed_at', 'status')
+
+
+class RecipientColumns:
+    """Allocation-only recipient data as typed, row-aligned arrays (see DonorColumns).
+
+    Rows are only appended; a recipient who leaves the list is switched off
+    in `active`, and a re-registered recipient gets a new row.
+    """
+
+    def __init__(self, recipient_id, organ, group, size, urgency, listed_day, latitude, longitude, city, hla,
+                 active):
+        self.recipient_id = recipient_id
+        self.organ = organ
+        self.group = group
+        self.size = size
+        self.urgency = urgency
+        self.listed_day = listed_day
+        self.latitude = latitude
+        self.longitude = longitude
+        self.city = city
+        self.hla = hla
+        self.active = active
+
+    def __len__(self) -> int:
+        return len(self.recipient_id)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, transport: TransportMatrix) -> 'RecipientColumns':
+        listed = pd.to_datetime(df['listed_at']).to_numpy(dtype='datetime64[D]').astype(np.int64)
+        return cls(
+            recipient_id=df['recipient_id'].to_numpy(dtype=object),
+            organ=pd.Categorical(df['organ_needed'], categories=ORGANS).codes.astype(np.int8),
+            group=pd.Categorical(df['blood_group'], categories=BLOOD_GROUPS).codes.astype(np.int8),
+            size=df['size_factor'].to_numpy(dtype=np.float32),
+            urgency=df['urgency'].to_numpy(dtype=np.int8),
+            listed_day=listed.astype(np.int32),
+            latitude=df['latitude'].to_numpy(dtype=np.float32),
+            longitude=df['longitude'].to_numpy(dtype=np.float32),
+            city=transport.city_codes(df['city']),
+            hla=hla_codes.encode(df),
+            active=(df['status'] == WAITING).to_numpy(),
+        )
+
+    def extended(self, tail: 'RecipientColumns') -> 'RecipientColumns':
+        return RecipientColumns(*(np.concatenate([getattr(self, name), getattr(tail, name)]) for name in (
+            'recipient_id', 'organ', 'group', 'size', 'urgency', 'listed_day', 'latitude', 'longitude', 'city',
+            'hla', 'active')))
+
+
+class Waitlist:
+    """Recipients waiting for an organ: records in SQLite, allocation arrays in memory.
+
+    SQLite is the source of truth (it holds names, contact numbers and HLA
+    typing); load() rebuilds the arrays from it. Writers take the lock and
+    swap in extended arrays, so an allocation in progress keeps a consistent
+    snapshot.
+    """
+
+    def __init__(self, path: str = WAITLIST_PATH):
+        self.path = path
+        # Opened by load() or the first query, not at import
+        self._conn: Optional[sqlite3.Connection] = None
+        self._open_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self.transport: Optional[TransportMatrix] = None
+        self.columns: Optional[RecipientColumns] = None
+        self.row_of: Dict[str, int] = {}
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """The SQLite connection, opened (and the schema created) on first use."""
+        if self._conn is None:
+            with self._open_lock:
+                if self._conn is None:
+                    conn = sqlite3.connect(self.path, check_same_thread=False)
+                    conn.execute(SCHEMA)
+                    self._conn = conn
+        return self._conn
+
+    def load(self, transport: Optional[TransportMatrix] = None) -> None:
+        self.transport = transport or matching_service.organ_transport or TransportMatrix.load()
+        with self._lock:
+            df = pd.read_sql_query(f"SELECT * FROM waitlist WHERE status = '{WAITING}'", self.conn)
+            self.columns = RecipientColumns.from_frame(df, self.transport)
+            self.row_of = {r: i for i, r in enumerate(self.columns.recipient_id)}
+        logger.info("Waitlist loaded", extra={'recipients': len(df)})
+
+    def _validate(self, df: pd.DataFrame) -> pd.DataFrame:
+        missing = [c for c in REQUIRED_COLUMNS if c not in df.columns or df[c].isna().any()]
+        if missing:
+            raise ValueError(f"Missing required field(s): {', '.join(missing)}")
+        duplicated = df['recipient_id'][df['recipient_id'].duplicated()]
+        if not duplicated.empty:
+            raise ValueError(f"Duplicate recipient_id(s): {', '.join(map(str, duplicated.unique()))}")
+        if not df['organ_needed'].isin(ORGANS).all():
+            raise ValueError(f"organ_needed must be one of: {', '.join(ORGANS)}")
+        if not df['blood_group'].isin(BLOOD_GROUPS).all():
+            raise ValueError(f"blood_group must be one of: {', '.join(BLOOD_GROUPS)}")
+        urgency = pd.to_numeric(df['urgency'], errors='coerce')
+        if not urgency.between(1, 10).all():
+            raise ValueError("urgency must be between 1 and 10")
+
+        df = df.reindex(columns=COLUMNS).copy()
+        df['urgency'] = urgency.astype(int)
+        df['size_factor'] = pd.to_numeric(df['size_factor'], errors='coerce').fillna(1.0)
+        # Recipients registered by city only are placed at the city's centre
+        unplaced = (df['latitude'].isna() | df['longitude'].isna()).to_numpy()
+        if unplaced.any():
+            codes = self.transport.city_codes(df.loc[unplaced, 'city'])
+            if (codes == UNKNOWN_CITY).any():
+                raise ValueError("latitude/longitude are required for cities outside the transport graph")
+            df.loc[unplaced, 'latitude'] = self.transport.latitude[codes]
+            df.loc[unplaced, 'longitude'] = self.transport.longitude[codes]
+        listed = pd.to_datetime(df['listed_at'], errors='coerce', format='mixed')
+        if (listed.isna() & df['listed_at'].notna()).any():
+            raise ValueError("listed_at must be a date")
+        df['listed_at'] = listed.fillna(pd.Timestamp(datetime.utcnow())).dt.strftime('%Y-%m-%dT%H:%M:%S')
+        df['status'] = WAITING
+        return df
+
+    def add(self, recipients: pd.DataFrame) -> int:
+        """Lists (or re-lists, replacing the old entry) the given recipients."""
+        if self.columns is None:
+            self.load()
+        df = self._validate(recipients)
+        tail = RecipientColumns.from_frame(df, self.transport)
+        values = df.astype(object).where(df.notna(), None)
+        with self._lock, self.conn:
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO waitlist ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                values.itertuples(index=False, name=None))
+            for recipient_id in df['recipient_id']:
+                if recipient_id in self.row_of:
+                    self.columns.active[self.row_of[recipient_id]] = False
+            start = len(self.columns)
+            self.row_of.update((r, start + i) for i, r in enumerate(df['recipient_id']))
+            self.columns = self.columns.extended(tail)
+        return len(df)
+
+    def remove(self, recipient_id: str, status: str = REMOVED) -> bool:
+        with self._lock, self.conn:
+            row = self.row_of.pop(recipient_id, None)
+            if row is None:
+                return False
+            self.columns.active[row] = False
+            self.conn.execute("UPDATE waitlist SET status = ? WHERE recipient_id = ?", (status, recipient_id))
+        return True
+
+    def get(self, recipient_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self.conn.execute(f"SELECT {', '.join(COLUMNS)} FROM waitlist WHERE recipient_id = ?",
+                                     (recipient_id,)).fetchone()
+        return dict(zip(COLUMNS, row)) if row else None
+
+    def hydrate(self, recipient_ids) -> pd.DataFrame:
+        recipient_ids = list(recipient_ids)
+        if not recipient_ids:
+            return pd.DataFrame(columns=['name', 'contact_number', 'city'])
+        rows = []
+        with self._lock:
+            # Batched to stay under SQLite's bound-parameter limit
+            for start in range(0, len(recipient_ids), HYDRATE_BATCH):
+                batch = recipient_ids[start:start + HYDRATE_BATCH]
+                rows += self.conn.execute(
+                    "SELECT recipient_id, name, contact_number, city FROM waitlist "
+                    f"WHERE recipient_id IN ({', '.join('?' * len(batch))})", batch).fetchall()
+        return pd.DataFrame(rows, columns=['recipient_id', 'name', 'contact_number', 'city']).set_index('recipient_id')
+
+
+def allocate(offer: Mapping, top_n: int = ALLOCATION_TOP_N, today=None) -> pd.DataFrame:
+    """Ranks the waitlist for one organ offer (a row of organ_df).
+
+    Every waiting recipient for the organ with an ABO-compatible blood group
+    who can be reached inside the organ's viability window is scored as
+    HLA score * size match * urgency / (distance_km + 1), mirroring the
+    recipient -> donor organ score. The HLA score comes from donor/recipient
+    mismatches where both are typed, else the offer's hla_match_score. One pass of array operations over the
+    whole list, so allocation cost grows linearly with the waitlist.
+    """
+    cols = waitlist.columns
+    if cols is None or offer['organ_available'] not in ORGANS or offer['blood_group'] not in BLOOD_GROUPS:
+        return pd.DataFrame()
+    transport = waitlist.transport
+
+    with stage('allocate_organ', 'filter'):
+        compatible = ABO_COMPATIBLE[BLOOD_GROUPS.index(offer['blood_group'])]
+        rows = np.flatnonzero(cols.active & (cols.organ == ORGANS.index(offer['organ_available']))
+                              & compatible[cols.group])
+    if len(rows) == 0:
+        return pd.DataFrame()
+
+    with stage('allocate_organ', 'distance'):
+        distance_km = haversine_km(cols.latitude[rows].astype(np.float64), cols.longitude[rows].astype(np.float64),
+                                   float(offer['latitude']), float(offer['longitude']))
+        origin = transport.city_codes([offer['city']])[0]
+        transport_hours = transport.transport_hours(origin, cols.city[rows], distance_km)
+        limit = matching_service.MAX_VIABILITY_HOURS.get(offer['organ_available'],
+                                                         matching_service.DEFAULT_VIABILITY_HOURS)
+        reachable = transport_hours <= limit
+        rows, distance_km, transport_hours = rows[reachable], distance_km[reachable], transport_hours[reachable]
+    if len(rows) == 0:
+        return pd.DataFrame()
+
+    with stage('allocate_organ', 'rank'):
+        today = day_number(today or datetime.utcnow())
+        waiting_days = np.maximum(today - cols.listed_day[rows], 0)
+        priority = cols.urgency[rows] + np.minimum(waiting_days / WAIT_DAYS_PER_POINT, MAX_WAIT_POINTS)
+        size_match = np.clip(1 - np.abs(float(offer['tissue_size_factor']) - cols.size[rows]), 0, 1)
+        offer_hla = hla_codes.encode_typing({column: offer.get(column) for column in HLA_COLUMNS})
+        recipient_hla = cols.hla[rows]
+        hla_score = hla_scores(offer_hla, recipient_hla, float(offer['hla_match_score']))
+        score = hla_score * size_match * (priority / 10) / (distance_km + 1)
+        top = np.argpartition(-score, top_n)[:top_n] if len(rows) > top_n else np.arange(len(rows))
+        top = top[np.argsort(-score[top], kind='stable')]
+
+    with stage('allocate_organ', 'hydrate'):
+        result = pd.DataFrame({
+            'recipient_id': cols.recipient_id[rows[top]],
+            'blood_group': np.array(BLOOD_GROUPS, dtype=object)[cols.group[rows[top]]],
+            'urgency': cols.urgency[rows[top]].astype(int),
+            'waiting_days': waiting_days[top].astype(int),
+            'distance_km': distance_km[top],
+            'transport_hours': transport_hours[top],
+            'hla_match_score': hla_score[top],
+            'hla_mismatches': np.where(typed(offer_hla) & typed(recipient_hla[top]),
+                                       mismatches(offer_hla, recipient_hla[top]).sum(axis=1), np.nan),
+            # Sizes are stored as float32; round so responses do not show float noise
+            'size_match': size_match[top].astype(np.float64).round(4),
+            'allocation_score': score[top],
+        })
+        records = waitlist.hydrate(result['recipient_id']).reindex(result['recipient_id'])
+        result.insert(1, 'name', records['name'].to_numpy())
+        result.insert(2, 'contact_number', records['contact_number'].to_numpy())
+        result.insert(4, 'city', records['city'].to_numpy())
+        return result
+
+
+# Global waitlist; load() is called once resources are loaded
+waitlist = Waitlist()
+
+_allocations: 'OrderedDict[str, Dict]' = OrderedDict()
+_allocations_lock = threading.Lock()
+# New offers are allocated off the import/request path, one at a time
+_allocation_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='allocation')
+
+
+def _store_allocation(donor_id: str, ranked: pd.DataFrame) -> Dict:
+    allocation = {'donor_id': donor_id, 'allocated_at': datetime.utcnow().isoformat(timespec='seconds'),
+                  'recipients': ranked.astype(object).where(ranked.notna(), None).to_dict(orient='records')}
+    with _allocations_lock:
+        _allocations[donor_id] = allocation
+        _allocations.move_to_end(donor_id)
+        while len(_allocations) > ALLOCATION_CACHE_SIZE:
+            _allocations.popitem(last=False)
+    return allocation
+
+
+def _allocate_offers(offers: pd.DataFrame) -> None:
+    for offer in offers[offers['donor_type'] == 'Deceased'].to_dict(orient='records'):
+        ranked = allocate(offer)
+        _store_allocation(offer['donor_id'], ranked)
+        logger.info("Organ offer allocated", extra={
+            'donor_id': offer['donor_id'], 'organ': offer['organ_available'], 'candidates': len(ranked),
+            'top_recipient': None if ranked.empty else ranked['recipient_id'].iloc[0]})
+
+
+def _on_new_offers(offers: pd.DataFrame) -> None:
+    if waitlist.columns is not None:
+        _allocation_executor.submit(_allocate_offers, offers)
+
+
+matching_service.subscribe_organ_offers(_on_new_offers)
+
+# --- Flask API Endpoints ---
+
+@WAITLIST_BLUEPRINT.route('/api/waitlist', methods=['POST'])
+def add_recipient():
+    """Lists one recipient (JSON object) or several (JSON array)."""
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({"error": "Expected a JSON object or array of recipients."}), 400
+    try:
+        added = waitlist.add(pd.DataFrame(data if isinstance(data, list) else [data]))
+    except ValueError as e:
+        return jsonify({"error": f"Recipient rejected: {e}"}), 400
+    return jsonify({"listed": added}), 201
+
+
+@WAITLIST_BLUEPRINT.route('/api/waitlist/<recipient_id>', methods=['GET'])
+def get_recipient(recipient_id):
+    record = waitlist.get(recipient_id)
+    if not record:
+        return jsonify({"error": "Recipient not found"}), 404
+    return jsonify(record), 200
+
+
+@WAITLIST_BLUEPRINT.route('/api/waitlist/<recipient_id>', methods=['DELETE'])
+def remove_recipient(recipient_id):
+    """Takes a recipient off the list ('status': allocated or removed)."""
+    status = (request.get_json(silent=True) or {}).get('status', REMOVED)
+    if status not in (ALLOCATED, REMOVED):
+        return jsonify({"error": f"status must be '{ALLOCATED}' or '{REMOVED}'."}), 400
+    if not waitlist.remove(recipient_id, status):
+        return jsonify({"error": "Recipient not on the waitlist"}), 404
+    return jsonify({"recipient_id": recipient_id, "status": status}), 200
+
+
+@WAITLIST_BLUEPRINT.route('/api/organ/offers/<donor_id>/allocation', methods=['GET'])
+def offer_allocation(donor_id):
+    """Ranked recipients for an organ offer; recomputed on ?refresh=1 or if not yet allocated."""
+    try:
+        top_n = int(request.args.get('top_n', ALLOCATION_TOP_N))
+        if top_n <= 0:
+            raise ValueError
+    except ValueError:
+        return jsonify({"error": "top_n must be a positive integer."}), 400
+    with _allocations_lock:
+        allocation = _allocations.get(donor_id)
+    if allocation is None or request.args.get('refresh'):
+        organs = matching_service.organ_df
+        offer = organs[organs['donor_id'] == donor_id] if organs is not None else pd.DataFrame()
+        if offer.empty:
+            return jsonify({"error": "Organ offer not found"}), 404
+        allocation = _store_allocation(donor_id, allocate(offer.iloc[0].to_dict(), top_n))
+    return jsonify(allocation), 200